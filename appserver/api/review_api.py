@@ -1,29 +1,56 @@
+import asyncio
+import contextlib
+import os
 import shutil
 import tempfile
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, File, Form, HTTPException, UploadFile
+from fastapi import APIRouter, File, Form, HTTPException, Request, Response, UploadFile
 
-from appserver.service.new_review_service import review_document_with_chain_of_thought
+from appserver.service.new_review_service import CONCLUSION_MODES, review_document_with_chain_of_thought
 
 router = APIRouter()
 
+# 评审进行中检查客户端是否断开的间隔（秒）
+DISCONNECT_POLL_INTERVAL = 0.5
+
 @router.post("/review")
 async def review_document(
+    request: Request,
     file: UploadFile = File(...),
-    review_points: List[str] = Form(...)
+    review_points: List[str] = Form(...),
+    conclusion_mode: str = Form("compact"),
+    include_reasoning: bool = Form(False),
+    point_timeout: Optional[float] = Form(None)
 ):
     filename = file.filename or ""
     if not (filename.endswith('.docx') or filename.endswith('.md')):
         raise HTTPException(status_code=400, detail="仅支持 docx 或 md 文件")
+    # compact：结构化判定（verdict/severity/rationale）；detailed：完整推理文本
+    if conclusion_mode not in CONCLUSION_MODES:
+        raise HTTPException(status_code=400, detail=f"conclusion_mode 仅支持 {', '.join(CONCLUSION_MODES)}")
     with tempfile.NamedTemporaryFile(delete=False, suffix=filename[-5:]) as tmp:
         shutil.copyfileobj(file.file, tmp)
         tmp_path = tmp.name
+    review = asyncio.ensure_future(review_document_with_chain_of_thought(
+        tmp_path, review_points, conclusion_mode=conclusion_mode, include_reasoning=include_reasoning,
+        point_timeout=point_timeout
+    ))
     try:
-        results = review_document_with_chain_of_thought(tmp_path, review_points)
+        # 客户端断开时取消剩余要点，释放上游并发；超时的要点以 status=timeout 返回部分结果
+        while not review.done():
+            await asyncio.wait({review}, timeout=DISCONNECT_POLL_INTERVAL)
+            if not review.done() and await request.is_disconnected():
+                review.cancel()
+                return Response(status_code=499)
+        results = review.result()
     finally:
+        if not review.done():
+            review.cancel()
+            # 等待评审任务回收完剩余的要点任务后再删除它可能仍在读取的临时文件
+            with contextlib.suppress(asyncio.CancelledError):
+                await review
         try:
-            import os
             os.remove(tmp_path)
         except Exception:
             pass
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""
+模型客户端热路径基准套件：结果保存为JSON，可与历史结果对比以发现回归
+
+覆盖：
+- convert_message_to_dict 与 _build_payload
+- call_api_stream / call_api_stream_async 的SSE解析（经本地桩服务，不限速）
+- CustomChatModel._astream 的 ChatGenerationChunk 构造（上游为内存中的SSE响应体）
+- 端到端 ainvoke / astream，并发 1、10、100
+
+全部请求发往进程内启动的 DashScopeStub，不访问外部网络。
+JSON结构参照 pytest-benchmark：每个用例记录 min/max/mean/median/stddev/ops 等统计量。
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_client_hotpaths
+    python -m appserver.benchmarks.bench_client_hotpaths --output base.json
+    python -m appserver.benchmarks.bench_client_hotpaths --compare base.json --max-regression 0.15
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from appserver.benchmarks.bench_sse_parser import build_stream, split_reads
+from appserver.models.new_model import CustomChatModel, DashScopeAPIClient, convert_message_to_dict
+from appserver.models.sse_parser import DashScopeStreamDecoder
+from appserver.pytests.dashscope_stub import DashScopeStub, StubConfig
+
+DEFAULT_OUTPUT_DIR = ".benchmarks"
+STREAM_TOKENS = 2_000
+CHUNK_TOKENS = 10_000
+E2E_TOKENS = 64
+CONCURRENCY = (1, 10, 100)
+
+
+def build_messages(turns: int = 10) -> List[Any]:
+    """系统提示词加多轮历史，模拟典型的审核对话"""
+    messages: List[Any] = [SystemMessage(content="你是一名专业的文档审核助手。" * 50)]
+    for turn in range(turns):
+        messages.append(HumanMessage(content=f"第{turn}轮问题：" + "请检查这一段内容。" * 10))
+        messages.append(AIMessage(content=f"第{turn}轮回答：" + "该段内容符合要求。" * 10))
+    messages.append(HumanMessage(content="请给出最终结论"))
+    return messages
+
+
+def summarize(samples: List[float], extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """将每轮耗时（秒）汇总为统计量"""
+    mean = statistics.fmean(samples)
+    stats = {
+        "min": min(samples),
+        "max": max(samples),
+        "mean": mean,
+        "median": statistics.median(samples),
+        "stddev": statistics.stdev(samples) if len(samples) > 1 else 0.0,
+        "rounds": len(samples),
+        "ops": 1 / mean if mean else 0.0,
+    }
+    if extra:
+        stats.update(extra)
+    return stats
+
+
+class BenchmarkSuite:
+    """
+    收集各用例的统计结果
+
+    每个用例先预热一次，再执行 rounds 轮，每轮调用 inner 次目标函数，记录单次调用的平均耗时。
+    """
+
+    def __init__(self, rounds: int = 5, only: Optional[List[str]] = None):
+        """
+        Args:
+            rounds: 每个用例的测量轮数
+            only: 只运行名称包含其中任一子串的用例，None表示全部运行
+        """
+        self.rounds = rounds
+        self.only = only
+        self.results: List[Dict[str, Any]] = []
+
+    def selected(self, name: str) -> bool:
+        return not self.only or any(part in name for part in self.only)
+
+    def _record(self, name: str, group: str, params: Dict[str, Any], stats: Dict[str, Any]) -> None:
+        self.results.append({"name": name, "group": group, "params": params, "stats": stats})
+        print(f"{name:<44} median {stats['median'] * 1e3:10.3f} ms  stddev {stats['stddev'] * 1e3:8.3f} ms"
+              f"  ops {stats['ops']:12,.1f}/s")
+
+    def run(self, name: str, group: str, func: Callable[[], Any], inner: int = 1,
+            params: Optional[Dict[str, Any]] = None) -> None:
+        """测量同步函数"""
+        if not self.selected(name):
+            return
+        func()
+        samples = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(inner):
+                func()
+            samples.append((time.perf_counter() - start) / inner)
+        self._record(name, group, dict(params or {}, inner=inner), summarize(samples))
+
+    async def arun(self, name: str, group: str, func: Callable[[], Awaitable[Any]], inner: int = 1,
+                   params: Optional[Dict[str, Any]] = None,
+                   extra: Optional[Callable[[List[float]], Dict[str, Any]]] = None) -> None:
+        """测量协程函数，extra 根据各轮耗时计算附加指标"""
+        if not self.selected(name):
+            return
+        await func()
+        samples = []
+        for _ in range(self.rounds):
+            start = time.perf_counter()
+            for _ in range(inner):
+                await func()
+            samples.append((time.perf_counter() - start) / inner)
+        self._record(name, group, dict(params or {}, inner=inner), summarize(samples, extra(samples) if extra else None))
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "machine_info": {
+                "python_version": platform.python_version(),
+                "python_implementation": platform.python_implementation(),
+                "machine": platform.machine(),
+                "system": platform.system(),
+                "cpu_count": os.cpu_count(),
+            },
+            "commit_info": _commit_info(),
+            "datetime": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "benchmarks": self.results,
+        }
+
+
+def _commit_info() -> Dict[str, Any]:
+    """当前git提交，无法获取时返回空字典"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {}
+    return {"id": commit, "dirty": dirty}
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """
+    按中位数对比两次结果
+
+    Args:
+        current: 本次结果
+        baseline: 基线结果
+        max_regression: 允许的最大变慢比例，如0.15表示慢15%以内不算回归
+
+    Returns:
+        List[str]: 超出阈值的用例名称
+    """
+    base = {bench["name"]: bench["stats"]["median"] for bench in baseline.get("benchmarks", [])}
+    regressions = []
+    print(f"\n{'benchmark':<44} {'baseline':>12} {'current':>12} {'change':>8}")
+    for bench in current["benchmarks"]:
+        name = bench["name"]
+        if name not in base or not base[name]:
+            continue
+        change = bench["stats"]["median"] / base[name] - 1
+        flag = ""
+        if change > max_regression:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<44} {base[name] * 1e3:10.3f}ms {bench['stats']['median'] * 1e3:10.3f}ms {change:+7.1%}{flag}")
+    return regressions
+
+
+# ---------- 用例 ----------
+
+def bench_payload(suite: BenchmarkSuite) -> None:
+    messages = build_messages()
+    client = DashScopeAPIClient(api_key="bench", metrics=[])
+    suite.run("convert_message_to_dict", "payload",
+              lambda: [convert_message_to_dict(message) for message in messages],
+              inner=1_000, params={"messages": len(messages)})
+    suite.run("build_payload", "payload",
+              lambda: client._build_payload(messages, "qwen-turbo", stop=["###"], incremental_output=True),
+              inner=1_000, params={"messages": len(messages)})
+    client.close()
+
+
+def bench_sse(suite: BenchmarkSuite, stub: DashScopeStub) -> None:
+    stub.configure(ttft=0.0, tokens_per_second=0.0, reply_tokens=STREAM_TOKENS)
+    messages = [HumanMessage(content="你好")]
+    client = DashScopeAPIClient(api_key="bench", api_url=stub.url, metrics=[])
+    for incremental in (True, False):
+        suite.run(f"call_api_stream[incremental={incremental}]", "sse",
+                  lambda: list(client.call_api_stream(messages, "qwen-turbo", max_tokens=None,
+                                                      incremental_output=incremental)),
+                  params={"tokens": STREAM_TOKENS, "incremental": incremental})
+    client.close()
+
+    async def run_async() -> None:
+        aclient = DashScopeAPIClient(api_key="bench", api_url=stub.url, metrics=[])
+
+        async def consume() -> None:
+            async for _ in aclient.call_api_stream_async(messages, "qwen-turbo", max_tokens=None):
+                pass
+
+        await suite.arun("call_api_stream_async", "sse", consume, params={"tokens": STREAM_TOKENS})
+        await aclient.aclose()
+
+    asyncio.run(run_async())
+
+
+def bench_chunks(suite: BenchmarkSuite) -> None:
+    reads = split_reads(build_stream(CHUNK_TOKENS))
+    messages = [HumanMessage(content="你好")]
+
+    async def from_memory(*args: Any, **kwargs: Any) -> AsyncIterator[str]:
+        decoder = DashScopeStreamDecoder(incremental=True)
+        for raw in reads:
+            for chunk in decoder.feed(raw):
+                yield chunk
+        for chunk in decoder.flush():
+            yield chunk
+
+    async def run_async() -> None:
+        for coalesce in (0, 32):
+            model = CustomChatModel(api_key="bench", metrics_sinks=[], stream_coalesce_chars=coalesce)
+            # 仅替换网络层，保留合并窗口与对象构造的开销
+            model._api_client.call_api_stream_async = from_memory
+
+            async def consume() -> None:
+                async for _ in model._astream(messages):
+                    pass
+
+            await suite.arun(f"astream_chunks[coalesce={coalesce}]", "chunks", consume,
+                             params={"tokens": CHUNK_TOKENS, "coalesce_chars": coalesce})
+
+    asyncio.run(run_async())
+
+
+def bench_end_to_end(suite: BenchmarkSuite, stub: DashScopeStub) -> None:
+    stub.configure(ttft=0.0, tokens_per_second=0.0, reply_tokens=E2E_TOKENS)
+
+    async def run_async() -> None:
+        model = CustomChatModel(api_key="bench", api_url=stub.url, metrics_sinks=[], pool_maxsize=max(CONCURRENCY))
+
+        async def invoke() -> None:
+            await model.ainvoke("你好")
+
+        async def stream() -> None:
+            async for _ in model.astream("你好"):
+                pass
+
+        for mode, call in (("ainvoke", invoke), ("astream", stream)):
+            for concurrency in CONCURRENCY:
+                async def batch(call: Callable[[], Awaitable[None]] = call, concurrency: int = concurrency) -> None:
+                    await asyncio.gather(*[call() for _ in range(concurrency)])
+
+                await suite.arun(
+                    f"{mode}[concurrency={concurrency}]", "end_to_end", batch,
+                    params={"concurrency": concurrency, "tokens": E2E_TOKENS},
+                    extra=lambda samples, concurrency=concurrency: {
+                        "requests_per_second": concurrency / statistics.median(samples)
+                    },
+                )
+        await model.aclose()
+
+    asyncio.run(run_async())
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="模型客户端热路径基准套件")
+    parser.add_argument("--output", help=f"结果JSON路径，默认写入 {DEFAULT_OUTPUT_DIR}/ 下带时间戳的文件")
+    parser.add_argument("--compare", help="基线结果JSON路径")
+    parser.add_argument("--max-regression", type=float, default=0.15, help="中位数允许的最大变慢比例")
+    parser.add_argument("--rounds", type=int, default=5, help="每个用例的测量轮数")
+    parser.add_argument("--only", nargs="*", help="只运行名称包含这些子串的用例")
+    args = parser.parse_args(argv)
+
+    suite = BenchmarkSuite(rounds=args.rounds, only=args.only)
+    bench_payload(suite)
+    bench_chunks(suite)
+    with DashScopeStub(StubConfig()) as stub:
+        bench_sse(suite, stub)
+        bench_end_to_end(suite, stub)
+
+    result = suite.to_json()
+    output = args.output
+    if output is None:
+        stamp = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(DEFAULT_OUTPUT_DIR, f"client_hotpaths-{stamp}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存: {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(result, baseline, args.max_regression)
+        if regressions:
+            print(f"\n{len(regressions)} 个用例超过回归阈值 {args.max_regression:.0%}: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+匹配输出格式对比：要求模型逐字返回段落原文（text）与只返回段落编号（indices）
+
+标注集为 resources/test-report/match-labels.json（要点取自 report-error.txt 列出的错误）。
+离线运行时按标注答案估算两种格式的输出token（约一字一token）；
+设置 DASHSCOPE_API_KEY 并加 --live 时，用 CustomChatModel 实际调用两种提示词，
+比较上游返回的输出token、耗时以及相对标注的精确率/召回率，--record 把模型回答保存为JSON；
+--replies 对已保存的回答离线计算精确率/召回率，不调用模型。
+逐字输出的结果通过段落原文包含关系映射回编号后再计算准确率。
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_match_output
+    python -m appserver.benchmarks.bench_match_output --live --record replies.json
+    python -m appserver.benchmarks.bench_match_output --replies replies.json
+"""
+
+import argparse
+import json
+import os
+import re
+import time
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+LABELS = os.path.join("resources", "test-report", "match-labels.json")
+FORMATS = ("text", "indices")
+
+
+def load_labels(path: str) -> Tuple[str, Dict[str, Set[int]]]:
+    """返回 (报告路径, 要点到段落序号（从0开始）的映射)"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    report = os.path.join(os.path.dirname(path), data["report"])
+    return report, {point: {n - 1 for n in numbers} for point, numbers in data["points"].items()}
+
+
+def _squash(text: str) -> str:
+    return re.sub(r"[\s*|]+", "", text)
+
+
+def text_to_indices(output: str, paragraphs: Sequence[str]) -> Set[int]:
+    """把逐字输出映射回段落序号：段落原文（去空白与表格符号）出现在输出中即视为命中"""
+    squashed = _squash(output)
+    return {i for i, para in enumerate(paragraphs) if len(_squash(para)) >= 4 and _squash(para) in squashed}
+
+
+def score(predicted: Set[int], gold: Set[int]) -> Tuple[int, int, int]:
+    """返回 (命中数, 预测数, 标注数)"""
+    return len(predicted & gold), len(predicted), len(gold)
+
+
+def predict(output: str, content: str, paragraphs: Sequence[str]) -> Set[int]:
+    """把某种格式的模型回答转换为段落序号，编号无法解析时视为没有命中"""
+    if output == "text":
+        return text_to_indices(content, paragraphs)
+    from appserver.service.new_review_service import parse_match_indices
+
+    try:
+        return set(parse_match_indices(content, range(len(paragraphs))))
+    except ValueError:
+        return set()
+
+
+def evaluate(replies: Dict[str, Dict[str, str]], labels: Dict[str, Set[int]], paragraphs: Sequence[str]) -> None:
+    """按标注计算每个要点与整体的精确率/召回率"""
+    counts: Dict[str, List[Tuple[int, int, int]]] = {output: [] for output in FORMATS}
+    print(f"\n{'review point':<24} {'text hit/pred/gold':>20} {'indices hit/pred/gold':>22}")
+    for point, gold in labels.items():
+        row = []
+        for output in FORMATS:
+            counts[output].append(score(predict(output, replies[point][output], paragraphs), gold))
+            row.append("/".join(map(str, counts[output][-1])))
+        print(f"{point:<24} {row[0]:>20} {row[1]:>22}")
+    print()
+    for output in FORMATS:
+        report_accuracy(output, counts[output])
+
+
+def report_accuracy(name: str, counts: List[Tuple[int, int, int]]) -> None:
+    hit = sum(c[0] for c in counts)
+    predicted = sum(c[1] for c in counts)
+    gold = sum(c[2] for c in counts)
+    precision = hit / predicted if predicted else 0.0
+    recall = hit / gold if gold else 0.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    print(f"{name:<8} precision {precision:6.1%}  recall {recall:6.1%}  f1 {f1:6.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="匹配输出格式对比")
+    parser.add_argument("--labels", default=LABELS)
+    parser.add_argument("--live", action="store_true", help="实际调用模型（需要 DASHSCOPE_API_KEY）")
+    parser.add_argument("--record", help="--live 时把两种格式的模型回答保存到该JSON文件")
+    parser.add_argument("--replies", help="对已保存的回答离线计算精确率/召回率")
+    args = parser.parse_args()
+
+    if not args.live:
+        # 评审服务在导入时检查密钥；离线对比不会调用模型
+        os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+    from appserver.service.new_review_service import build_match_messages, extract_paragraphs, parse_match_indices
+
+    report, labels = load_labels(args.labels)
+    paragraphs = extract_paragraphs(report)
+    allowed = range(len(paragraphs))
+    print(f"== {report}: {len(paragraphs)} paragraphs, {len(labels)} labelled review points ==")
+
+    print(f"\n{'review point':<24} {'text':>8} {'indices':>8}   (estimated output tokens for the labelled answer)")
+    text_total = index_total = 0
+    for point, gold in labels.items():
+        text_tokens = len("\n".join(paragraphs[i] for i in sorted(gold)))
+        answer = json.dumps([i + 1 for i in sorted(gold)])
+        assert set(parse_match_indices(answer, allowed)) == gold
+        text_total += text_tokens
+        index_total += len(answer)
+        print(f"{point:<24} {text_tokens:8d} {len(answer):8d}")
+    print(f"{'total':<24} {text_total:8d} {index_total:8d}   {1 - index_total / text_total:.1%} fewer")
+
+    replies: Optional[Dict[str, Dict[str, str]]] = None
+    if args.replies:
+        with open(args.replies, encoding="utf-8") as f:
+            replies = json.load(f)["replies"]
+        print(f"\n== recorded replies: {args.replies} ==")
+
+    if args.live:
+        from appserver.models.new_model import CustomChatModel
+
+        model = CustomChatModel(temperature=0.3, max_tokens=512)
+        replies = {point: {} for point in labels}
+        usage = {output: 0 for output in FORMATS}
+        latency = {output: 0.0 for output in FORMATS}
+        for point in labels:
+            for output in FORMATS:
+                start = time.perf_counter()
+                message = model.invoke(build_match_messages(paragraphs, point, output=output))
+                latency[output] += time.perf_counter() - start
+                usage[output] += (message.usage_metadata or {}).get("output_tokens", 0)
+                replies[point][output] = str(message.content)
+
+        print(f"\n{'format':<8} {'output tokens':>14} {'latency':>10}")
+        for output in FORMATS:
+            print(f"{output:<8} {usage[output]:14d} {latency[output]:9.2f}s")
+        if args.record:
+            with open(args.record, "w", encoding="utf-8") as f:
+                json.dump({"report": os.path.basename(report), "model": model.model_name, "replies": replies},
+                          f, ensure_ascii=False, indent=2)
+
+    if replies is not None:
+        evaluate(replies, labels, paragraphs)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+段落检索基准：在测试报告上比较“全部段落拼入提示词”与“检索候选段落”的匹配阶段输入token与耗时
+
+输入token按约一字一token估算（与调用埋点的估算方式一致）；检索耗时包含建索引与批量检索。
+匹配提示词按评审流程实际使用的输出方式（REVIEW_MATCH_OUTPUT）构造，输出方式会出现在结果表头中，
+不同输出方式的提示词长度不同，对比历史数据时需要确认二者一致。
+设置 DASHSCOPE_API_KEY 并加 --live 时，另外用 CustomChatModel 实际调用匹配提示词，比较端到端耗时。
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_paragraph_retrieval
+    python -m appserver.benchmarks.bench_paragraph_retrieval --live
+    python -m appserver.benchmarks.bench_paragraph_retrieval --embeddings
+"""
+
+import argparse
+import os
+import statistics
+import time
+from typing import Any, List
+
+REPORT = os.path.join("resources", "test-report", "report.md")
+REVIEW_POINTS = ["格式规范", "内容完整性", "逻辑性", "数据准确性", "测试通过率", "严重缺陷修复情况", "测试环境配置", "遗留问题列表"]
+ROUNDS = 20
+
+
+def prompt_tokens(messages: List[Any]) -> int:
+    return sum(len(str(message.content)) for message in messages)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="段落检索基准")
+    parser.add_argument("--report", default=REPORT)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--embeddings", action="store_true", help="融合本地向量模型（需要 sentence-transformers）")
+    parser.add_argument("--live", action="store_true", help="实际调用模型比较匹配阶段耗时（需要 DASHSCOPE_API_KEY）")
+    args = parser.parse_args()
+
+    if not args.live:
+        # 评审服务在导入时检查密钥；离线基准不会调用模型
+        os.environ.setdefault("DASHSCOPE_API_KEY", "bench")
+    from appserver.service.new_review_service import (
+        REVIEW_MATCH_OUTPUT,
+        build_batch_match_messages,
+        build_match_messages,
+        extract_paragraphs,
+    )
+    from appserver.service.paragraph_retriever import ParagraphRetriever
+
+    paragraphs = extract_paragraphs(args.report)
+    retriever = ParagraphRetriever(use_embeddings=args.embeddings, top_k=args.top_k)
+    print(f"== {args.report}: {len(paragraphs)} paragraphs, {len(REVIEW_POINTS)} review points ==")
+    print(f"retriever: {retriever.stats()}")
+    print(f"match output: {REVIEW_MATCH_OUTPUT}")
+
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        results = retriever.build(paragraphs).search_many(REVIEW_POINTS)
+        samples.append(time.perf_counter() - start)
+    print(f"index + search: median {statistics.median(samples) * 1e3:.2f} ms per document")
+
+    full_total = retrieved_total = skipped = 0
+    prompts = []
+    print(f"\n{'review point':<16} {'full':>8} {'retrieved':>10} {'saved':>8}  llm")
+    for point, result in zip(REVIEW_POINTS, results):
+        full = build_match_messages(paragraphs, point, output=REVIEW_MATCH_OUTPUT)
+        if result.confident:
+            retrieved, tokens = None, 0
+            skipped += 1
+        elif not result.candidates:
+            # 没有候选的要点由评审流程在完整文档上匹配
+            retrieved, tokens = full, prompt_tokens(full)
+        else:
+            candidates = sorted(result.candidates, key=lambda c: c.index)
+            retrieved = build_match_messages(
+                [c.text for c in candidates], point, [c.index for c in candidates], output=REVIEW_MATCH_OUTPUT
+            )
+            tokens = prompt_tokens(retrieved)
+        full_total += prompt_tokens(full)
+        retrieved_total += tokens
+        prompts.append((full, retrieved))
+        saved = 1 - tokens / prompt_tokens(full)
+        print(f"{point:<16} {prompt_tokens(full):8d} {tokens:10d} {saved:8.1%}  {'skip' if retrieved is None else 'call'}")
+    print(f"{'total':<16} {full_total:8d} {retrieved_total:10d} {1 - retrieved_total / full_total:8.1%}"
+          f"  {skipped}/{len(REVIEW_POINTS)} skipped")
+
+    # 批量匹配：文档（或候选并集）只发送一次
+    pending = [point for point, result in zip(REVIEW_POINTS, results) if not result.confident]
+    union = sorted({c.index for point, result in zip(REVIEW_POINTS, results) if not result.confident for c in result.candidates})
+    batch_full = prompt_tokens(build_batch_match_messages(paragraphs, REVIEW_POINTS))
+    batch_retrieved = prompt_tokens(build_batch_match_messages([paragraphs[i] for i in union], pending, union))
+    print(f"{'batch':<16} {batch_full:8d} {batch_retrieved:10d} {1 - batch_retrieved / full_total:8.1%}  1 call")
+
+    if args.live:
+        from appserver.models.new_model import CustomChatModel
+
+        model = CustomChatModel(temperature=0.3, max_tokens=512)
+        full_latency, retrieved_latency = [], []
+        for full, retrieved in prompts:
+            start = time.perf_counter()
+            model.invoke(full)
+            full_latency.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            if retrieved is not None:
+                model.invoke(retrieved)
+            retrieved_latency.append(time.perf_counter() - start)
+        print(f"\nmatch latency (sum over points): full {sum(full_latency):.2f} s, retrieved {sum(retrieved_latency):.2f} s")
+
+
+if __name__ == "__main__":
+    main()
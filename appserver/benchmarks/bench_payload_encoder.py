@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+请求体编码微基准：长系统提示词 + 多轮历史，比较每次整体 json.dumps 与 PayloadEncoder
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_payload_encoder
+"""
+
+import json
+import time
+from typing import Any, Callable, Dict, List
+
+from appserver.models.payload_encoder import JSONCodec, OrjsonCodec, PayloadEncoder, orjson
+
+SYSTEM_PROMPT_CHARS = 8_000
+TURNS = 20
+REQUESTS = 2_000
+ROUNDS = 3
+
+
+def build_payloads() -> List[Dict[str, Any]]:
+    """构造一组共享系统提示词与对话前缀的payload，模拟同一会话的连续请求"""
+    system = {"role": "system", "content": "你是一名专业的文档审核助手。" * (SYSTEM_PROMPT_CHARS // 14)}
+    history = [system]
+    for turn in range(TURNS):
+        history.append({"role": "user", "content": f"第{turn}轮问题：" + "请检查这一段内容。" * 20})
+        history.append({"role": "assistant", "content": f"第{turn}轮回答：" + "该段内容符合要求。" * 20})
+    payloads = []
+    for idx in range(REQUESTS):
+        messages = history + [{"role": "user", "content": f"新问题{idx}"}]
+        payloads.append({
+            "model": "qwen-turbo",
+            "input": {"messages": messages},
+            "parameters": {"result_format": "message", "temperature": 0.7, "max_tokens": 2000},
+        })
+    return payloads
+
+
+def bench(name: str, encode: Callable[[Dict[str, Any]], bytes], payloads: List[Dict[str, Any]]) -> None:
+    best = float("inf")
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        for payload in payloads:
+            encode(payload)
+        best = min(best, time.perf_counter() - start)
+    print(f"{name:<36} {best * 1000:8.2f} ms  {best / len(payloads) * 1e6:8.1f} us/request")
+
+
+def main() -> None:
+    payloads = build_payloads()
+    size = len(JSONCodec().dumps(payloads[0])) / 1024
+    print(f"== {REQUESTS} requests, {2 * TURNS + 2} messages, {size:.0f} KiB body ==")
+    bench("json.dumps (requests json=)", lambda p: json.dumps(p).encode("utf-8"), payloads)
+    bench("PayloadEncoder(json)", PayloadEncoder(JSONCodec()).encode, payloads)
+    if orjson is not None:
+        bench("orjson.dumps", orjson.dumps, payloads)
+        bench("PayloadEncoder(orjson)", PayloadEncoder(OrjsonCodec()).encode, payloads)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+SSE解析微基准：比较逐行解码的旧实现与字节级增量解析器在10k token流上的吞吐
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_sse_parser
+"""
+
+import json
+import time
+from typing import Callable, Dict, Iterable, List
+
+from appserver.models.sse_parser import DashScopeStreamDecoder
+
+TOKENS = 10_000
+READ_SIZE = 1024
+ROUNDS = 15
+
+
+def build_stream(tokens: int = TOKENS, incremental: bool = True) -> bytes:
+    """构造一个包含 tokens 帧的DashScope SSE响应体"""
+    frames = []
+    accumulated = ""
+    for idx in range(tokens):
+        piece = f"词{idx % 10}"
+        accumulated += piece
+        content = piece if incremental else accumulated
+        chunk = {
+            "output": {"choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "null"}]},
+            "usage": {"input_tokens": 12, "output_tokens": idx + 1},
+            "request_id": "bench",
+        }
+        frames.append(f"id:{idx}\nevent:result\n:HTTP_STATUS/200\ndata:{json.dumps(chunk, ensure_ascii=False)}\n\n")
+    return "".join(frames).encode("utf-8")
+
+
+def split_reads(body: bytes, size: int = READ_SIZE) -> List[bytes]:
+    """按固定大小切分，模拟网络读取"""
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def legacy_parse(reads: Iterable[bytes], incremental: bool = True) -> List[str]:
+    """旧实现：按行解码为str，逐帧json.loads，并通过切片累计全文计算增量"""
+    deltas = []
+    pending = b""
+    accumulated_content = ""
+    for raw in reads:
+        pending += raw
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            line = line.decode("utf-8").strip()
+            if not line.startswith("data:"):
+                continue
+            chunk_data = json.loads(line[5:])
+            current = chunk_data["output"]["choices"][0]["message"]["content"]
+            if incremental:
+                deltas.append(current)
+            elif len(current) > len(accumulated_content):
+                deltas.append(current[len(accumulated_content):])
+                accumulated_content = current
+    return deltas
+
+
+def decoder_parse(reads: Iterable[bytes], incremental: bool = True) -> List[str]:
+    """新实现：DashScopeStreamDecoder"""
+    decoder = DashScopeStreamDecoder(incremental=incremental)
+    deltas = []
+    for raw in reads:
+        deltas.extend(decoder.feed(raw))
+    deltas.extend(decoder.flush())
+    return deltas
+
+
+def bench(funcs: Dict[str, Callable[..., List[str]]], reads: List[bytes], incremental: bool) -> Dict[str, float]:
+    """各实现交替运行 ROUNDS 轮并取最快一轮，避免机器负载漂移只影响其中一个实现"""
+    best = {name: float("inf") for name in funcs}
+    for _ in range(ROUNDS):
+        for name, func in funcs.items():
+            start = time.perf_counter()
+            deltas = func(reads, incremental)
+            best[name] = min(best[name], time.perf_counter() - start)
+            assert len(deltas) == TOKENS
+    mb = sum(len(r) for r in reads) / 1024 / 1024
+    for name, elapsed in best.items():
+        print(f"{name:<32} {elapsed * 1000:8.2f} ms  {TOKENS / elapsed:12,.0f} tokens/s  {mb / elapsed:8.1f} MB/s")
+    return best
+
+
+def main() -> None:
+    for incremental in (True, False):
+        mode = "incremental" if incremental else "cumulative"
+        reads = split_reads(build_stream(incremental=incremental))
+        print(f"== {TOKENS} tokens, {mode} mode, {len(reads)} reads ==")
+        bench({"legacy line parser": legacy_parse, "DashScopeStreamDecoder": decoder_parse}, reads, incremental)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+流式输出开销微基准：比较 stream（逐增量构造LangChain对象）、stream 加合并窗口
+与 stream_text（直接产出str）在10k token流上的每秒产出量
+
+上游用预先构造好的SSE响应体代替，经 DashScopeStreamDecoder 解析，不访问网络。
+
+运行方式（项目根目录下）：
+    python -m appserver.benchmarks.bench_stream_text
+"""
+
+import time
+from typing import Any, Callable, Iterator, List
+
+from appserver.benchmarks.bench_sse_parser import build_stream, split_reads
+from appserver.models.new_model import CustomChatModel
+from appserver.models.sse_parser import DashScopeStreamDecoder
+
+TOKENS = 10_000
+ROUNDS = 5
+
+
+def make_model(reads: List[bytes], **kwargs: Any) -> CustomChatModel:
+    """构造一个从内存SSE响应体读取增量的模型"""
+    model = CustomChatModel(api_key="bench", **kwargs)
+
+    def call_api_stream(*args: Any, **kw: Any) -> Iterator[str]:
+        decoder = DashScopeStreamDecoder(incremental=True)
+        for raw in reads:
+            yield from decoder.feed(raw)
+        yield from decoder.flush()
+
+    # 仅替换网络层，保留缓存、合并窗口与对象构造等模型自身的开销
+    model._api_client.call_api_stream = call_api_stream
+    return model
+
+
+def bench(name: str, produce: Callable[[], List[Any]]) -> None:
+    best = float("inf")
+    count = 0
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        items = produce()
+        best = min(best, time.perf_counter() - start)
+        count = len(items)
+    print(f"{name:<36} {best * 1000:8.2f} ms  {count:6d} items  {TOKENS / best:12,.0f} tokens/s  {count / best:12,.0f} items/s")
+
+
+def main() -> None:
+    reads = split_reads(build_stream(TOKENS))
+    plain = make_model(reads)
+    coalesced = make_model(reads, stream_coalesce_chars=32)
+    print(f"== {TOKENS} tokens ==")
+    bench("stream (ChatGenerationChunk)", lambda: list(plain.stream("hi")))
+    bench("stream, coalesce 32 chars", lambda: list(coalesced.stream("hi")))
+    bench("stream_text (str)", lambda: list(plain.stream_text("hi")))
+
+
+if __name__ == "__main__":
+    main()
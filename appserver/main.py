@@ -1,13 +1,32 @@
 from typing import Union
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 
 from appserver.api import review_api
+from appserver.models.metrics import PrometheusExporter
+from appserver.models.registry import model_registry
+from appserver.service.new_review_service import get_retriever
 
 app = FastAPI()
 # 评审api
 app.include_router(review_api.router)
 
+@app.on_event("startup")
+def build_retriever():
+    """启动时创建共享的段落检索器，开启向量检索时模型在这里加载而不是在首个请求中"""
+    get_retriever()
+
+@app.on_event("shutdown")
+async def close_models():
+    """关闭时释放共享模型实例的连接池：同步requests会话与服务事件循环上的aiohttp会话"""
+    await model_registry.aclose()
+
+@app.get("/metrics")
+def metrics():
+    """LLM调用埋点，Prometheus文本格式"""
+    exporter = PrometheusExporter()
+    return Response(content=exporter.render(), media_type=exporter.content_type)
+
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
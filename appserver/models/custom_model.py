@@ -4,19 +4,48 @@ from langchain_core.callbacks.manager import (
     AsyncCallbackManagerForLLMRun,
     CallbackManagerForLLMRun,
 )
+from langchain_core.language_models import LanguageModelInput
 from langchain_core.language_models.llms import LLM
 from langchain_core.messages import (
     AIMessage,
-    AIMessageChunk,
     BaseMessage,
     HumanMessage,
     SystemMessage,
+    get_buffer_string,
 )
-from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.outputs import ChatGeneration, ChatResult, GenerationChunk
+from langchain_core.prompt_values import ChatPromptValue, PromptValue
 from langchain_core.pydantic_v1 import Field, root_validator
 from langchain_core.utils import get_from_dict_or_env
 
-import requests
+# 兼容包内导入与在models目录下直接运行脚本两种方式
+try:
+    from .new_model import DashScopeAPIClient
+    from .payload_encoder import JSONCodec
+except ImportError:
+    from new_model import DashScopeAPIClient
+    from payload_encoder import JSONCodec
+
+
+class _ChatPrompt(str):
+    """
+    chat 模式的提示词：字符串内容即LLM基类拼接出的 "System: ...\nHuman: ..."（用于缓存键与回调），
+    同时携带原始消息，随提示词本身经 generate/stream 传到 _call/_stream，不依赖任何全局状态
+    """
+
+    messages: List[BaseMessage]
+
+    def __new__(cls, messages: List[BaseMessage]) -> "_ChatPrompt":
+        prompt = super().__new__(cls, get_buffer_string(messages))
+        prompt.messages = list(messages)
+        return prompt
+
+
+class _ChatPromptValue(ChatPromptValue):
+    """to_string 返回携带原始消息的 _ChatPrompt"""
+
+    def to_string(self) -> str:
+        return _ChatPrompt(self.messages)
 
 
 def _convert_message_to_dict(message: BaseMessage) -> dict:
@@ -77,7 +106,7 @@ class CustomDashScopeLLM(LLM):
     "模型名称，如 qwen-turbo, qwen-max 等"
     
     mode: Literal["completion", "chat"] = "chat"
-    "运行模式：completion(补全) 或 chat(聊天)"
+    "运行模式：completion 把提示词作为单条用户消息发送；chat 保留消息列表中的角色（system/user/assistant）"
     
     # 生成参数
     temperature: float = 0.7
@@ -107,61 +136,94 @@ class CustomDashScopeLLM(LLM):
         )
         return values
     
+    # 连接池配置，见 DashScopeAPIClient 的参数
+    pool_connections: int = 10
+    pool_maxsize: int = 100
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+    warmup: bool = False
+    
+    coalesce_requests: bool = False
+    "是否合并相同payload的并发请求"
+    
+    rate_limit: Optional[Dict[str, Any]] = None
+    "限流配置，见 RateLimiter 的参数"
+    
+    hedging: Optional[Dict[str, Any]] = None
+    "对冲请求配置，见 HedgingPolicy 的参数"
+    
+    # 多端点配置：端点列表与路由参数，见 Endpoint 与 EndpointRouter
+    endpoints: Optional[List[Union[str, Dict[str, Any]]]] = None
+    routing: Optional[Dict[str, Any]] = None
+    
+    metrics_sinks: Optional[List[Any]] = None
+    "调用埋点输出端，None表示写入进程级默认注册表"
+    
+    json_codec: Optional[JSONCodec] = None
+    "请求体与响应的JSON编解码器，None表示自动选择（安装了orjson时使用orjson）"
+    
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        # 共享连接池的API客户端：同步请求复用requests.Session，异步请求复用aiohttp.ClientSession；
+        # 连接池、合并、限流、对冲、多端点与编解码配置与 CustomChatModel 一致
+        self._client = DashScopeAPIClient(
+            api_key=self.dashscope_api_key,
+            api_url=self.api_url,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            keepalive_timeout=self.keepalive_timeout,
+            dns_cache_ttl=self.dns_cache_ttl,
+            warmup=self.warmup,
+            coalesce=self.coalesce_requests,
+            rate_limit=self.rate_limit,
+            hedging=self.hedging,
+            endpoints=self.endpoints,
+            routing=self.routing,
+            metrics=self.metrics_sinks,
+            json_codec=self.json_codec
+        )
+    
+    async def aclose(self) -> None:
+        """释放API客户端持有的连接池"""
+        await self._client.aclose()
+    
     @property
     def _llm_type(self) -> str:
         """返回LLM类型"""
         return "dashscope"
     
-    def _call(
-        self,
-        prompt: Union[str, BaseMessage],
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> str:
-        prompt_str = ""
-        messages: list[BaseMessage] = []
-        if isinstance(prompt, str):
-            prompt_str = prompt
-            messages = [HumanMessage(content=prompt)]
-        elif isinstance(prompt, BaseMessage):
-            prompt_str = str(prompt.content)
-            messages = [prompt]
-        else:
-            raise ValueError(f"prompt 必须为 str 或 BaseMessage, 当前为: {type(prompt)}")
-        if self.mode == "chat":
-            result = self._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
-            return result.generations[0].message.content
-        else:
-            if self.streaming:
-                # 只取第一个chunk内容（因为目前实现只yield一次）
-                chunk = next(self._stream(prompt_str, stop=stop, run_manager=run_manager, **kwargs))
-                return chunk.message.content
-            # 构造payload
-            dashscope_payload = {
-                "model": self.model_name,
-                "input": {
-                    "messages": [{"role": "user", "content": prompt_str}]
-                },
-                "parameters": {
-                    "result_format": "message"
-                }
-            }
-            if self.request_params:
-                dashscope_payload["parameters"].update(self.request_params)
-            dashscope_payload["parameters"].update(kwargs)
-            response = self._call_dashscope(payload=dashscope_payload)
-            return response["output"]["choices"][0]["message"]["content"]
-    
-    def _generate(
-        self,
-        messages: list,
-        stop: Optional[List[str]] = None,
-        run_manager: Optional[CallbackManagerForLLMRun] = None,
-        **kwargs: Any,
-    ) -> ChatResult:
-        # 兼容字符串、嵌套字符串等情况，全部转为BaseMessage
-        normalized_messages: list[BaseMessage] = []
+    def _convert_input(self, model_input: LanguageModelInput) -> PromptValue:
+        """
+        转换调用输入；chat 模式下让提示词携带消息列表的原始消息
+        
+        LLM 基类的 invoke/ainvoke/stream/astream 会把消息列表拼成 "System: ...\nHuman: ..." 字符串
+        再交给 _call/_stream。chat 模式下拼出的字符串是 _ChatPrompt，原始消息随它一起传递，
+        由 _normalize_messages 还原为带角色的消息；缓存命中、调用失败或相同提示词并发时都不会残留或串用。
+        """
+        prompt_value = super()._convert_input(model_input)
+        if self.mode == "chat" and isinstance(prompt_value, ChatPromptValue):
+            return _ChatPromptValue(messages=prompt_value.messages)
+        return prompt_value
+    
+    def _normalize_messages(self, messages: Union[str, BaseMessage, list]) -> List[BaseMessage]:
+        """
+        将字符串、消息对象或（嵌套）列表统一转为BaseMessage列表
+        
+        Args:
+            messages: 提示词、消息对象或消息列表
+            
+        Returns:
+            List[BaseMessage]: 消息列表
+        """
+        if isinstance(messages, _ChatPrompt):
+            return list(messages.messages)
+        if isinstance(messages, str):
+            return [HumanMessage(content=messages)]
+        if isinstance(messages, BaseMessage):
+            return [messages]
+        if not isinstance(messages, list):
+            raise ValueError(f"prompt 必须为 str 或 BaseMessage, 当前为: {type(messages)}")
+        normalized_messages: List[BaseMessage] = []
         for msg in messages:
             if isinstance(msg, BaseMessage):
                 normalized_messages.append(msg)
@@ -178,136 +240,153 @@ class CustomDashScopeLLM(LLM):
                         raise ValueError(f"不支持的消息类型: {submsg}")
             else:
                 raise ValueError(f"不支持的消息类型: {msg}")
-        if self.streaming:
-            return self._generate_stream(normalized_messages, stop=stop, run_manager=run_manager, **kwargs)
-        # DashScope官方要求：messages放在input字段下，参数放在parameters字段下
-        dashscope_payload = {
-            "model": self.model_name,
-            "input": {
-                "messages": [_convert_message_to_dict(msg) for msg in normalized_messages]
-            },
-            "parameters": {
-                "result_format": "message"
-            }
-        }
+        return normalized_messages
+    
+    def _request_kwargs(self, stop: Optional[List[str]], **kwargs: Any) -> Dict[str, Any]:
+        """
+        组装传给API客户端的参数
+        
+        completion 与 chat 两种模式都以messages形式请求DashScope，
+        区别只在于输入：completion 模式的提示词作为单条用户消息发送，chat 模式保留原始消息的角色
+        （见 _convert_input）。
+        """
+        parameters: Dict[str, Any] = {"top_p": self.top_p}
         if self.request_params:
-            dashscope_payload["parameters"].update(self.request_params)
-        dashscope_payload["parameters"].update(kwargs)
-        response = self._call_dashscope(payload=dashscope_payload)
-        message = _convert_dict_to_message({
-            "role": "assistant",
-            "content": response["output"]["choices"][0]["message"]["content"],
-        })
-        return ChatResult(generations=[ChatGeneration(message=message)])
+            parameters.update(self.request_params)
+        parameters.update(kwargs)
+        return {
+            "model_name": self.model_name,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stop": stop,
+            **parameters,
+        }
     
-    def _stream(
+    def _call(
         self,
-        prompt: str,
+        prompt: Union[str, BaseMessage],
         stop: Optional[List[str]] = None,
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
-    ) -> Iterator[ChatGenerationChunk]:
-        # 构造payload
-        dashscope_payload = {
-            "model": self.model_name,
-            "input": {
-                "messages": [{"role": "user", "content": prompt}]
-            },
-            "parameters": {
-                "result_format": "message"
-            }
-        }
-        if self.request_params:
-            dashscope_payload["parameters"].update(self.request_params)
-        dashscope_payload["parameters"].update(kwargs)
-        response = self._call_dashscope(payload=dashscope_payload)
-        content = response["output"]["choices"][0]["message"]["content"]
-        yield ChatGenerationChunk(message=AIMessageChunk(content=content))
+    ) -> str:
+        """
+        同步调用；streaming=True 时逐块读取SSE并拼接，期间回调每个token
+        """
+        if self.streaming:
+            return "".join(
+                chunk.text for chunk in self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
+            )
+        return self._client.call_api(self._normalize_messages(prompt), **self._request_kwargs(stop, **kwargs))
     
-    def _generate_stream(
+    async def _acall(
         self,
-        messages: List[BaseMessage],
+        prompt: Union[str, BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> str:
+        """
+        原生异步调用，基于共享的aiohttp会话，不占用线程池
+        """
+        if self.streaming:
+            chunks = []
+            async for chunk in self._astream(prompt, stop=stop, run_manager=run_manager, **kwargs):
+                chunks.append(chunk.text)
+            return "".join(chunks)
+        return await self._client.call_api_async(
+            self._normalize_messages(prompt), **self._request_kwargs(stop, **kwargs)
+        )
+    
+    def _stream(
+        self,
+        prompt: Union[str, BaseMessage],
         stop: Optional[List[str]] = None,
         run_manager: Optional[CallbackManagerForLLMRun] = None,
         **kwargs: Any,
-    ) -> ChatResult:
+    ) -> Iterator[GenerationChunk]:
         """
-        流式生成聊天回复
+        流式生成：按SSE帧逐个产出文本增量
         
         Args:
-            messages: 消息列表
+            prompt: 提示词或消息
             stop: 停止词列表
             run_manager: 回调管理器
             **kwargs: 其他参数
             
-        Returns:
-            ChatResult: 聊天结果
+        Yields:
+            GenerationChunk: 文本增量
         """
-        normalized_messages: list[BaseMessage] = []
-        for msg in messages:
-            if isinstance(msg, BaseMessage):
-                normalized_messages.append(msg)
-            elif isinstance(msg, str):
-                normalized_messages.append(HumanMessage(content=msg))
-            elif isinstance(msg, list):
-                for submsg in msg:
-                    if isinstance(submsg, BaseMessage):
-                        normalized_messages.append(submsg)
-                    elif isinstance(submsg, str):
-                        normalized_messages.append(HumanMessage(content=submsg))
-                    else:
-                        raise ValueError(f"不支持的消息类型: {submsg}")
-            else:
-                raise ValueError(f"不支持的消息类型: {msg}")
-        dashscope_payload = {
-            "model": self.model_name,
-            "input": {
-                "messages": [_convert_message_to_dict(msg) for msg in normalized_messages]
-            },
-            "parameters": {
-                "result_format": "message"
-            }
-        }
-        if self.request_params:
-            dashscope_payload["parameters"].update(self.request_params)
-        dashscope_payload["parameters"].update(kwargs)
-        response = self._call_dashscope(payload=dashscope_payload)
-        message = _convert_dict_to_message({
-            "role": "assistant",
-            "content": response["output"]["choices"][0]["message"]["content"],
-        })
-        return ChatResult(generations=[ChatGeneration(message=message)])
+        for delta in self._client.call_api_stream(
+            self._normalize_messages(prompt), **self._request_kwargs(stop, **kwargs)
+        ):
+            chunk = GenerationChunk(text=delta)
+            if run_manager:
+                run_manager.on_llm_new_token(delta, chunk=chunk)
+            yield chunk
     
-    def _make_request(self, payload: dict) -> dict:
+    async def _astream(
+        self,
+        prompt: Union[str, BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[GenerationChunk]:
         """
-        发送HTTP请求到DashScope API
+        原生异步流式生成
         
         Args:
-            payload: 请求payload
+            prompt: 提示词或消息
+            stop: 停止词列表
+            run_manager: 回调管理器
+            **kwargs: 其他参数
             
-        Returns:
-            dict: API响应
+        Yields:
+            GenerationChunk: 文本增量
         """
-        headers = {
-            "Authorization": f"Bearer {self.dashscope_api_key}",
-            "Content-Type": "application/json"
-        }
-        response = requests.post(self.api_url, json=payload, headers=headers, timeout=60)
-        if response.status_code != 200:
-            raise ValueError(f"DashScope API错误: {response.text}")
-        return response.json()
-
-    def _call_dashscope(self, payload: dict) -> Any:
+        async for delta in self._client.call_api_stream_async(
+            self._normalize_messages(prompt), **self._request_kwargs(stop, **kwargs)
+        ):
+            chunk = GenerationChunk(text=delta)
+            if run_manager:
+                await run_manager.on_llm_new_token(delta, chunk=chunk)
+            yield chunk
+    
+    def _generate_chat(
+        self,
+        messages: list,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[CallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
         """
-        调用DashScope API的通用方法
+        以消息列表生成聊天回复
         
         Args:
-            payload: 请求payload
+            messages: 消息列表，兼容字符串与嵌套列表
+            stop: 停止词列表
+            run_manager: 回调管理器
+            **kwargs: 其他参数
             
         Returns:
-            Any: API响应
+            ChatResult: 聊天结果
         """
-        return self._make_request(payload)
+        content = self._call(self._normalize_messages(messages), stop=stop, run_manager=run_manager, **kwargs)
+        message = _convert_dict_to_message({"role": "assistant", "content": content})
+        return ChatResult(generations=[ChatGeneration(message=message)])
+    
+    async def _agenerate_chat(
+        self,
+        messages: list,
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        """
+        异步版本的 _generate_chat
+        """
+        content = await self._acall(self._normalize_messages(messages), stop=stop, run_manager=run_manager, **kwargs)
+        message = _convert_dict_to_message({"role": "assistant", "content": content})
+        return ChatResult(generations=[ChatGeneration(message=message)])
 
 
 # 使用示例
@@ -333,11 +412,10 @@ if __name__ == "__main__":
     result = llm.invoke("请介绍一下你自己")
     print(result)
     
-    # 聊天对话
+    # 聊天对话：system 与 user 消息按各自的角色发送
     print("\n=== 聊天对话 ===")
     messages = [
         SystemMessage(content="你是一个专业的AI助手"),
         HumanMessage(content="你好，请用简洁的语言介绍一下你自己")
     ]
-    response = chat._generate(messages)
-    print(response.generations[0].message.content)
\ No newline at end of file
+    print(chat.invoke(messages))
\ No newline at end of file
@@ -0,0 +1,377 @@
+"""
+多端点故障转移与基于延迟的路由
+
+每个端点维护EWMA延迟与EWMA错误率，请求优先路由到最快的健康端点；
+连续失败的端点由熔断器摘除，冷却后放行一个半开探测请求，探测成功才恢复。
+端点可以是DashScope原生接口，也可以是OpenAI兼容网关。
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional, TypeVar, Union
+
+import aiohttp
+import requests
+
+try:
+    from .errors import APIStatusError
+    from .sse_parser import DashScopeStreamDecoder, OpenAIStreamDecoder
+except ImportError:
+    from errors import APIStatusError
+    from sse_parser import DashScopeStreamDecoder, OpenAIStreamDecoder
+
+T = TypeVar("T")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# 可以换端点重试的网络层异常
+_NETWORK_ERRORS = (requests.RequestException, aiohttp.ClientError, asyncio.TimeoutError, ConnectionError)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """判断异常是否应当换一个端点重试"""
+    if isinstance(exc, APIStatusError):
+        return exc.retryable
+    return isinstance(exc, _NETWORK_ERRORS)
+
+
+@dataclass
+class Endpoint:
+    """
+    一个上游端点
+
+    Attributes:
+        url: 请求地址
+        weight: 路由权重，越大越优先
+        protocol: "dashscope" 或 "openai"（OpenAI兼容的chat/completions接口）
+        api_key: 端点专用的API密钥，None表示使用客户端的密钥
+        name: 端点名称，用于统计，默认为url
+    """
+
+    url: str
+    weight: float = 1.0
+    protocol: str = "dashscope"
+    api_key: Optional[str] = None
+    name: Optional[str] = None
+
+    def __post_init__(self) -> None:
+        if self.protocol not in ("dashscope", "openai"):
+            raise ValueError(f"不支持的端点协议: {self.protocol}")
+        if self.name is None:
+            self.name = self.url
+
+    def build_body(self, payload: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        """
+        将DashScope格式的payload转换为该端点的请求体
+
+        Args:
+            payload: DashScope格式的payload
+            stream: 是否流式请求
+
+        Returns:
+            Dict: 请求体
+        """
+        if self.protocol == "dashscope":
+            return payload
+        parameters = payload.get("parameters", {})
+        body: Dict[str, Any] = {
+            "model": payload["model"],
+            "messages": payload["input"]["messages"],
+        }
+        for key in ("temperature", "max_tokens", "top_p", "stop", "seed"):
+            if parameters.get(key) is not None:
+                body[key] = parameters[key]
+        if stream:
+            body["stream"] = True
+            # 让上游在最后一帧返回用量，供调用埋点使用
+            body["stream_options"] = {"include_usage": True}
+        return body
+
+    def parse_response(self, response_data: Dict[str, Any]) -> str:
+        """从非流式响应中取出回复文本"""
+        if self.protocol == "dashscope":
+            return response_data["output"]["choices"][0]["message"]["content"]
+        return response_data["choices"][0]["message"]["content"]
+
+    def stream_decoder(self, incremental: bool = True) -> DashScopeStreamDecoder:
+        """返回该端点协议对应的流式解码器"""
+        if self.protocol == "dashscope":
+            return DashScopeStreamDecoder(incremental=incremental)
+        return OpenAIStreamDecoder()
+
+
+class EndpointState:
+    """端点的运行时统计与熔断状态"""
+
+    def __init__(self, endpoint: Endpoint):
+        self.endpoint = endpoint
+        self.ewma_latency: Optional[float] = None
+        self.ewma_error = 0.0
+        self.circuit = CLOSED
+        self.opened_at = 0.0
+        self.consecutive_failures = 0
+        self.probe_in_flight = False
+        self.requests = 0
+        self.failures = 0
+
+    def score(self, error_penalty: float) -> float:
+        """路由得分，越小越优先；尚无延迟样本的端点得分为0以便被探索"""
+        latency = self.ewma_latency if self.ewma_latency is not None else 0.0
+        return latency * (1.0 + error_penalty * self.ewma_error) / max(self.endpoint.weight, 1e-6)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "name": self.endpoint.name,
+            "circuit": self.circuit,
+            "ewma_latency": self.ewma_latency,
+            "ewma_error": self.ewma_error,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EndpointRouter:
+    """
+    按EWMA延迟与错误率选择端点，并在失败时依次转移到下一个端点
+    """
+
+    def __init__(
+        self,
+        endpoints: List[Endpoint],
+        alpha: float = 0.3,
+        error_penalty: float = 10.0,
+        failure_threshold: int = 3,
+        reset_timeout: float = 30.0,
+        retryable: Callable[[BaseException], bool] = is_retryable
+    ):
+        """
+        初始化路由器
+
+        Args:
+            endpoints: 端点列表（也可以是任何带 name 与 weight 属性的路由目标）
+            alpha: EWMA平滑系数，越大越看重最近的样本
+            error_penalty: 错误率对得分的放大系数
+            failure_threshold: 连续失败多少次后熔断
+            reset_timeout: 熔断后多久允许半开探测（秒）
+            retryable: 判断异常是否应当转移到下一个目标
+        """
+        if not endpoints:
+            raise ValueError("至少需要一个端点")
+        self.states = [EndpointState(endpoint) for endpoint in endpoints]
+        self.alpha = alpha
+        self.error_penalty = error_penalty
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.retryable = retryable
+        self._lock = threading.Lock()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """返回各端点的统计快照"""
+        with self._lock:
+            return [state.snapshot() for state in self.states]
+
+    def candidates(self, rank: Optional[Callable[[EndpointState], float]] = None) -> List[EndpointState]:
+        """
+        返回本次请求依次尝试的端点
+
+        顺序为：到期的半开探测端点（每次最多一个，且同一端点同一时间只放行一个探测）、按得分排序的健康端点；
+        熔断中的端点只在没有其他选择时作为兜底，按熔断时间从早到晚排列。
+
+        Args:
+            rank: 健康端点的排序函数，越小越优先；None表示按延迟与错误率得分排序
+        """
+        now = time.monotonic()
+        with self._lock:
+            probes: List[EndpointState] = []
+            healthy: List[EndpointState] = []
+            tripped: List[EndpointState] = []
+            for state in self.states:
+                if state.circuit == CLOSED:
+                    healthy.append(state)
+                elif not probes and not state.probe_in_flight and now - state.opened_at >= self.reset_timeout:
+                    state.circuit = HALF_OPEN
+                    state.probe_in_flight = True
+                    probes.append(state)
+                else:
+                    tripped.append(state)
+            healthy.sort(key=rank or (lambda state: state.score(self.error_penalty)))
+            ordered = probes + healthy
+            if not ordered:
+                tripped.sort(key=lambda state: state.opened_at)
+                ordered = tripped
+            return ordered
+
+    def _observe_latency(self, state: EndpointState, latency: float) -> None:
+        """更新EWMA延迟，调用方需持有锁"""
+        state.ewma_latency = latency if state.ewma_latency is None else (
+            self.alpha * latency + (1 - self.alpha) * state.ewma_latency
+        )
+
+    def record_success(self, state: EndpointState, latency: float) -> None:
+        """记录一次成功请求"""
+        with self._lock:
+            state.requests += 1
+            self._observe_latency(state, latency)
+            state.ewma_error *= (1 - self.alpha)
+            state.consecutive_failures = 0
+            state.circuit = CLOSED
+            state.probe_in_flight = False
+
+    def record_failure(self, state: EndpointState, latency: Optional[float] = None) -> None:
+        """记录一次失败请求，必要时熔断；失败耗时（如超时）同样计入延迟"""
+        with self._lock:
+            state.requests += 1
+            if latency is not None:
+                self._observe_latency(state, latency)
+            state.failures += 1
+            state.ewma_error = self.alpha + (1 - self.alpha) * state.ewma_error
+            state.consecutive_failures += 1
+            if state.circuit == HALF_OPEN or state.consecutive_failures >= self.failure_threshold:
+                state.circuit = OPEN
+                state.opened_at = time.monotonic()
+            state.probe_in_flight = False
+
+    def _release_probe(self, state: EndpointState) -> None:
+        """请求因非端点原因结束时（如被取消、4xx），释放半开探测名额"""
+        with self._lock:
+            if state.circuit == HALF_OPEN:
+                state.circuit = OPEN
+            state.probe_in_flight = False
+
+    def call_sync(self, func: Callable[[Endpoint], T], rank: Optional[Callable[[EndpointState], float]] = None) -> T:
+        """
+        同步调用：按候选顺序尝试，可重试的失败转移到下一个端点
+
+        Args:
+            func: 以端点为参数发送请求的函数
+            rank: 健康端点的排序函数，见 candidates
+
+        Returns:
+            第一个成功端点的结果
+        """
+        last_error: Optional[BaseException] = None
+        for state in self.candidates(rank):
+            start = time.monotonic()
+            try:
+                result = func(state.endpoint)
+            except Exception as exc:
+                if not self.retryable(exc):
+                    self._release_probe(state)
+                    raise
+                self.record_failure(state, time.monotonic() - start)
+                last_error = exc
+                continue
+            except BaseException:
+                self._release_probe(state)
+                raise
+            self.record_success(state, time.monotonic() - start)
+            return result
+        raise last_error
+
+    async def call(
+        self,
+        func: Callable[[Endpoint], Awaitable[T]],
+        rank: Optional[Callable[[EndpointState], float]] = None
+    ) -> T:
+        """异步版本的 call_sync"""
+        last_error: Optional[BaseException] = None
+        for state in self.candidates(rank):
+            start = time.monotonic()
+            try:
+                result = await func(state.endpoint)
+            except Exception as exc:
+                if not self.retryable(exc):
+                    self._release_probe(state)
+                    raise
+                self.record_failure(state, time.monotonic() - start)
+                last_error = exc
+                continue
+            except BaseException:
+                self._release_probe(state)
+                raise
+            self.record_success(state, time.monotonic() - start)
+            return result
+        raise last_error
+
+    def stream_sync(
+        self,
+        func: Callable[[Endpoint], Iterator[str]],
+        rank: Optional[Callable[[EndpointState], float]] = None
+    ) -> Iterator[str]:
+        """
+        同步流式调用：首个片段到达前失败可转移端点，延迟按首片段时间（TTFT）统计
+        """
+        last_error: Optional[BaseException] = None
+        for state in self.candidates(rank):
+            start = time.monotonic()
+            started = False
+            try:
+                for chunk in func(state.endpoint):
+                    if not started:
+                        started = True
+                        self.record_success(state, time.monotonic() - start)
+                    yield chunk
+            except Exception as exc:
+                if started:
+                    raise
+                if not self.retryable(exc):
+                    self._release_probe(state)
+                    raise
+                self.record_failure(state, time.monotonic() - start)
+                last_error = exc
+                continue
+            except BaseException:
+                if not started:
+                    self._release_probe(state)
+                raise
+            if not started:
+                self.record_success(state, time.monotonic() - start)
+            return
+        raise last_error
+
+    async def stream(
+        self,
+        func: Callable[[Endpoint], AsyncIterator[str]],
+        rank: Optional[Callable[[EndpointState], float]] = None
+    ) -> AsyncIterator[str]:
+        """异步版本的 stream_sync"""
+        last_error: Optional[BaseException] = None
+        for state in self.candidates(rank):
+            start = time.monotonic()
+            started = False
+            try:
+                async for chunk in func(state.endpoint):
+                    if not started:
+                        started = True
+                        self.record_success(state, time.monotonic() - start)
+                    yield chunk
+            except Exception as exc:
+                if started:
+                    raise
+                if not self.retryable(exc):
+                    self._release_probe(state)
+                    raise
+                self.record_failure(state, time.monotonic() - start)
+                last_error = exc
+                continue
+            except BaseException:
+                if not started:
+                    self._release_probe(state)
+                raise
+            if not started:
+                self.record_success(state, time.monotonic() - start)
+            return
+        raise last_error
+
+
+def to_endpoint(value: Union[str, Dict[str, Any], Endpoint]) -> Endpoint:
+    """将url字符串、配置字典或Endpoint统一为Endpoint"""
+    if isinstance(value, Endpoint):
+        return value
+    if isinstance(value, str):
+        return Endpoint(url=value)
+    return Endpoint(**value)
@@ -0,0 +1,28 @@
+"""
+模型客户端的异常类型
+
+均继承自ValueError，与原有 "API请求失败" 的错误处理方式保持兼容。
+"""
+
+from typing import Optional
+
+
+class APIStatusError(ValueError):
+    """上游返回非200状态码"""
+
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+    @property
+    def retryable(self) -> bool:
+        """429与5xx可以换一个端点或稍后重试，其他4xx属于请求本身的问题"""
+        return self.status == 429 or self.status >= 500
+
+
+class RateLimitError(APIStatusError):
+    """上游返回429时抛出，携带 Retry-After 给出的等待时间"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message, 429)
+        self.retry_after = retry_after
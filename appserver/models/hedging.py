@@ -0,0 +1,178 @@
+"""
+对冲请求（hedged requests）
+
+非流式请求在超过近期延迟的某个分位数仍未返回时，再发送一个相同的请求，
+取先返回的结果并取消另一个。额外请求量受预算约束（如不超过5%）。
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """滑动窗口内的延迟分位数统计"""
+
+    def __init__(self, window: int = 500):
+        """
+        Args:
+            window: 保留的最近样本数
+        """
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, latency: float) -> None:
+        """记录一次延迟（秒）"""
+        with self._lock:
+            self._samples.append(latency)
+
+    def percentile(self, p: float) -> Optional[float]:
+        """
+        计算分位数
+
+        Args:
+            p: 分位数，0-100
+
+        Returns:
+            Optional[float]: 对应的延迟（秒），没有样本时返回None
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, max(0, int(round(p / 100 * (len(samples) - 1)))))
+        return samples[index]
+
+    def snapshot(self) -> Dict[str, Any]:
+        """返回常用分位数"""
+        return {
+            "count": len(self._samples),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+        }
+
+
+class HedgingPolicy:
+    """
+    对冲策略：何时发送对冲请求，以及额外请求的预算
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 0.05,
+        max_burst: float = 10.0,
+        window: int = 500
+    ):
+        """
+        初始化对冲策略
+
+        Args:
+            percentile: 等待超过该延迟分位数后发送对冲请求
+            budget: 对冲请求占全部请求的比例上限
+            min_samples: 样本数不足时不对冲
+            min_delay: 对冲前的最短等待时间（秒）
+            max_burst: 预算最多累积的对冲次数
+            window: 延迟统计的滑动窗口大小
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.max_burst = max_burst
+        self.latency = LatencyTracker(window)
+        self._credits = 0.0
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回对冲计数与延迟分位数"""
+        return {
+            "requests": self.requests,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_ratio": self.hedged / self.requests if self.requests else 0.0,
+            "latency": self.latency.snapshot(),
+        }
+
+    def hedge_delay(self) -> Optional[float]:
+        """返回发送对冲请求前的等待时间，样本不足时返回None"""
+        if len(self.latency) < self.min_samples:
+            return None
+        threshold = self.latency.percentile(self.percentile)
+        return max(self.min_delay, threshold) if threshold is not None else None
+
+    def _on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self._credits = min(self.max_burst, self._credits + self.budget)
+
+    def _try_spend(self) -> bool:
+        """预算允许时消耗一次对冲额度"""
+        with self._lock:
+            if self._credits < 1.0:
+                return False
+            self._credits -= 1.0
+            self.hedged += 1
+            return True
+
+    async def run(self, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        执行请求，必要时发送对冲请求
+
+        Args:
+            func: 返回协程的函数，每次调用发送一个独立的请求
+
+        Returns:
+            先成功返回的结果
+        """
+        self._on_request()
+        start = time.monotonic()
+        primary = asyncio.ensure_future(func())
+        delay = self.hedge_delay()
+        if delay is None:
+            result = await primary
+            self.latency.record(time.monotonic() - start)
+            return result
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not self._try_spend():
+            result = await primary
+            self.latency.record(time.monotonic() - start)
+            return result
+
+        hedge = asyncio.ensure_future(func())
+        pending = {primary, hedge}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.hedge_wins += 1
+                        self.latency.record(time.monotonic() - start)
+                        return task.result()
+                if not pending:
+                    # 两个请求都失败时抛出主请求的异常
+                    return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
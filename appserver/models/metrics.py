@@ -0,0 +1,519 @@
+"""
+LLM调用埋点
+
+每次调用记录排队时间、建连时间（发出请求到收到响应头）、首token时间（TTFT）、
+token间隔（ITL）分布、总耗时与token用量；上游返回 usage 字段时使用上游用量，否则按字符估算。
+记录结果交给可插拔的输出端：
+- MetricsRegistry：进程内直方图与计数器
+- PrometheusExporter：把 MetricsRegistry 渲染为Prometheus文本格式
+- JSONLSink：每次调用追加一行JSON
+CustomChatModel 另外以LangChain自定义事件（METRICS_EVENT）上报，
+NodeMetricsHandler 据此按LangGraph节点汇总耗时与用量。
+"""
+
+import asyncio
+import bisect
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# CustomChatModel 上报埋点使用的LangChain自定义事件名
+METRICS_EVENT = "llm_call_metrics"
+
+# 直方图桶上界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+INTER_TOKEN_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+THROUGHPUT_BUCKETS = (1, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+
+def _percentile(samples: Sequence[float], p: float) -> Optional[float]:
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, int(round(p / 100 * (len(ordered) - 1)))))]
+
+
+def normalize_usage(usage: Mapping[str, Any]) -> Dict[str, int]:
+    """
+    将上游 usage 字段统一为 prompt_tokens / completion_tokens / total_tokens
+
+    DashScope 使用 input_tokens / output_tokens，OpenAI兼容接口使用 prompt_tokens / completion_tokens。
+    """
+    prompt = usage.get("input_tokens", usage.get("prompt_tokens"))
+    completion = usage.get("output_tokens", usage.get("completion_tokens"))
+    total = usage.get("total_tokens")
+    if total is None and prompt is not None and completion is not None:
+        total = prompt + completion
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": total}
+
+
+@dataclass
+class CallMetrics:
+    """
+    一次LLM调用的埋点结果，时间单位为秒
+
+    Attributes:
+        model: 模型名称
+        stream: 是否流式调用
+        endpoint: 最后一次尝试的端点地址
+        started_at: 调用开始的时间戳
+        queue_wait: 调用开始到发出请求的时间（限流排队、重试退避）
+        connect: 发出请求到收到响应头的时间
+        ttft: 调用开始到首个文本片段的时间，仅流式调用
+        inter_token: 相邻文本片段的间隔
+        duration: 总耗时
+        usage_source: "upstream" 表示用量来自上游 usage 字段，"estimate" 表示按字符估算
+        status: "ok"、"error" 或 "cancelled"
+        error: 异常类型名
+        coalesced: 本次调用合并到相同请求的在途调用上，没有单独请求上游；
+            端点、建连时间与用量沿用该在途调用，排队时间为本次调用开始到其发出请求
+        hedge: 本条记录是对冲请求本身，而不是一次业务调用
+    """
+
+    model: str
+    stream: bool
+    endpoint: Optional[str] = None
+    started_at: float = 0.0
+    queue_wait: Optional[float] = None
+    connect: Optional[float] = None
+    ttft: Optional[float] = None
+    inter_token: List[float] = field(default_factory=list)
+    duration: Optional[float] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    total_tokens: Optional[int] = None
+    usage_source: str = "estimate"
+    status: str = "ok"
+    error: Optional[str] = None
+    coalesced: bool = False
+    hedge: bool = False
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """输出速度：流式调用按首token之后的生成时间计算，非流式按总耗时计算"""
+        if not self.completion_tokens or self.duration is None:
+            return None
+        elapsed = self.duration - (self.ttft or 0.0)
+        return self.completion_tokens / elapsed if elapsed > 0 else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为可JSON序列化的字典，token间隔只保留分布摘要"""
+        return {
+            "model": self.model,
+            "stream": self.stream,
+            "endpoint": self.endpoint,
+            "started_at": self.started_at,
+            "queue_wait": self.queue_wait,
+            "connect": self.connect,
+            "ttft": self.ttft,
+            "inter_token": {
+                "count": len(self.inter_token),
+                "p50": _percentile(self.inter_token, 50),
+                "p95": _percentile(self.inter_token, 95),
+                "max": max(self.inter_token) if self.inter_token else None,
+            },
+            "duration": self.duration,
+            "tokens_per_second": self.tokens_per_second,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "usage_source": self.usage_source,
+            "status": self.status,
+            "error": self.error,
+            "coalesced": self.coalesced,
+            "hedge": self.hedge,
+        }
+
+
+class MetricsSink:
+    """埋点输出端基类"""
+
+    def emit(self, metrics: CallMetrics) -> None:
+        raise NotImplementedError
+
+
+class CallRecorder:
+    """
+    记录一次调用的各阶段时间点
+
+    客户端在调用开始时创建，发送请求、收到响应头、收到文本片段与上游用量时分别通知，
+    结束时调用 finish 把结果交给输出端。对冲请求由 hedge() 创建的记录器单独记录；
+    合并到在途调用上的调用结束前调用 coalesced_with，沿用在途调用的时间点与用量。
+    """
+
+    def __init__(
+        self,
+        payload: Mapping[str, Any],
+        stream: bool,
+        sinks: Iterable[MetricsSink] = (),
+        listener: Optional[Callable[[CallMetrics], None]] = None
+    ):
+        """
+        Args:
+            payload: DashScope格式的请求payload，用于取模型名与估算输入token
+            stream: 是否流式调用
+            sinks: 输出端
+            listener: 调用结束时额外接收结果的回调
+        """
+        self.metrics = CallMetrics(model=str(payload.get("model", "")), stream=stream, started_at=time.time())
+        self.sinks = tuple(sinks)
+        self.listener = listener
+        self._payload = payload
+        self._start = time.perf_counter()
+        self._sent: Optional[float] = None
+        self._last: Optional[float] = None
+        self._chars = 0
+        self._finished = False
+
+    def hedge(self) -> "CallRecorder":
+        """为本次调用发出的对冲请求创建单独的记录器，时间从对冲请求发出时算起"""
+        recorder = CallRecorder(self._payload, self.metrics.stream, self.sinks)
+        recorder.metrics.hedge = True
+        return recorder
+
+    def coalesced_with(self, leader: "CallRecorder") -> None:
+        """
+        本次调用合并到 leader 的在途请求上：沿用其端点、建连时间与上游用量
+
+        Args:
+            leader: 实际发送请求的调用的记录器
+        """
+        metrics = self.metrics
+        metrics.coalesced = True
+        metrics.endpoint = leader.metrics.endpoint
+        metrics.connect = leader.metrics.connect
+        if leader._sent is not None:
+            metrics.queue_wait = max(0.0, leader._sent - self._start)
+        if leader.metrics.usage_source == "upstream":
+            metrics.prompt_tokens = leader.metrics.prompt_tokens
+            metrics.completion_tokens = leader.metrics.completion_tokens
+            metrics.total_tokens = leader.metrics.total_tokens
+            metrics.usage_source = "upstream"
+
+    def sending(self, endpoint: str) -> None:
+        """即将向端点发出请求；重试时以第一次发出的时间计算排队时间"""
+        now = time.perf_counter()
+        if self.metrics.queue_wait is None:
+            self.metrics.queue_wait = now - self._start
+        self.metrics.endpoint = endpoint
+        self._sent = now
+
+    def connected(self) -> None:
+        """收到响应头"""
+        if self._sent is not None:
+            self.metrics.connect = time.perf_counter() - self._sent
+
+    def token(self, text: str) -> None:
+        """收到一个文本片段"""
+        now = time.perf_counter()
+        if self._last is None:
+            self.metrics.ttft = now - self._start
+        else:
+            self.metrics.inter_token.append(now - self._last)
+        self._last = now
+        self._chars += len(text)
+
+    def usage(self, usage: Optional[Mapping[str, Any]]) -> None:
+        """记录上游返回的 usage 字段"""
+        if not usage:
+            return
+        normalized = normalize_usage(usage)
+        if normalized["prompt_tokens"] is None and normalized["completion_tokens"] is None:
+            return
+        self.metrics.prompt_tokens = normalized["prompt_tokens"]
+        self.metrics.completion_tokens = normalized["completion_tokens"]
+        self.metrics.total_tokens = normalized["total_tokens"]
+        self.metrics.usage_source = "upstream"
+
+    def finish(self, text: Optional[str] = None, error: Optional[BaseException] = None) -> CallMetrics:
+        """
+        结束记录并输出，多次调用只生效一次
+
+        Args:
+            text: 非流式调用的完整输出，用于估算输出token
+            error: 调用失败或被取消时的异常
+
+        Returns:
+            CallMetrics: 本次调用的埋点结果
+        """
+        metrics = self.metrics
+        if self._finished:
+            return metrics
+        self._finished = True
+        metrics.duration = time.perf_counter() - self._start
+        if text is not None:
+            self._chars = len(text)
+        if error is not None:
+            cancelled = isinstance(error, (GeneratorExit, asyncio.CancelledError))
+            metrics.status = "cancelled" if cancelled else "error"
+            metrics.error = type(error).__name__
+        if metrics.usage_source == "estimate":
+            # 与限流估算一致：约一字一token
+            messages = self._payload.get("input", {}).get("messages", [])
+            metrics.prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages)
+            metrics.completion_tokens = self._chars
+            metrics.total_tokens = metrics.prompt_tokens + metrics.completion_tokens
+
+        for sink in self.sinks:
+            try:
+                sink.emit(metrics)
+            except Exception:
+                # 埋点失败不能影响业务调用
+                pass
+        if self.listener is not None:
+            self.listener(metrics)
+        return metrics
+
+
+class _Histogram:
+    """累积桶直方图"""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """返回 (le, 累计计数) 列表，最后一项为 +Inf"""
+        result, total = [], 0
+        for bound, count in zip(list(self.buckets) + ["+Inf"], self.counts):
+            total += count
+            result.append((str(bound), total))
+        return result
+
+    def quantile(self, q: float) -> Optional[float]:
+        """按桶上界估算分位数"""
+        if not self.count:
+            return None
+        target = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= target:
+                return bound
+        return float("inf")
+
+
+# 指标名 -> (说明, 桶)
+HISTOGRAMS = {
+    "llm_queue_wait_seconds": ("调用开始到发出请求的时间", LATENCY_BUCKETS),
+    "llm_connect_seconds": ("发出请求到收到响应头的时间", LATENCY_BUCKETS),
+    "llm_ttft_seconds": ("首token时间", LATENCY_BUCKETS),
+    "llm_inter_token_seconds": ("相邻文本片段的间隔", INTER_TOKEN_BUCKETS),
+    "llm_duration_seconds": ("调用总耗时", LATENCY_BUCKETS),
+    "llm_tokens_per_second": ("输出速度（token/秒）", THROUGHPUT_BUCKETS),
+}
+COUNTERS = {
+    "llm_calls_total": "调用次数",
+    "llm_coalesced_calls_total": "合并到在途调用上的调用次数",
+    "llm_hedge_requests_total": "对冲请求次数",
+    "llm_prompt_tokens_total": "输入token数",
+    "llm_completion_tokens_total": "输出token数",
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry(MetricsSink):
+    """
+    进程内的直方图与计数器，按模型与是否流式打标签
+
+    线程安全。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], _Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+
+    def _observe(self, name: str, labels: Labels, value: Optional[float]) -> None:
+        if value is None:
+            return
+        key = (name, labels)
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            histogram = self._histograms[key] = _Histogram(HISTOGRAMS[name][1])
+        histogram.observe(value)
+
+    def _inc(self, name: str, labels: Labels, value: Optional[float]) -> None:
+        if value:
+            self._counters[(name, labels)] = self._counters.get((name, labels), 0) + value
+
+    def emit(self, metrics: CallMetrics) -> None:
+        labels = (("model", metrics.model), ("stream", "true" if metrics.stream else "false"))
+        status = (("status", metrics.status),)
+        with self._lock:
+            if metrics.hedge:
+                # 对冲请求消耗上游用量，但不是一次业务调用，不计入调用次数与延迟分布
+                self._inc("llm_hedge_requests_total", labels + status, 1)
+                self._inc("llm_prompt_tokens_total", labels, metrics.prompt_tokens)
+                self._inc("llm_completion_tokens_total", labels, metrics.completion_tokens)
+                return
+            self._inc("llm_calls_total", labels + status, 1)
+            if metrics.coalesced:
+                # 合并的调用没有单独请求上游：用量与建连时间已由在途调用计入
+                self._inc("llm_coalesced_calls_total", labels + status, 1)
+            else:
+                self._inc("llm_prompt_tokens_total", labels, metrics.prompt_tokens)
+                self._inc("llm_completion_tokens_total", labels, metrics.completion_tokens)
+                self._observe("llm_connect_seconds", labels, metrics.connect)
+            self._observe("llm_queue_wait_seconds", labels, metrics.queue_wait)
+            self._observe("llm_ttft_seconds", labels, metrics.ttft)
+            for interval in metrics.inter_token:
+                self._observe("llm_inter_token_seconds", labels, interval)
+            if metrics.status == "ok":
+                self._observe("llm_duration_seconds", labels, metrics.duration)
+                self._observe("llm_tokens_per_second", labels, metrics.tokens_per_second)
+
+    def histograms(self) -> List[Tuple[str, Labels, _Histogram]]:
+        with self._lock:
+            return sorted(((name, labels, h) for (name, labels), h in self._histograms.items()), key=lambda x: x[:2])
+
+    def counters(self) -> List[Tuple[str, Labels, float]]:
+        with self._lock:
+            return sorted((name, labels, value) for (name, labels), value in self._counters.items())
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        返回各指标的摘要
+
+        Returns:
+            Dict: {指标名: [{"labels":..., "count":..., "sum":..., "p50":..., "p95":...}]}，计数器只有 value
+        """
+        result: Dict[str, Any] = {}
+        for name, labels, histogram in self.histograms():
+            result.setdefault(name, []).append({
+                "labels": dict(labels),
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "p50": histogram.quantile(0.5),
+                "p95": histogram.quantile(0.95),
+            })
+        for name, labels, value in self.counters():
+            result.setdefault(name, []).append({"labels": dict(labels), "value": value})
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+def _escape(value: str) -> str:
+    """转义标签值中的反斜杠、双引号与换行"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Labels = ()) -> str:
+    items = labels + extra
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in items) + "}"
+
+
+class PrometheusExporter:
+    """
+    将 MetricsRegistry 渲染为Prometheus文本格式（text/plain; version=0.0.4）
+    """
+
+    content_type = "text/plain; version=0.0.4; charset=utf-8"
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        """
+        Args:
+            registry: 指标注册表，None表示使用进程级默认注册表
+        """
+        self.registry = registry or metrics_registry
+
+    def render(self) -> str:
+        lines: List[str] = []
+        described = set()
+        for name, labels, value in self.registry.counters():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {COUNTERS[name]}")
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_format_labels(labels)} {value:g}")
+        for name, labels, histogram in self.registry.histograms():
+            if name not in described:
+                described.add(name)
+                lines.append(f"# HELP {name} {HISTOGRAMS[name][0]}")
+                lines.append(f"# TYPE {name} histogram")
+            for bound, count in histogram.cumulative():
+                lines.append(f"{name}_bucket{_format_labels(labels, (('le', bound),))} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum:.6g}")
+            lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class JSONLSink(MetricsSink):
+    """每次调用向文件追加一行JSON"""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: JSONL文件路径
+        """
+        self.path = path
+        self._lock = threading.Lock()
+
+    def emit(self, metrics: CallMetrics) -> None:
+        line = json.dumps(metrics.to_dict(), ensure_ascii=False)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+
+# 进程级默认注册表，客户端未指定输出端时写入这里
+metrics_registry = MetricsRegistry()
+
+
+class NodeMetricsHandler(BaseCallbackHandler):
+    """
+    汇总 METRICS_EVENT 的LangChain回调，按LangGraph节点（无节点信息时按"default"）统计调用次数、耗时与用量
+
+    用法：graph.invoke(inputs, config={"callbacks": [handler]})，结束后读取 handler.summary()
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._nodes: Dict[str, Dict[str, float]] = {}
+
+    def on_custom_event(
+        self,
+        name: str,
+        data: Any,
+        *,
+        run_id: UUID,
+        tags: Optional[List[str]] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+        **kwargs: Any
+    ) -> None:
+        if name != METRICS_EVENT:
+            return
+        node = str((metadata or {}).get("langgraph_node", "default"))
+        with self._lock:
+            totals = self._nodes.setdefault(node, {
+                "calls": 0, "duration": 0.0, "ttft": 0.0, "prompt_tokens": 0, "completion_tokens": 0,
+            })
+            totals["calls"] += 1
+            totals["duration"] += data.get("duration") or 0.0
+            totals["ttft"] += data.get("ttft") or 0.0
+            totals["prompt_tokens"] += data.get("prompt_tokens") or 0
+            totals["completion_tokens"] += data.get("completion_tokens") or 0
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """返回 {节点: {calls, duration, ttft, prompt_tokens, completion_tokens}}，时间为各次调用之和"""
+        with self._lock:
+            return {node: dict(totals) for node, totals in self._nodes.items()}
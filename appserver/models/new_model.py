@@ -39,12 +39,22 @@
 # - 全程遵循LangChain官方接口和类型要求，确保与LangChain生态兼容
 # - 代码风格清晰，注释详细，便于后续维护和扩展
 
-import json
+import asyncio
 import os
-from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+import threading
+import warnings
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Mapping, Optional, Union
 
 import aiohttp
 import requests
+from requests.adapters import HTTPAdapter
+from langchain_core.callbacks.manager import (
+    adispatch_custom_event,
+    ahandle_event,
+    dispatch_custom_event,
+    handle_event,
+)
+from langchain_core.language_models import LanguageModelInput
 from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.messages import (
     AIMessage,
@@ -55,6 +65,30 @@ from langchain_core.messages import (
 )
 from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
 
+# 兼容包内导入与在models目录下直接运行脚本两种方式
+try:
+    from .endpoints import Endpoint, EndpointRouter, to_endpoint
+    from .errors import APIStatusError
+    from .hedging import HedgingPolicy
+    from .metrics import METRICS_EVENT, CallMetrics, CallRecorder, MetricsSink, metrics_registry
+    from .payload_encoder import JSONCodec, PayloadEncoder
+    from .rate_limiter import RateLimiter, RateLimitError, estimate_tokens, get_rate_limiter, parse_retry_after
+    from .response_cache import ResponseCache, cache_key, iter_replay_chunks
+    from .singleflight import SingleFlight, payload_key
+    from .stop_sequences import StopSequenceMatcher, normalize_stop, truncate_at_stop
+    from .stream_coalescer import acoalesce_chunks, coalesce_chunks
+except ImportError:
+    from endpoints import Endpoint, EndpointRouter, to_endpoint
+    from errors import APIStatusError
+    from hedging import HedgingPolicy
+    from metrics import METRICS_EVENT, CallMetrics, CallRecorder, MetricsSink, metrics_registry
+    from payload_encoder import JSONCodec, PayloadEncoder
+    from rate_limiter import RateLimiter, RateLimitError, estimate_tokens, get_rate_limiter, parse_retry_after
+    from response_cache import ResponseCache, cache_key, iter_replay_chunks
+    from singleflight import SingleFlight, payload_key
+    from stop_sequences import StopSequenceMatcher, normalize_stop, truncate_at_stop
+    from stream_coalescer import acoalesce_chunks, coalesce_chunks
+
 
 def convert_message_to_dict(message: BaseMessage) -> Dict[str, str]:
     """将LangChain消息对象转换为DashScope API格式"""
@@ -77,7 +111,19 @@ class DashScopeAPIClient:
         self,
         api_key: Optional[str] = None,
         api_url: str = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation",
-        timeout: int = 60
+        timeout: int = 60,
+        pool_connections: int = 10,
+        pool_maxsize: int = 100,
+        keepalive_timeout: float = 30.0,
+        dns_cache_ttl: int = 300,
+        warmup: bool = False,
+        coalesce: bool = False,
+        rate_limit: Optional[Dict[str, Any]] = None,
+        hedging: Optional[Dict[str, Any]] = None,
+        endpoints: Optional[List[Union[str, Dict[str, Any], Endpoint]]] = None,
+        routing: Optional[Dict[str, Any]] = None,
+        json_codec: Optional[JSONCodec] = None,
+        metrics: Optional[List[MetricsSink]] = None
     ):
         """
         初始化DashScope API客户端
@@ -86,9 +132,25 @@ class DashScopeAPIClient:
             api_key: API密钥，如果为None则从环境变量获取
             api_url: API端点URL
             timeout: 请求超时时间（秒）
+            pool_connections: 同步连接池缓存的主机数
+            pool_maxsize: 每个主机的最大连接数（同步与异步共用）
+            keepalive_timeout: 异步连接空闲保活时间（秒）
+            dns_cache_ttl: 异步DNS缓存时间（秒）
+            warmup: 是否在初始化时预热连接
+            coalesce: 是否合并payload相同的并发在途请求（single-flight）
+            rate_limit: 限流配置（RateLimiter的参数），同一端点地址与API Key的客户端共享限流器；None表示不限流
+            hedging: 对冲请求配置（HedgingPolicy的参数），仅作用于异步非流式调用；None表示不对冲
+            endpoints: 带权重的端点列表（url、配置字典或Endpoint）；None表示只使用api_url
+            routing: 端点路由与熔断配置（EndpointRouter的参数）
+            json_codec: 请求体与响应的JSON编解码器，None表示自动选择（安装了orjson时使用orjson）
+            metrics: 调用埋点的输出端，None表示写入进程级默认注册表，空列表表示不记录
         """
         self.api_url = api_url
         self.timeout = timeout
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
         
         # 获取API密钥
         if api_key is None:
@@ -97,20 +159,286 @@ class DashScopeAPIClient:
                 raise ValueError("请设置DASHSCOPE_API_KEY环境变量或直接提供api_key参数")
         else:
             self.api_key = api_key
+        
+        # 连接池：同步共用一个Session，异步每个事件循环一个ClientSession
+        self._session: Optional[requests.Session] = None
+        self._async_sessions: Dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+        self._lock = threading.Lock()
+        
+        # 在途请求合并，默认关闭
+        self._singleflight: Optional[SingleFlight] = SingleFlight() if coalesce else None
+        
+        # 对冲请求策略，同时负责统计异步非流式调用的延迟分位数
+        self._hedging: Optional[HedgingPolicy] = HedgingPolicy(**hedging) if hedging is not None else None
+        
+        # 多端点路由：按EWMA延迟选择最快的健康端点，失败时转移并熔断
+        self._router: Optional[EndpointRouter] = (
+            EndpointRouter([to_endpoint(endpoint) for endpoint in endpoints], **(routing or {}))
+            if endpoints else None
+        )
+        
+        # 按端点（地址 + API Key）共享的限流器，默认关闭；_rate_limiter 为api_url对应的限流器
+        self._rate_limit = rate_limit
+        self._rate_limiter: Optional[RateLimiter] = (
+            self._limiter(self._default_endpoint()) if rate_limit is not None else None
+        )
+        # 多个端点时限流器不在端点内重试429，交给路由转移到其他端点；None表示使用限流器的重试配置
+        self._limiter_retries: Optional[int] = (
+            0 if self._router is not None and len(self._router.states) > 1 else None
+        )
+        
+        # 请求体预编码：缓存模型头、参数与消息的编码结果，发送时只拼接字节
+        self._encoder = PayloadEncoder(json_codec)
+        self._codec = self._encoder.codec
+        
+        # 调用埋点：排队、建连、首token、token间隔、总耗时与用量
+        self._metrics: List[MetricsSink] = [metrics_registry] if metrics is None else list(metrics)
+        
+        if warmup:
+            self.warmup()
+    
+    @property
+    def session(self) -> requests.Session:
+        """返回共享的同步Session（首次访问时创建）"""
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=self.pool_connections,
+                        pool_maxsize=self.pool_maxsize
+                    )
+                    session.mount("https://", adapter)
+                    session.mount("http://", adapter)
+                    self._session = session
+        return self._session
+    
+    def _get_async_session(self) -> aiohttp.ClientSession:
+        """返回当前事件循环共享的aiohttp ClientSession"""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._discard_stale_sessions()
+            session = self._async_sessions.get(loop)
+            if session is None or session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.pool_maxsize,
+                    keepalive_timeout=self.keepalive_timeout,
+                    ttl_dns_cache=self.dns_cache_ttl,
+                    use_dns_cache=True
+                )
+                session = aiohttp.ClientSession(connector=connector)
+                self._async_sessions[loop] = session
+        return session
+    
+    def _discard_stale_sessions(self) -> None:
+        """
+        丢弃已关闭事件循环遗留的会话（调用方需持有 self._lock）
+        
+        会话的连接绑定在原事件循环上，循环关闭后无法再 await session.close()，其中的连接会泄漏；
+        此时发出 ResourceWarning，提示在循环关闭前调用 aclose()。
+        """
+        for stale_loop in [l for l in self._async_sessions if l.is_closed()]:
+            session = self._async_sessions.pop(stale_loop)
+            if not session.closed:
+                warnings.warn(
+                    "事件循环关闭前未调用 aclose()，丢弃其遗留的aiohttp会话，其中的连接无法正常关闭",
+                    ResourceWarning,
+                    stacklevel=3
+                )
+    
+    def warmup(self) -> None:
+        """预热同步连接池，提前完成TCP与TLS握手"""
+        try:
+            self.session.head(self.api_url, timeout=self.timeout)
+        except requests.RequestException:
+            pass
+    
+    async def awarmup(self, connections: int = 1) -> None:
+        """
+        预热当前事件循环的异步连接池
+        
+        Args:
+            connections: 并发建立的连接数
+        """
+        session = self._get_async_session()
+        
+        async def _open() -> None:
+            try:
+                async with session.head(
+                    self.api_url,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)
+                ) as response:
+                    await response.read()
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                pass
+        
+        await asyncio.gather(*[_open() for _ in range(connections)])
+    
+    def close(self) -> None:
+        """关闭同步Session"""
+        with self._lock:
+            session, self._session = self._session, None
+        if session is not None:
+            session.close()
+    
+    async def aclose(self) -> None:
+        """关闭同步Session以及当前事件循环的异步会话"""
+        self.close()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            session = self._async_sessions.pop(loop, None)
+        if session is not None and not session.closed:
+            await session.close()
+    
+    def __enter__(self) -> "DashScopeAPIClient":
+        return self
+    
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+    
+    async def __aenter__(self) -> "DashScopeAPIClient":
+        return self
+    
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+    
+    def coalescing_stats(self) -> Dict[str, Any]:
+        """返回在途请求合并的计数器，未开启合并时返回空字典"""
+        return self._singleflight.stats() if self._singleflight is not None else {}
+    
+    def hedging_stats(self) -> Dict[str, Any]:
+        """返回对冲计数与延迟分位数，未开启对冲时返回空字典"""
+        return self._hedging.stats() if self._hedging is not None else {}
+    
+    def encoder_stats(self) -> Dict[str, Any]:
+        """返回请求体编码缓存的命中统计"""
+        return self._encoder.stats()
+    
+    def _recorder(
+        self,
+        payload: Dict[str, Any],
+        stream: bool,
+        on_metrics: Optional[Callable[[CallMetrics], None]]
+    ) -> Optional[CallRecorder]:
+        """为一次调用创建埋点记录器，没有输出端与回调时返回None"""
+        if not self._metrics and on_metrics is None:
+            return None
+        return CallRecorder(payload, stream, self._metrics, on_metrics)
+    
+    @staticmethod
+    def _leader_recorder(payload: Dict[str, Any], stream: bool, recorder: Optional[CallRecorder]) -> CallRecorder:
+        """合并请求时领头调用总要记录时间点，供加入的调用沿用；本身不需要埋点时使用不输出的记录器"""
+        return recorder if recorder is not None else CallRecorder(payload, stream)
+    
+    @staticmethod
+    def _mark_coalesced(recorder: CallRecorder, leaders: List[CallRecorder]) -> None:
+        """本次调用加入了在途调用时，沿用领头调用的端点、建连时间与用量"""
+        if leaders:
+            recorder.coalesced_with(leaders[0])
+    
+    def _hedged_sender(self, payload: Dict[str, Any], recorder: Optional[CallRecorder]) -> Callable[[], Awaitable[str]]:
+        """
+        返回交给对冲策略的请求函数：第一次调用是主请求，记入本次调用的记录器；
+        之后的对冲请求各自使用单独的记录器，避免两个请求的时间点互相覆盖
+        """
+        attempts = 0
+        
+        async def send_hedge(hedge_recorder: CallRecorder) -> str:
+            try:
+                content = await self._post_async(payload, hedge_recorder)
+            except BaseException as exc:
+                hedge_recorder.finish(error=exc)
+                raise
+            hedge_recorder.finish(content)
+            return content
+        
+        def send() -> Awaitable[str]:
+            nonlocal attempts
+            attempts += 1
+            if attempts == 1 or recorder is None:
+                return self._post_async(payload, recorder)
+            return send_hedge(recorder.hedge())
+        
+        return send
+    
+    def _record_stream(self, stream: Iterator[str], recorder: CallRecorder) -> Iterator[str]:
+        """记录流式调用的每个文本片段，流结束、出错或被关闭时输出埋点"""
+        error: Optional[BaseException] = None
+        try:
+            for delta in stream:
+                recorder.token(delta)
+                yield delta
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            stream.close()
+            recorder.finish(error=error)
+    
+    async def _record_stream_async(
+        self,
+        stream: AsyncIterator[str],
+        recorder: CallRecorder,
+        leaders: Optional[List[CallRecorder]] = None
+    ) -> AsyncIterator[str]:
+        """异步版本的 _record_stream；leaders 非空表示本次流加入了在途的相同流"""
+        error: Optional[BaseException] = None
+        try:
+            async for delta in stream:
+                recorder.token(delta)
+                yield delta
+        except BaseException as exc:
+            error = exc
+            raise
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+            self._mark_coalesced(recorder, leaders or [])
+            recorder.finish(error=error)
+    
+    def _encode_body(self, payload: Dict[str, Any], endpoint: Endpoint, stream: bool = False) -> bytes:
+        """将payload编码为目标端点的JSON请求体"""
+        if endpoint.protocol == "dashscope":
+            return self._encoder.encode(payload)
+        return self._codec.dumps(endpoint.build_body(payload, stream=stream))
     
-    def _build_headers(self) -> Dict[str, str]:
-        """构建请求头"""
+    def _build_headers(self, api_key: Optional[str] = None) -> Dict[str, str]:
+        """构建请求头，api_key为None时使用客户端的密钥"""
         return {
-            "Authorization": f"Bearer {self.api_key}",
+            "Authorization": f"Bearer {api_key or self.api_key}",
             "Content-Type": "application/json"
         }
     
+    def _build_stream_headers(self, endpoint: Endpoint) -> Dict[str, str]:
+        """构建流式请求头"""
+        headers = self._build_headers(endpoint.api_key)
+        headers["Accept"] = "text/event-stream"
+        if endpoint.protocol == "dashscope":
+            headers["X-DashScope-SSE"] = "enable"
+        return headers
+    
+    def _default_endpoint(self) -> Endpoint:
+        """未配置多端点时，由api_url构成的单一端点"""
+        return Endpoint(url=self.api_url)
+    
+    def _limiter(self, endpoint: Endpoint) -> Optional[RateLimiter]:
+        """端点对应的共享限流器，未开启限流时返回None"""
+        if self._rate_limit is None:
+            return None
+        return get_rate_limiter(endpoint.api_key or self.api_key, url=endpoint.url, **self._rate_limit)
+    
+    def endpoint_stats(self) -> List[Dict[str, Any]]:
+        """返回各端点的延迟、错误率与熔断状态，未配置多端点时返回空列表"""
+        return self._router.stats() if self._router is not None else []
+    
     def _build_payload(
         self,
         messages: List[BaseMessage],
         model_name: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        stop: Optional[List[str]] = None,
         **kwargs: Any
     ) -> Dict[str, Any]:
         """
@@ -121,6 +449,7 @@ class DashScopeAPIClient:
             model_name: 模型名称
             temperature: 温度参数
             max_tokens: 最大token数
+            stop: 停止词列表，生成内容在第一个停止词处截断（不含停止词）
             **kwargs: 其他参数
             
         Returns:
@@ -138,12 +467,32 @@ class DashScopeAPIClient:
             }
         }
         
+        # 停止词同时发给上游，让上游尽早结束生成
+        stop = normalize_stop(stop)
+        if stop:
+            payload["parameters"]["stop"] = stop
+        
         # 添加额外参数
         if kwargs:
             payload["parameters"].update(kwargs)
         
         return payload
     
+    def _raise_for_status(self, status: int, text: str, headers: Mapping[str, str]) -> None:
+        """
+        将非200响应转换为异常
+        
+        Raises:
+            RateLimitError: 上游返回429时抛出，携带Retry-After
+            APIStatusError: 其他状态码时抛出（ValueError的子类）
+        """
+        if status == 429:
+            raise RateLimitError(
+                f"API请求失败: {status} - {text}",
+                retry_after=parse_retry_after(headers.get("Retry-After"))
+            )
+        raise APIStatusError(f"API请求失败: {status} - {text}", status)
+    
     def _parse_response(self, response_data: Dict[str, Any]) -> str:
         """
         解析API响应
@@ -162,6 +511,8 @@ class DashScopeAPIClient:
         model_name: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
         **kwargs: Any
     ) -> str:
         """
@@ -172,6 +523,8 @@ class DashScopeAPIClient:
             model_name: 模型名称
             temperature: 温度参数
             max_tokens: 最大token数
+            stop: 停止词列表，生成内容在第一个停止词处截断（不含停止词）
+            on_metrics: 调用结束时接收本次埋点结果的回调
             **kwargs: 其他参数
             
         Returns:
@@ -186,25 +539,78 @@ class DashScopeAPIClient:
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
+            stop=stop,
             **kwargs
         )
         
-        headers = self._build_headers()
+        recorder = self._recorder(payload, False, on_metrics)
+        leaders: List[CallRecorder] = []
+        try:
+            if self._singleflight is not None:
+                key = payload_key(payload, self.api_url, "call")
+                timing = self._leader_recorder(payload, False, recorder)
+                content = self._singleflight.do_sync(
+                    key, lambda: self._post(payload, timing), context=timing, on_join=leaders.append
+                )
+            else:
+                content = self._post(payload, recorder)
+        except BaseException as exc:
+            if recorder is not None:
+                self._mark_coalesced(recorder, leaders)
+                recorder.finish(error=exc)
+            raise
+        if recorder is not None:
+            self._mark_coalesced(recorder, leaders)
+        content = self._apply_stop(content, payload)
+        if recorder is not None:
+            recorder.finish(content)
+        return content
+    
+    def _apply_stop(self, content: str, payload: Dict[str, Any]) -> str:
+        """上游未必严格执行停止词，非流式结果在客户端再截断一次"""
+        stop = payload["parameters"].get("stop")
+        return truncate_at_stop(content, stop) if stop else content
+    
+    def _post(self, payload: Dict[str, Any], recorder: Optional[CallRecorder] = None) -> str:
+        """在限流保护下发送同步非流式请求，配置了多端点时按路由依次尝试"""
+        def attempt(endpoint: Endpoint) -> str:
+            limiter = self._limiter(endpoint)
+            if limiter is None:
+                return self._send(payload, endpoint, recorder)
+            return limiter.run_sync(
+                estimate_tokens(payload), lambda: self._send(payload, endpoint, recorder), self._limiter_retries
+            )
+        
+        if self._router is None:
+            return attempt(self._default_endpoint())
+        return self._router.call_sync(attempt)
+    
+    def _send(self, payload: Dict[str, Any], endpoint: Endpoint, recorder: Optional[CallRecorder] = None) -> str:
+        """向指定端点发送同步非流式请求并解析响应"""
+        headers = self._build_headers(endpoint.api_key)
+        if recorder is not None:
+            recorder.sending(endpoint.url)
         
         # 发送API请求
-        response = requests.post(
-            self.api_url,
-            json=payload,
+        response = self.session.post(
+            endpoint.url,
+            data=self._encode_body(payload, endpoint),
             headers=headers,
             timeout=self.timeout
         )
+        if recorder is not None:
+            recorder.connected()
         
         if response.status_code != 200:
-            raise ValueError(f"API请求失败: {response.status_code} - {response.text}")
+            self._raise_for_status(response.status_code, response.text, response.headers)
         
         # 解析响应
-        response_data = response.json()
-        return self._parse_response(response_data)
+        response_data = self._codec.loads(response.content)
+        if recorder is not None:
+            recorder.usage(response_data.get("usage"))
+        if endpoint.protocol == "dashscope":
+            return self._parse_response(response_data)
+        return endpoint.parse_response(response_data)
     
     def call_api_stream(
         self,
@@ -212,6 +618,8 @@ class DashScopeAPIClient:
         model_name: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
         **kwargs: Any
     ) -> Iterator[str]:
         """
@@ -222,6 +630,8 @@ class DashScopeAPIClient:
             model_name: 模型名称
             temperature: 温度参数
             max_tokens: 最大token数
+            stop: 停止词列表，生成内容在第一个停止词处截断（不含停止词）
+            on_metrics: 调用结束时接收本次埋点结果的回调
             **kwargs: 其他参数
             
         Yields:
@@ -236,46 +646,93 @@ class DashScopeAPIClient:
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
+            stop=stop,
             **kwargs
         )
         
-        # 启用流式输出
-        payload["parameters"]["incremental_output"] = True
+        # 启用流式输出，默认增量模式，调用方也可显式关闭以使用累计模式
+        payload["parameters"].setdefault("incremental_output", True)
         
-        headers = self._build_headers()
-        headers["Accept"] = "text/event-stream"
-        headers["X-DashScope-SSE"] = "enable"
-
-        # 发送流式API请求
-        response = requests.post(
-            self.api_url,
-            json=payload,
-            headers=headers,
-            timeout=self.timeout
-        )
+        recorder = self._recorder(payload, True, on_metrics)
+        stream = self._stream(payload, recorder)
+        if payload["parameters"].get("stop"):
+            stream = self._stop_stream(stream, payload["parameters"]["stop"])
+        if recorder is not None:
+            stream = self._record_stream(stream, recorder)
+        yield from stream
+    
+    def _stop_stream(self, stream: Iterator[str], stop: List[str]) -> Iterator[str]:
+        """
+        在客户端执行停止词，匹配后立即关闭上游HTTP流
         
-        if response.status_code != 200:
-            raise ValueError(f"API请求失败: {response.status_code} - {response.text}")
-        
-        # 处理Server-Sent Events (SSE)格式的流式响应
-        for line in response.iter_lines():
-            if line:
-                line = line.decode('utf-8')
-                if line.startswith('data:'):
-                    data = line[5:]  # 移除 'data: ' 前缀
-                    if data.strip() == '[DONE]':
-                        break
-                    try:
-                        chunk_data = json.loads(data)
-                        # 解析官方API返回格式
-                        if 'output' in chunk_data and 'choices' in chunk_data['output']:
-                            choice = chunk_data['output']['choices'][0]
-                            if 'message' in choice and 'content' in choice['message']:
-                                content = choice['message']['content']
-                                if content:
-                                    yield content
-                    except json.JSONDecodeError:
-                        continue
+        关闭生成器会沿调用链退出 with session.post(...) 块，断开连接，上游随之停止生成
+        """
+        matcher = StopSequenceMatcher(stop)
+        try:
+            for delta in stream:
+                text = matcher.feed(delta)
+                if text:
+                    yield text
+                if matcher.stopped:
+                    return
+            tail = matcher.flush()
+            if tail:
+                yield tail
+        finally:
+            stream.close()
+    
+    def _stream(self, payload: Dict[str, Any], recorder: Optional[CallRecorder] = None) -> Iterator[str]:
+        """在限流保护下发送同步流式请求，配置了多端点时按路由依次尝试"""
+        def attempt(endpoint: Endpoint) -> Iterator[str]:
+            limiter = self._limiter(endpoint)
+            if limiter is None:
+                return self._send_stream(payload, endpoint, recorder)
+            return limiter.stream_sync(
+                estimate_tokens(payload), lambda: self._send_stream(payload, endpoint, recorder), self._limiter_retries
+            )
+        
+        if self._router is None:
+            return attempt(self._default_endpoint())
+        return self._router.stream_sync(attempt)
+    
+    def _send_stream(
+        self,
+        payload: Dict[str, Any],
+        endpoint: Endpoint,
+        recorder: Optional[CallRecorder] = None
+    ) -> Iterator[str]:
+        """向指定端点发送同步流式请求并逐个产出文本增量"""
+        incremental = bool(payload["parameters"]["incremental_output"])
+        headers = self._build_stream_headers(endpoint)
+        if recorder is not None:
+            recorder.sending(endpoint.url)
+        
+        # 发送流式API请求：stream=True 使响应体按帧到达即处理，而不是整体缓冲
+        with self.session.post(
+            endpoint.url,
+            data=self._encode_body(payload, endpoint, stream=True),
+            headers=headers,
+            timeout=self.timeout,
+            stream=True
+        ) as response:
+            if recorder is not None:
+                recorder.connected()
+            if response.status_code != 200:
+                self._raise_for_status(response.status_code, response.text, response.headers)
+            
+            # 处理Server-Sent Events (SSE)格式的流式响应
+            # chunk_size=None 表示数据到达多少就处理多少，避免等待固定大小的缓冲区填满
+            decoder = endpoint.stream_decoder(incremental=incremental)
+            try:
+                for raw in response.iter_content(chunk_size=None):
+                    yield from decoder.feed(raw)
+                    if decoder.done:
+                        return
+                yield from decoder.flush()
+            finally:
+                # 提前结束时也记录已收到的累计用量
+                if recorder is not None:
+                    recorder.usage(decoder.usage)
     
     async def call_api_async(
         self,
@@ -283,6 +740,8 @@ class DashScopeAPIClient:
         model_name: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
         **kwargs: Any
     ) -> str:
         """
@@ -293,6 +752,8 @@ class DashScopeAPIClient:
             model_name: 模型名称
             temperature: 温度参数
             max_tokens: 最大token数
+            stop: 停止词列表，生成内容在第一个停止词处截断（不含停止词）
+            on_metrics: 调用结束时接收本次埋点结果的回调
             **kwargs: 其他参数
             
         Returns:
@@ -307,26 +768,83 @@ class DashScopeAPIClient:
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
+            stop=stop,
             **kwargs
         )
         
-        headers = self._build_headers()
+        recorder = self._recorder(payload, False, on_metrics)
+        leaders: List[CallRecorder] = []
+        timing = recorder
+        if self._singleflight is not None:
+            timing = self._leader_recorder(payload, False, recorder)
+        if self._hedging is not None:
+            fetch = lambda: self._hedging.run(self._hedged_sender(payload, timing))
+        else:
+            fetch = lambda: self._post_async(payload, timing)
+        
+        try:
+            if self._singleflight is not None:
+                key = payload_key(payload, self.api_url, "call")
+                content = await self._singleflight.do(key, fetch, context=timing, on_join=leaders.append)
+            else:
+                content = await fetch()
+        except BaseException as exc:
+            if recorder is not None:
+                self._mark_coalesced(recorder, leaders)
+                recorder.finish(error=exc)
+            raise
+        if recorder is not None:
+            self._mark_coalesced(recorder, leaders)
+        content = self._apply_stop(content, payload)
+        if recorder is not None:
+            recorder.finish(content)
+        return content
+    
+    async def _post_async(self, payload: Dict[str, Any], recorder: Optional[CallRecorder] = None) -> str:
+        """在限流保护下发送异步非流式请求，配置了多端点时按路由依次尝试"""
+        async def attempt(endpoint: Endpoint) -> str:
+            limiter = self._limiter(endpoint)
+            if limiter is None:
+                return await self._send_async(payload, endpoint, recorder)
+            return await limiter.run(
+                estimate_tokens(payload), lambda: self._send_async(payload, endpoint, recorder), self._limiter_retries
+            )
+        
+        if self._router is None:
+            return await attempt(self._default_endpoint())
+        return await self._router.call(attempt)
+    
+    async def _send_async(
+        self,
+        payload: Dict[str, Any],
+        endpoint: Endpoint,
+        recorder: Optional[CallRecorder] = None
+    ) -> str:
+        """向指定端点发送异步非流式请求并解析响应"""
+        headers = self._build_headers(endpoint.api_key)
+        if recorder is not None:
+            recorder.sending(endpoint.url)
         
         # 发送异步API请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=self.timeout)
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise ValueError(f"API请求失败: {response.status} - {error_text}")
+        session = self._get_async_session()
+        async with session.post(
+            endpoint.url,
+            data=self._encode_body(payload, endpoint),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as response:
+            if recorder is not None:
+                recorder.connected()
+            if response.status != 200:
+                self._raise_for_status(response.status, await response.text(), response.headers)
                 
-                # 解析响应
-                response_data = await response.json()
+            # 解析响应
+            response_data = self._codec.loads(await response.read())
+            if recorder is not None:
+                recorder.usage(response_data.get("usage"))
+            if endpoint.protocol == "dashscope":
                 return self._parse_response(response_data)
+            return endpoint.parse_response(response_data)
     
     async def call_api_stream_async(
         self,
@@ -334,6 +852,8 @@ class DashScopeAPIClient:
         model_name: str,
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
         **kwargs: Any
     ) -> AsyncIterator[str]:
         """
@@ -344,6 +864,8 @@ class DashScopeAPIClient:
             model_name: 模型名称
             temperature: 温度参数
             max_tokens: 最大token数
+            stop: 停止词列表，生成内容在第一个停止词处截断（不含停止词）
+            on_metrics: 调用结束时接收本次埋点结果的回调
             **kwargs: 其他参数
             
         Yields:
@@ -358,51 +880,106 @@ class DashScopeAPIClient:
             model_name=model_name,
             temperature=temperature,
             max_tokens=max_tokens,
+            stop=stop,
             **kwargs
         )
         
-        # 启用流式输出
-        payload["parameters"]["incremental_output"] = True
+        # 启用流式输出，默认增量模式，调用方也可显式关闭以使用累计模式
+        payload["parameters"].setdefault("incremental_output", True)
         
-        headers = self._build_headers()
-        headers["Accept"] = "text/event-stream"
+        recorder = self._recorder(payload, True, on_metrics)
+        leaders: List[CallRecorder] = []
+        if self._singleflight is not None:
+            key = payload_key(payload, self.api_url, "stream")
+            timing = self._leader_recorder(payload, True, recorder)
+            stream = self._singleflight.stream(
+                key, lambda: self._stream_async(payload, timing), context=timing, on_join=leaders.append
+            )
+        else:
+            stream = self._stream_async(payload, recorder)
+        if payload["parameters"].get("stop"):
+            stream = self._stop_stream_async(stream, payload["parameters"]["stop"])
+        if recorder is not None:
+            stream = self._record_stream_async(stream, recorder, leaders)
+        try:
+            async for delta in stream:
+                yield delta
+        finally:
+            # 调用方提前关闭时立即逐层关闭内部流，而不是等垃圾回收
+            await stream.aclose()
+    
+    async def _stop_stream_async(self, stream: AsyncIterator[str], stop: List[str]) -> AsyncIterator[str]:
+        """异步版本的 _stop_stream"""
+        matcher = StopSequenceMatcher(stop)
+        try:
+            async for delta in stream:
+                text = matcher.feed(delta)
+                if text:
+                    yield text
+                if matcher.stopped:
+                    return
+            tail = matcher.flush()
+            if tail:
+                yield tail
+        finally:
+            aclose = getattr(stream, "aclose", None)
+            if aclose is not None:
+                await aclose()
+    
+    def _stream_async(self, payload: Dict[str, Any], recorder: Optional[CallRecorder] = None) -> AsyncIterator[str]:
+        """在限流保护下发送异步流式请求，配置了多端点时按路由依次尝试"""
+        def attempt(endpoint: Endpoint) -> AsyncIterator[str]:
+            limiter = self._limiter(endpoint)
+            if limiter is None:
+                return self._send_stream_async(payload, endpoint, recorder)
+            return limiter.stream(
+                estimate_tokens(payload), lambda: self._send_stream_async(payload, endpoint, recorder),
+                self._limiter_retries
+            )
+        
+        if self._router is None:
+            return attempt(self._default_endpoint())
+        return self._router.stream(attempt)
+    
+    async def _send_stream_async(
+        self,
+        payload: Dict[str, Any],
+        endpoint: Endpoint,
+        recorder: Optional[CallRecorder] = None
+    ) -> AsyncIterator[str]:
+        """向指定端点发送异步流式请求并逐个产出文本增量"""
+        incremental = bool(payload["parameters"]["incremental_output"])
+        headers = self._build_stream_headers(endpoint)
+        if recorder is not None:
+            recorder.sending(endpoint.url)
         
         # 发送异步流式API请求
-        async with aiohttp.ClientSession() as session:
-            async with session.post(
-                self.api_url,
-                json=payload,
-                headers=headers,
-                timeout=aiohttp.ClientTimeout(total=self.timeout)
-            ) as response:
-                if response.status != 200:
-                    error_text = await response.text()
-                    raise ValueError(f"API请求失败: {response.status} - {error_text}")
+        session = self._get_async_session()
+        async with session.post(
+            endpoint.url,
+            data=self._encode_body(payload, endpoint, stream=True),
+            headers=headers,
+            timeout=aiohttp.ClientTimeout(total=self.timeout)
+        ) as response:
+            if recorder is not None:
+                recorder.connected()
+            if response.status != 200:
+                self._raise_for_status(response.status, await response.text(), response.headers)
                 
-                # 处理Server-Sent Events (SSE)格式的流式响应
-                accumulated_content = ""
-                async for line in response.content:
-                    line = line.decode('utf-8').strip()
-                    if line.startswith('data:'):
-                        data = line[5:]  # 移除 'data: ' 前缀
-                        if data.strip() == '[DONE]':
-                            break
-                        try:
-                            chunk_data = json.loads(data)
-                            # 解析官方API返回格式
-                            if 'output' in chunk_data and 'choices' in chunk_data['output']:
-                                choice = chunk_data['output']['choices'][0]
-                                if 'message' in choice and 'content' in choice['message']:
-                                    current_content = choice['message']['content']
-                                    if current_content:
-                                        # 计算增量内容
-                                        if len(current_content) > len(accumulated_content):
-                                            delta_content = current_content[len(accumulated_content):]
-                                            if delta_content:
-                                                yield delta_content
-                                            accumulated_content = current_content
-                        except json.JSONDecodeError:
-                            continue
+            # 处理Server-Sent Events (SSE)格式的流式响应
+            decoder = endpoint.stream_decoder(incremental=incremental)
+            try:
+                async for raw in response.content.iter_any():
+                    for delta in decoder.feed(raw):
+                        yield delta
+                    if decoder.done:
+                        return
+                for delta in decoder.flush():
+                    yield delta
+            finally:
+                # 提前结束时也记录已收到的累计用量
+                if recorder is not None:
+                    recorder.usage(decoder.usage)
 
 
 class CustomChatModel(BaseChatModel):
@@ -419,14 +996,126 @@ class CustomChatModel(BaseChatModel):
     api_key: Optional[str] = None
     api_url: str = "https://dashscope.aliyuncs.com/api/v1/services/aigc/text-generation/generation"
     
+    # 连接池配置，见 DashScopeAPIClient 的参数
+    pool_connections: int = 10
+    pool_maxsize: int = 100
+    keepalive_timeout: float = 30.0
+    dns_cache_ttl: int = 300
+    warmup: bool = False
+    
+    # 是否合并相同payload的并发请求
+    coalesce_requests: bool = False
+    
+    # 限流配置，见 RateLimiter 的参数
+    rate_limit: Optional[Dict[str, Any]] = None
+    
+    # 对冲请求配置，见 HedgingPolicy 的参数
+    hedging: Optional[Dict[str, Any]] = None
+    
+    # 多端点配置：端点列表与路由参数，见 Endpoint 与 EndpointRouter
+    endpoints: Optional[List[Union[str, Dict[str, Any]]]] = None
+    routing: Optional[Dict[str, Any]] = None
+    
+    # 响应缓存：仅对temperature不高于cache_max_temperature的调用生效
+    response_cache: Optional[ResponseCache] = None
+    cache_max_temperature: float = 0.3
+    
+    # 流式增量合并窗口：小增量按字符数或时间合并后再包装为LangChain对象，0表示不合并
+    stream_coalesce_chars: int = 0
+    stream_coalesce_interval: float = 0.0
+    
+    # 调用埋点输出端，None表示写入进程级默认注册表；每次调用另外以LangChain自定义事件上报
+    metrics_sinks: Optional[List[Any]] = None
+    
+    # 请求体与响应的JSON编解码器，None表示自动选择（安装了orjson时使用orjson）
+    json_codec: Optional[JSONCodec] = None
+    
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         # 初始化API客户端
         self._api_client = DashScopeAPIClient(
             api_key=self.api_key,
-            api_url=self.api_url
+            api_url=self.api_url,
+            pool_connections=self.pool_connections,
+            pool_maxsize=self.pool_maxsize,
+            keepalive_timeout=self.keepalive_timeout,
+            dns_cache_ttl=self.dns_cache_ttl,
+            warmup=self.warmup,
+            coalesce=self.coalesce_requests,
+            rate_limit=self.rate_limit,
+            hedging=self.hedging,
+            endpoints=self.endpoints,
+            routing=self.routing,
+            metrics=self.metrics_sinks,
+            json_codec=self.json_codec
         )
     
+    async def aclose(self) -> None:
+        """释放API客户端持有的连接池"""
+        await self._api_client.aclose()
+    
+    def _response_cache_key(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]],
+        **kwargs: Any
+    ) -> Optional[str]:
+        """计算响应缓存key，未启用缓存或温度过高时返回None"""
+        if self.response_cache is None or self.temperature > self.cache_max_temperature:
+            return None
+        params = {
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "stop": stop,
+            **kwargs
+        }
+        return cache_key(self.model_name, params, [convert_message_to_dict(msg) for msg in messages])
+    
+    @staticmethod
+    def _usage_metadata(calls: List[CallMetrics]) -> Optional[Dict[str, int]]:
+        """上游返回了用量时转换为LangChain的 usage_metadata"""
+        if not calls or calls[-1].usage_source != "upstream":
+            return None
+        metrics = calls[-1]
+        return {
+            "input_tokens": metrics.prompt_tokens or 0,
+            "output_tokens": metrics.completion_tokens or 0,
+            "total_tokens": metrics.total_tokens or 0,
+        }
+    
+    def _report_metrics(self, run_manager: Optional[Any], calls: List[CallMetrics]) -> None:
+        """
+        以LangChain自定义事件上报埋点，事件挂在本次模型运行下，图运行时可按节点归因
+        
+        stream/astream 不向 _stream/_astream 传 run_manager，此时挂在外层可运行对象（如图节点）上；
+        不在任何运行上下文中时不上报。
+        """
+        for metrics in calls:
+            if run_manager is None:
+                try:
+                    dispatch_custom_event(METRICS_EVENT, metrics.to_dict())
+                except RuntimeError:
+                    pass
+                continue
+            handle_event(
+                run_manager.handlers, "on_custom_event", "ignore_custom_event", METRICS_EVENT, metrics.to_dict(),
+                run_id=run_manager.run_id, tags=run_manager.tags, metadata=run_manager.metadata
+            )
+    
+    async def _areport_metrics(self, run_manager: Optional[Any], calls: List[CallMetrics]) -> None:
+        """异步版本的 _report_metrics"""
+        for metrics in calls:
+            if run_manager is None:
+                try:
+                    await adispatch_custom_event(METRICS_EVENT, metrics.to_dict())
+                except RuntimeError:
+                    pass
+                continue
+            await ahandle_event(
+                run_manager.handlers, "on_custom_event", "ignore_custom_event", METRICS_EVENT, metrics.to_dict(),
+                run_id=run_manager.run_id, tags=run_manager.tags, metadata=run_manager.metadata
+            )
+    
     @property
     def _llm_type(self) -> str:
         """返回模型类型标识"""
@@ -460,17 +1149,27 @@ class CustomChatModel(BaseChatModel):
         Returns:
             ChatResult: 聊天结果
         """
-        # 使用API客户端调用API
-        content = self._api_client.call_api(
-            messages=messages,
-            model_name=self.model_name,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            **kwargs
-        )
+        key = self._response_cache_key(messages, stop, **kwargs)
+        content = self.response_cache.get(key) if key is not None else None
+        calls: List[CallMetrics] = []
+        if content is None:
+            # 使用API客户端调用API
+            content = self._api_client.call_api(
+                messages=messages,
+                model_name=self.model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stop=stop,
+                on_metrics=calls.append,
+                **kwargs
+            )
+            if key is not None:
+                self.response_cache.set(key, content)
+            self._report_metrics(run_manager, calls)
         
         # 创建ChatResult
-        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+        message = AIMessage(content=content, usage_metadata=self._usage_metadata(calls))
+        return ChatResult(generations=[ChatGeneration(message=message)])
     
     def _stream(
         self,
@@ -491,21 +1190,71 @@ class CustomChatModel(BaseChatModel):
         Yields:
             ChatGenerationChunk: 聊天生成块
         """
+        calls: List[CallMetrics] = []
+        for chunk in coalesce_chunks(
+            self._iter_text(messages, stop, on_metrics=calls.append, **kwargs),
+            self.stream_coalesce_chars,
+            self.stream_coalesce_interval
+        ):
+            # 创建ChatGenerationChunk，直接使用流式返回的内容
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        self._report_metrics(run_manager, calls)
+    
+    def _iter_text(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        """流式产出文本增量：命中缓存时回放，否则调用API，完整结束的流写回缓存"""
+        key = self._response_cache_key(messages, stop, **kwargs)
+        cached = self.response_cache.get(key) if key is not None else None
+        if cached is not None:
+            # 命中缓存时按片段回放
+            yield from iter_replay_chunks(cached)
+            return
+        
         # 使用API客户端进行流式调用
-        result = self._api_client.call_api_stream(
+        collected: List[str] = []
+        for chunk in self._api_client.call_api_stream(
             messages=messages,
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
+            stop=stop,
+            on_metrics=on_metrics,
             **kwargs
-        )
-
-        for chunk in result:
-            # 创建ChatGenerationChunk，直接使用流式返回的内容
-            generation_chunk = ChatGenerationChunk(
-                message=AIMessageChunk(content=chunk)
-            )
-            yield generation_chunk
+        ):
+            collected.append(chunk)
+            yield chunk
+        
+        # 只有完整结束的流才写入缓存
+        if key is not None:
+            self.response_cache.set(key, "".join(collected))
+    
+    def stream_text(
+        self,
+        input: LanguageModelInput,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> Iterator[str]:
+        """
+        低开销的流式接口，直接产出SSE解析出的str增量
+        
+        与 stream 相比不为每个增量构造 AIMessageChunk/ChatGenerationChunk，
+        也不触发LangChain回调；缓存、停止词等行为与 stream 一致。
+        
+        Args:
+            input: 与 invoke 相同的输入（字符串、消息列表或PromptValue）
+            stop: 停止词列表
+            **kwargs: 其他API参数
+            
+        Yields:
+            str: 文本增量
+        """
+        messages = self._convert_input(input).to_messages()
+        yield from self._iter_text(messages, stop, **kwargs)
     
     async def _agenerate(
         self,
@@ -526,17 +1275,27 @@ class CustomChatModel(BaseChatModel):
         Returns:
             ChatResult: 聊天结果
         """
-        # 使用API客户端进行异步调用
-        content = await self._api_client.call_api_async(
-            messages=messages,
-            model_name=self.model_name,
-            temperature=self.temperature,
-            max_tokens=self.max_tokens,
-            **kwargs
-        )
+        key = self._response_cache_key(messages, stop, **kwargs)
+        content = await self.response_cache.aget(key) if key is not None else None
+        calls: List[CallMetrics] = []
+        if content is None:
+            # 使用API客户端进行异步调用
+            content = await self._api_client.call_api_async(
+                messages=messages,
+                model_name=self.model_name,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                stop=stop,
+                on_metrics=calls.append,
+                **kwargs
+            )
+            if key is not None:
+                await self.response_cache.aset(key, content)
+            await self._areport_metrics(run_manager, calls)
         
         # 创建ChatResult
-        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=content))])
+        message = AIMessage(content=content, usage_metadata=self._usage_metadata(calls))
+        return ChatResult(generations=[ChatGeneration(message=message)])
     
     async def _astream(
         self,
@@ -557,19 +1316,70 @@ class CustomChatModel(BaseChatModel):
         Yields:
             ChatGenerationChunk: 聊天生成块
         """
+        calls: List[CallMetrics] = []
+        async for chunk in acoalesce_chunks(
+            self._aiter_text(messages, stop, on_metrics=calls.append, **kwargs),
+            self.stream_coalesce_chars,
+            self.stream_coalesce_interval
+        ):
+            # 创建ChatGenerationChunk，直接使用流式返回的内容
+            yield ChatGenerationChunk(message=AIMessageChunk(content=chunk))
+        await self._areport_metrics(run_manager, calls)
+    
+    async def _aiter_text(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        on_metrics: Optional[Callable[[CallMetrics], None]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """异步版本的 _iter_text"""
+        key = self._response_cache_key(messages, stop, **kwargs)
+        cached = await self.response_cache.aget(key) if key is not None else None
+        if cached is not None:
+            # 命中缓存时按片段回放
+            for chunk in iter_replay_chunks(cached):
+                yield chunk
+            return
+        
         # 使用API客户端进行异步流式调用
+        collected: List[str] = []
         async for chunk in self._api_client.call_api_stream_async(
             messages=messages,
             model_name=self.model_name,
             temperature=self.temperature,
             max_tokens=self.max_tokens,
+            stop=stop,
+            on_metrics=on_metrics,
             **kwargs
         ):
-            # 创建ChatGenerationChunk，直接使用流式返回的内容
-            generation_chunk = ChatGenerationChunk(
-                message=AIMessageChunk(content=chunk)
-            )
-            yield generation_chunk
+            collected.append(chunk)
+            yield chunk
+        
+        # 只有完整结束的流才写入缓存
+        if key is not None:
+            await self.response_cache.aset(key, "".join(collected))
+    
+    async def astream_text(
+        self,
+        input: LanguageModelInput,
+        stop: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> AsyncIterator[str]:
+        """
+        异步版本的 stream_text
+        
+        Args:
+            input: 与 ainvoke 相同的输入（字符串、消息列表或PromptValue）
+            stop: 停止词列表
+            **kwargs: 其他API参数
+            
+        Yields:
+            str: 文本增量
+        """
+        messages = self._convert_input(input).to_messages()
+        async for chunk in self._aiter_text(messages, stop, **kwargs):
+            yield chunk
 
 
 if __name__ == "__main__":
@@ -0,0 +1,211 @@
+"""
+请求体预编码
+
+DashScope请求体由固定的模型名、参数与消息列表组成。长系统提示词与多轮对话历史
+在相邻请求之间基本不变，每次都重新转换、重新序列化整份JSON会浪费CPU。
+PayloadEncoder 缓存模型头、参数与单条消息编码后的字节，发送时只做字节拼接。
+JSON编解码器可插拔，安装了 orjson 时自动使用；orjson 整体编码已经比拼接缓存更快，此时不走缓存。
+"""
+
+import json
+import threading
+from typing import Any, Dict, Hashable, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖
+    orjson = None
+
+
+class JSONCodec:
+    """
+    JSON编解码器，dumps 输出UTF-8字节（紧凑格式，不转义非ASCII字符）
+    """
+
+    name = "json"
+    # 是否适合增量编码：标准库逐条编码开销大，缓存单条消息的编码结果收益明显
+    incremental = True
+
+    def dumps(self, obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+
+class OrjsonCodec(JSONCodec):
+    """基于 orjson 的编解码器"""
+
+    name = "orjson"
+    # orjson整体编码比逐条查缓存再拼接更快（见 benchmarks/bench_payload_encoder.py），直接整体编码
+    incremental = False
+
+    def dumps(self, obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    def loads(self, data: bytes) -> Any:
+        return orjson.loads(data)
+
+
+def default_codec() -> JSONCodec:
+    """返回可用的最快编解码器：安装了 orjson 时使用 orjson，否则使用标准库"""
+    return OrjsonCodec() if orjson is not None else JSONCodec()
+
+
+class _BytesCache:
+    """
+    key -> bytes 缓存，超出条目数或总字节数上限时淘汰最早写入的条目
+
+    读路径只做一次dict查找（GIL下原子），不加锁，也不维护LRU顺序，以免缓存开销抵消编码收益。
+    """
+
+    def __init__(self, max_entries: int, max_bytes: Optional[int] = None):
+        """
+        Args:
+            max_entries: 最多缓存的条目数
+            max_bytes: 缓存值的总字节数上限，None表示只按条目数限制；单个值超过上限时不缓存
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.data: Dict[Hashable, bytes] = {}
+        self.size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.data)
+
+    def put(self, key: Hashable, value: bytes) -> bytes:
+        max_bytes = self.max_bytes
+        if max_bytes is not None and len(value) > max_bytes:
+            return value
+        with self._lock:
+            previous = self.data.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.data[key] = value
+            self.size += len(value)
+            while len(self.data) > self.max_entries or (max_bytes is not None and self.size > max_bytes):
+                self.size -= len(self.data.pop(next(iter(self.data))))
+        return value
+
+
+def _freeze(value: Any) -> Optional[Hashable]:
+    """将参数值转为可哈希的key，含不可哈希的嵌套结构时返回None"""
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        # 类型也参与key，避免 1 / 1.0 / True 共用同一份编码
+        return (type(value), value)
+    if isinstance(value, (list, tuple)):
+        items = tuple(_freeze(item) for item in value)
+        return None if any(item is None for item in items) else (type(value), items)
+    return None
+
+
+class PayloadEncoder:
+    """
+    DashScope payload 的增量编码器
+
+    输出与 codec.dumps(payload) 语义相同的JSON字节：
+    模型头按模型名缓存，参数按取值缓存，字符串内容的消息按 (role, content) 缓存。
+    结构不符合DashScope格式的payload，或编解码器本身足够快（incremental=False）时直接整体编码。
+    """
+
+    def __init__(
+        self,
+        codec: Optional[JSONCodec] = None,
+        max_messages: int = 4096,
+        max_message_bytes: int = 16 * 1024 * 1024,
+        max_parameters: int = 256
+    ):
+        """
+        Args:
+            codec: JSON编解码器，None表示自动选择
+            max_messages: 最多缓存的消息编码数
+            max_message_bytes: 消息编码缓存的总字节数上限；缓存key中的原文大小与编码结果相当，
+                实际占用的内存约为该值的两倍
+            max_parameters: 最多缓存的参数编码数
+        """
+        self.codec = codec or default_codec()
+        self._heads = _BytesCache(64)
+        self._parameters = _BytesCache(max_parameters)
+        self._messages = _BytesCache(max_messages, max_message_bytes)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回消息编码缓存的命中统计"""
+        total = self._messages.hits + self._messages.misses
+        return {
+            "codec": self.codec.name,
+            "cached_messages": len(self._messages),
+            "cached_message_bytes": self._messages.size,
+            "message_hits": self._messages.hits,
+            "message_misses": self._messages.misses,
+            "message_hit_rate": self._messages.hits / total if total else 0.0,
+        }
+
+    def _encode_parameters(self, parameters: Dict[str, Any]) -> bytes:
+        frozen = tuple((key, _freeze(value)) for key, value in parameters.items())
+        if any(value is None for _, value in frozen):
+            return self.codec.dumps(parameters)
+        encoded = self._parameters.data.get(frozen)
+        if encoded is None:
+            encoded = self._parameters.put(frozen, self.codec.dumps(parameters))
+        return encoded
+
+    def _encode_messages(self, messages: List[Any]) -> bytes:
+        """逐条取缓存的消息编码并拼接，只有 role/content 均为字符串的消息进入缓存"""
+        cache = self._messages
+        lookup = cache.data.get
+        dumps = self.codec.dumps
+        parts = []
+        hits = 0
+        for message in messages:
+            role = message.get("role")
+            content = message.get("content")
+            if type(content) is not str or type(role) is not str or len(message) != 2:
+                parts.append(dumps(message))
+                continue
+            key = (role, content)
+            encoded = lookup(key)
+            if encoded is None:
+                cache.misses += 1
+                encoded = cache.put(key, dumps(message))
+            else:
+                hits += 1
+            parts.append(encoded)
+        cache.hits += hits
+        return b",".join(parts)
+
+    def encode(self, payload: Dict[str, Any]) -> bytes:
+        """
+        编码payload
+
+        Args:
+            payload: DashScope格式的payload
+
+        Returns:
+            bytes: JSON请求体
+        """
+        if not self.codec.incremental:
+            return self.codec.dumps(payload)
+        model = payload.get("model")
+        messages = payload.get("input", {}).get("messages") if isinstance(payload.get("input"), dict) else None
+        if (
+            not isinstance(messages, list)
+            or not isinstance(model, str)
+            or payload.keys() != {"model", "input", "parameters"}
+            or payload["input"].keys() != {"messages"}
+            or not isinstance(payload["parameters"], dict)
+        ):
+            return self.codec.dumps(payload)
+
+        head = self._heads.data.get(model)
+        if head is None:
+            head = self._heads.put(model, b'{"model":' + self.codec.dumps(model) + b',"input":{"messages":[')
+        return b"".join((
+            head,
+            self._encode_messages(messages),
+            b']},"parameters":',
+            self._encode_parameters(payload["parameters"]),
+            b"}",
+        ))
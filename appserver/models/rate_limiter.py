@@ -0,0 +1,480 @@
+"""
+客户端限流与自适应并发控制
+
+按端点（地址 + API Key）共享一个限流器：
+- 令牌桶：每秒请求数（RPS）与每分钟token数（TPM）
+- AIMD自适应并发：成功且延迟正常时加性增加并发上限，遇到429或延迟超标时乘性减小
+- 429重试：带抖动的指数退避，优先遵循 Retry-After；配置了多个端点时由调用方关闭，让429交给端点路由转移
+超出限额的调用在队列中等待，而不是直接失败。
+"""
+
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Iterator, Optional, Tuple, TypeVar, Union
+
+try:
+    from .errors import RateLimitError
+except ImportError:
+    from errors import RateLimitError
+
+T = TypeVar("T")
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析 Retry-After 响应头
+
+    Args:
+        value: 秒数或HTTP日期
+
+    Returns:
+        Optional[float]: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def estimate_tokens(payload: Dict[str, Any]) -> int:
+    """
+    粗略估算一次请求消耗的token数（输入按字符计，加上最大输出长度）
+
+    中文约一字一token，英文按字符计会偏高，作为限流估算是保守的。
+    """
+    messages = payload.get("input", {}).get("messages", [])
+    prompt_tokens = sum(len(str(message.get("content", ""))) for message in messages)
+    return prompt_tokens + int(payload.get("parameters", {}).get("max_tokens") or 0)
+
+
+class TokenBucket:
+    """
+    线程安全的令牌桶
+
+    reserve 预扣令牌并返回需要等待的秒数，调用方自行选择 time.sleep 或 asyncio.sleep。
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        """
+        Args:
+            rate: 每秒补充的令牌数
+            capacity: 桶容量，默认等于一秒的补充量
+        """
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(rate, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """
+        预扣令牌
+
+        Args:
+            amount: 需要的令牌数，超过容量时按容量计
+
+        Returns:
+            float: 令牌到位前需要等待的秒数
+        """
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+
+class _Waiter:
+    """并发槽位的等待者，同步调用使用threading.Event，异步调用使用Future"""
+
+    def __init__(self, future: Optional["asyncio.Future[None]"] = None):
+        self.future = future
+        self.event = threading.Event() if future is None else None
+        self.granted = False
+
+    def wake(self) -> None:
+        self.granted = True
+        if self.future is not None:
+            loop = self.future.get_loop()
+            loop.call_soon_threadsafe(self._resolve)
+        else:
+            self.event.set()
+
+    def _resolve(self) -> None:
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+class RateLimiter:
+    """
+    单个端点（地址 + API Key）的限流器，组合令牌桶与AIMD自适应并发上限
+    """
+
+    def __init__(
+        self,
+        requests_per_second: Optional[float] = None,
+        tokens_per_minute: Optional[int] = None,
+        initial_concurrency: int = 8,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        latency_target: Optional[float] = None,
+        max_retries: int = 5,
+        base_backoff: float = 0.5,
+        max_backoff: float = 30.0
+    ):
+        """
+        初始化限流器
+
+        Args:
+            requests_per_second: 每秒请求数上限，None表示不限制
+            tokens_per_minute: 每分钟token数上限，None表示不限制
+            initial_concurrency: 初始并发上限
+            min_concurrency: 并发上限的下界
+            max_concurrency: 并发上限的上界
+            latency_target: 延迟目标（秒），超过时视为拥塞并减小并发
+            max_retries: 429最大重试次数
+            base_backoff: 退避基准时间（秒）
+            max_backoff: 单次退避的最长时间（秒）
+        """
+        self.request_bucket = TokenBucket(requests_per_second) if requests_per_second else None
+        self.token_bucket = (
+            TokenBucket(tokens_per_minute / 60.0, capacity=tokens_per_minute) if tokens_per_minute else None
+        )
+        self.min_concurrency = min_concurrency
+        self.max_concurrency = max_concurrency
+        self.latency_target = latency_target
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self._limit = float(max(min_concurrency, min(initial_concurrency, max_concurrency)))
+        self._in_flight = 0
+        self._waiters: Deque[_Waiter] = deque()
+        self._lock = threading.Lock()
+        # 两次乘性减小之间至少间隔的时间，避免同一批429把上限一路压到底
+        self._decrease_cooldown = 1.0
+        self._last_decrease = 0.0
+
+        self.throttled = 0
+        self.retries = 0
+        self.total_wait = 0.0
+        self.acquired = 0
+
+    @property
+    def concurrency_limit(self) -> int:
+        """当前的并发上限"""
+        return int(self._limit)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回限流器状态快照"""
+        return {
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self._in_flight,
+            "queued": len(self._waiters),
+            "throttled": self.throttled,
+            "retries": self.retries,
+            "acquired": self.acquired,
+            "avg_wait": self.total_wait / self.acquired if self.acquired else 0.0,
+        }
+
+    def _bucket_delay(self, tokens: int) -> float:
+        delay = 0.0
+        if self.request_bucket is not None:
+            delay = max(delay, self.request_bucket.reserve(1))
+        if self.token_bucket is not None and tokens:
+            delay = max(delay, self.token_bucket.reserve(tokens))
+        return delay
+
+    def _try_acquire_slot(self, waiter: Optional[_Waiter] = None) -> bool:
+        """尝试占用并发槽位，失败时把waiter加入队列，调用方需持有锁"""
+        if not self._waiters and self._in_flight < int(self._limit):
+            self._in_flight += 1
+            return True
+        if waiter is not None:
+            self._waiters.append(waiter)
+        return False
+
+    def _wake_waiters(self) -> None:
+        """按FIFO顺序唤醒等待者，调用方需持有锁"""
+        while self._waiters and self._in_flight < int(self._limit):
+            waiter = self._waiters.popleft()
+            self._in_flight += 1
+            waiter.wake()
+
+    async def acquire(self, tokens: int = 0) -> float:
+        """
+        异步获取发送许可，必要时排队等待
+
+        Args:
+            tokens: 本次请求预估消耗的token数
+
+        Returns:
+            float: 排队等待的总时长（秒）
+        """
+        start = time.monotonic()
+        delay = self._bucket_delay(tokens)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        loop = asyncio.get_running_loop()
+        waiter = _Waiter(loop.create_future())
+        with self._lock:
+            acquired = self._try_acquire_slot(waiter)
+        if not acquired:
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                with self._lock:
+                    if waiter.granted:
+                        self._in_flight -= 1
+                        self._wake_waiters()
+                    else:
+                        self._waiters.remove(waiter)
+                raise
+        return self._record_wait(start)
+
+    def acquire_sync(self, tokens: int = 0) -> float:
+        """
+        同步获取发送许可，必要时阻塞等待
+
+        Args:
+            tokens: 本次请求预估消耗的token数
+
+        Returns:
+            float: 排队等待的总时长（秒）
+        """
+        start = time.monotonic()
+        delay = self._bucket_delay(tokens)
+        if delay > 0:
+            time.sleep(delay)
+        waiter = _Waiter()
+        with self._lock:
+            acquired = self._try_acquire_slot(waiter)
+        if not acquired:
+            waiter.event.wait()
+        return self._record_wait(start)
+
+    def _record_wait(self, start: float) -> float:
+        waited = time.monotonic() - start
+        with self._lock:
+            self.acquired += 1
+            self.total_wait += waited
+        return waited
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False) -> None:
+        """
+        归还并发槽位，并根据结果调整并发上限
+
+        Args:
+            latency: 请求耗时（秒），请求失败时为None
+            throttled: 是否因429被限流
+        """
+        with self._lock:
+            self._in_flight -= 1
+            now = time.monotonic()
+            congested = throttled or (
+                self.latency_target is not None and latency is not None and latency > self.latency_target
+            )
+            if throttled:
+                self.throttled += 1
+            if congested:
+                if now - self._last_decrease >= self._decrease_cooldown:
+                    self._limit = max(float(self.min_concurrency), self._limit / 2)
+                    self._last_decrease = now
+            elif latency is not None:
+                # 加性增加：每个完整窗口大约+1
+                self._limit = min(float(self.max_concurrency), self._limit + 1.0 / self._limit)
+            self._wake_waiters()
+
+    def backoff_delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        计算第attempt次重试前的等待时间
+
+        Args:
+            attempt: 已失败的次数（从0开始）
+            retry_after: 上游通过 Retry-After 给出的等待时间
+
+        Returns:
+            float: 等待秒数
+        """
+        # 全抖动指数退避，避免大量调用方同时重试
+        delay = random.uniform(0, min(self.max_backoff, self.base_backoff * (2 ** attempt)))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
+
+    async def run(
+        self,
+        tokens: int,
+        func: Callable[[], Awaitable[T]],
+        max_retries: Optional[int] = None
+    ) -> T:
+        """
+        在限流保护下执行异步请求，429时退避重试
+
+        Args:
+            tokens: 预估token数
+            func: 返回协程的函数
+            max_retries: 本次调用的429最大重试次数，None表示使用限流器的配置；
+                为0时429直接抛出，由端点路由转移到其他端点
+
+        Returns:
+            协程的返回值
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            start = time.monotonic()
+            try:
+                result = await func()
+            except RateLimitError as exc:
+                self.release(throttled=True)
+                if attempt >= max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt, exc.retry_after))
+                attempt += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release(latency=time.monotonic() - start)
+            return result
+
+    def run_sync(self, tokens: int, func: Callable[[], T], max_retries: Optional[int] = None) -> T:
+        """同步版本的 run"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self.acquire_sync(tokens)
+            start = time.monotonic()
+            try:
+                result = func()
+            except RateLimitError as exc:
+                self.release(throttled=True)
+                if attempt >= max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt, exc.retry_after))
+                attempt += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                self.release()
+                raise
+            self.release(latency=time.monotonic() - start)
+            return result
+
+    async def stream(
+        self,
+        tokens: int,
+        func: Callable[[], AsyncIterator[str]],
+        max_retries: Optional[int] = None
+    ) -> AsyncIterator[str]:
+        """
+        在限流保护下执行异步流式请求，整个流期间占用一个并发槽位
+
+        只有在首个片段产出之前遇到429才会重试。AIMD的延迟信号取首片段延迟（TTFT）而不是整个流的耗时，
+        否则长输出总会超过 latency_target 而被误判为拥塞。max_retries 的含义同 run。
+        """
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            start = time.monotonic()
+            started = False
+            ttft: Optional[float] = None
+            try:
+                async for chunk in func():
+                    if not started:
+                        ttft = time.monotonic() - start
+                    started = True
+                    yield chunk
+            except RateLimitError as exc:
+                self.release(throttled=True)
+                if started or attempt >= max_retries:
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt, exc.retry_after))
+                attempt += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                self.release()
+                raise
+            # 流的总时长取决于输出长度，以首片段延迟作为拥塞信号；没有任何片段时取总耗时
+            self.release(latency=ttft if ttft is not None else time.monotonic() - start)
+            return
+
+    def stream_sync(
+        self,
+        tokens: int,
+        func: Callable[[], Iterator[str]],
+        max_retries: Optional[int] = None
+    ) -> Iterator[str]:
+        """同步版本的 stream"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        attempt = 0
+        while True:
+            self.acquire_sync(tokens)
+            start = time.monotonic()
+            started = False
+            ttft: Optional[float] = None
+            try:
+                for chunk in func():
+                    if not started:
+                        ttft = time.monotonic() - start
+                    started = True
+                    yield chunk
+            except RateLimitError as exc:
+                self.release(throttled=True)
+                if started or attempt >= max_retries:
+                    raise
+                time.sleep(self.backoff_delay(attempt, exc.retry_after))
+                attempt += 1
+                self.retries += 1
+                continue
+            except BaseException:
+                self.release()
+                raise
+            # 流的总时长取决于输出长度，以首片段延迟作为拥塞信号；没有任何片段时取总耗时
+            self.release(latency=ttft if ttft is not None else time.monotonic() - start)
+            return
+
+
+_limiters: Dict[Tuple[Optional[str], str], RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api_key: str, url: Optional[str] = None, **config: Union[int, float, None]) -> RateLimiter:
+    """
+    获取端点对应的共享限流器，同一端点地址与API Key的所有客户端共用一份配额
+
+    不同端点（如区域直连与网关）的配额与拥塞状态相互独立，不能因为共用API Key而互相压低并发上限。
+
+    Args:
+        api_key: API密钥
+        url: 端点地址，None表示只按API Key区分
+        **config: 首次创建时传给RateLimiter的参数
+
+    Returns:
+        RateLimiter: 共享的限流器
+    """
+    key = (url, api_key)
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if limiter is None:
+            limiter = _limiters[key] = RateLimiter(**config)
+        return limiter
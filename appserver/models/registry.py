@@ -0,0 +1,166 @@
+"""
+进程级模型注册表
+
+模型对象（及其内部的HTTP客户端与连接池）按“名称 + 参数”在进程内只创建一次，
+各服务共享同一实例，避免每次调用都重新构造对象、重新建立TLS连接。
+LangChain模型的调用方法不修改实例状态，可在多线程与多协程间共享。
+"""
+
+import asyncio
+import json
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def _params_key(params: Dict[str, Any]) -> str:
+    """将参数规范化为缓存key，不可JSON序列化的值按repr参与比较"""
+    return json.dumps(params, sort_keys=True, ensure_ascii=False, default=repr)
+
+
+def _tongyi(**params: Any) -> Any:
+    from langchain_community.llms.tongyi import Tongyi
+    return Tongyi(**params)
+
+
+def _chat_tongyi(**params: Any) -> Any:
+    from langchain_community.chat_models import ChatTongyi
+    return ChatTongyi(**params)
+
+
+def _deepseek(**params: Any) -> Any:
+    from langchain_deepseek import ChatDeepSeek
+    return ChatDeepSeek(**params)
+
+
+def _custom_chat(**params: Any) -> Any:
+    try:
+        from .new_model import CustomChatModel
+    except ImportError:
+        from new_model import CustomChatModel
+    return CustomChatModel(**params)
+
+
+def _dashscope_llm(**params: Any) -> Any:
+    try:
+        from .custom_model import CustomDashScopeLLM
+    except ImportError:
+        from custom_model import CustomDashScopeLLM
+    return CustomDashScopeLLM(**params)
+
+
+class ModelRegistry:
+    """
+    模型工厂与实例池
+
+    通过 register 注册工厂函数，通过 get 获取共享实例；
+    同一 (名称, 参数) 只会调用一次工厂函数，并发首次获取时也不会重复创建。
+    """
+
+    def __init__(self):
+        self._factories: Dict[str, Callable[..., Any]] = {}
+        self._instances: Dict[Tuple[str, str], Any] = {}
+        self._creating: Dict[Tuple[str, str], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[..., Any]) -> None:
+        """
+        注册模型工厂
+
+        Args:
+            name: 模型名称，如 "tongyi"、"deepseek"
+            factory: 以关键字参数构造模型实例的函数
+        """
+        with self._lock:
+            self._factories[name] = factory
+
+    def names(self) -> List[str]:
+        """返回已注册的模型名称"""
+        with self._lock:
+            return sorted(self._factories)
+
+    def get(self, name: str, **params: Any) -> Any:
+        """
+        获取共享的模型实例，不存在时创建
+
+        Args:
+            name: 已注册的模型名称
+            **params: 传给工厂函数的参数，参数相同的调用共享同一实例
+
+        Returns:
+            模型实例
+
+        Raises:
+            ValueError: 模型名称未注册时抛出
+        """
+        key = (name, _params_key(params))
+        instance = self._instances.get(key)
+        if instance is not None:
+            return instance
+
+        with self._lock:
+            factory = self._factories.get(name)
+            if factory is None:
+                raise ValueError(f"未注册的模型: {name}，可选: {sorted(self._factories)}")
+            creating = self._creating.setdefault(key, threading.Lock())
+
+        # 每个key单独加锁：构造慢的模型不会阻塞其他模型的获取
+        with creating:
+            instance = self._instances.get(key)
+            if instance is None:
+                instance = factory(**params)
+                self._instances[key] = instance
+        with self._lock:
+            self._creating.pop(key, None)
+        return instance
+
+    def stats(self) -> Dict[str, int]:
+        """返回各模型名称下的实例数"""
+        counts: Dict[str, int] = {}
+        for name, _ in list(self._instances):
+            counts[name] = counts.get(name, 0) + 1
+        return counts
+
+    def clear(self) -> List[Any]:
+        """清空实例池并返回被移除的实例"""
+        with self._lock:
+            instances = list(self._instances.values())
+            self._instances.clear()
+        return instances
+
+    async def aclose(self) -> None:
+        """
+        清空实例池，并释放实例持有的连接池（支持 aclose 或 close 的实例）
+
+        单个实例释放失败不影响其余实例，全部处理完后抛出第一个错误。
+        """
+        first_error: Optional[Exception] = None
+        for instance in self.clear():
+            try:
+                aclose = getattr(instance, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                    continue
+                close = getattr(instance, "close", None)
+                if close is not None:
+                    result = close()
+                    if asyncio.iscoroutine(result):
+                        await result
+            except Exception as exc:
+                if first_error is None:
+                    first_error = exc
+        if first_error is not None:
+            raise first_error
+
+
+# 进程内共享的默认注册表
+model_registry = ModelRegistry()
+model_registry.register("tongyi", _tongyi)
+model_registry.register("chat_tongyi", _chat_tongyi)
+model_registry.register("deepseek", _deepseek)
+model_registry.register("custom_chat", _custom_chat)
+model_registry.register("dashscope_llm", _dashscope_llm)
+
+
+def get_model(name: str, **params: Any) -> Any:
+    """从默认注册表获取共享的模型实例，见 ModelRegistry.get"""
+    return model_registry.get(name, **params)
@@ -0,0 +1,236 @@
+"""
+确定性响应缓存
+
+为低温度（近似确定性）的模型调用缓存完整回复：
+- 内存层：有界LRU + TTL
+- 磁盘层（可选）：SQLite，多个uvicorn worker可共享同一个文件
+- 流式调用命中时把缓存文本按片段回放
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+
+def cache_key(model_name: str, params: Dict[str, Any], messages: List[Dict[str, str]]) -> str:
+    """
+    根据模型名称、生成参数与规范化后的消息计算缓存key
+
+    Args:
+        model_name: 模型名称
+        params: 生成参数（temperature、max_tokens、stop等）
+        messages: 已转换为API格式的消息列表
+
+    Returns:
+        str: 形如 "模型名:sha256" 的key，前缀用于按模型失效
+    """
+    normalized = [
+        {"role": message["role"], "content": str(message["content"]).replace("\r\n", "\n").strip()}
+        for message in messages
+    ]
+    canonical = json.dumps(
+        {"params": params, "messages": normalized},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return f"{model_name}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()}"
+
+
+def iter_replay_chunks(text: str, chunk_size: int = 16) -> Iterator[str]:
+    """
+    将缓存文本切分为片段，用于流式回放
+
+    Args:
+        text: 缓存的完整文本
+        chunk_size: 每个片段的字符数
+
+    Yields:
+        str: 文本片段
+    """
+    for start in range(0, len(text), chunk_size):
+        yield text[start:start + chunk_size]
+
+
+class ResponseCache:
+    """
+    两级响应缓存：内存LRU + 可选SQLite磁盘层
+
+    线程安全；异步调用方使用 aget/aset，磁盘读写会放到线程池中执行。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: Optional[float] = 3600.0,
+        sqlite_path: Optional[str] = None
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            max_entries: 内存层最大条目数
+            ttl: 条目存活时间（秒），None表示永不过期
+            sqlite_path: SQLite文件路径，None表示不启用磁盘层
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.sqlite_path = sqlite_path
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, Tuple[Optional[float], str]]" = OrderedDict()
+        self._db: Optional[sqlite3.Connection] = None
+        if sqlite_path is not None:
+            self._db = sqlite3.connect(sqlite_path, timeout=30, check_same_thread=False)
+            # WAL模式允许多个进程同时读写
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中、未命中与淘汰计数"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "size": len(self._entries),
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _expires_at(self) -> Optional[float]:
+        return time.time() + self.ttl if self.ttl is not None else None
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存
+
+        Args:
+            key: 缓存key
+
+        Returns:
+            Optional[str]: 命中时返回缓存文本，否则返回None
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at is None or expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at is None or expires_at > now:
+                        self._put_memory(key, value, expires_at)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: str) -> None:
+        """
+        写入缓存
+
+        Args:
+            key: 缓存key
+            value: 完整回复文本
+        """
+        expires_at = self._expires_at()
+        with self._lock:
+            self._put_memory(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at)
+                )
+                self._db.commit()
+
+    def _put_memory(self, key: str, value: str, expires_at: Optional[float]) -> None:
+        """写入内存层并按LRU淘汰，调用方需持有锁"""
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def aget(self, key: str) -> Optional[str]:
+        """异步查询缓存，磁盘层查询不阻塞事件循环"""
+        if self._db is None:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: str, value: str) -> None:
+        """异步写入缓存，磁盘层写入不阻塞事件循环"""
+        if self._db is None:
+            self.set(key, value)
+        else:
+            await asyncio.to_thread(self.set, key, value)
+
+    def invalidate(self, key: Optional[str] = None, model_name: Optional[str] = None) -> int:
+        """
+        使缓存失效
+
+        Args:
+            key: 指定失效的key
+            model_name: 使该模型的全部条目失效；key与model_name都为空时清空缓存
+
+        Returns:
+            int: 内存层中被删除的条目数
+        """
+        with self._lock:
+            if key is not None:
+                keys = [key] if key in self._entries else []
+            elif model_name is not None:
+                prefix = f"{model_name}:"
+                keys = [k for k in self._entries if k.startswith(prefix)]
+            else:
+                keys = list(self._entries)
+            for k in keys:
+                del self._entries[k]
+
+            if self._db is not None:
+                if key is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                elif model_name is not None:
+                    self._db.execute(
+                        "DELETE FROM responses WHERE substr(key, 1, ?) = ?",
+                        (len(f"{model_name}:"), f"{model_name}:")
+                    )
+                else:
+                    self._db.execute("DELETE FROM responses")
+                self._db.commit()
+            return len(keys)
+
+    def close(self) -> None:
+        """关闭磁盘层连接"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,270 @@
+"""
+在途请求合并（single-flight）
+
+相同payload的并发请求只向上游发送一次：
+- 非流式调用：所有等待者共享同一个结果或异常
+- 流式调用：上游token流广播给所有订阅者，迟到的订阅者先收到已缓冲的前缀，再接收实时的后续内容
+"""
+
+import asyncio
+import hashlib
+import json
+import threading
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def payload_key(payload: Dict[str, Any], *scope: str) -> str:
+    """
+    计算payload的规范化哈希
+
+    Args:
+        payload: 请求payload
+        *scope: 额外参与哈希的作用域（如API地址、是否流式）
+
+    Returns:
+        str: 十六进制sha256摘要
+    """
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    digest = hashlib.sha256()
+    for part in scope:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    digest.update(canonical.encode("utf-8"))
+    return digest.hexdigest()
+
+
+class _SyncCall:
+    """同步调用的在途记录"""
+
+    def __init__(self) -> None:
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.context: Any = None
+
+
+class _AsyncCall:
+    """异步调用的在途记录"""
+
+    def __init__(self, task: "asyncio.Future[Any]", context: Any) -> None:
+        self.task = task
+        self.context = context
+        self.waiters = 0
+
+
+class _StreamFlight:
+    """流式调用的在途记录，保存已到达的全部片段"""
+
+    def __init__(self) -> None:
+        self.chunks: List[str] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self.updated = asyncio.Event()
+        self.task: Optional["asyncio.Task[None]"] = None
+        self.context: Any = None
+
+    def notify(self) -> None:
+        """唤醒所有等待新片段的订阅者"""
+        updated, self.updated = self.updated, asyncio.Event()
+        updated.set()
+
+
+class SingleFlight:
+    """
+    按key合并在途请求，并统计合并命中率
+
+    异步在途记录按事件循环隔离，同步在途记录在线程间共享。
+    领头的调用可以附带一个 context（如埋点记录器），之后加入的调用通过 on_join 回调拿到它。
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._flights: Dict[Tuple[asyncio.AbstractEventLoop, str], _AsyncCall] = {}
+        self._sync_flights: Dict[str, _SyncCall] = {}
+        self._streams: Dict[Tuple[asyncio.AbstractEventLoop, str], _StreamFlight] = {}
+        self.calls = 0
+        self.coalesced = 0
+        self.stream_calls = 0
+        self.stream_coalesced = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """非流式与流式调用合并后的总命中率"""
+        total = self.calls + self.stream_calls
+        return (self.coalesced + self.stream_coalesced) / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回合并计数器快照"""
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "stream_calls": self.stream_calls,
+            "stream_coalesced": self.stream_coalesced,
+            "hit_rate": self.hit_rate,
+        }
+
+    def do_sync(self, key: str, func: Callable[[], T], context: Any = None,
+                on_join: Optional[Callable[[Any], None]] = None) -> T:
+        """
+        同步合并：相同key的并发调用只执行一次func
+
+        Args:
+            key: 请求key
+            func: 实际发送请求的函数
+            context: 本调用领头时附带的上下文
+            on_join: 本调用加入在途调用时，以领头调用的上下文回调
+
+        Returns:
+            func的返回值
+        """
+        with self._lock:
+            self.calls += 1
+            call = self._sync_flights.get(key)
+            leader = call is None
+            if leader:
+                call = self._sync_flights[key] = _SyncCall()
+                call.context = context
+            else:
+                self.coalesced += 1
+        if not leader and on_join is not None:
+            on_join(call.context)
+
+        if leader:
+            try:
+                call.result = func()
+            except BaseException as exc:
+                call.error = exc
+                raise
+            finally:
+                with self._lock:
+                    del self._sync_flights[key]
+                call.event.set()
+            return call.result
+
+        call.event.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    async def do(self, key: str, func: Callable[[], Awaitable[T]], context: Any = None,
+                 on_join: Optional[Callable[[Any], None]] = None) -> T:
+        """
+        异步合并：相同key的并发调用共享同一个上游任务
+
+        上游请求在独立任务中执行，单个等待者被取消不会影响其他等待者；所有等待者都离开时才取消上游。
+
+        Args:
+            key: 请求key
+            func: 返回协程的函数，协程负责实际发送请求
+            context: 本调用领头时附带的上下文
+            on_join: 本调用加入在途调用时，以领头调用的上下文回调
+
+        Returns:
+            协程的返回值
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        self.calls += 1
+        call = self._flights.get(flight_key)
+        if call is None:
+            call = self._flights[flight_key] = _AsyncCall(asyncio.ensure_future(func()), context)
+
+            def _finished(done: "asyncio.Future[Any]") -> None:
+                if self._flights.get(flight_key) is call:
+                    del self._flights[flight_key]
+                # 所有等待者都已离开时，避免出现"异常未被获取"的警告
+                if not done.cancelled():
+                    done.exception()
+
+            call.task.add_done_callback(_finished)
+        else:
+            self.coalesced += 1
+            if on_join is not None:
+                on_join(call.context)
+
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                # 取消的同时移出在途表，此后加入的调用者启动新的上游请求，而不是等待正在取消的任务
+                if self._flights.get(flight_key) is call:
+                    del self._flights[flight_key]
+                call.task.cancel()
+
+    async def stream(self, key: str, func: Callable[[], AsyncIterator[str]], context: Any = None,
+                     on_join: Optional[Callable[[Any], None]] = None) -> AsyncIterator[str]:
+        """
+        流式合并：相同key的并发流共享同一个上游流
+
+        第一个调用者启动上游流，之后的调用者加入广播；最后一个订阅者离开时才取消上游。
+
+        Args:
+            key: 请求key
+            func: 返回异步迭代器的函数，迭代器负责实际的流式请求
+            context: 本调用领头时附带的上下文
+            on_join: 本调用加入在途流时，以领头调用的上下文回调
+
+        Yields:
+            str: 流式内容片段
+        """
+        loop = asyncio.get_running_loop()
+        flight_key = (loop, key)
+        self.stream_calls += 1
+        flight = self._streams.get(flight_key)
+        if flight is None:
+            flight = self._streams[flight_key] = _StreamFlight()
+            flight.context = context
+            flight.task = asyncio.ensure_future(self._pump(flight_key, flight, func))
+        else:
+            self.stream_coalesced += 1
+            if on_join is not None:
+                on_join(flight.context)
+
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                while index < len(flight.chunks):
+                    yield flight.chunks[index]
+                    index += 1
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.updated.wait()
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done and flight.task is not None:
+                # 取消的同时移出在途表，此后加入的调用者启动新的上游流，而不是订阅正在取消的流
+                if self._streams.get(flight_key) is flight:
+                    del self._streams[flight_key]
+                flight.task.cancel()
+
+    async def _pump(self, flight_key: Tuple[asyncio.AbstractEventLoop, str], flight: _StreamFlight,
+                    func: Callable[[], AsyncIterator[str]]) -> None:
+        """驱动上游流并把片段广播给订阅者"""
+        upstream = func()
+        try:
+            async for chunk in upstream:
+                flight.chunks.append(chunk)
+                flight.notify()
+        except asyncio.CancelledError:
+            # 取消属于本任务，不作为上游错误保存；被外部取消时仍在等待的订阅者得到明确的错误
+            if flight.subscribers:
+                flight.error = RuntimeError("合并的上游流已被取消")
+            raise
+        except Exception as exc:
+            flight.error = exc
+        finally:
+            flight.done = True
+            if self._streams.get(flight_key) is flight:
+                del self._streams[flight_key]
+            flight.notify()
+            aclose = getattr(upstream, "aclose", None)
+            if aclose is not None:
+                await aclose()
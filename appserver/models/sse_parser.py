@@ -0,0 +1,252 @@
+"""
+增量式SSE（Server-Sent Events）解析器
+
+直接在原始字节缓冲区上工作，供DashScope同步与异步流式调用共用：
+- 支持多行 data 字段、event 字段与 id 字段
+- 支持跨多次读取被拆分的半帧
+- 直接切分每次读到的字节块，只缓冲跨读取的半行；已扫描的数据不会被复制或重复扫描，解析开销与增量长度成正比
+"""
+
+import json
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+# 直接调用解码器实例的扫描器，跳过 json.loads 的编码探测、首尾空白匹配与 raw_decode 的包装；解析失败时抛出 StopIteration
+_json_scan = json.JSONDecoder().scan_once
+
+
+@dataclass
+class SSEEvent:
+    """一个完整的SSE事件"""
+
+    data: bytes
+    event: str = "message"
+    id: Optional[str] = None
+
+
+class SSEParser:
+    """
+    基于字节缓冲区的增量SSE解析器
+
+    每次调用 feed 传入任意大小的字节块，返回其中已经完整的事件；
+    未完成的行保留在缓冲区中，等待后续数据。
+    """
+
+    def __init__(self) -> None:
+        # 尚未遇到换行符的半行，新数据只扫描一次，不会重复扫描缓冲区
+        self._buffer = bytearray()
+        self._data: List[bytes] = []
+        self._event: Optional[str] = None
+        self._event_names: Dict[bytes, str] = {}
+        self.last_event_id: Optional[str] = None
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        """
+        输入一段原始字节，返回解析出的完整事件
+
+        Args:
+            chunk: 从网络读取到的字节块
+
+        Returns:
+            List[SSEEvent]: 本次可以分发的事件列表
+        """
+        buffer = self._buffer
+        if not isinstance(chunk, bytes):
+            chunk = bytes(chunk)
+        if b"\n" not in chunk:
+            buffer += chunk
+            return []
+        # 直接切分本次读到的字节块，不复制完整区域；只有跨读取的半行需要与缓冲区拼接
+        lines = chunk.split(b"\n")
+        tail = lines.pop()
+        if buffer:
+            buffer += lines[0]
+            lines[0] = bytes(buffer)
+            buffer.clear()
+        if tail:
+            buffer += tail
+        # CRLF换行只在本次数据含有\r时才需要逐行处理
+        if b"\r" in chunk or b"\r" in lines[0]:
+            lines = [line[:-1] if line[-1:] == b"\r" else line for line in lines]
+
+        events: List[SSEEvent] = []
+        data = self._data
+        event_names = self._event_names
+        for line in lines:
+            if not line:
+                # 空行表示一个事件结束
+                if data:
+                    events.append(SSEEvent(
+                        data[0] if len(data) == 1 else b"\n".join(data), self._event or "message", self.last_event_id
+                    ))
+                    data = self._data = []
+                self._event = None
+                continue
+            # 一次切分出字段名与值，比逐个前缀比较更快
+            field, _, value = line.partition(b":")
+            if value[:1] == b" ":
+                value = value[1:]
+            if field == b"data":
+                # 绝大多数行都是 data 字段
+                data.append(value)
+            elif not field:
+                # 注释行（如DashScope的 :HTTP_STATUS/200）
+                continue
+            elif field == b"event":
+                # 事件名通常只有少数几种，缓存解码结果
+                event_name = event_names.get(value)
+                if event_name is None:
+                    event_name = value.decode("utf-8")
+                    if len(event_names) < 16:
+                        event_names[value] = event_name
+                self._event = event_name
+            elif field == b"id" and b"\x00" not in value:
+                self.last_event_id = value.decode("utf-8")
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """
+        流结束时调用，分发缓冲区中残留的最后一个事件
+
+        Returns:
+            List[SSEEvent]: 残留的事件（最多一个）
+        """
+        buffer = self._buffer
+        if buffer:
+            line = bytes(buffer)
+            if line[-1:] == b"\r":
+                line = line[:-1]
+            if line[:5] == b"data:":
+                self._data.append(line[6:] if line[5:6] == b" " else line[5:])
+            elif line:
+                self._process_line(line)
+            buffer.clear()
+        event = self._dispatch()
+        return [event] if event is not None else []
+
+    def _process_line(self, line: bytes) -> None:
+        """处理一行非data字段（不含换行符）"""
+        colon = line.find(b":")
+        if colon == 0:
+            # 注释行
+            return
+        if colon < 0:
+            field, value = line, b""
+        else:
+            field, value = line[:colon], line[colon + 1:]
+            if value[:1] == b" ":
+                value = value[1:]
+
+        if field == b"data":
+            self._data.append(value)
+        elif field == b"event":
+            self._event = value.decode("utf-8")
+        elif field == b"id":
+            if b"\x00" not in value:
+                self.last_event_id = value.decode("utf-8")
+
+    def _dispatch(self) -> Optional[SSEEvent]:
+        """将已累计的字段组装为事件并重置状态"""
+        data, self._data = self._data, []
+        event_type, self._event = self._event, None
+        if not data:
+            return None
+        return SSEEvent(
+            data=data[0] if len(data) == 1 else b"\n".join(data),
+            event=event_type or "message",
+            id=self.last_event_id
+        )
+
+
+class DashScopeStreamDecoder:
+    """
+    将DashScope的SSE字节流解码为文本增量
+
+    同时支持 incremental_output=True（每帧即为增量）与
+    incremental_output=False（每帧为累计全文）两种模式。
+    """
+
+    def __init__(self, incremental: bool = True) -> None:
+        """
+        Args:
+            incremental: 上游是否以增量模式输出
+        """
+        self.incremental = incremental
+        self.parser = SSEParser()
+        self.done = False
+        # 最近一帧携带的 usage 字段（DashScope每帧都带累计用量，OpenAI兼容接口在最后一帧）
+        self.usage: Optional[Dict[str, Any]] = None
+        # 累计模式下已输出的字符数
+        self._emitted = 0
+
+    def feed(self, chunk: bytes) -> List[str]:
+        """
+        输入一段原始字节，返回其中包含的文本增量
+
+        Args:
+            chunk: 从网络读取到的字节块
+
+        Returns:
+            List[str]: 文本增量列表
+
+        Raises:
+            ValueError: 上游返回错误事件时抛出
+        """
+        return self._decode_events(self.parser.feed(chunk))
+
+    def flush(self) -> List[str]:
+        """流结束时调用，返回残留事件中的文本增量"""
+        return self._decode_events(self.parser.flush())
+
+    def _decode_events(self, events: List[SSEEvent]) -> List[str]:
+        # 每帧的解码放在同一个循环里，避免逐帧的方法调用
+        deltas: List[str] = []
+        extract = self._extract_content
+        for event in events:
+            if self.done:
+                break
+            data = event.data
+            if event.event == "error":
+                raise ValueError(f"API请求失败: {data.decode('utf-8', errors='replace')}")
+            # JSON帧以 { 开头，只有其余数据才需要检查结束标记
+            if data[:1] != b"{" and data.strip() == b"[DONE]":
+                self.done = True
+                break
+            try:
+                frame = _json_scan(data.decode("utf-8"), 0)[0]
+                usage = frame.get("usage")
+                if usage:
+                    self.usage = usage
+                content = extract(frame)
+            except (StopIteration, json.JSONDecodeError, UnicodeDecodeError, KeyError, IndexError, TypeError,
+                    AttributeError):
+                continue
+            if not content:
+                continue
+            if not self.incremental:
+                if len(content) <= self._emitted:
+                    continue
+                content, self._emitted = content[self._emitted:], len(content)
+            deltas.append(content)
+        return deltas
+
+    def _extract_content(self, chunk_data: Dict[str, Any]) -> Optional[str]:
+        """从一帧JSON中取出文本内容"""
+        return chunk_data["output"]["choices"][0]["message"]["content"]
+
+
+class OpenAIStreamDecoder(DashScopeStreamDecoder):
+    """
+    将OpenAI兼容接口（chat/completions）的SSE字节流解码为文本增量
+
+    OpenAI格式的每帧总是增量，内容位于 choices[0].delta.content。
+    """
+
+    def __init__(self, incremental: bool = True) -> None:
+        super().__init__(incremental=True)
+
+    def _extract_content(self, chunk_data: Dict[str, Any]) -> Optional[str]:
+        choices = chunk_data.get("choices")
+        if not choices:
+            return None
+        return choices[0].get("delta", {}).get("content")
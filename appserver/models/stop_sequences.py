@@ -0,0 +1,106 @@
+"""
+客户端停止词匹配
+
+停止词会同时发送给上游，但上游未必严格执行（如OpenAI兼容网关、累计模式），
+因此客户端在流式输出时再做一次匹配。停止词可能被拆分在两个片段之间，
+匹配器只扣留“可能是某个停止词前缀”的尾部字符，其余文本立即输出，不增加首字延迟。
+"""
+
+import re
+from typing import Iterable, List, Optional
+
+
+def normalize_stop(stop: Optional[Iterable[str]]) -> List[str]:
+    """
+    规范化停止词列表：接受单个字符串或字符串列表，去掉空串与重复项
+
+    Args:
+        stop: 停止词或停止词列表
+
+    Returns:
+        List[str]: 停止词列表，未设置时为空列表
+    """
+    if not stop:
+        return []
+    if isinstance(stop, str):
+        stop = [stop]
+    return list(dict.fromkeys(s for s in stop if s))
+
+
+class StopSequenceMatcher:
+    """
+    跨片段的停止词匹配器
+
+    每次 feed 返回可以安全输出的文本；匹配到停止词后 stopped 为True，
+    返回的文本截止到停止词之前（不含停止词本身）。
+    """
+
+    def __init__(self, stop: Iterable[str]):
+        """
+        Args:
+            stop: 停止词列表，不能为空
+        """
+        self.stop = normalize_stop(stop)
+        if not self.stop:
+            raise ValueError("停止词列表不能为空")
+        # 正则按最左位置匹配，同一位置优先匹配更长的停止词
+        self._pattern = re.compile("|".join(re.escape(s) for s in sorted(self.stop, key=len, reverse=True)))
+        self._max_hold = max(len(s) for s in self.stop) - 1
+        self._pending = ""
+        self.stopped = False
+
+    def _held_length(self, text: str) -> int:
+        """返回text尾部可能是某个停止词前缀的最长长度"""
+        for length in range(min(self._max_hold, len(text)), 0, -1):
+            tail = text[-length:]
+            if any(s.startswith(tail) for s in self.stop):
+                return length
+        return 0
+
+    def feed(self, text: str) -> str:
+        """
+        输入一个片段
+
+        Args:
+            text: 新到达的文本片段
+
+        Returns:
+            str: 可以输出的文本，可能为空串
+        """
+        if self.stopped:
+            return ""
+        buffer = self._pending + text
+        match = self._pattern.search(buffer)
+        if match is not None:
+            self.stopped = True
+            self._pending = ""
+            return buffer[:match.start()]
+        held = self._held_length(buffer)
+        if held:
+            self._pending = buffer[-held:]
+            return buffer[:-held]
+        self._pending = ""
+        return buffer
+
+    def flush(self) -> str:
+        """流结束时输出扣留的尾部文本"""
+        pending, self._pending = self._pending, ""
+        return "" if self.stopped else pending
+
+
+def truncate_at_stop(text: str, stop: Iterable[str]) -> str:
+    """
+    在第一个停止词处截断完整文本
+
+    Args:
+        text: 完整文本
+        stop: 停止词列表
+
+    Returns:
+        str: 截断后的文本，不含停止词
+    """
+    stop = normalize_stop(stop)
+    if not stop:
+        return text
+    matcher = StopSequenceMatcher(stop)
+    return matcher.feed(text) + matcher.flush()
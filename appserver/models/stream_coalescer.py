@@ -0,0 +1,132 @@
+"""
+流式增量合并
+
+上游每个token一帧，逐帧包装成LangChain对象的开销在长文本上很可观。
+合并窗口把相邻的小增量拼接后再交给下游：缓冲区达到 max_chars 或距缓冲区
+第一个增量超过 max_delay 秒时输出。首个增量总是立即输出，不影响首字延迟。
+"""
+
+import asyncio
+import time
+from typing import AsyncIterator, Iterator, List, Optional
+
+
+def coalesce_chunks(stream: Iterator[str], max_chars: int = 0, max_delay: float = 0.0) -> Iterator[str]:
+    """
+    合并同步流中的小增量
+
+    同步迭代无法在等待上游时定时输出，因此时间窗口在下一个增量到达时检查。
+
+    Args:
+        stream: 文本增量流
+        max_chars: 缓冲区达到该字符数时输出，0表示不按大小合并
+        max_delay: 缓冲区最长保留时间（秒），0表示不按时间合并
+
+    Yields:
+        str: 合并后的文本
+    """
+    if max_chars <= 0 and max_delay <= 0:
+        yield from stream
+        return
+
+    buffer: List[str] = []
+    size = 0
+    first_at = 0.0
+    started = False
+    try:
+        for delta in stream:
+            if not started:
+                started = True
+                yield delta
+                continue
+            if not buffer:
+                first_at = time.monotonic()
+            buffer.append(delta)
+            size += len(delta)
+            if (max_chars > 0 and size >= max_chars) or (max_delay > 0 and time.monotonic() - first_at >= max_delay):
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        close = getattr(stream, "close", None)
+        if close is not None:
+            close()
+
+
+async def acoalesce_chunks(
+    stream: AsyncIterator[str],
+    max_chars: int = 0,
+    max_delay: float = 0.0
+) -> AsyncIterator[str]:
+    """
+    合并异步流中的小增量
+
+    上游停顿时到期的缓冲区会按时输出，而不是等到下一个增量到达。
+
+    Args:
+        stream: 文本增量流
+        max_chars: 缓冲区达到该字符数时输出，0表示不按大小合并
+        max_delay: 缓冲区最长保留时间（秒），0表示不按时间合并
+
+    Yields:
+        str: 合并后的文本
+    """
+    if max_chars <= 0 and max_delay <= 0:
+        async for delta in stream:
+            yield delta
+        return
+
+    iterator = stream.__aiter__()
+    buffer: List[str] = []
+    size = 0
+    deadline: Optional[float] = None
+    started = False
+    pending: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            timeout = None
+            if buffer and deadline is not None:
+                timeout = max(0.0, deadline - time.monotonic())
+            # asyncio.wait 超时不会取消等待中的 __anext__，上游读取不受影响
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                deadline = None
+                continue
+            try:
+                delta = pending.result()
+            except StopAsyncIteration:
+                pending = None
+                break
+            pending = None
+            if not started:
+                started = True
+                yield delta
+                continue
+            if not buffer and max_delay > 0:
+                deadline = time.monotonic() + max_delay
+            buffer.append(delta)
+            size += len(delta)
+            if max_chars > 0 and size >= max_chars:
+                yield "".join(buffer)
+                buffer.clear()
+                size = 0
+                deadline = None
+        if buffer:
+            yield "".join(buffer)
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()
+            try:
+                await pending
+            except (asyncio.CancelledError, Exception):
+                pass
+        aclose = getattr(stream, "aclose", None)
+        if aclose is not None:
+            await aclose()
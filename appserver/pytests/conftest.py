@@ -0,0 +1,35 @@
+"""
+公共夹具：本地DashScope桩服务
+
+dashscope_stub 启动一个默认配置的桩服务，可通过间接参数化传入 StubConfig 的字段：
+    @pytest.mark.parametrize("dashscope_stub", [{"ttft": 0.2}], indirect=True)
+
+dashscope_model_kwargs 为需要真实服务的测试提供连接参数：设置了 DASHSCOPE_API_KEY 时访问真实服务，
+否则（或设置了 DASHSCOPE_USE_STUB=1 时）指向本地桩服务，测试不再因缺少密钥而跳过。
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.dirname(__file__))
+from dashscope_stub import DashScopeStub, StubConfig
+
+
+@pytest.fixture
+def dashscope_stub(request):
+    """启动本地DashScope桩服务，测试结束后关闭"""
+    config = StubConfig(**getattr(request, "param", {}))
+    with DashScopeStub(config) as stub:
+        yield stub
+
+
+@pytest.fixture
+def dashscope_model_kwargs(request):
+    """CustomChatModel / DashScopeAPIClient 的连接参数（api_key、api_url）"""
+    if os.getenv("DASHSCOPE_API_KEY") and os.getenv("DASHSCOPE_USE_STUB") != "1":
+        yield {}
+        return
+    stub = request.getfixturevalue("dashscope_stub")
+    yield {"api_key": "stub", "api_url": stub.url}
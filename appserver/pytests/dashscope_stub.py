@@ -0,0 +1,384 @@
+"""
+本地DashScope兼容桩服务
+
+实现DashScope文本生成接口（JSON与SSE，支持 incremental_output）以及OpenAI兼容的 chat/completions，
+首token时间、输出速度、抖动、错误注入与429限流均可配置，随机性由种子固定，结果可复现。
+在后台线程的独立事件循环中运行，同步（requests）与异步（aiohttp）客户端都可以直接压测。
+
+pytest中通过 conftest.py 的 dashscope_stub 夹具使用；也可以单独启动：
+    python -m appserver.pytests.dashscope_stub --port 18001 --ttft 0.2 --tokens-per-second 50
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import threading
+import time
+from dataclasses import asdict, dataclass, field, fields
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+DASHSCOPE_PATH = "/api/v1/services/aigc/text-generation/generation"
+OPENAI_PATH = "/v1/chat/completions"
+DEFAULT_REPLY = "这是本地桩服务返回的回答，用于离线测试与压测。"
+
+
+@dataclass
+class StubConfig:
+    """
+    桩服务行为配置，时间单位为秒
+
+    Attributes:
+        ttft: 收到请求到首个token的时间（非流式调用为整体延迟的一部分）
+        tokens_per_second: 输出速度，0表示不限速
+        jitter: 延迟抖动比例，每次等待乘以 [1 - jitter, 1 + jitter] 内的随机系数
+        reply: 回答文本，None表示使用默认文本
+        reply_tokens: 回答的token数，按 chars_per_token 切分 reply 并循环补足；受请求 max_tokens 限制
+        chars_per_token: 每个token的字符数
+        error_rate: 以该概率返回500
+        throttle_rate: 以该概率返回429
+        retry_after: 429响应的 Retry-After（秒）
+        fail_first: 前N个请求固定返回 fail_status，用于测试重试与熔断
+        fail_status: fail_first 使用的状态码
+        stream_error_after: 流式输出该数量的token后发送错误事件，None表示不注入
+        usage: 是否在响应中返回 usage 字段
+        seed: 随机种子
+    """
+
+    ttft: float = 0.05
+    tokens_per_second: float = 200.0
+    jitter: float = 0.0
+    reply: Optional[str] = None
+    reply_tokens: int = 32
+    chars_per_token: int = 2
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+    retry_after: float = 1.0
+    fail_first: int = 0
+    fail_status: int = 503
+    stream_error_after: Optional[int] = None
+    usage: bool = True
+    seed: int = 0
+
+
+@dataclass
+class StubStats:
+    """桩服务的请求统计"""
+
+    requests: int = 0
+    streams: int = 0
+    errors: int = 0
+    throttled: int = 0
+    in_flight: int = 0
+    max_in_flight: int = 0
+    payloads: List[Dict[str, Any]] = field(default_factory=list)
+
+
+class DashScopeStub:
+    """
+    DashScope兼容桩服务
+
+    用法：
+        with DashScopeStub(StubConfig(ttft=0.1)) as stub:
+            model = CustomChatModel(api_key="stub", api_url=stub.url)
+    """
+
+    def __init__(self, config: Optional[StubConfig] = None, host: str = "127.0.0.1", port: int = 0,
+                 max_payloads: int = 1000):
+        """
+        Args:
+            config: 行为配置，None表示默认配置
+            host: 监听地址
+            port: 监听端口，0表示随机分配
+            max_payloads: 最多保留的请求体数量
+        """
+        self.config = config or StubConfig()
+        self.host = host
+        self.port = port
+        self.max_payloads = max_payloads
+        self.stats = StubStats()
+        self._random = random.Random(self.config.seed)
+        self._ids = itertools.count(1)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._runner: Optional[web.AppRunner] = None
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def url(self) -> str:
+        """DashScope文本生成接口地址"""
+        return self.base_url + DASHSCOPE_PATH
+
+    @property
+    def openai_url(self) -> str:
+        """OpenAI兼容接口地址"""
+        return self.base_url + OPENAI_PATH
+
+    def configure(self, **changes: Any) -> None:
+        """
+        运行中修改配置，修改 seed 时重置随机序列
+
+        Raises:
+            TypeError: 配置项不存在时抛出
+        """
+        names = {f.name for f in fields(StubConfig)}
+        unknown = set(changes) - names
+        if unknown:
+            raise TypeError(f"未知的桩服务配置: {sorted(unknown)}")
+        for name, value in changes.items():
+            setattr(self.config, name, value)
+        if "seed" in changes:
+            self._random = random.Random(self.config.seed)
+
+    def reset_stats(self) -> None:
+        self.stats = StubStats()
+
+    # ---------- 生命周期 ----------
+
+    def start(self) -> "DashScopeStub":
+        """在后台线程中启动服务，返回时已可接受连接"""
+        ready = threading.Event()
+        errors: List[BaseException] = []
+
+        def run() -> None:
+            loop = asyncio.new_event_loop()
+            self._loop = loop
+            asyncio.set_event_loop(loop)
+            try:
+                loop.run_until_complete(self._start_site())
+            except BaseException as exc:
+                errors.append(exc)
+                ready.set()
+                return
+            ready.set()
+            loop.run_forever()
+            loop.run_until_complete(self._runner.cleanup())
+            loop.close()
+
+        self._thread = threading.Thread(target=run, name="dashscope-stub", daemon=True)
+        self._thread.start()
+        ready.wait()
+        if errors:
+            raise errors[0]
+        return self
+
+    async def _start_site(self) -> None:
+        app = web.Application()
+        app.router.add_post(OPENAI_PATH, self._handle_openai)
+        app.router.add_post("/{tail:.*}", self._handle_dashscope)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        self.port = self._runner.addresses[0][1]
+
+    def stop(self) -> None:
+        """停止服务并等待后台线程退出"""
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+        self._loop = None
+        self._thread = None
+
+    def __enter__(self) -> "DashScopeStub":
+        return self.start()
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    # ---------- 行为 ----------
+
+    def _delay(self, seconds: float) -> float:
+        jitter = self.config.jitter
+        if jitter and seconds > 0:
+            seconds *= self._random.uniform(1 - jitter, 1 + jitter)
+        return max(0.0, seconds)
+
+    def _reply_tokens(self, max_tokens: Optional[int]) -> List[str]:
+        text = self.config.reply if self.config.reply is not None else DEFAULT_REPLY
+        size = max(1, self.config.chars_per_token)
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        count = self.config.reply_tokens
+        if max_tokens:
+            count = min(count, int(max_tokens))
+        return [pieces[i % len(pieces)] for i in range(count)]
+
+    def _injected_failure(self) -> Optional[web.Response]:
+        """按配置返回注入的错误响应，不注入时返回None"""
+        config = self.config
+        if self.stats.requests <= config.fail_first:
+            self.stats.errors += 1
+            return self._error(config.fail_status, "ServiceUnavailable", "injected failure")
+        if config.throttle_rate and self._random.random() < config.throttle_rate:
+            self.stats.throttled += 1
+            response = self._error(429, "Throttling.RateQuota", "Requests rate limit exceeded")
+            response.headers["Retry-After"] = f"{config.retry_after:g}"
+            return response
+        if config.error_rate and self._random.random() < config.error_rate:
+            self.stats.errors += 1
+            return self._error(500, "InternalError", "injected error")
+        return None
+
+    @staticmethod
+    def _error(status: int, code: str, message: str) -> web.Response:
+        body = {"code": code, "message": message, "request_id": "stub"}
+        return web.json_response(body, status=status)
+
+    def _usage(self, messages: List[Dict[str, Any]], output_tokens: int) -> Dict[str, int]:
+        input_tokens = sum(len(str(message.get("content", ""))) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    async def _begin(self, request: web.Request) -> Tuple[Optional[Dict[str, Any]], Optional[web.Response]]:
+        """记录请求并解析请求体，返回 (请求体, 注入的错误响应)"""
+        stats = self.stats
+        stats.requests += 1
+        stats.in_flight += 1
+        stats.max_in_flight = max(stats.max_in_flight, stats.in_flight)
+        try:
+            body = json.loads(await request.read())
+        except ValueError:
+            return None, self._error(400, "InvalidParameter", "request body is not valid JSON")
+        if len(stats.payloads) < self.max_payloads:
+            stats.payloads.append(body)
+        return body, self._injected_failure()
+
+    async def _handle_dashscope(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body, failure = await self._begin(request)
+            if failure is not None:
+                return failure
+            messages = (body.get("input") or {}).get("messages") or []
+            if not messages:
+                return self._error(400, "InvalidParameter", "Input messages must not be empty")
+            parameters = body.get("parameters") or {}
+            tokens = self._reply_tokens(parameters.get("max_tokens"))
+            stream = request.headers.get("X-DashScope-SSE") == "enable" or "text/event-stream" in request.headers.get("Accept", "")
+            if not stream:
+                await asyncio.sleep(self._delay(self.config.ttft + self._generation_time(len(tokens))))
+                return web.json_response(self._dashscope_frame("".join(tokens), "stop", messages, len(tokens)))
+            return await self._stream(
+                request, tokens, messages,
+                lambda text, emitted, finish: self._dashscope_frame(text, finish, messages, emitted),
+                incremental=bool(parameters.get("incremental_output", False)),
+            )
+        finally:
+            self.stats.in_flight -= 1
+
+    async def _handle_openai(self, request: web.Request) -> web.StreamResponse:
+        try:
+            body, failure = await self._begin(request)
+            if failure is not None:
+                return failure
+            messages = body.get("messages") or []
+            if not messages:
+                return self._error(400, "InvalidParameter", "messages must not be empty")
+            tokens = self._reply_tokens(body.get("max_tokens"))
+            if not body.get("stream"):
+                await asyncio.sleep(self._delay(self.config.ttft + self._generation_time(len(tokens))))
+                return web.json_response(self._openai_frame("".join(tokens), "stop", messages, len(tokens), False))
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return await self._stream(
+                request, tokens, messages,
+                lambda text, emitted, finish: self._openai_frame(text, finish, messages, emitted, True, include_usage),
+                incremental=True, done_marker=True,
+            )
+        finally:
+            self.stats.in_flight -= 1
+
+    def _generation_time(self, count: int) -> float:
+        rate = self.config.tokens_per_second
+        return count / rate if rate > 0 else 0.0
+
+    async def _stream(self, request: web.Request, tokens: List[str], messages: List[Dict[str, Any]],
+                      frame: Callable[[str, int, str], Dict[str, Any]], incremental: bool, done_marker: bool = False) -> web.StreamResponse:
+        """逐token输出SSE帧：首帧前等待 ttft，之后按输出速度等待"""
+        self.stats.streams += 1
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream", "Cache-Control": "no-cache"})
+        await response.prepare(request)
+        interval = 1.0 / self.config.tokens_per_second if self.config.tokens_per_second > 0 else 0.0
+        await asyncio.sleep(self._delay(self.config.ttft))
+        emitted = ""
+        try:
+            for index, token in enumerate(tokens):
+                if index:
+                    await asyncio.sleep(self._delay(interval))
+                if self.config.stream_error_after is not None and index >= self.config.stream_error_after:
+                    error = {"code": "InternalError", "message": "injected stream error", "request_id": "stub"}
+                    await response.write(f"event:error\n:HTTP_STATUS/500\ndata:{json.dumps(error)}\n\n".encode("utf-8"))
+                    return response
+                emitted += token
+                finish = "stop" if index == len(tokens) - 1 else "null"
+                data = frame(token if incremental else emitted, index + 1, finish)
+                await response.write(self._sse(data))
+            if done_marker:
+                await response.write(b"data: [DONE]\n\n")
+            await response.write_eof()
+        except ConnectionResetError:
+            # 客户端提前断开（如命中停止词）
+            pass
+        return response
+
+    def _sse(self, data: Dict[str, Any]) -> bytes:
+        event_id = next(self._ids)
+        payload = json.dumps(data, ensure_ascii=False)
+        return f"id:{event_id}\nevent:result\n:HTTP_STATUS/200\ndata:{payload}\n\n".encode("utf-8")
+
+    def _dashscope_frame(self, text: str, finish: str, messages: List[Dict[str, Any]], emitted: int) -> Dict[str, Any]:
+        frame: Dict[str, Any] = {
+            "output": {"choices": [{"message": {"role": "assistant", "content": text}, "finish_reason": finish}]},
+            "request_id": "stub",
+        }
+        if self.config.usage:
+            frame["usage"] = self._usage(messages, emitted)
+        return frame
+
+    def _openai_frame(self, text: str, finish: str, messages: List[Dict[str, Any]], emitted: int,
+                      stream: bool, include_usage: bool = True) -> Dict[str, Any]:
+        choice: Dict[str, Any] = {"index": 0, "finish_reason": None if finish == "null" else finish}
+        if stream:
+            choice["delta"] = {"role": "assistant", "content": text}
+        else:
+            choice["message"] = {"role": "assistant", "content": text}
+        frame: Dict[str, Any] = {"id": "stub", "object": "chat.completion", "choices": [choice]}
+        if self.config.usage and include_usage and (not stream or finish == "stop"):
+            usage = self._usage(messages, emitted)
+            frame["usage"] = {
+                "prompt_tokens": usage["input_tokens"],
+                "completion_tokens": usage["output_tokens"],
+                "total_tokens": usage["total_tokens"],
+            }
+        return frame
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="本地DashScope兼容桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18001)
+    for f in fields(StubConfig):
+        if f.name in ("reply", "stream_error_after"):
+            parser.add_argument(f"--{f.name.replace('_', '-')}", default=None,
+                                type=str if f.name == "reply" else int)
+        elif f.type in (bool, "bool"):
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=lambda v: v.lower() in ("1", "true", "yes"),
+                                default=f.default)
+        else:
+            parser.add_argument(f"--{f.name.replace('_', '-')}", type=type(f.default), default=f.default)
+    args = vars(parser.parse_args())
+    host, port = args.pop("host"), args.pop("port")
+    stub = DashScopeStub(StubConfig(**args), host=host, port=port).start()
+    print(f"DashScope桩服务已启动: {stub.url}")
+    print(f"配置: {json.dumps(asdict(stub.config), ensure_ascii=False)}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -10,13 +10,9 @@ from langchain_core.messages import SystemMessage, HumanMessage
 pytestmark = pytest.mark.asyncio
 
 @pytest.mark.asyncio
-async def test_async_stream():
+async def test_async_stream(dashscope_model_kwargs):
     """测试异步流式输出"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        pytest.skip("未设置DASHSCOPE_API_KEY环境变量")
-    
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     messages = [
         SystemMessage(content="你是一个专业的AI助手"),
         HumanMessage(content="请写一首关于春天的短诗")
@@ -31,13 +27,9 @@ async def test_async_stream():
     print(f"异步流式输出结果: {full_response}")
 
 @pytest.mark.asyncio
-async def test_async_stream_invoke():
+async def test_async_stream_invoke(dashscope_model_kwargs):
     """测试异步流式astream方法"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        pytest.skip("未设置DASHSCOPE_API_KEY环境变量")
-    
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     full_response = ""
     async for chunk in model.astream("请写一首关于春天的短诗"):
         content = chunk.content
@@ -47,13 +39,9 @@ async def test_async_stream_invoke():
     print(f"异步流式astream结果: {full_response}")
 
 @pytest.mark.asyncio
-async def test_concurrent_async_stream():
+async def test_concurrent_async_stream(dashscope_model_kwargs):
     """测试并发异步流式输出"""
-    api_key = os.getenv("DASHSCOPE_API_KEY")
-    if not api_key:
-        pytest.skip("未设置DASHSCOPE_API_KEY环境变量")
-    
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     
     async def stream_task(prompt: str):
         full_response = ""
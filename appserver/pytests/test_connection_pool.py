@@ -0,0 +1,120 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import DashScopeAPIClient
+
+
+class _KeepAliveHandler(BaseHTTPRequestHandler):
+    """支持keep-alive的简易DashScope响应处理器，记录客户端连接"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _reply(self, body: bytes) -> None:
+        self.server.client_ports.add(self.client_address[1])
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        body = json.dumps({
+            "output": {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+        }).encode("utf-8")
+        self._reply(body)
+
+    def do_HEAD(self):
+        self._reply(b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def keepalive_server():
+    """启动本地keep-alive服务器"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _KeepAliveHandler)
+    server.client_ports = set()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _url(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}/generation"
+
+
+def test_sync_calls_reuse_connection(keepalive_server):
+    """同步调用复用同一个TCP连接"""
+    with DashScopeAPIClient(api_key="test", api_url=_url(keepalive_server)) as client:
+        for _ in range(3):
+            assert client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo") == "ok"
+    assert len(keepalive_server.client_ports) == 1
+
+
+def test_warmup_opens_connection_before_first_call(keepalive_server):
+    """预热后首次调用直接复用已建立的连接"""
+    client = DashScopeAPIClient(api_key="test", api_url=_url(keepalive_server), warmup=True)
+    assert len(keepalive_server.client_ports) == 1
+    client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo")
+    assert len(keepalive_server.client_ports) == 1
+    client.close()
+
+
+@pytest.mark.asyncio
+async def test_async_calls_share_session(keepalive_server):
+    """同一事件循环内的异步调用共享ClientSession与连接"""
+    async with DashScopeAPIClient(api_key="test", api_url=_url(keepalive_server)) as client:
+        for _ in range(3):
+            result = await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo")
+            assert result == "ok"
+        session = client._get_async_session()
+        assert client._get_async_session() is session
+    assert session.closed
+    assert len(keepalive_server.client_ports) == 1
+
+
+@pytest.mark.asyncio
+async def test_awarmup_opens_concurrent_connections(keepalive_server):
+    """异步预热按需并发建立多个连接"""
+    client = DashScopeAPIClient(api_key="test", api_url=_url(keepalive_server))
+    await client.awarmup(connections=3)
+    assert len(keepalive_server.client_ports) == 3
+    await client.aclose()
+
+
+def test_stale_loop_session_is_dropped_with_warning(keepalive_server):
+    """事件循环关闭前未调用aclose时，遗留会话被丢弃并发出ResourceWarning"""
+    client = DashScopeAPIClient(api_key="test", api_url=_url(keepalive_server))
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo"))
+    loop.close()
+
+    async def call_again():
+        with pytest.warns(ResourceWarning):
+            await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo")
+        assert list(client._async_sessions) == [asyncio.get_running_loop()]
+        await client.aclose()
+
+    asyncio.run(call_again())
+
+
+def test_chat_model_forwards_pool_settings():
+    """CustomChatModel 把全部连接池配置传给API客户端"""
+    from models.new_model import CustomChatModel
+
+    model = CustomChatModel(api_key="test", pool_connections=4, pool_maxsize=8, keepalive_timeout=5.0, dns_cache_ttl=60)
+    client = model._api_client
+    assert (client.pool_connections, client.pool_maxsize, client.keepalive_timeout, client.dns_cache_ttl) == (4, 8, 5.0, 60)
@@ -0,0 +1,185 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.custom_model import CustomDashScopeLLM
+
+FRAME_INTERVAL = 0.1
+TOKENS = ["你", "好", "，", "世界"]
+
+
+class _DashScopeHandler(BaseHTTPRequestHandler):
+    """非流式返回整段文本、流式按间隔逐帧输出的伪DashScope服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.server.payloads.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        if self.headers.get("X-DashScope-SSE") != "enable":
+            body = json.dumps(
+                {"output": {"choices": [{"message": {"role": "assistant", "content": "".join(TOKENS)}}]}}
+            ).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for idx, token in enumerate(TOKENS):
+            if idx:
+                time.sleep(FRAME_INTERVAL)
+            chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": token}}]}}
+            self._write_chunk(f"data:{json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """启动本地伪DashScope服务"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _DashScopeHandler)
+    httpd.payloads = []
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/generation"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+@pytest.mark.parametrize("mode", ["completion", "chat"])
+def test_stream_is_incremental(server, mode):
+    """两种模式的流式输出都按SSE帧逐块到达"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url, mode=mode)
+    start = time.perf_counter()
+    stream = llm.stream("hi")
+    first = next(stream)
+    ttft = time.perf_counter() - start
+    rest = list(stream)
+    assert [first] + rest == TOKENS
+    assert ttft < FRAME_INTERVAL * (len(TOKENS) - 1) / 2
+    assert server.payloads[0]["parameters"]["incremental_output"] is True
+
+
+def test_invoke_sends_generation_parameters(server):
+    """非流式调用携带温度、top_p与额外请求参数"""
+    llm = CustomDashScopeLLM(
+        dashscope_api_key="test", api_url=server.url, temperature=0.2, request_params={"seed": 7}
+    )
+    assert llm.invoke("hi") == "".join(TOKENS)
+    parameters = server.payloads[0]["parameters"]
+    assert parameters["temperature"] == 0.2
+    assert parameters["top_p"] == 0.8
+    assert parameters["seed"] == 7
+
+
+def test_streaming_flag_aggregates_chunks(server):
+    """streaming=True 时 invoke 逐块读取并拼接"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url, streaming=True)
+    assert llm.invoke("hi") == "".join(TOKENS)
+    assert "incremental_output" in server.payloads[0]["parameters"]
+
+
+@pytest.mark.asyncio
+async def test_native_async_does_not_use_executor(server, monkeypatch):
+    """ainvoke/astream 走原生异步实现，不回退到线程池中的同步调用"""
+
+    def _sync_forbidden(*args, **kwargs):
+        raise AssertionError("不应调用同步实现")
+
+    monkeypatch.setattr(CustomDashScopeLLM, "_call", _sync_forbidden)
+    monkeypatch.setattr(CustomDashScopeLLM, "_stream", _sync_forbidden)
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url)
+    try:
+        results = await asyncio.gather(*(llm.ainvoke("hi") for _ in range(5)))
+        chunks = [chunk async for chunk in llm.astream("hi")]
+    finally:
+        await llm.aclose()
+    assert results == ["".join(TOKENS)] * 5
+    assert chunks == TOKENS
+
+
+def test_generate_chat_with_messages(server):
+    """_generate_chat 接受消息列表"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url)
+    result = llm._generate_chat([SystemMessage(content="sys"), HumanMessage(content="hi")])
+    assert result.generations[0].message.content == "".join(TOKENS)
+    assert [m["role"] for m in server.payloads[0]["input"]["messages"]] == ["system", "user"]
+
+
+@pytest.mark.asyncio
+async def test_chat_mode_sends_role_messages(server):
+    """chat 模式下消息列表按原角色发送，不被拼接成一条用户消息"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url)
+    messages = [SystemMessage(content="你是评审专家"), HumanMessage(content="hi")]
+    expected = [{"role": "system", "content": "你是评审专家"}, {"role": "user", "content": "hi"}]
+    assert llm.invoke(messages) == "".join(TOKENS)
+    assert await llm.ainvoke(messages) == "".join(TOKENS)
+    assert "".join(llm.stream(messages)) == "".join(TOKENS)
+    assert "".join([chunk async for chunk in llm.astream(messages)]) == "".join(TOKENS)
+    assert [payload["input"]["messages"] for payload in server.payloads] == [expected] * 4
+    await llm.aclose()
+
+
+def test_completion_mode_flattens_messages(server):
+    """completion 模式把提示词作为单条用户消息发送"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url, mode="completion")
+    llm.invoke([SystemMessage(content="你是评审专家"), HumanMessage(content="hi")])
+    assert server.payloads[0]["input"]["messages"] == [{"role": "user", "content": "System: 你是评审专家\nHuman: hi"}]
+
+
+@pytest.mark.asyncio
+async def test_chat_roles_survive_duplicate_prompts(server):
+    """同一批次里的相同消息列表各自按角色发送，不会因为拼接出的提示词相同而丢失角色"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url)
+    messages = [SystemMessage(content="你是评审专家"), HumanMessage(content="hi")]
+    expected = [{"role": "system", "content": "你是评审专家"}, {"role": "user", "content": "hi"}]
+    assert llm.batch([messages] * 3) == ["".join(TOKENS)] * 3
+    assert await llm.abatch([messages] * 3) == ["".join(TOKENS)] * 3
+    await llm.aclose()
+    assert [payload["input"]["messages"] for payload in server.payloads] == [expected] * 6
+
+
+def test_plain_prompt_is_a_user_message(server):
+    """chat 模式下字符串提示词即使与拼接格式相同，也作为单条用户消息发送"""
+    llm = CustomDashScopeLLM(dashscope_api_key="test", api_url=server.url)
+    llm.invoke([SystemMessage(content="你是评审专家"), HumanMessage(content="hi")])
+    llm.invoke("System: 你是评审专家\nHuman: hi")
+    assert server.payloads[1]["input"]["messages"] == [{"role": "user", "content": "System: 你是评审专家\nHuman: hi"}]
+
+
+def test_client_settings_are_forwarded(server):
+    """连接池、合并、限流与多端点配置传给API客户端"""
+    llm = CustomDashScopeLLM(
+        dashscope_api_key="test",
+        api_url=server.url,
+        pool_maxsize=4,
+        coalesce_requests=True,
+        rate_limit={"max_retries": 1},
+        endpoints=[server.url],
+        routing={"failure_threshold": 2},
+    )
+    client = llm._client
+    assert client.pool_maxsize == 4
+    assert client._singleflight is not None
+    assert client._rate_limiter is not None and client._rate_limiter.max_retries == 1
+    assert [state.endpoint.url for state in client._router.states] == [server.url]
+    assert client._router.failure_threshold == 2
+    assert llm.invoke("hi") == "".join(TOKENS)
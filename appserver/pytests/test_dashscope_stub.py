@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+import requests
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.custom_model import CustomDashScopeLLM
+from models.errors import APIStatusError
+from models.new_model import CustomChatModel, DashScopeAPIClient
+from models.rate_limiter import RateLimitError
+
+MESSAGES = [HumanMessage(content="你好")]
+
+
+def _client(stub, **kwargs):
+    return DashScopeAPIClient(api_key="stub", api_url=stub.url, metrics=[], **kwargs)
+
+
+class TestProtocol:
+    """测试协议兼容性"""
+
+    @pytest.mark.parametrize("dashscope_stub", [{"reply": "abcdef", "reply_tokens": 3}], indirect=True)
+    def test_json_and_sse(self, dashscope_stub):
+        """非流式JSON、增量SSE与累计SSE输出相同的文本"""
+        client = _client(dashscope_stub)
+        assert client.call_api(MESSAGES, model_name="qwen-turbo") == "abcdef"
+        assert list(client.call_api_stream(MESSAGES, model_name="qwen-turbo")) == ["ab", "cd", "ef"]
+        cumulative = list(client.call_api_stream(MESSAGES, model_name="qwen-turbo", incremental_output=False))
+        assert cumulative == ["ab", "cd", "ef"]
+        assert dashscope_stub.stats.payloads[-1]["parameters"]["incremental_output"] is False
+        client.close()
+
+    def test_raw_frames_follow_dashscope_format(self, dashscope_stub):
+        """SSE帧包含 id/event/HTTP_STATUS 注释与 usage"""
+        response = requests.post(
+            dashscope_stub.url,
+            json={"model": "qwen-turbo", "input": {"messages": [{"role": "user", "content": "hi"}]},
+                  "parameters": {"incremental_output": True}},
+            headers={"X-DashScope-SSE": "enable"},
+        )
+        text = response.content.decode("utf-8")
+        assert response.headers["Content-Type"].startswith("text/event-stream")
+        assert text.startswith("id:1\nevent:result\n:HTTP_STATUS/200\ndata:")
+        assert '"finish_reason": "stop"' in text
+        assert '"usage": {"input_tokens": 2' in text
+
+    def test_max_tokens_and_empty_messages(self, dashscope_stub):
+        """max_tokens 限制输出长度，空消息返回400"""
+        client = _client(dashscope_stub)
+        assert len(list(client.call_api_stream(MESSAGES, model_name="qwen-turbo", max_tokens=4))) == 4
+        with pytest.raises(APIStatusError) as exc_info:
+            client.call_api([], model_name="qwen-turbo")
+        assert exc_info.value.status == 400
+        client.close()
+
+    @pytest.mark.asyncio
+    async def test_openai_protocol(self, dashscope_stub):
+        """OpenAI兼容端点的非流式与流式调用"""
+        client = DashScopeAPIClient(
+            api_key="stub", metrics=[], endpoints=[{"url": dashscope_stub.openai_url, "protocol": "openai"}]
+        )
+        text = await client.call_api_async(MESSAGES, model_name="local")
+        chunks = [chunk async for chunk in client.call_api_stream_async(MESSAGES, model_name="local")]
+        assert "".join(chunks) == text
+        await client.aclose()
+
+
+class TestBehavior:
+    """测试可配置的延迟与故障"""
+
+    @pytest.mark.parametrize("dashscope_stub", [{"ttft": 0.2, "tokens_per_second": 50, "reply_tokens": 6}],
+                             indirect=True)
+    def test_ttft_and_token_rate(self, dashscope_stub):
+        """首token时间与输出速度符合配置"""
+        client = _client(dashscope_stub)
+        start = time.perf_counter()
+        arrivals = [time.perf_counter() - start for _ in client.call_api_stream(MESSAGES, model_name="qwen-turbo")]
+        assert 0.2 <= arrivals[0] < 0.35
+        assert arrivals[-1] - arrivals[0] >= 5 / 50 * 0.9
+        client.close()
+
+    @pytest.mark.parametrize("dashscope_stub", [{"jitter": 0.5, "ttft": 0.01, "error_rate": 0.3, "seed": 7}],
+                             indirect=True)
+    def test_seed_makes_faults_reproducible(self, dashscope_stub):
+        """相同种子下注入的故障序列一致"""
+        def run():
+            dashscope_stub.configure(seed=7)
+            outcomes = []
+            for _ in range(10):
+                response = requests.post(
+                    dashscope_stub.url,
+                    json={"model": "m", "input": {"messages": [{"role": "user", "content": "hi"}]}},
+                )
+                outcomes.append(response.status_code)
+            return outcomes
+
+        first, second = run(), run()
+        assert first == second
+        assert 500 in first and 200 in first
+
+    @pytest.mark.parametrize("dashscope_stub", [{"throttle_rate": 1.0, "retry_after": 2}], indirect=True)
+    def test_throttling_returns_retry_after(self, dashscope_stub):
+        """429响应携带 Retry-After"""
+        client = _client(dashscope_stub)
+        with pytest.raises(RateLimitError) as exc_info:
+            client.call_api(MESSAGES, model_name="qwen-turbo")
+        assert exc_info.value.retry_after == 2
+        assert dashscope_stub.stats.throttled == 1
+        client.close()
+
+    @pytest.mark.parametrize("dashscope_stub", [{"fail_first": 1}], indirect=True)
+    def test_fail_first_then_recover(self, dashscope_stub):
+        """前N个请求失败，之后恢复"""
+        client = _client(dashscope_stub)
+        with pytest.raises(APIStatusError) as exc_info:
+            client.call_api(MESSAGES, model_name="qwen-turbo")
+        assert exc_info.value.status == 503
+        assert client.call_api(MESSAGES, model_name="qwen-turbo")
+        client.close()
+
+    @pytest.mark.parametrize("dashscope_stub", [{"stream_error_after": 2}], indirect=True)
+    def test_stream_error_event(self, dashscope_stub):
+        """流式输出中途的错误事件转换为异常"""
+        client = _client(dashscope_stub)
+        received = []
+        with pytest.raises(ValueError):
+            for chunk in client.call_api_stream(MESSAGES, model_name="qwen-turbo"):
+                received.append(chunk)
+        assert len(received) == 2
+        client.close()
+
+
+class TestLoad:
+    """测试并发压测"""
+
+    @pytest.mark.asyncio
+    @pytest.mark.parametrize("dashscope_stub", [{"ttft": 0.1, "tokens_per_second": 100, "reply_tokens": 10}],
+                             indirect=True)
+    async def test_concurrent_streams_overlap(self, dashscope_stub):
+        """并发流式请求在桩服务端同时在途，总耗时接近单个请求"""
+        model = CustomChatModel(api_key="stub", api_url=dashscope_stub.url, metrics_sinks=[])
+
+        async def one():
+            return "".join([chunk async for chunk in model.astream_text("你好")])
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*[one() for _ in range(20)])
+        elapsed = time.perf_counter() - start
+        assert len(set(results)) == 1
+        assert dashscope_stub.stats.streams == 20
+        assert dashscope_stub.stats.max_in_flight == 20
+        assert elapsed < 1.0
+        await model.aclose()
+
+    @pytest.mark.asyncio
+    async def test_custom_dashscope_llm(self, dashscope_stub):
+        """custom_model.py 的 CustomDashScopeLLM 同样可以指向桩服务"""
+        llm = CustomDashScopeLLM(dashscope_api_key="stub", api_url=dashscope_stub.url)
+        text = await llm.ainvoke("你好")
+        chunks = [chunk async for chunk in llm.astream("你好")]
+        assert text and "".join(chunks) == text
+        await llm.aclose()
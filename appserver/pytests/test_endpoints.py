@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.endpoints import CLOSED, OPEN, Endpoint, EndpointRouter
+from models.errors import APIStatusError
+from models.new_model import DashScopeAPIClient
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """可配置延迟、状态码与协议的伪上游服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        server.posts += 1
+        time.sleep(server.latency)
+        if server.status != 200:
+            self._send(server.status, b'{"message": "upstream error"}', "application/json")
+            return
+        if body.get("stream") or self.headers.get("X-DashScope-SSE") == "enable":
+            self._send(200, self._sse_body(server.reply), "text/event-stream")
+        else:
+            self._send(200, json.dumps(self._message(server.reply)).encode("utf-8"), "application/json")
+
+    def _message(self, text):
+        message = {"message": {"role": "assistant", "content": text}}
+        if self.server.openai:
+            return {"choices": [message]}
+        return {"output": {"choices": [message]}}
+
+    def _sse_body(self, text):
+        frames = []
+        for char in text:
+            if self.server.openai:
+                chunk = {"choices": [{"delta": {"content": char}}]}
+            else:
+                chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": char}}]}}
+            frames.append(f"data: {json.dumps(chunk)}\n\n")
+        if self.server.openai:
+            frames.append("data: [DONE]\n\n")
+        return "".join(frames).encode("utf-8")
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _start_stub(latency: float, reply: str, openai: bool = False):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    server.posts = 0
+    server.latency = latency
+    server.reply = reply
+    server.status = 200
+    server.openai = openai
+    server.url = f"http://127.0.0.1:{server.server_address[1]}/generation"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+@pytest.fixture
+def stubs():
+    """一个快的DashScope端点与一个慢的OpenAI兼容端点"""
+    fast = _start_stub(latency=0.01, reply="fast")
+    slow = _start_stub(latency=0.15, reply="slow", openai=True)
+    yield fast, slow
+    for server in (fast, slow):
+        server.shutdown()
+        server.server_close()
+
+
+def _client(fast, slow, **routing):
+    return DashScopeAPIClient(
+        api_key="test",
+        endpoints=[
+            {"url": slow.url, "protocol": "openai", "name": "gateway"},
+            {"url": fast.url, "name": "regional"},
+        ],
+        routing=routing or None
+    )
+
+
+class TestEndpointRouter:
+    """测试EndpointRouter的状态机"""
+
+    def test_circuit_opens_and_half_open_probe_recovers(self):
+        """连续失败后熔断，冷却后放行一个探测，成功则恢复"""
+        router = EndpointRouter([Endpoint("http://a"), Endpoint("http://b")], failure_threshold=2, reset_timeout=0.05)
+        a = router.states[0]
+        router.record_failure(a)
+        router.record_failure(a)
+        assert a.circuit == OPEN
+        assert [s.endpoint.url for s in router.candidates()] == ["http://b"]
+        time.sleep(0.06)
+        ordered = router.candidates()
+        assert ordered[0] is a
+        # 探测进行中时不再放行第二个探测
+        assert a not in router.candidates()
+        router.record_success(a, 0.01)
+        assert a.circuit == CLOSED
+
+    def test_all_tripped_falls_back_to_oldest(self):
+        """所有端点都熔断时仍然尝试最早熔断的端点"""
+        router = EndpointRouter([Endpoint("http://a")], failure_threshold=1, reset_timeout=60)
+        router.record_failure(router.states[0])
+        assert router.candidates() == router.states
+
+    def test_interrupted_probe_is_released(self):
+        """半开探测被KeyboardInterrupt等BaseException打断时释放探测名额，端点不会永久卡在探测中"""
+        router = EndpointRouter([Endpoint("http://a")], failure_threshold=1, reset_timeout=0.01)
+        a = router.states[0]
+        router.record_failure(a)
+        time.sleep(0.02)
+
+        def interrupted(endpoint):
+            raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            router.call_sync(interrupted)
+        assert not a.probe_in_flight
+        assert router.call_sync(lambda endpoint: endpoint.url) == "http://a"
+        assert a.circuit == CLOSED
+
+    def test_openai_body_conversion(self):
+        """OpenAI兼容端点的请求体转换"""
+        endpoint = Endpoint("http://gw", protocol="openai")
+        payload = {
+            "model": "qwen-turbo",
+            "input": {"messages": [{"role": "user", "content": "hi"}]},
+            "parameters": {"result_format": "message", "temperature": 0.3, "max_tokens": 10, "incremental_output": True},
+        }
+        assert endpoint.build_body(payload, stream=True) == {
+            "model": "qwen-turbo",
+            "messages": [{"role": "user", "content": "hi"}],
+            "temperature": 0.3,
+            "max_tokens": 10,
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+
+
+@pytest.mark.asyncio
+async def test_routes_to_faster_endpoint(stubs):
+    """探索两个端点后，请求集中到延迟更低的端点"""
+    fast, slow = stubs
+    async with _client(fast, slow) as client:
+        results = [
+            await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo") for _ in range(10)
+        ]
+    assert results.count("fast") >= 9
+    assert slow.posts == 1
+    stats = {s["name"]: s for s in client.endpoint_stats()}
+    assert stats["regional"]["ewma_latency"] < stats["gateway"]["ewma_latency"]
+
+
+@pytest.mark.asyncio
+async def test_failover_and_circuit_breaker(stubs):
+    """故障端点被熔断，请求转移到另一个端点，恢复后经半开探测重新启用"""
+    fast, slow = stubs
+    fast.status = 500
+    async with _client(fast, slow, failure_threshold=2, reset_timeout=1.0) as client:
+        for _ in range(5):
+            assert await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo") == "slow"
+        assert fast.posts == 2
+        assert {s["name"]: s["circuit"] for s in client.endpoint_stats()}["regional"] == OPEN
+
+        fast.status = 200
+        await asyncio.sleep(1.05)
+        assert await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo") == "fast"
+        assert {s["name"]: s["circuit"] for s in client.endpoint_stats()}["regional"] == CLOSED
+
+
+def test_sync_stream_over_openai_gateway(stubs):
+    """同步流式调用经由OpenAI兼容端点"""
+    fast, slow = stubs
+    fast.status = 503
+    with _client(fast, slow, failure_threshold=1) as client:
+        chunks = list(client.call_api_stream([HumanMessage(content="hi")], model_name="qwen-turbo"))
+    assert "".join(chunks) == "slow"
+
+
+def test_client_error_is_not_failed_over(stubs):
+    """4xx属于请求本身的问题，不转移端点"""
+    fast, slow = stubs
+    fast.status = 400
+    slow.status = 400
+    with _client(fast, slow) as client:
+        with pytest.raises(APIStatusError) as excinfo:
+            client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo")
+    assert excinfo.value.status == 400
+    assert fast.posts + slow.posts == 1
+
+
+def test_429_fails_over_without_in_endpoint_retries(stubs):
+    """多端点时429交给路由转移，限流器不在被限流的端点上退避重试；每个端点各有一个限流器"""
+    fast, slow = stubs
+    fast.status = 429
+    with DashScopeAPIClient(
+        api_key="test",
+        endpoints=[{"url": fast.url, "name": "regional"}, {"url": slow.url, "protocol": "openai", "name": "gateway"}],
+        rate_limit={"max_retries": 5, "base_backoff": 1.0}
+    ) as client:
+        start = time.monotonic()
+        assert client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo") == "slow"
+        elapsed = time.monotonic() - start
+        regional, gateway = (client._limiter(state.endpoint) for state in client._router.states)
+    assert fast.posts == 1
+    assert elapsed < 1.0
+    assert regional is not gateway
+    assert regional.stats()["throttled"] == 1
+    assert gateway.stats()["throttled"] == 0
@@ -0,0 +1,138 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.hedging import HedgingPolicy, LatencyTracker
+from models.new_model import DashScopeAPIClient
+
+
+def _warm_policy(**kwargs) -> HedgingPolicy:
+    """构造已积累延迟样本与对冲预算的策略"""
+    policy = HedgingPolicy(min_samples=10, min_delay=0.01, **kwargs)
+    for _ in range(100):
+        policy.latency.record(0.05)
+        policy._on_request()
+    return policy
+
+
+class TestLatencyTracker:
+    """测试LatencyTracker"""
+
+    def test_percentiles(self):
+        """分位数按排序后的样本计算"""
+        tracker = LatencyTracker(window=100)
+        for ms in range(1, 101):
+            tracker.record(ms / 1000)
+        assert tracker.percentile(50) == pytest.approx(0.050, abs=0.001)
+        assert tracker.percentile(99) == pytest.approx(0.099, abs=0.001)
+        assert tracker.snapshot()["count"] == 100
+
+    def test_window_drops_old_samples(self):
+        """只保留最近的样本"""
+        tracker = LatencyTracker(window=3)
+        for value in [10.0, 1.0, 1.0, 1.0]:
+            tracker.record(value)
+        assert tracker.percentile(100) == 1.0
+
+
+class TestHedgingPolicy:
+    """测试HedgingPolicy"""
+
+    @pytest.mark.asyncio
+    async def test_no_hedge_without_samples(self):
+        """样本不足时不发送对冲请求"""
+        policy = HedgingPolicy(min_samples=10)
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            return "ok"
+
+        assert await policy.run(call) == "ok"
+        assert calls == 1
+        assert policy.hedged == 0
+
+    @pytest.mark.asyncio
+    async def test_hedge_wins_when_primary_stalls(self):
+        """主请求卡住时对冲请求先返回，主请求被取消"""
+        policy = _warm_policy(budget=0.05)
+        calls = 0
+        cancelled = asyncio.Event()
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                try:
+                    await asyncio.sleep(5)
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+                return "slow"
+            await asyncio.sleep(0.01)
+            return "fast"
+
+        start = time.monotonic()
+        assert await policy.run(call) == "fast"
+        assert time.monotonic() - start < 1
+        assert policy.hedge_wins == 1
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_budget_caps_extra_requests(self):
+        """对冲请求数不超过预算"""
+        policy = _warm_policy(budget=0.05, max_burst=1)
+        policy._credits = 0.0
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.02)
+            return "ok"
+
+        for _ in range(40):
+            await policy.run(call)
+        assert policy.hedged <= 2
+        assert calls <= 42
+
+    @pytest.mark.asyncio
+    async def test_failed_primary_falls_back_to_hedge(self):
+        """主请求失败时使用对冲请求的结果"""
+        policy = _warm_policy()
+        calls = 0
+
+        async def call():
+            nonlocal calls
+            calls += 1
+            if calls == 1:
+                await asyncio.sleep(0.1)
+                raise ValueError("upstream error")
+            await asyncio.sleep(0.2)
+            return "ok"
+
+        assert await policy.run(call) == "ok"
+
+    @pytest.mark.asyncio
+    async def test_both_failed_raises_primary_error(self):
+        """两个请求都失败时抛出异常"""
+        policy = _warm_policy()
+
+        async def call():
+            await asyncio.sleep(0.1)
+            raise ValueError("upstream error")
+
+        with pytest.raises(ValueError):
+            await policy.run(call)
+
+
+def test_client_exposes_hedging_stats():
+    """客户端按配置创建对冲策略并暴露统计"""
+    client = DashScopeAPIClient(api_key="test", hedging={"percentile": 90, "budget": 0.05})
+    assert client.hedging_stats()["requests"] == 0
+    assert DashScopeAPIClient(api_key="test").hedging_stats() == {}
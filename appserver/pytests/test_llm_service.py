@@ -0,0 +1,231 @@
+import asyncio
+import os
+import sys
+
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.models.endpoints import OPEN
+from appserver.models.errors import APIStatusError
+from appserver.models.registry import model_registry
+from appserver.service.llm_router import Backend
+from appserver.service.llm_service import LLMService
+
+
+class _FakeChatModel:
+    """可配置延迟与故障的伪模型"""
+
+    def __init__(self, reply: str, latency: float = 0.0, fail: bool = False):
+        self.reply = reply
+        self.latency = latency
+        self.fail = fail
+        self.calls = 0
+
+    async def agenerate(self, batch, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("backend down")
+        return LLMResult(generations=[[ChatGeneration(message=AIMessage(content=self.reply))]])
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.fail:
+            raise ConnectionError("backend down")
+        for char in self.reply:
+            yield AIMessageChunk(content=char)
+
+
+@pytest.fixture
+def fakes():
+    """在默认注册表中注册伪模型，参数 key 选择实例"""
+    models = {
+        "fast": _FakeChatModel("fast", latency=0.01),
+        "slow": _FakeChatModel("slow", latency=0.08),
+        "broken": _FakeChatModel("broken", fail=True),
+    }
+    model_registry.register("fake", lambda key: models[key])
+    yield models
+    model_registry.clear()
+
+
+def _service(*specs, **routing):
+    return LLMService(
+        backends=[Backend(name=key, provider="fake", params={"key": key}, price=price) for key, price in specs],
+        routing=routing or None
+    )
+
+
+@pytest.mark.asyncio
+async def test_prefers_lower_latency_after_exploration(fakes):
+    """探索各后端后，fast 偏好集中到延迟最低的后端"""
+    service = _service(("slow", 0.1), ("fast", 1.0))
+    results = [await service.chat([HumanMessage(content="hi")], prefer="fast") for _ in range(6)]
+    assert results.count("fast") >= 5
+    assert fakes["slow"].calls == 1
+
+
+@pytest.mark.asyncio
+async def test_cheap_preference_uses_price(fakes):
+    """cheap 偏好选择价格最低的后端"""
+    service = _service(("fast", 1.0), ("slow", 0.1))
+    assert await service.chat([HumanMessage(content="hi")], prefer="cheap") == "slow"
+
+
+@pytest.mark.asyncio
+async def test_backend_hint_pins_first_choice(fakes):
+    """指定后端时优先使用该后端"""
+    service = _service(("fast", 0.0), ("slow", 0.0))
+    assert await service.chat([HumanMessage(content="hi")], backend="slow") == "slow"
+
+
+@pytest.mark.asyncio
+async def test_failover_is_transparent_and_trips_circuit(fakes):
+    """后端故障时自动转移，连续失败后熔断"""
+    service = _service(("broken", 0.0), ("fast", 1.0), failure_threshold=2, reset_timeout=60)
+    for _ in range(3):
+        assert await service.chat([HumanMessage(content="hi")], prefer="cheap") == "fast"
+    chunks = [chunk async for chunk in service.achat([HumanMessage(content="hi")], prefer="cheap")]
+    assert "".join(chunks) == "fast"
+    stats = {s["name"]: s for s in service.backend_stats()}
+    assert stats["broken"]["circuit"] == OPEN
+    assert fakes["broken"].calls == 2
+
+
+@pytest.mark.asyncio
+async def test_client_error_not_failed_over(fakes):
+    """4xx错误直接抛给调用方"""
+    async def bad_request(*args, **kwargs):
+        raise APIStatusError("bad request", 400)
+
+    fakes["fast"].agenerate = bad_request
+    service = _service(("fast", 0.0), ("slow", 0.0))
+    with pytest.raises(APIStatusError):
+        await service.chat([HumanMessage(content="hi")], backend="fast")
+    assert fakes["slow"].calls == 0
+
+
+def test_invalid_preference_rejected(fakes):
+    """未知的路由偏好抛出ValueError"""
+    with pytest.raises(ValueError):
+        _service(("fast", 0.0)).router.rank("fastest")
+
+
+def test_default_backend_from_model_name():
+    """未配置后端时按模型名称构造默认后端"""
+    assert LLMService(model_name="qwen-turbo").router.backends[0].provider == "chat_tongyi"
+    assert LLMService(model_name="deepseek-chat").router.backends[0].provider == "deepseek"
+
+
+@pytest.mark.asyncio
+async def test_chat_and_stream_go_through_scheduler(fakes):
+    """chat 与 achat 占用调度槽位，排队超时抛出 DeadlineExceeded"""
+    from appserver.service.scheduler import BATCH, DeadlineExceeded
+
+    service = LLMService(
+        backends=[Backend(name="slow", provider="fake", params={"key": "slow"})],
+        scheduler={"max_concurrency": 1, "reserved": 0}
+    )
+    running = asyncio.create_task(service.chat([HumanMessage(content="hi")]))
+    await asyncio.sleep(0.01)
+    assert service.scheduler_stats()["running"] == 1
+    with pytest.raises(DeadlineExceeded):
+        await service.chat([HumanMessage(content="hi")], priority=BATCH, deadline=0.01)
+    assert await running == "slow"
+
+    chunks = [chunk async for chunk in service.achat([HumanMessage(content="hi")])]
+    assert "".join(chunks) == "slow"
+    stats = service.scheduler_stats()
+    assert stats["running"] == 0
+    assert stats["classes"]["interactive"]["dispatched"] == 1
+    assert stats["classes"]["batch"]["expired"] == 1
+
+
+class _DripModel:
+    """逐字符慢速输出的伪模型"""
+
+    def __init__(self, reply: str, interval: float = 0.01):
+        self.reply = reply
+        self.interval = interval
+        self.calls = 0
+        self.closed = 0
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        try:
+            for char in self.reply:
+                await asyncio.sleep(self.interval)
+                yield AIMessageChunk(content=char)
+        finally:
+            self.closed += 1
+
+
+@pytest.fixture
+def drip():
+    model = _DripModel("abcdefgh")
+    model_registry.register("drip", lambda: model)
+    yield LLMService(backends=[Backend(name="drip", provider="drip")], broadcast=True), model
+    model_registry.clear()
+
+
+@pytest.mark.asyncio
+async def test_identical_streams_share_one_upstream(drip):
+    """相同的并发流式对话只请求一次上游，迟到者收到完整回复"""
+    service, model = drip
+    messages = [HumanMessage(content="刷新看板")]
+
+    async def collect(delay):
+        await asyncio.sleep(delay)
+        return "".join([chunk async for chunk in service.achat(messages)])
+
+    results = await asyncio.gather(collect(0), collect(0.03), collect(0.05))
+    assert results == ["abcdefgh"] * 3
+    assert model.calls == 1
+    assert service.broadcast_stats()["stream_coalesced"] == 2
+    assert service.scheduler_stats()["classes"]["interactive"]["dispatched"] == 1
+
+    other = "".join([chunk async for chunk in service.achat([HumanMessage(content="另一个问题")])])
+    assert other == "abcdefgh"
+    assert model.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_broadcast_is_opt_in(drip):
+    """广播默认关闭；开启广播的服务也可以按调用退出"""
+    _, model = drip
+    messages = [HumanMessage(content="刷新看板")]
+
+    async def collect(service, **kwargs):
+        return "".join([chunk async for chunk in service.achat(messages, **kwargs)])
+
+    service = LLMService(backends=[Backend(name="drip", provider="drip")])
+    assert await asyncio.gather(collect(service), collect(service)) == ["abcdefgh"] * 2
+    assert model.calls == 2
+    assert await asyncio.gather(collect(service, broadcast=True), collect(service, broadcast=True)) == ["abcdefgh"] * 2
+    assert model.calls == 3
+
+    shared, _ = drip
+    await asyncio.gather(collect(shared), collect(shared, broadcast=False))
+    assert model.calls == 5
+    assert shared.broadcast_stats()["stream_coalesced"] == 0
+
+
+@pytest.mark.asyncio
+async def test_upstream_cancelled_only_after_last_subscriber_leaves(drip):
+    """部分订阅者离开不影响其他订阅者，全部离开后取消上游"""
+    service, model = drip
+    messages = [HumanMessage(content="刷新看板")]
+    first = service.achat(messages)
+    second = service.achat(messages)
+    assert await first.__anext__() == "a"
+    assert await second.__anext__() == "a"
+    await first.aclose()
+    assert await second.__anext__() == "b"
+    assert model.closed == 0
+    await second.aclose()
+    await asyncio.sleep(0.02)
+    assert model.closed == 1
+    assert service.scheduler_stats()["running"] == 0
@@ -0,0 +1,349 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.metrics import (
+    CallRecorder,
+    JSONLSink,
+    MetricsRegistry,
+    NodeMetricsHandler,
+    PrometheusExporter,
+    normalize_usage,
+)
+from models.new_model import CustomChatModel, DashScopeAPIClient
+
+TOKENS = ["你好", "，", "我是", "助手"]
+FRAME_INTERVAL = 0.02
+PAYLOAD = {"model": "qwen-turbo", "input": {"messages": [{"role": "user", "content": "你好啊"}]}, "parameters": {}}
+
+
+class _UsageHandler(BaseHTTPRequestHandler):
+    """逐帧输出TOKENS、每帧携带累计usage的伪DashScope服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("X-DashScope-SSE") != "enable":
+            body = json.dumps({
+                "output": {"choices": [{"message": {"content": "".join(TOKENS)}}]},
+                "usage": {"input_tokens": 7, "output_tokens": 5, "total_tokens": 12},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for i, token in enumerate(TOKENS, 1):
+            time.sleep(FRAME_INTERVAL)
+            chunk = {
+                "output": {"choices": [{"message": {"role": "assistant", "content": token}}]},
+                "usage": {"input_tokens": 7, "output_tokens": i, "total_tokens": 7 + i},
+            }
+            self._write_chunk(f"data:{json.dumps(chunk)}\n\n".encode("utf-8"))
+        self._write_chunk(b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """启动本地服务器"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _UsageHandler)
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/generation"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class _SlowFirstHandler(_UsageHandler):
+    """第一个非流式请求延迟返回，之后的请求立即返回"""
+
+    def do_POST(self):
+        self.server.posts += 1
+        if self.server.posts == 1:
+            time.sleep(0.5)
+        super().do_POST()
+
+
+@pytest.fixture
+def hedge_server():
+    """启动第一个请求很慢的本地服务器"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _SlowFirstHandler)
+    httpd.posts = 0
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/generation"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestCallRecorder:
+    """测试CallRecorder"""
+
+    def test_stream_timings_and_estimated_usage(self):
+        """首token与token间隔按片段到达时间计算，无上游用量时按字符估算"""
+        received = []
+        recorder = CallRecorder(PAYLOAD, stream=True, listener=received.append)
+        recorder.sending("http://upstream")
+        recorder.connected()
+        for token in ["ab", "c", "d"]:
+            time.sleep(0.01)
+            recorder.token(token)
+        metrics = recorder.finish()
+        assert received == [metrics]
+        assert metrics.queue_wait <= metrics.connect + metrics.queue_wait <= metrics.ttft <= metrics.duration
+        assert len(metrics.inter_token) == 2
+        assert min(metrics.inter_token) >= 0.005
+        assert (metrics.prompt_tokens, metrics.completion_tokens, metrics.total_tokens) == (3, 4, 7)
+        assert metrics.usage_source == "estimate"
+        assert metrics.tokens_per_second > 0
+
+    def test_upstream_usage_and_error_status(self):
+        """上游用量优先，异常记录为 error，生成器关闭记录为 cancelled，finish 只生效一次"""
+        recorder = CallRecorder(PAYLOAD, stream=False)
+        recorder.usage({"input_tokens": 10, "output_tokens": 3})
+        metrics = recorder.finish(error=ValueError("boom"))
+        assert (metrics.prompt_tokens, metrics.completion_tokens, metrics.total_tokens) == (10, 3, 13)
+        assert metrics.usage_source == "upstream"
+        assert (metrics.status, metrics.error) == ("error", "ValueError")
+        assert recorder.finish().status == "error"
+        assert CallRecorder(PAYLOAD, stream=True).finish(error=GeneratorExit()).status == "cancelled"
+
+    def test_normalize_usage(self):
+        """OpenAI 兼容格式的 usage 统一为相同字段"""
+        assert normalize_usage({"prompt_tokens": 2, "completion_tokens": 3}) == {
+            "prompt_tokens": 2, "completion_tokens": 3, "total_tokens": 5,
+        }
+
+
+class TestSinks:
+    """测试输出端"""
+
+    def _metrics(self):
+        recorder = CallRecorder(PAYLOAD, stream=True)
+        recorder.token("a")
+        recorder.token("b")
+        recorder.usage({"input_tokens": 4, "output_tokens": 2, "total_tokens": 6})
+        return recorder
+
+    def test_registry_and_prometheus_export(self):
+        """直方图与计数器按模型打标签，并渲染为Prometheus文本格式"""
+        registry = MetricsRegistry()
+        recorder = self._metrics()
+        recorder.sinks = (registry,)
+        recorder.finish()
+        snapshot = registry.snapshot()
+        assert snapshot["llm_ttft_seconds"][0]["count"] == 1
+        assert snapshot["llm_inter_token_seconds"][0]["count"] == 1
+        assert snapshot["llm_completion_tokens_total"][0]["value"] == 2
+
+        text = PrometheusExporter(registry).render()
+        assert "# TYPE llm_ttft_seconds histogram" in text
+        assert 'llm_ttft_seconds_bucket{model="qwen-turbo",stream="true",le="+Inf"} 1' in text
+        assert 'llm_calls_total{model="qwen-turbo",stream="true",status="ok"} 1' in text
+        assert 'llm_prompt_tokens_total{model="qwen-turbo",stream="true"} 4' in text
+
+    def test_jsonl_sink(self, tmp_path):
+        """每次调用追加一行JSON"""
+        path = str(tmp_path / "calls.jsonl")
+        for _ in range(2):
+            recorder = self._metrics()
+            recorder.sinks = (JSONLSink(path),)
+            recorder.finish()
+        with open(path, encoding="utf-8") as f:
+            lines = [json.loads(line) for line in f]
+        assert len(lines) == 2
+        assert lines[0]["usage_source"] == "upstream"
+        assert lines[0]["inter_token"]["count"] == 1
+
+    def test_failing_sink_does_not_break_call(self):
+        """输出端异常被忽略"""
+        class Broken:
+            def emit(self, metrics):
+                raise RuntimeError("disk full")
+
+        recorder = CallRecorder(PAYLOAD, stream=False, sinks=[Broken()])
+        assert recorder.finish("ok").status == "ok"
+
+
+class TestClientInstrumentation:
+    """测试DashScopeAPIClient的埋点"""
+
+    def test_sync_stream_records_ttft_and_upstream_usage(self, server):
+        """同步流式调用记录首token、token间隔与上游用量"""
+        registry = MetricsRegistry()
+        received = []
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, metrics=[registry])
+        text = "".join(client.call_api_stream(
+            [HumanMessage(content="hi")], model_name="qwen-turbo", on_metrics=received.append
+        ))
+        assert text == "".join(TOKENS)
+        metrics = received[0]
+        assert metrics.stream and metrics.status == "ok"
+        assert metrics.endpoint == server.url
+        assert metrics.connect is not None and metrics.queue_wait is not None
+        assert metrics.ttft >= FRAME_INTERVAL
+        assert len(metrics.inter_token) == len(TOKENS) - 1
+        assert (metrics.prompt_tokens, metrics.completion_tokens) == (7, len(TOKENS))
+        assert metrics.usage_source == "upstream"
+        assert registry.snapshot()["llm_calls_total"][0]["value"] == 1
+        client.close()
+
+    @pytest.mark.asyncio
+    async def test_async_call_records_usage(self, server):
+        """异步非流式调用记录总耗时与上游用量"""
+        received = []
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, metrics=[])
+        content = await client.call_api_async(
+            [HumanMessage(content="hi")], model_name="qwen-turbo", on_metrics=received.append
+        )
+        assert content == "".join(TOKENS)
+        metrics = received[0]
+        assert not metrics.stream and metrics.ttft is None
+        assert metrics.total_tokens == 12
+        assert metrics.duration >= metrics.connect
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_closed_async_stream_is_cancelled(self, server):
+        """调用方中途放弃的流记录为 cancelled，并保留已收到的累计用量"""
+        received = []
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, metrics=[])
+        stream = client.call_api_stream_async(
+            [HumanMessage(content="hi")], model_name="qwen-turbo", on_metrics=received.append
+        )
+        assert await stream.__anext__() == TOKENS[0]
+        await stream.aclose()
+        assert received[0].status == "cancelled"
+        assert received[0].completion_tokens == 1
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_coalesced_calls_reuse_leader_timings(self, server):
+        """合并到在途调用上的调用标记为 coalesced，沿用领头调用的建连时间与用量，用量不重复计数"""
+        registry = MetricsRegistry()
+        received = []
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, coalesce=True, metrics=[registry])
+        messages = [HumanMessage(content="hi")]
+        await asyncio.gather(*[
+            client.call_api_async(messages, model_name="qwen-turbo", on_metrics=received.append) for _ in range(2)
+        ])
+        leader, follower = sorted(received, key=lambda m: m.coalesced)
+        assert not leader.coalesced and follower.coalesced
+        assert follower.endpoint == server.url
+        assert follower.connect == leader.connect is not None
+        assert follower.queue_wait is not None
+        assert follower.total_tokens == 12 and follower.usage_source == "upstream"
+        snapshot = registry.snapshot()
+        assert snapshot["llm_calls_total"][0]["value"] == 2
+        assert snapshot["llm_coalesced_calls_total"][0]["value"] == 1
+        assert snapshot["llm_prompt_tokens_total"][0]["value"] == 7
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_coalesced_stream_records_own_ttft(self, server):
+        """加入在途流的调用记录自己的首token时间，建连时间与用量沿用领头的流"""
+        received = []
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, coalesce=True, metrics=[])
+        messages = [HumanMessage(content="hi")]
+
+        async def consume():
+            stream = client.call_api_stream_async(messages, model_name="qwen-turbo", on_metrics=received.append)
+            return "".join([delta async for delta in stream])
+
+        assert await asyncio.gather(consume(), consume()) == ["".join(TOKENS)] * 2
+        follower = next(m for m in received if m.coalesced)
+        assert follower.ttft >= FRAME_INTERVAL
+        assert follower.connect is not None
+        assert follower.completion_tokens == len(TOKENS) and follower.usage_source == "upstream"
+        await client.aclose()
+
+    @pytest.mark.asyncio
+    async def test_hedge_request_recorded_separately(self, hedge_server):
+        """对冲请求单独记录，不覆盖主请求的时间点，也不计入调用次数"""
+        registry = MetricsRegistry()
+        received = []
+        client = DashScopeAPIClient(
+            api_key="test", api_url=hedge_server.url, metrics=[registry],
+            hedging={"min_samples": 1, "min_delay": 0.05, "budget": 1.0}
+        )
+        client._hedging.latency.record(0.01)
+        content = await client.call_api_async(
+            [HumanMessage(content="hi")], model_name="qwen-turbo", on_metrics=received.append
+        )
+        assert content == "".join(TOKENS)
+        assert client.hedging_stats()["hedge_wins"] == 1
+        call = received[0]
+        assert not call.hedge and call.status == "ok"
+        # 主请求在收到响应头前被取消，建连时间不会被对冲请求覆盖
+        assert call.connect is None
+        snapshot = registry.snapshot()
+        assert snapshot["llm_calls_total"][0]["value"] == 1
+        assert snapshot["llm_hedge_requests_total"] == [
+            {"labels": {"model": "qwen-turbo", "stream": "false", "status": "ok"}, "value": 1}
+        ]
+        await client.aclose()
+
+    def test_disabled_metrics_skip_recording(self, server):
+        """没有输出端与回调时不创建记录器"""
+        client = DashScopeAPIClient(api_key="test", api_url=server.url, metrics=[])
+        assert client._recorder(PAYLOAD, False, None) is None
+        client.close()
+
+
+class TestCustomChatModelEvents:
+    """测试CustomChatModel的回调事件"""
+
+    def test_invoke_reports_metrics_per_node(self, server):
+        """埋点以自定义事件上报，按调用方元数据中的节点归因，并填充 usage_metadata"""
+        handler = NodeMetricsHandler()
+        model = CustomChatModel(api_key="test", api_url=server.url, metrics_sinks=[])
+        result = model.invoke("hi", config={"callbacks": [handler], "metadata": {"langgraph_node": "review"}})
+        assert result.usage_metadata["total_tokens"] == 12
+        summary = handler.summary()
+        assert summary["review"]["calls"] == 1
+        assert summary["review"]["completion_tokens"] == 5
+
+    @pytest.mark.asyncio
+    async def test_astream_inside_node_reports_metrics(self, server):
+        """节点内的异步流式调用在流结束后上报埋点，挂在外层节点上"""
+        handler = NodeMetricsHandler()
+        model = CustomChatModel(api_key="test", api_url=server.url, metrics_sinks=[])
+
+        async def node(text):
+            return "".join([chunk.content async for chunk in model.astream(text)])
+
+        result = await RunnableLambda(node).ainvoke(
+            "hi", config={"callbacks": [handler], "metadata": {"langgraph_node": "draft"}}
+        )
+        assert result == "".join(TOKENS)
+        summary = handler.summary()["draft"]
+        assert summary["calls"] == 1
+        assert summary["ttft"] > 0
+        await model.aclose()
+
+    def test_stream_without_run_context_is_silent(self, server):
+        """不在运行上下文中的流式调用不上报事件，也不报错"""
+        model = CustomChatModel(api_key="test", api_url=server.url, metrics_sinks=[])
+        assert "".join(chunk.content for chunk in model.stream("hi")) == "".join(TOKENS)
@@ -87,17 +87,17 @@ class TestCustomChatModel:
                 CustomChatModel()
             assert "DASHSCOPE_API_KEY" in str(excinfo.value)
     
-    @patch('new_model.requests.post')
+    @patch('requests.Session.post')
     def test_generate_success(self, mock_post, model):
         """测试成功生成回复"""
-        # 模拟API响应
+        # 模拟API响应（请求经由客户端的连接池 requests.Session 发出）
         mock_response = MagicMock()
         mock_response.status_code = 200
-        mock_response.json.return_value = {
+        mock_response.content = json.dumps({
             "output": {
-                "text": "你好！我是一个AI助手，很高兴为您服务。"
+                "choices": [{"message": {"role": "assistant", "content": "你好！我是一个AI助手，很高兴为您服务。"}}]
             }
-        }
+        }).encode("utf-8")
         mock_post.return_value = mock_response
         
         # 测试消息
@@ -117,15 +117,18 @@ class TestCustomChatModel:
         # 验证API调用
         mock_post.assert_called_once()
         call_args = mock_post.call_args
+        assert call_args[0][0] == model.api_url
         assert call_args[1]['headers']['Authorization'] == f'Bearer {model.api_key}'
+        assert json.loads(call_args[1]['data'])['input']['messages'][1] == {"role": "user", "content": "你好"}
     
-    @patch('new_model.requests.post')
+    @patch('requests.Session.post')
     def test_generate_api_error(self, mock_post, model):
         """测试API错误处理"""
         # 模拟API错误
         mock_response = MagicMock()
         mock_response.status_code = 401
         mock_response.text = "Unauthorized"
+        mock_response.headers = {}
         mock_post.return_value = mock_response
         
         messages = [HumanMessage(content="测试")]
@@ -133,7 +136,8 @@ class TestCustomChatModel:
         # 验证抛出异常
         with pytest.raises(Exception) as excinfo:
             model._generate(messages)
-        assert "API调用失败" in str(excinfo.value)
+        assert "API请求失败: 401" in str(excinfo.value)
+        mock_post.assert_called_once()
 
 
 # 简单的函数测试，便于单独运行
@@ -161,12 +165,12 @@ def test_convert_ai_message_simple():
     assert result["content"] == "AI回复" 
 
 
-def test_stream_generation():
-    """测试流式生成"""
+def test_stream_generation(dashscope_model_kwargs):
+    """测试流式生成（未配置 DASHSCOPE_API_KEY 时使用本地桩服务）"""
     logging.info("开始测试流式生成")
     
     # 创建模型实例
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     assert model is not None, "模型实例创建失败"
     
     # 准备测试消息
@@ -196,7 +200,7 @@ def test_stream_generation():
             assert chunk is not None, f"第 {chunk_count} 个chunk不应为空"
             
             # 验证chunk类型（根据实际返回类型调整）
-            assert hasattr(chunk, 'content') or isinstance(chunk, (str, dict)), \
+            assert hasattr(chunk, 'message') or isinstance(chunk, (str, dict)), \
                 f"第 {chunk_count} 个chunk类型不正确: {type(chunk)}"
             
             chunks.append(chunk)
@@ -216,8 +220,8 @@ def test_stream_generation():
     # 验证chunk内容
     total_content = ""
     for i, chunk in enumerate(chunks):
-        if hasattr(chunk, 'content'):
-            content = chunk.content
+        if hasattr(chunk, 'message'):
+            content = chunk.message.content
         elif isinstance(chunk, str):
             content = chunk
         elif isinstance(chunk, dict) and 'content' in chunk:
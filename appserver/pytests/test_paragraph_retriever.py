@@ -0,0 +1,192 @@
+import importlib
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.service import paragraph_retriever
+from appserver.service.paragraph_retriever import BM25, ParagraphRetriever, tokenize
+
+REPORT = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'test-report', 'report.md')
+
+PARAGRAPHS = [
+    "# 系统测试报告",
+    "|----------|----------|",
+    "本次测试共执行120条用例，整体通过率95%。",
+    "测试环境为 Windows 11 与 MySQL 8.0。",
+    "遗留两个严重缺陷，涉及用户权限越界。",
+    "建议上线前进行一次全量回归测试。",
+]
+
+
+def _bigram_embedder(texts):
+    """按字符二元组哈希的确定性向量化，相近措辞得到相近向量"""
+    vectors = np.zeros((len(texts), 256), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for i in range(max(1, len(text) - 1)):
+            vectors[row, zlib.crc32(text[i:i + 2].encode("utf-8")) % 256] += 1.0
+    return vectors
+
+
+class TestTokenize:
+    """测试中文分词"""
+
+    def test_fallback_char_bigrams(self, monkeypatch):
+        """未安装jieba时中文按单字与二字切分，英文数字按词切分"""
+        monkeypatch.setattr(paragraph_retriever, "jieba", None)
+        assert tokenize("通过率 MySQL 8.0") == ["通", "过", "率", "通过", "过率", "mysql", "8.0"]
+
+
+class TestBM25:
+    """测试BM25"""
+
+    def test_scores_rank_matching_document_first(self):
+        """包含查询词的文档得分最高，不相关文档得分为0"""
+        corpus = [tokenize(p) for p in ["测试通过率为95%", "测试环境配置", "缺陷修复情况"]]
+        scores = BM25(corpus).scores(tokenize("通过率"))
+        assert int(np.argmax(scores)) == 0
+        assert scores[2] == 0
+
+    def test_coverage_ignores_single_characters(self, monkeypatch):
+        """覆盖率只统计多字词项，未出现在语料中的词项计入分母"""
+        monkeypatch.setattr(paragraph_retriever, "jieba", None)
+        bm25 = BM25([tokenize(p) for p in ["性能测试", "测试通过率"]])
+        assert bm25.coverage(tokenize("逻辑性")).max() == 0
+        assert bm25.coverage(tokenize("测试通过率"))[1] == pytest.approx(1.0)
+        assert 0 < bm25.coverage(tokenize("测试覆盖"))[0] < 1
+
+
+class TestParagraphRetriever:
+    """测试段落检索"""
+
+    def test_bm25_only_without_embeddings(self):
+        """关闭向量检索时仅使用BM25，装饰性段落不参与检索"""
+        index = ParagraphRetriever(use_embeddings=False, top_k=3).build(PARAGRAPHS)
+        assert 1 not in index.positions
+        result = index.search("测试环境")
+        assert result.candidates[0].index == 3
+        assert len(result.candidates) <= 3
+        assert index.retriever.stats()["embeddings"] is False
+
+    def test_defaults_to_bm25_only(self, monkeypatch):
+        """默认不加载向量模型，只有显式开启时才创建"""
+        created = []
+        monkeypatch.setattr(paragraph_retriever, "SentenceTransformerEmbedder", lambda: created.append(1) or _bigram_embedder)
+        assert ParagraphRetriever().embedder is None
+        assert created == []
+        assert ParagraphRetriever(use_embeddings=True).embedder is _bigram_embedder
+        assert created == [1]
+
+    def test_confident_match_returns_original_text(self):
+        """置信度达到阈值时直接返回候选原文"""
+        index = ParagraphRetriever(use_embeddings=False, confidence_threshold=0.9).build(PARAGRAPHS)
+        result = index.search("整体通过率")
+        assert result.confident
+        assert result.matched_content() == PARAGRAPHS[2]
+
+    def test_short_circuit_is_opt_in(self):
+        """默认不设置置信度阈值，候选总是交给LLM"""
+        index = ParagraphRetriever(use_embeddings=False).build(PARAGRAPHS)
+        result = index.search("整体通过率")
+        assert result.candidates[0].index == 2
+        assert not result.confident and result.matched_content() == ""
+
+    def test_headings_and_short_paragraphs_never_confident(self):
+        """标题与过短的段落即使完全命中也不会被直接采用"""
+        index = ParagraphRetriever(use_embeddings=False, confidence_threshold=0.5).build(
+            ["## 六、附录：遗留问题列表", "遗留问题", "遗留问题共两项：权限越界缺陷与导出乱码缺陷，均已排期修复。"]
+        )
+        result = index.search("遗留问题")
+        assert all(c.confidence == 1.0 for c in result.candidates)
+        assert [c.index for c in result.confident_candidates] == [2]
+
+    def test_unrelated_point_is_not_confident(self):
+        """与文档无关的要点不会被判为高置信"""
+        index = ParagraphRetriever(use_embeddings=False).build(PARAGRAPHS)
+        result = index.search("格式规范")
+        assert not result.confident
+        assert result.matched_content() == ""
+
+    def test_hybrid_with_embedder(self):
+        """提供向量化函数时融合BM25与向量相似度，查询向量批量计算"""
+        calls = []
+
+        def embedder(texts):
+            calls.append(len(texts))
+            return _bigram_embedder(texts)
+
+        retriever = ParagraphRetriever(embedder=embedder, bm25_weight=0.5)
+        index = retriever.build(PARAGRAPHS)
+        results = index.search_many(["严重缺陷", "全量回归测试", "测试环境"])
+        assert calls == [len(index.positions), 3]
+        assert [r.candidates[0].index for r in results] == [4, 5, 3]
+        assert retriever.stats()["embeddings"] is True
+
+    def test_empty_document(self):
+        """空文档返回空结果"""
+        result = ParagraphRetriever(use_embeddings=False).build([]).search("格式规范")
+        assert result.candidates == [] and not result.confident
+
+
+@pytest.mark.asyncio
+async def test_review_sends_only_candidates(monkeypatch):
+    """评审流程只把候选段落交给LLM，高置信要点跳过匹配调用"""
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    service = importlib.import_module("appserver.service.new_review_service")
+    prompts = {}
+
+    async def fake_match(paragraphs, review_point, model_name="qwen-turbo", indices=None, limit=None):
+        prompts[review_point] = service.build_match_messages(paragraphs, review_point, indices)[1].content
+        return "匹配内容"
+
+    async def fake_conclusion(point, content, model_name, limit=None):
+        return f"结论:{content}"
+
+    monkeypatch.setattr(service, "allm_match_content", fake_match)
+    monkeypatch.setattr(service, "allm_review_conclusion", fake_conclusion)
+
+    retriever = ParagraphRetriever(use_embeddings=False, top_k=3, confidence_threshold=0.85)
+    results = await service.review_document_with_chain_of_thought(
+        REPORT, ["测试通过率", "数据准确性"], retriever=retriever, match_mode="per_point", conclusion_mode="detailed"
+    )
+
+    # 高置信要点直接使用检索原文
+    assert "测试通过率" not in prompts
+    assert "通过率" in results["测试通过率"]["matched_content"]
+    # 其余要点只包含top-k候选，编号保持原文序号
+    full = service.build_match_messages(service.extract_paragraphs(REPORT), "数据准确性")[1].content
+    assert len(re.findall(r"\[\d+\] ", prompts["数据准确性"])) == 3
+    assert len(prompts["数据准确性"]) < len(full) / 3
+    assert results["数据准确性"] == {
+        "status": "ok", "matched_content": "匹配内容", "conclusion_mode": "detailed", "conclusion": "结论:匹配内容"
+    }
+
+
+@pytest.mark.asyncio
+async def test_review_without_candidates_matches_full_document(monkeypatch):
+    """检索没有任何候选的要点在完整文档上匹配，而不是以空内容下结论"""
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    service = importlib.import_module("appserver.service.new_review_service")
+    sent = {}
+
+    async def fake_match(paragraphs, review_point, model_name="qwen-turbo", indices=None, limit=None):
+        sent[review_point] = len(paragraphs)
+        return "全文匹配"
+
+    async def fake_conclusion(point, content, model_name, limit=None):
+        return f"结论:{content}"
+
+    monkeypatch.setattr(service, "allm_match_content", fake_match)
+    monkeypatch.setattr(service, "allm_review_conclusion", fake_conclusion)
+    for match_mode in ("per_point", "batch"):
+        sent.clear()
+        results = await service.review_document_with_chain_of_thought(
+            REPORT, ["zzz"], retriever=ParagraphRetriever(use_embeddings=False),
+            match_mode=match_mode, conclusion_mode="detailed"
+        )
+        assert sent == {"zzz": len(service.extract_paragraphs(REPORT))}
+        assert results["zzz"]["conclusion"] == "结论:全文匹配"
@@ -0,0 +1,111 @@
+import json
+import os
+import sys
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.endpoints import Endpoint
+from models.new_model import CustomChatModel, DashScopeAPIClient
+from models.payload_encoder import JSONCodec, OrjsonCodec, PayloadEncoder, default_codec, orjson
+
+
+def _payload(messages, **parameters):
+    return {
+        "model": "qwen-turbo",
+        "input": {"messages": messages},
+        "parameters": {"result_format": "message", "temperature": 0.7, **parameters},
+    }
+
+
+class TestPayloadEncoder:
+    """测试PayloadEncoder"""
+
+    def test_output_matches_full_encoding(self):
+        """增量编码结果与整体编码等价"""
+        encoder = PayloadEncoder(JSONCodec())
+        payload = _payload(
+            [{"role": "system", "content": "你是助手\n\"引号\""}, {"role": "user", "content": "hi"}],
+            stop=["###"], max_tokens=None
+        )
+        assert json.loads(encoder.encode(payload)) == payload
+
+    def test_history_prefix_is_cached(self):
+        """多轮对话中不变的历史消息只编码一次"""
+        encoder = PayloadEncoder(JSONCodec())
+        history = [{"role": "system", "content": "s" * 1000}]
+        for turn in range(5):
+            history = history + [{"role": "user", "content": f"q{turn}"}]
+            encoder.encode(_payload(history))
+            history = history + [{"role": "assistant", "content": f"a{turn}"}]
+        stats = encoder.stats()
+        # 每条消息只在首次出现时编码一次：1条系统消息 + 5个问题 + 前4轮的回答
+        assert stats["message_misses"] == 1 + 5 + 4
+        # 第t轮复用系统消息与之前的t个问题、t-1个回答
+        assert stats["message_hits"] == sum(2 * turn for turn in range(5))
+
+    def test_parameter_types_are_not_conflated(self):
+        """取值相等但类型不同的参数不共用缓存"""
+        encoder = PayloadEncoder(JSONCodec())
+        assert b'"seed":1}' in encoder.encode(_payload([], seed=1))
+        assert b'"seed":true}' in encoder.encode(_payload([], seed=True))
+
+    def test_unknown_shape_falls_back(self):
+        """非DashScope结构的payload整体编码"""
+        encoder = PayloadEncoder(JSONCodec())
+        payload = {"model": "m", "input": {"prompt": "hi"}, "parameters": {}}
+        assert json.loads(encoder.encode(payload)) == payload
+        assert encoder.stats()["message_misses"] == 0
+
+    def test_non_string_content_not_cached(self):
+        """多模态等非字符串内容不进入缓存"""
+        encoder = PayloadEncoder(JSONCodec())
+        message = {"role": "user", "content": [{"text": "hi"}]}
+        assert json.loads(encoder.encode(_payload([message])))["input"]["messages"] == [message]
+        assert encoder.stats()["cached_messages"] == 0
+
+    def test_message_cache_is_bounded_by_bytes(self):
+        """消息编码缓存按总字节数淘汰，超过上限的单条消息不缓存"""
+        encoder = PayloadEncoder(JSONCodec(), max_message_bytes=4500)
+        for idx in range(10):
+            encoder.encode(_payload([{"role": "user", "content": f"{idx}" + "x" * 1000}]))
+        stats = encoder.stats()
+        assert stats["cached_messages"] == 4
+        assert stats["cached_message_bytes"] <= 4500
+        encoder.encode(_payload([{"role": "user", "content": "y" * 5000}]))
+        assert encoder.stats()["cached_messages"] == 4
+        # 最近写入的消息仍在缓存中
+        encoder.encode(_payload([{"role": "user", "content": "9" + "x" * 1000}]))
+        assert encoder.stats()["message_hits"] == 1
+
+    @pytest.mark.skipif(orjson is None, reason="未安装orjson")
+    def test_orjson_codec(self):
+        """安装了orjson时默认使用，编码结果与标准库一致"""
+        assert isinstance(default_codec(), OrjsonCodec)
+        payload = _payload([{"role": "user", "content": "你好"}], top_p=0.8)
+        assert json.loads(PayloadEncoder(OrjsonCodec()).encode(payload)) == payload
+
+
+def test_client_encodes_body_per_endpoint_protocol():
+    """DashScope端点使用预编码，OpenAI兼容端点编码转换后的请求体"""
+    client = DashScopeAPIClient(api_key="test", json_codec=JSONCodec())
+    payload = client._build_payload(
+        [SystemMessage(content="sys"), HumanMessage(content="hi"), AIMessage(content="yo")],
+        model_name="qwen-turbo",
+        temperature=0.1,
+        max_tokens=10
+    )
+    assert json.loads(client._encode_body(payload, Endpoint("http://a"))) == payload
+    openai_body = json.loads(client._encode_body(payload, Endpoint("http://b", protocol="openai"), stream=True))
+    assert openai_body["stream"] is True
+    assert openai_body["messages"] == payload["input"]["messages"]
+    assert client.encoder_stats()["codec"] == "json"
+
+
+def test_chat_model_forwards_json_codec():
+    """CustomChatModel 的 json_codec 传给API客户端"""
+    codec = JSONCodec()
+    model = CustomChatModel(api_key="test", json_codec=codec)
+    assert model._api_client._codec is codec
+    assert model._api_client._encoder.codec is codec
@@ -0,0 +1,204 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import DashScopeAPIClient
+from models.rate_limiter import (
+    RateLimiter,
+    RateLimitError,
+    TokenBucket,
+    estimate_tokens,
+    parse_retry_after,
+)
+
+
+class TestTokenBucket:
+    """测试TokenBucket"""
+
+    def test_burst_then_wait(self):
+        """容量内不等待，超出后按速率计算等待时间"""
+        bucket = TokenBucket(rate=10, capacity=2)
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == 0
+        assert bucket.reserve() == pytest.approx(0.1, abs=0.02)
+
+
+class TestRateLimiter:
+    """测试RateLimiter"""
+
+    def test_parse_retry_after(self):
+        """Retry-After 支持秒数，非法值返回None"""
+        assert parse_retry_after("2") == 2.0
+        assert parse_retry_after("abc") is None
+        assert parse_retry_after(None) is None
+
+    def test_estimate_tokens(self):
+        """估算token数为输入字符数加最大输出长度"""
+        payload = {"input": {"messages": [{"role": "user", "content": "你好"}]}, "parameters": {"max_tokens": 10}}
+        assert estimate_tokens(payload) == 12
+
+    def test_aimd_adjusts_limit(self):
+        """成功时加性增加，429时乘性减小"""
+        limiter = RateLimiter(initial_concurrency=4, max_concurrency=8)
+        limiter.acquire_sync()
+        limiter.release(latency=0.1)
+        assert limiter.concurrency_limit == 4
+        for _ in range(4):
+            limiter.acquire_sync()
+            limiter.release(latency=0.1)
+        assert limiter.concurrency_limit == 5
+        limiter.acquire_sync()
+        limiter.release(throttled=True)
+        assert limiter.concurrency_limit == 2
+
+    def test_slow_latency_counts_as_congestion(self):
+        """延迟超过目标时减小并发上限"""
+        limiter = RateLimiter(initial_concurrency=8, latency_target=0.5)
+        limiter.acquire_sync()
+        limiter.release(latency=2.0)
+        assert limiter.concurrency_limit == 4
+
+    @pytest.mark.asyncio
+    async def test_long_stream_uses_ttft_as_latency(self):
+        """流式调用以首片段延迟作为延迟信号，输出时间长不算拥塞"""
+        limiter = RateLimiter(initial_concurrency=8, latency_target=0.1)
+
+        async def long_stream():
+            for _ in range(5):
+                await asyncio.sleep(0.05)
+                yield "x"
+
+        assert [chunk async for chunk in limiter.stream(0, long_stream)] == ["x"] * 5
+        assert limiter.concurrency_limit == 8
+
+        def slow_first_chunk():
+            time.sleep(0.15)
+            yield "x"
+
+        assert list(limiter.stream_sync(0, slow_first_chunk)) == ["x"]
+        assert limiter.concurrency_limit == 4
+
+    def test_backoff_honors_retry_after(self):
+        """退避时间不小于Retry-After"""
+        limiter = RateLimiter(base_backoff=0.01)
+        assert limiter.backoff_delay(0, retry_after=1.5) >= 1.5
+        assert limiter.backoff_delay(3) <= 0.08
+
+    @pytest.mark.asyncio
+    async def test_callers_queue_at_limit(self):
+        """超出并发上限的调用排队而不是失败"""
+        limiter = RateLimiter(initial_concurrency=2, max_concurrency=2)
+        running = 0
+        peak = 0
+
+        async def call():
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+            return "ok"
+
+        results = await asyncio.gather(*[limiter.run(0, call) for _ in range(6)])
+        assert results == ["ok"] * 6
+        assert peak == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_leaves_queue(self):
+        """排队中被取消的调用不会占用槽位"""
+        limiter = RateLimiter(initial_concurrency=1, max_concurrency=1)
+        await limiter.acquire()
+        waiter = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        limiter.release(latency=0.01)
+        assert limiter.stats()["in_flight"] == 0
+        assert limiter.stats()["queued"] == 0
+
+    @pytest.mark.asyncio
+    async def test_retries_rate_limit_errors(self):
+        """429会在退避后重试，超过次数后抛出"""
+        limiter = RateLimiter(base_backoff=0.001, max_retries=2)
+        attempts = 0
+
+        async def flaky():
+            nonlocal attempts
+            attempts += 1
+            if attempts < 3:
+                raise RateLimitError("429", retry_after=0)
+            return "ok"
+
+        assert await limiter.run(0, flaky) == "ok"
+        assert limiter.stats()["retries"] == 2
+
+        async def always_throttled():
+            raise RateLimitError("429")
+
+        with pytest.raises(RateLimitError):
+            await limiter.run(0, always_throttled)
+
+
+class _ThrottlingHandler(BaseHTTPRequestHandler):
+    """前两次请求返回429的伪DashScope服务"""
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.posts += 1
+        if self.server.posts <= 2:
+            body = b'{"code": "Throttling"}'
+            self.send_response(429)
+            self.send_header("Retry-After", "0.05")
+        else:
+            body = json.dumps({
+                "output": {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+            }).encode("utf-8")
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def throttling_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ThrottlingHandler)
+    server.posts = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/generation"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_client_waits_out_429(throttling_server):
+    """客户端遇到429时按Retry-After等待并重试，最终成功"""
+    config = {"base_backoff": 0.01, "max_retries": 3}
+    async with DashScopeAPIClient(api_key="rate-limit-test", api_url=throttling_server, rate_limit=config) as client:
+        start = time.monotonic()
+        result = await client.call_api_async([HumanMessage(content="hi")], model_name="qwen-turbo")
+        elapsed = time.monotonic() - start
+    assert result == "ok"
+    assert elapsed >= 0.1
+    assert client._rate_limiter.stats()["throttled"] == 2
+
+
+def test_client_raises_without_limiter(throttling_server):
+    """未开启限流时429直接以ValueError抛出"""
+    with DashScopeAPIClient(api_key="test", api_url=throttling_server) as client:
+        with pytest.raises(ValueError) as excinfo:
+            client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo")
+    assert "429" in str(excinfo.value)
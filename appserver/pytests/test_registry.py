@@ -0,0 +1,108 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import CustomChatModel
+from models.registry import ModelRegistry, get_model, model_registry
+
+
+class _Closable:
+    def __init__(self, **params):
+        self.params = params
+        self.closed = False
+
+    async def aclose(self):
+        self.closed = True
+
+
+class TestModelRegistry:
+    """测试ModelRegistry"""
+
+    def test_same_params_share_instance(self):
+        """名称与参数相同的获取返回同一实例，参数不同则各自创建"""
+        registry = ModelRegistry()
+        registry.register("fake", _Closable)
+        first = registry.get("fake", model="a", temperature=0.1)
+        assert registry.get("fake", temperature=0.1, model="a") is first
+        assert registry.get("fake", model="a", temperature=0.2) is not first
+        assert registry.stats() == {"fake": 2}
+
+    def test_concurrent_first_get_creates_once(self):
+        """并发首次获取只调用一次工厂函数"""
+        registry = ModelRegistry()
+        created = []
+
+        def slow_factory(**params):
+            time.sleep(0.05)
+            created.append(params)
+            return _Closable(**params)
+
+        registry.register("slow", slow_factory)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry.get("slow", model="x"))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert len(created) == 1
+        assert all(result is results[0] for result in results)
+
+    def test_unknown_name_raises(self):
+        """未注册的名称抛出ValueError"""
+        with pytest.raises(ValueError):
+            ModelRegistry().get("missing")
+
+    @pytest.mark.asyncio
+    async def test_aclose_releases_instances(self):
+        """aclose 清空实例池并释放连接"""
+        registry = ModelRegistry()
+        registry.register("fake", _Closable)
+        instance = registry.get("fake")
+        await registry.aclose()
+        assert instance.closed
+        assert registry.get("fake") is not instance
+
+    @pytest.mark.asyncio
+    async def test_aclose_continues_after_failure(self):
+        """单个实例释放失败时其余实例仍被释放，之后抛出该错误"""
+
+        class _Broken(_Closable):
+            async def aclose(self):
+                raise RuntimeError("close failed")
+
+        registry = ModelRegistry()
+        registry.register("broken", _Broken)
+        registry.register("fake", _Closable)
+        registry.get("broken")
+        instance = registry.get("fake")
+        with pytest.raises(RuntimeError):
+            await registry.aclose()
+        assert instance.closed
+        assert registry.stats() == {}
+
+
+def test_default_registry_builds_custom_chat_model_once():
+    """默认注册表中的 custom_chat 按参数共享 CustomChatModel"""
+    model = get_model("custom_chat", api_key="test", model_name="qwen-turbo")
+    assert isinstance(model, CustomChatModel)
+    assert get_model("custom_chat", api_key="test", model_name="qwen-turbo") is model
+    assert {"tongyi", "chat_tongyi", "deepseek", "custom_chat", "dashscope_llm"} <= set(model_registry.names())
+
+
+@pytest.mark.asyncio
+async def test_aclose_closes_client_sessions(dashscope_stub):
+    """应用关闭时的 aclose 同时关闭模型客户端的同步Session与异步会话"""
+    registry = ModelRegistry()
+    registry.register("custom_chat", CustomChatModel)
+    model = registry.get("custom_chat", api_key="stub", api_url=dashscope_stub.url)
+    model.invoke("hi")
+    await model.ainvoke("hi")
+    client = model._api_client
+    session = next(iter(client._async_sessions.values()))
+    await registry.aclose()
+    assert client._session is None
+    assert session.closed and not client._async_sessions
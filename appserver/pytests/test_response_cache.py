@@ -0,0 +1,121 @@
+import os
+import sys
+import time
+from unittest.mock import MagicMock
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import CustomChatModel
+from models.response_cache import ResponseCache, cache_key, iter_replay_chunks
+
+
+class TestResponseCache:
+    """测试ResponseCache"""
+
+    def test_key_normalizes_messages(self):
+        """消息首尾空白与换行风格不影响key"""
+        params = {"temperature": 0.3}
+        a = cache_key("qwen-turbo", params, [{"role": "user", "content": " 你好\r\n"}])
+        b = cache_key("qwen-turbo", params, [{"role": "user", "content": "你好"}])
+        assert a == b
+        assert a.startswith("qwen-turbo:")
+        assert a != cache_key("qwen-turbo", {"temperature": 0.1}, [{"role": "user", "content": "你好"}])
+
+    def test_lru_eviction(self):
+        """超出容量时淘汰最久未使用的条目"""
+        cache = ResponseCache(max_entries=2)
+        cache.set("a", "1")
+        cache.set("b", "2")
+        assert cache.get("a") == "1"
+        cache.set("c", "3")
+        assert cache.get("b") is None
+        assert cache.get("a") == "1"
+        assert cache.stats()["evictions"] == 1
+
+    def test_ttl_expiration(self):
+        """过期条目视为未命中"""
+        cache = ResponseCache(ttl=0.05)
+        cache.set("a", "1")
+        time.sleep(0.1)
+        assert cache.get("a") is None
+        stats = cache.stats()
+        assert stats["expirations"] == 1
+        assert stats["misses"] == 1
+
+    def test_sqlite_tier_shared_between_instances(self, tmp_path):
+        """磁盘层可在多个缓存实例（worker）之间共享"""
+        path = str(tmp_path / "responses.db")
+        writer = ResponseCache(sqlite_path=path)
+        reader = ResponseCache(sqlite_path=path)
+        writer.set("qwen-turbo:abc", "缓存内容")
+        assert reader.get("qwen-turbo:abc") == "缓存内容"
+        assert reader.stats()["disk_hits"] == 1
+        writer.close()
+        reader.close()
+
+    def test_invalidate_by_model(self, tmp_path):
+        """按模型失效内存层与磁盘层"""
+        cache = ResponseCache(sqlite_path=str(tmp_path / "responses.db"))
+        cache.set("qwen-turbo:a", "1")
+        cache.set("qwen-max:b", "2")
+        assert cache.invalidate(model_name="qwen-turbo") == 1
+        assert cache.get("qwen-turbo:a") is None
+        assert cache.get("qwen-max:b") == "2"
+        cache.invalidate()
+        assert cache.get("qwen-max:b") is None
+        cache.close()
+
+    def test_replay_chunks(self):
+        """回放片段拼接后与原文一致"""
+        text = "一段需要回放的缓存文本" * 3
+        chunks = list(iter_replay_chunks(text, chunk_size=4))
+        assert "".join(chunks) == text
+        assert all(len(chunk) <= 4 for chunk in chunks)
+
+
+class TestCustomChatModelCache:
+    """测试CustomChatModel接入响应缓存"""
+
+    messages = [SystemMessage(content="你是一名文档分析专家。"), HumanMessage(content="评审要点：格式规范")]
+
+    def _model(self, temperature: float = 0.3) -> CustomChatModel:
+        model = CustomChatModel(api_key="test", temperature=temperature, response_cache=ResponseCache())
+        model._api_client = MagicMock()
+        model._api_client.call_api.return_value = "匹配结果"
+        model._api_client.call_api_stream.return_value = iter(["匹配", "结果"])
+        return model
+
+    def test_generate_hits_cache(self):
+        """相同请求第二次直接命中缓存"""
+        model = self._model()
+        first = model._generate(self.messages)
+        second = model._generate(self.messages)
+        assert first.generations[0].message.content == second.generations[0].message.content == "匹配结果"
+        assert model._api_client.call_api.call_count == 1
+        assert model.response_cache.stats()["hits"] == 1
+
+    def test_high_temperature_bypasses_cache(self):
+        """温度高于阈值时不使用缓存"""
+        model = self._model(temperature=0.7)
+        model._generate(self.messages)
+        model._generate(self.messages)
+        assert model._api_client.call_api.call_count == 2
+
+    def test_stream_replays_cached_text(self):
+        """流式调用命中时回放缓存文本"""
+        model = self._model()
+        streamed = "".join(chunk.message.content for chunk in model._stream(self.messages))
+        replayed = "".join(chunk.message.content for chunk in model._stream(self.messages))
+        assert streamed == replayed == "匹配结果"
+        assert model._api_client.call_api_stream.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_agenerate_shares_cache_with_sync(self):
+        """异步调用与同步调用共享缓存"""
+        model = self._model()
+        model._generate(self.messages)
+        result = await model._agenerate(self.messages)
+        assert result.generations[0].message.content == "匹配结果"
+        model._api_client.call_api_async.assert_not_called()
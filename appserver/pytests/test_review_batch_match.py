@@ -0,0 +1,291 @@
+import importlib
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.service.paragraph_retriever import ParagraphRetriever
+
+REPORT = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'test-report', 'report.md')
+LABELS = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'test-report', 'match-labels.json')
+POINTS = ["格式规范", "内容完整性", "逻辑性", "数据准确性"]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """导入评审服务（模块导入时检查密钥）"""
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    return importlib.import_module("appserver.service.new_review_service")
+
+
+@pytest.fixture
+def calls(service, monkeypatch):
+    """替换LLM调用，记录批量与逐要点匹配的请求"""
+    record = {"batch": [], "per_point": []}
+
+    async def fake_batch(paragraphs, review_points, model_name="qwen-turbo", indices=None, limit=None):
+        record["batch"].append((list(review_points), list(indices) if indices is not None else None))
+        allowed = list(indices) if indices is not None else list(range(len(paragraphs)))
+        text = "```json\n" + str({str(n): [allowed[0] + 1] for n in range(1, len(review_points) + 1)}).replace("'", '"') + "\n```"
+        return service.parse_batch_match(text, review_points, allowed)
+
+    async def fake_match(paragraphs, review_point, model_name="qwen-turbo", indices=None, limit=None):
+        record["per_point"].append(review_point)
+        return "逐要点匹配"
+
+    async def fake_conclusion(point, content, model_name, limit=None):
+        return "结论"
+
+    async def fake_compact(point, content, model_name, include_reasoning, limit=None):
+        return {"verdict": "符合"}
+
+    monkeypatch.setattr(service, "allm_batch_match", fake_batch)
+    monkeypatch.setattr(service, "allm_match_content", fake_match)
+    monkeypatch.setattr(service, "allm_review_conclusion", fake_conclusion)
+    monkeypatch.setattr(service, "allm_compact_conclusion", fake_compact)
+    return record
+
+
+class TestParseBatchMatch:
+    """测试批量匹配输出解析"""
+
+    def test_parse_fenced_json(self, service):
+        """允许代码块标记，编号转为从0开始并过滤未发送的段落"""
+        text = '结果如下：\n```json\n{"1": [3, 5, 99], "2": [], "3": ["4"], "4": [3]}\n```'
+        result = service.parse_batch_match(text, POINTS, range(10))
+        assert result == {"格式规范": [2, 4], "内容完整性": [], "逻辑性": [3], "数据准确性": [2]}
+
+    def test_parse_accepts_point_text_as_key(self, service):
+        """键也可以是评审要点原文"""
+        assert service.parse_batch_match('{"格式规范": [1]}', ["格式规范"], [0]) == {"格式规范": [0]}
+
+    @pytest.mark.parametrize("text", ["无法判断", '{"1": [1]}', '{"1": [1], "2": 3}', '{"1": [1], "2": [null]}'])
+    def test_parse_invalid_output(self, service, text):
+        """非JSON、缺少要点或编号无效时抛出ValueError"""
+        with pytest.raises(ValueError):
+            service.parse_batch_match(text, POINTS[:2], range(10))
+
+
+class TestChunkReviewPoints:
+    """测试按token预算拆分评审要点"""
+
+    def test_single_chunk_within_budget(self, service):
+        """预算充足时所有要点一组"""
+        paragraphs = service.extract_paragraphs(REPORT)
+        assert service.chunk_review_points(paragraphs, POINTS) == [POINTS]
+
+    def test_split_when_over_budget(self, service):
+        """超出预算时拆分，每组都不超过预算"""
+        paragraphs = service.extract_paragraphs(REPORT)
+        points = [f"{point}{n}" for n in range(10) for point in POINTS]
+        base = service.estimate_tokens(service.build_batch_match_messages(paragraphs, []))
+        budget = base + 100
+        chunks = service.chunk_review_points(paragraphs, points, budget=budget)
+        assert len(chunks) > 1
+        assert [point for chunk in chunks for point in chunk] == points
+        for chunk in chunks:
+            assert service.estimate_tokens(service.build_batch_match_messages(paragraphs, chunk)) <= budget
+
+    def test_document_over_budget(self, service):
+        """文档本身超出预算时返回空列表"""
+        paragraphs = service.extract_paragraphs(REPORT)
+        assert service.chunk_review_points(paragraphs, POINTS, budget=100) == []
+
+
+class TestBatchReview:
+    """测试评审流程的批量匹配模式"""
+
+    @pytest.mark.asyncio
+    async def test_document_sent_once(self, service, calls):
+        """不启用检索时文档只发送一次，各要点得到段落原文"""
+        results = await service.review_document_with_chain_of_thought(REPORT, POINTS, use_retrieval=False)
+        assert len(calls["batch"]) == 1 and calls["batch"][0][0] == POINTS
+        assert calls["per_point"] == []
+        first = service.extract_paragraphs(REPORT)[0]
+        assert all(result["matched_content"] == first for result in results.values())
+
+    @pytest.mark.asyncio
+    async def test_batch_with_retrieval_sends_candidate_union(self, service, calls):
+        """启用检索时只发送未高置信要点的候选段落并集"""
+        retriever = ParagraphRetriever(use_embeddings=False, top_k=3, confidence_threshold=0.85)
+        await service.review_document_with_chain_of_thought(REPORT, POINTS + ["测试通过率"], retriever=retriever)
+        (points, indices), = calls["batch"]
+        assert "测试通过率" not in points
+        assert len(indices) <= 3 * len(points)
+        assert indices == sorted(indices)
+
+    @pytest.mark.asyncio
+    async def test_chunked_when_over_budget(self, service, calls, monkeypatch):
+        """超出预算时拆分为多次批量请求"""
+        paragraphs = service.extract_paragraphs(REPORT)
+        base = service.estimate_tokens(service.build_batch_match_messages(paragraphs, []))
+        monkeypatch.setattr(service, "BATCH_MATCH_TOKEN_BUDGET", base + 15)
+        await service.review_document_with_chain_of_thought(REPORT, POINTS, use_retrieval=False)
+        assert len(calls["batch"]) > 1
+        assert sorted(p for points, _ in calls["batch"] for p in points) == sorted(POINTS)
+        assert calls["per_point"] == []
+
+    @pytest.mark.asyncio
+    async def test_fallback_to_per_point(self, service, calls, monkeypatch):
+        """输出无法解析或文档超出预算时回退到逐要点匹配"""
+        async def broken(*args, **kwargs):
+            raise ValueError("批量匹配输出不是JSON")
+
+        monkeypatch.setattr(service, "allm_batch_match", broken)
+        results = await service.review_document_with_chain_of_thought(REPORT, POINTS, use_retrieval=False)
+        assert calls["per_point"] == POINTS
+        assert results["格式规范"]["matched_content"] == "逐要点匹配"
+
+        calls["per_point"].clear()
+        monkeypatch.setattr(service, "BATCH_MATCH_TOKEN_BUDGET", 100)
+        await service.review_document_with_chain_of_thought(REPORT, POINTS, use_retrieval=False)
+        assert calls["per_point"] == POINTS
+
+    @pytest.mark.asyncio
+    async def test_per_point_mode(self, service, calls):
+        """per_point 模式保持逐要点匹配，未知模式报错"""
+        await service.review_document_with_chain_of_thought(REPORT, POINTS, use_retrieval=False, match_mode="per_point")
+        assert calls["batch"] == [] and calls["per_point"] == POINTS
+        with pytest.raises(ValueError):
+            await service.review_document_with_chain_of_thought(REPORT, POINTS, match_mode="unknown")
+
+
+class _FakeLLM:
+    """按顺序返回预设输出的模型，记录收到的提示词"""
+
+    def __init__(self, *outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+
+    def invoke(self, messages):
+        self.prompts.append(messages[-1].content)
+        return self.outputs.pop(0)
+
+
+class TestIndexOnlyMatch:
+    """测试逐要点匹配只返回段落编号"""
+
+    @pytest.mark.parametrize("text, expected", [
+        ("[3, 7]", [2, 6]),
+        ("相关段落：[7，3]", [2, 6]),
+        ("[3] [7]", [2, 6]),
+        ("[]", []),
+        ("[3, 99]", [2]),
+    ])
+    def test_parse_match_indices(self, service, text, expected):
+        """解析编号数组，忽略未发送的编号"""
+        assert service.parse_match_indices(text, range(10)) == expected
+
+    def test_parse_without_indices(self, service):
+        """输出不含编号数组时抛出ValueError"""
+        with pytest.raises(ValueError):
+            service.parse_match_indices("测试环境段落", range(10))
+
+    def test_content_rebuilt_from_paragraphs(self, service, monkeypatch):
+        """提示词只要求编号，匹配内容由本地按原文序号还原"""
+        llm = _FakeLLM("[5, 2]")
+        monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+        paragraphs = ["甲", "乙", "丙"]
+        content = service.llm_match_content(paragraphs, "要点", indices=[1, 4, 7])
+        assert content == "甲\n乙"
+        assert "[2] 甲" in llm.prompts[0] and "JSON数组" in llm.prompts[0]
+        assert "段落原文（如有多个可合并）" not in llm.prompts[0]
+
+    def test_fallback_to_text_output(self, service, monkeypatch):
+        """编号无法解析时改为要求返回段落原文"""
+        llm = _FakeLLM("无法判断", "乙")
+        monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+        assert service.llm_match_content(["甲", "乙"], "要点") == "乙"
+        assert "段落原文（如有多个可合并）" in llm.prompts[1]
+
+    def test_labelled_answers_round_trip(self, service, monkeypatch):
+        """标注答案按编号格式回答时，解析与原文还原不丢失也不多出段落"""
+        with open(LABELS, encoding="utf-8") as f:
+            labels = json.load(f)["points"]
+        paragraphs = service.extract_paragraphs(REPORT)
+        for point, numbers in labels.items():
+            gold = sorted(n - 1 for n in numbers)
+            answer = json.dumps(numbers)
+            assert service.parse_match_indices(answer, range(len(paragraphs))) == gold
+            llm = _FakeLLM(answer)
+            monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+            assert service.llm_match_content(paragraphs, point) == "\n".join(paragraphs[i] for i in gold)
+
+    def test_verbatim_output_opt_in(self, service, monkeypatch):
+        """output="text" 时仍要求逐字返回段落原文"""
+        llm = _FakeLLM("乙")
+        monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+        assert service.llm_match_content(["甲", "乙"], "要点", output="text") == "乙"
+        assert len(llm.prompts) == 1
+        assert "段落原文（如有多个可合并）" in llm.prompts[0] and "JSON数组" not in llm.prompts[0]
+
+
+class TestCompactConclusion:
+    """测试结构化评审结论"""
+
+    def test_parse_compact_conclusion(self, service):
+        """取输出中最后一个JSON对象，理由按长度截断，非法严重程度置空"""
+        text = '推理：数据一致。\n{"verdict": "不符合", "severity": "致命", "rationale": "' + "合计错误" * 40 + '"}'
+        conclusion = service.parse_compact_conclusion(text)
+        assert conclusion["verdict"] == "不符合"
+        assert conclusion["severity"] is None
+        assert len(conclusion["rationale"]) == service.RATIONALE_MAX_CHARS
+
+    def test_parse_unstructured_output(self, service):
+        """输出无法解析时判定为无法判断，保留截断后的原文"""
+        conclusion = service.parse_compact_conclusion("该部分基本符合要求")
+        assert conclusion == {"verdict": "无法判断", "severity": None, "rationale": "该部分基本符合要求"}
+
+    def test_output_length_bounded(self, service, monkeypatch):
+        """默认不生成推理，并严格限制输出token"""
+        received = {}
+
+        class LLM:
+            def invoke(self, messages, **kwargs):
+                received.update(kwargs, prompt=messages[-1].content)
+                return '{"verdict": "符合", "severity": "无", "rationale": "数据一致"}'
+
+        monkeypatch.setattr(service, "get_model", lambda name, **params: LLM())
+        conclusion = service.llm_compact_conclusion("数据准确性", "合计120")
+        assert conclusion == {"verdict": "符合", "severity": "无", "rationale": "数据一致"}
+        assert received["max_tokens"] == service.COMPACT_CONCLUSION_MAX_TOKENS
+        assert "不要展示推理过程" in received["prompt"]
+
+    def test_reasoning_only_on_request(self, service, monkeypatch):
+        """要求推理时推理过程与结论分开返回"""
+        class LLM:
+            def invoke(self, messages, **kwargs):
+                return '第一步：核对合计。\n第二步：发现不一致。\n{"verdict": "不符合", "severity": "严重", "rationale": "合计错误"}'
+
+        monkeypatch.setattr(service, "get_model", lambda name, **params: LLM())
+        conclusion = service.llm_compact_conclusion("数据准确性", "合计120", include_reasoning=True)
+        assert conclusion["reasoning"] == "第一步：核对合计。\n第二步：发现不一致。"
+        assert conclusion["verdict"] == "不符合"
+
+    @pytest.mark.asyncio
+    async def test_review_reports_mode(self, service, calls, monkeypatch):
+        """评审结果标明使用的结论模式，推理只在要求时返回"""
+        results = await service.review_document_with_chain_of_thought(REPORT, POINTS[:1], use_retrieval=False)
+        assert results["格式规范"]["conclusion_mode"] == "compact"
+        assert results["格式规范"]["conclusion"] == {"verdict": "符合"}
+        assert "reasoning" not in results["格式规范"]
+
+        async def with_reasoning(point, content, model_name, include_reasoning, limit=None):
+            return {"verdict": "符合", "reasoning": "推理"}
+
+        monkeypatch.setattr(service, "allm_compact_conclusion", with_reasoning)
+        results = await service.review_document_with_chain_of_thought(
+            REPORT, POINTS[:1], use_retrieval=False, include_reasoning=True
+        )
+        assert results["格式规范"]["reasoning"] == "推理"
+        assert results["格式规范"]["conclusion"] == {"verdict": "符合"}
+
+        results = await service.review_document_with_chain_of_thought(
+            REPORT, POINTS[:1], use_retrieval=False, conclusion_mode="detailed"
+        )
+        assert results["格式规范"] == {"status": "ok", "matched_content": results["格式规范"]["matched_content"],
+                                     "conclusion_mode": "detailed", "conclusion": "结论"}
+        with pytest.raises(ValueError):
+            await service.review_document_with_chain_of_thought(REPORT, POINTS, conclusion_mode="verbose")
@@ -0,0 +1,188 @@
+import asyncio
+import importlib
+import os
+import sys
+
+import aiohttp
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.models.custom_model import CustomDashScopeLLM
+from appserver.service.scheduler import PriorityScheduler
+
+REPORT = os.path.join(os.path.dirname(__file__), '..', '..', 'resources', 'test-report', 'report.md')
+POINTS = ["格式规范", "内容完整性", "逻辑性", "数据准确性", "测试环境配置", "遗留问题列表"]
+
+
+@pytest.fixture
+def service(monkeypatch):
+    """导入评审服务（模块导入时检查密钥）"""
+    monkeypatch.setenv("DASHSCOPE_API_KEY", "test")
+    return importlib.import_module("appserver.service.new_review_service")
+
+
+class _AsyncLLM:
+    """
+    记录并发数的异步模型：匹配返回编号，结论返回JSON；slow 中的要点结论调用会长时间阻塞，failing 中的要点结论调用抛出异常，
+    timing_out 中的要点结论调用以 {要点: 异常} 给出HTTP客户端超时
+    """
+
+    def __init__(self, delay=0.05, slow=(), failing=(), timing_out=None):
+        self.delay = delay
+        self.slow = set(slow)
+        self.failing = set(failing)
+        self.timing_out = dict(timing_out or {})
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+        self.cancelled = 0
+
+    async def ainvoke(self, messages, **kwargs):
+        prompt = messages[-1].content
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            conclusion = "评审结论" in prompt or "verdict" in prompt
+            slow = conclusion and any(f"评审要点：{point}" in prompt for point in self.slow)
+            await asyncio.sleep(10 if slow else self.delay)
+            if conclusion and any(f"评审要点：{point}" in prompt for point in self.failing):
+                raise RuntimeError("上游返回500")
+            for point, error in self.timing_out.items():
+                if conclusion and f"评审要点：{point}" in prompt:
+                    raise error
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        return '{"verdict": "符合", "severity": "无", "rationale": "一致"}' if conclusion else "[1]"
+
+
+def _review(service, **kwargs):
+    kwargs.setdefault("use_retrieval", False)
+    kwargs.setdefault("match_mode", "per_point")
+    kwargs.setdefault("scheduler", PriorityScheduler(max_concurrency=16, reserved=0))
+    return service.review_document_with_chain_of_thought(REPORT, POINTS, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_per_request_concurrency(service, monkeypatch):
+    """单个请求的在途模型调用数不超过 max_concurrency"""
+    llm = _AsyncLLM()
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service, max_concurrency=2)
+    assert llm.max_in_flight == 2
+    assert llm.calls == 2 * len(POINTS)
+    assert all(r["status"] == "ok" and r["conclusion"]["verdict"] == "符合" for r in results.values())
+    assert results["格式规范"]["matched_content"] == "# 系统测试报告"
+
+
+@pytest.mark.asyncio
+async def test_global_concurrency_shared_across_requests(service, monkeypatch):
+    """多个请求共享全局调度器的并发上限"""
+    llm = _AsyncLLM()
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    scheduler = PriorityScheduler(max_concurrency=3, reserved=0)
+    await asyncio.gather(*[_review(service, max_concurrency=4, scheduler=scheduler) for _ in range(3)])
+    assert llm.max_in_flight == 3
+    assert scheduler.stats()["running"] == 0
+
+
+@pytest.mark.asyncio
+async def test_point_timeout_returns_partial_results(service, monkeypatch):
+    """超时的要点返回已完成的匹配内容，其余要点正常返回"""
+    llm = _AsyncLLM(slow=["逻辑性"])
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service, point_timeout=0.5)
+    timed_out = results["逻辑性"]
+    assert timed_out["status"] == "timeout"
+    assert timed_out["matched_content"] == "# 系统测试报告"
+    assert timed_out["conclusion"] is None
+    assert all(results[point]["status"] == "ok" for point in POINTS if point != "逻辑性")
+    assert llm.cancelled == 1 and llm.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_point_error_does_not_orphan_other_points(service, monkeypatch):
+    """单个要点出错时返回 status=error，其余要点照常完成，不留下在途调用"""
+    llm = _AsyncLLM(failing=["逻辑性"])
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service, max_concurrency=2)
+    failed = results["逻辑性"]
+    assert failed["status"] == "error" and "上游返回500" in failed["error"]
+    assert failed["matched_content"] == "# 系统测试报告" and failed["conclusion"] is None
+    assert all(results[point]["status"] == "ok" for point in POINTS if point != "逻辑性")
+    assert llm.in_flight == 0 and llm.calls == 2 * len(POINTS)
+
+
+@pytest.mark.asyncio
+async def test_http_client_timeout_is_reported_as_timeout(service, monkeypatch):
+    """HTTP客户端的超时（含被包装后抛出的）与要点截止时间一样返回 status=timeout"""
+    wrapped = ValueError("API请求失败")
+    wrapped.__cause__ = asyncio.TimeoutError()
+    llm = _AsyncLLM(timing_out={"逻辑性": aiohttp.ServerTimeoutError("读取超时"), "数据准确性": wrapped})
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service)
+    assert results["逻辑性"]["status"] == "timeout"
+    assert results["数据准确性"]["status"] == "timeout"
+    assert "error" not in results["逻辑性"]
+    assert all(results[point]["status"] == "ok" for point in POINTS if point not in ("逻辑性", "数据准确性"))
+
+
+@pytest.mark.asyncio
+async def test_cancellation_stops_remaining_points(service, monkeypatch):
+    """取消评审（如客户端断开）会取消在途调用，不再发起新的调用"""
+    llm = _AsyncLLM(delay=0.2)
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    task = asyncio.ensure_future(_review(service, max_concurrency=2))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    calls = llm.calls
+    await asyncio.sleep(0.3)
+    assert llm.cancelled == 2 and llm.in_flight == 0
+    assert llm.calls == calls < 2 * len(POINTS)
+
+
+@pytest.mark.asyncio
+async def test_batch_match_survives_single_point_timeout(service, monkeypatch):
+    """批量匹配由所有要点共享，评审结束后不会遗留在途请求"""
+    llm = _AsyncLLM(slow=["格式规范"])
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service, match_mode="batch", point_timeout=0.5)
+    assert results["格式规范"]["status"] == "timeout"
+    assert sum(r["status"] == "ok" for r in results.values()) == len(POINTS) - 1
+    assert llm.in_flight == 0
+
+
+def test_default_scheduler_is_per_event_loop(service, monkeypatch):
+    """默认调度器按事件循环创建，不同事件循环中的评审互不共享异步原语"""
+    llm = _AsyncLLM(delay=0.01)
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+
+    async def review():
+        await _review(service, scheduler=None)
+        return service.get_review_scheduler()
+
+    first = asyncio.run(review())
+    second = asyncio.run(review())
+    assert first is not second
+    assert second.stats()["running"] == 0
+    # 已关闭事件循环的调度器被丢弃
+    assert first not in service._review_schedulers.values()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("dashscope_stub", [{"ttft": 0.1, "reply": "[1]", "chars_per_token": 4, "reply_tokens": 1}],
+                         indirect=True)
+async def test_native_async_against_stub(service, monkeypatch, dashscope_stub):
+    """通过aiohttp直接调用上游，并发受限于 max_concurrency"""
+    llm = CustomDashScopeLLM(dashscope_api_key="stub", api_url=dashscope_stub.url)
+    monkeypatch.setattr(service, "get_model", lambda name, **params: llm)
+    results = await _review(service, max_concurrency=3)
+    assert dashscope_stub.stats.requests == 2 * len(POINTS)
+    assert dashscope_stub.stats.max_in_flight == 3
+    assert all(r["status"] == "ok" for r in results.values())
+    await llm.aclose()
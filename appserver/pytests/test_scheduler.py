@@ -0,0 +1,133 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.service.scheduler import BATCH, INTERACTIVE, STANDARD, DeadlineExceeded, PriorityScheduler
+
+
+async def _hold(scheduler, priority, order, release_event, deadline=None):
+    async with scheduler.slot(priority, deadline):
+        order.append(priority)
+        await release_event.wait()
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class TestPriorityScheduler:
+    """测试PriorityScheduler"""
+
+    @pytest.mark.asyncio
+    async def test_interactive_jumps_queued_batch(self):
+        """排队中的批量请求之后到达的交互请求先出队"""
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+        release = asyncio.Event()
+        order = []
+        blocker = asyncio.create_task(_hold(scheduler, BATCH, order, release))
+        await _settle()
+        tasks = [asyncio.create_task(_hold(scheduler, BATCH, order, release)) for _ in range(3)]
+        await _settle()
+        tasks.append(asyncio.create_task(_hold(scheduler, INTERACTIVE, order, release)))
+        await _settle()
+        assert scheduler.stats()["classes"][BATCH]["queued"] == 3
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+        assert order == [BATCH, INTERACTIVE, BATCH, BATCH, BATCH]
+
+    @pytest.mark.asyncio
+    async def test_reserved_slot_keeps_interactive_unblocked(self):
+        """批量请求占不满预留槽位，交互请求无需排队"""
+        scheduler = PriorityScheduler(max_concurrency=3, reserved=1)
+        release = asyncio.Event()
+        order = []
+        batch = [asyncio.create_task(_hold(scheduler, BATCH, order, release)) for _ in range(5)]
+        await _settle()
+        assert scheduler.stats()["running"] == 2
+        interactive = asyncio.create_task(_hold(scheduler, INTERACTIVE, order, release))
+        await _settle()
+        assert order.count(INTERACTIVE) == 1
+        release.set()
+        await asyncio.gather(interactive, *batch)
+        assert scheduler.stats()["classes"][INTERACTIVE]["wait"]["p50"] == 0.0
+
+    @pytest.mark.asyncio
+    async def test_weighted_fair_share_between_standard_and_batch(self):
+        """standard 与 batch 按权重交替出队，batch 不会被饿死"""
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0, weights={STANDARD: 3.0, BATCH: 1.0}, strict=())
+        order = []
+
+        async def run(priority):
+            async with scheduler.slot(priority):
+                order.append(priority)
+                await asyncio.sleep(0)
+
+        blocker = asyncio.create_task(run(STANDARD))
+        tasks = [asyncio.create_task(run(p)) for p in [STANDARD] * 8 + [BATCH] * 4]
+        await asyncio.gather(blocker, *tasks)
+        first_eight = order[1:9]
+        assert first_eight.count(BATCH) == 2
+        assert first_eight.count(STANDARD) == 6
+
+    @pytest.mark.asyncio
+    async def test_deadline_expires_queued_request(self):
+        """超过截止时间仍在排队的请求失败，不占用槽位"""
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+        release = asyncio.Event()
+        order = []
+        blocker = asyncio.create_task(_hold(scheduler, STANDARD, order, release))
+        await _settle()
+        with pytest.raises(DeadlineExceeded):
+            await _hold(scheduler, BATCH, order, release, deadline=0.05)
+        release.set()
+        await blocker
+        stats = scheduler.stats()
+        assert stats["classes"][BATCH]["expired"] == 1
+        assert stats["running"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_leak_slot(self):
+        """排队中被取消的请求不会占用槽位"""
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+        release = asyncio.Event()
+        order = []
+        blocker = asyncio.create_task(_hold(scheduler, STANDARD, order, release))
+        await _settle()
+        waiter = asyncio.create_task(_hold(scheduler, STANDARD, order, release))
+        await _settle()
+        waiter.cancel()
+        release.set()
+        await blocker
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+        assert scheduler.stats()["running"] == 0
+        async with scheduler.slot(BATCH):
+            pass
+
+    @pytest.mark.asyncio
+    async def test_deadline_racing_grant_does_not_leak_slot(self, monkeypatch):
+        """截止时间与槽位分配同时发生时，超时的请求归还已分配的槽位"""
+        scheduler = PriorityScheduler(max_concurrency=1, reserved=0)
+        await scheduler.acquire(STANDARD)
+
+        async def granted_then_timed_out(future, timeout):
+            # 持有者恰好在超时触发的同一轮事件循环中归还槽位，槽位已分配给排队者
+            scheduler.release(STANDARD)
+            assert future.done()
+            raise asyncio.TimeoutError
+
+        monkeypatch.setattr(asyncio, "wait_for", granted_then_timed_out)
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.acquire(BATCH, deadline=0.05)
+        stats = scheduler.stats()
+        assert stats["running"] == 0
+        assert stats["classes"][BATCH]["running"] == 0
+
+    def test_unknown_priority_rejected(self):
+        """未知类别抛出ValueError"""
+        with pytest.raises(ValueError):
+            asyncio.run(PriorityScheduler().acquire("urgent"))
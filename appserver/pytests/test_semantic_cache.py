@@ -0,0 +1,153 @@
+import os
+import sys
+import time
+import zlib
+
+import numpy as np
+import pytest
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
+from langchain_core.outputs import ChatGeneration, LLMResult
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+from appserver.models.registry import model_registry
+from appserver.service.llm_router import Backend
+from appserver.service.llm_service import LLMService
+from appserver.service.semantic_cache import SemanticCache, normalize_prompt, split_prompt
+
+
+def _bigram_embedder(texts):
+    """按字符二元组哈希的确定性向量化，相近措辞得到相近向量"""
+    vectors = np.zeros((len(texts), 256), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for i in range(max(1, len(text) - 1)):
+            vectors[row, zlib.crc32(text[i:i + 2].encode("utf-8")) % 256] += 1.0
+    return vectors
+
+
+def _cache(**kwargs):
+    kwargs.setdefault("threshold", 0.6)
+    return SemanticCache(embedder=_bigram_embedder, use_faiss=False, **kwargs)
+
+
+class TestSemanticCache:
+    """测试SemanticCache"""
+
+    def test_normalize_prompt(self):
+        """全角、大小写、空白与句末标点不影响规范化结果"""
+        assert normalize_prompt("  今天  天气怎么样？？ ") == normalize_prompt("今天 天气怎么样")
+        assert normalize_prompt("ＡＢＣ Test!") == "abc test"
+
+    def test_similar_wording_hits(self):
+        """措辞相近的提问命中，无关提问不命中"""
+        cache = _cache()
+        cache.store([HumanMessage(content="北京今天的天气怎么样")], "晴")
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样？")]) == "晴"
+        assert cache.lookup([HumanMessage(content="如何评审合同条款")]) is None
+        stats = cache.stats()
+        assert stats["hits"] == 1
+        assert stats["misses"] == 1
+
+    def test_context_and_params_must_match(self):
+        """系统提示词与生成参数不同的请求不共享缓存"""
+        cache = _cache()
+        messages = [SystemMessage(content="你是气象助手"), HumanMessage(content="北京今天天气怎么样")]
+        cache.store(messages, "晴", {"temperature": 0.1})
+        assert cache.lookup(messages, {"temperature": 0.1}) == "晴"
+        assert cache.lookup(messages, {"temperature": 0.9}) is None
+        assert cache.lookup([SystemMessage(content="你是律师"), messages[1]], {"temperature": 0.1}) is None
+        assert split_prompt(messages)[0] != split_prompt(messages[1:])[0]
+
+    def test_namespace_isolation(self):
+        """不同命名空间互不可见，可单独清空"""
+        cache = _cache()
+        cache.store([HumanMessage(content="北京今天天气怎么样")], "晴", namespace="a")
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样")], namespace="b") is None
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样")], namespace="a") == "晴"
+        assert cache.invalidate("a") == 1
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样")], namespace="a") is None
+
+    def test_lru_eviction(self):
+        """超出容量时淘汰最久未使用的条目"""
+        cache = _cache(max_entries=2, threshold=0.99)
+        cache.store([HumanMessage(content="第一个问题是什么")], "1")
+        cache.store([HumanMessage(content="另一件完全不同的事")], "2")
+        assert cache.lookup([HumanMessage(content="第一个问题是什么")]) == "1"
+        cache.store([HumanMessage(content="再来一个新的提问")], "3")
+        assert cache.lookup([HumanMessage(content="另一件完全不同的事")]) is None
+        assert cache.lookup([HumanMessage(content="第一个问题是什么")]) == "1"
+        assert cache.stats()["evictions"] == 1
+        assert cache.stats()["namespaces"]["default"] == 2
+
+    def test_ttl_expiration(self):
+        """过期条目视为未命中并从索引删除"""
+        cache = _cache(ttl=0.05)
+        cache.store([HumanMessage(content="北京今天天气怎么样")], "晴")
+        time.sleep(0.1)
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样")]) is None
+        assert cache.stats()["expirations"] == 1
+        assert cache.stats()["namespaces"]["default"] == 0
+
+    def test_faiss_backend_matches_numpy(self):
+        """faiss 索引与 numpy 检索结果一致"""
+        pytest.importorskip("faiss")
+        cache = SemanticCache(embedder=_bigram_embedder, threshold=0.6, use_faiss=True)
+        cache.store([HumanMessage(content="北京今天的天气怎么样")], "晴")
+        assert cache.lookup([HumanMessage(content="北京今天天气怎么样？")]) == "晴"
+        assert cache.stats()["backend"] == "faiss"
+
+
+class _CountingModel:
+    """统计调用次数的伪模型"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.calls = 0
+
+    async def agenerate(self, batch, **kwargs):
+        self.calls += 1
+        return LLMResult(generations=[[ChatGeneration(message=AIMessage(content=self.reply))]])
+
+    async def astream(self, messages, **kwargs):
+        self.calls += 1
+        for char in self.reply:
+            yield AIMessageChunk(content=char)
+
+
+@pytest.fixture
+def service():
+    model = _CountingModel("北京今天晴，最高气温二十五度，适合出行。")
+    model_registry.register("fake_cached", lambda: model)
+    service = LLMService(
+        backends=[Backend(name="fake", provider="fake_cached")],
+        semantic_cache=_cache()
+    )
+    yield service, model
+    model_registry.clear()
+
+
+@pytest.mark.asyncio
+async def test_chat_served_from_semantic_cache(service):
+    """措辞相近的第二次提问不再请求模型"""
+    service, model = service
+    first = await service.chat([HumanMessage(content="北京今天的天气怎么样")])
+    second = await service.chat([HumanMessage(content="北京今天天气怎么样？")])
+    assert first == second
+    assert model.calls == 1
+    assert service.cache_stats()["hits"] == 1
+
+    await service.chat([HumanMessage(content="北京今天天气怎么样")], cache_namespace=None)
+    assert model.calls == 2
+
+
+@pytest.mark.asyncio
+async def test_stream_replays_cached_answer(service):
+    """流式调用写入缓存，命中时按片段回放完整回答"""
+    service, model = service
+    streamed = "".join([chunk async for chunk in service.achat([HumanMessage(content="北京今天的天气怎么样")])])
+    replayed = [chunk async for chunk in service.achat([HumanMessage(content="北京今天天气怎么样")])]
+    assert "".join(replayed) == streamed
+    assert len(replayed) > 1
+    assert model.calls == 1
+    assert await service.chat([HumanMessage(content="北京今天天气怎么样")]) == streamed
+    assert model.calls == 1
+    assert service.scheduler_stats()["classes"]["standard"]["dispatched"] == 0
@@ -0,0 +1,253 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import DashScopeAPIClient
+from models.singleflight import SingleFlight, payload_key
+
+
+class TestPayloadKey:
+    """测试payload规范化哈希"""
+
+    def test_key_ignores_dict_order(self):
+        """字段顺序不影响key"""
+        a = {"model": "qwen-turbo", "parameters": {"temperature": 0.3, "max_tokens": 10}}
+        b = {"parameters": {"max_tokens": 10, "temperature": 0.3}, "model": "qwen-turbo"}
+        assert payload_key(a) == payload_key(b)
+
+    def test_scope_changes_key(self):
+        """作用域不同则key不同"""
+        payload = {"model": "qwen-turbo"}
+        assert payload_key(payload, "call") != payload_key(payload, "stream")
+
+
+class TestSingleFlight:
+    """测试SingleFlight"""
+
+    @pytest.mark.asyncio
+    async def test_concurrent_calls_share_one_upstream(self):
+        """并发相同key只执行一次"""
+        flight = SingleFlight()
+        upstream = 0
+
+        async def call():
+            nonlocal upstream
+            upstream += 1
+            await asyncio.sleep(0.05)
+            return "result"
+
+        results = await asyncio.gather(*[flight.do("k", call) for _ in range(5)])
+        assert results == ["result"] * 5
+        assert upstream == 1
+        assert flight.stats()["coalesced"] == 4
+        assert flight.hit_rate == pytest.approx(0.8)
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate_to_all_waiters(self):
+        """上游异常传递给所有等待者，结束后不再合并"""
+        flight = SingleFlight()
+        upstream = 0
+
+        async def fail():
+            nonlocal upstream
+            upstream += 1
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        results = await asyncio.gather(*[flight.do("k", fail) for _ in range(3)], return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        with pytest.raises(ValueError):
+            await flight.do("k", fail)
+        assert upstream == 2
+
+    @pytest.mark.asyncio
+    async def test_cancelled_waiter_does_not_cancel_others(self):
+        """一个等待者被取消不影响其他等待者"""
+        flight = SingleFlight()
+
+        async def call():
+            await asyncio.sleep(0.05)
+            return 42
+
+        first = asyncio.ensure_future(flight.do("k", call))
+        second = asyncio.ensure_future(flight.do("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        assert await second == 42
+
+    @pytest.mark.asyncio
+    async def test_upstream_cancelled_when_last_waiter_leaves(self):
+        """所有等待者都被取消时取消上游，之后的调用启动新的上游请求"""
+        flight = SingleFlight()
+        cancelled = asyncio.Event()
+        started = 0
+
+        async def call():
+            nonlocal started
+            started += 1
+            try:
+                await asyncio.sleep(0.05)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+            return 42
+
+        first = asyncio.ensure_future(flight.do("k", call))
+        second = asyncio.ensure_future(flight.do("k", call))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        second.cancel()
+        await asyncio.wait_for(cancelled.wait(), timeout=1)
+        assert await flight.do("k", call) == 42
+        assert started == 2
+
+    def test_sync_calls_share_one_upstream(self):
+        """同步并发相同key只执行一次"""
+        flight = SingleFlight()
+        upstream = []
+
+        def call():
+            upstream.append(1)
+            time.sleep(0.1)
+            return "ok"
+
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            results = list(pool.map(lambda _: flight.do_sync("k", call), range(4)))
+        assert results == ["ok"] * 4
+        assert len(upstream) == 1
+        assert flight.coalesced == 3
+
+    @pytest.mark.asyncio
+    async def test_stream_fan_out_with_late_joiner(self):
+        """迟到的订阅者先收到缓冲前缀，再接收后续片段"""
+        flight = SingleFlight()
+        started = 0
+
+        async def upstream():
+            nonlocal started
+            started += 1
+            for token in ["a", "b", "c", "d"]:
+                await asyncio.sleep(0.02)
+                yield token
+
+        async def consume(delay):
+            await asyncio.sleep(delay)
+            return [chunk async for chunk in flight.stream("k", upstream)]
+
+        results = await asyncio.gather(consume(0), consume(0.05))
+        assert results == [["a", "b", "c", "d"]] * 2
+        assert started == 1
+        assert flight.stream_coalesced == 1
+
+    @pytest.mark.asyncio
+    async def test_stream_cancelled_when_last_subscriber_leaves(self):
+        """最后一个订阅者离开时取消上游"""
+        flight = SingleFlight()
+        closed = asyncio.Event()
+
+        async def upstream():
+            try:
+                while True:
+                    await asyncio.sleep(0.01)
+                    yield "x"
+            finally:
+                closed.set()
+
+        stream = flight.stream("k", upstream)
+        assert await stream.__anext__() == "x"
+        await stream.aclose()
+        await asyncio.wait_for(closed.wait(), timeout=1)
+
+    @pytest.mark.asyncio
+    async def test_join_while_upstream_cancelling_starts_new_stream(self):
+        """上游正在取消时加入的订阅者启动新的上游流，不会收到取消错误"""
+        flight = SingleFlight()
+        started = 0
+
+        async def upstream():
+            nonlocal started
+            started += 1
+            for token in ["a", "b"]:
+                await asyncio.sleep(0.01)
+                yield token
+
+        first = flight.stream("k", upstream)
+        assert await first.__anext__() == "a"
+        await first.aclose()
+        # 被取消的上游任务尚未运行到finally，新订阅者立即加入
+        assert [chunk async for chunk in flight.stream("k", upstream)] == ["a", "b"]
+        assert started == 2
+
+    @pytest.mark.asyncio
+    async def test_pump_task_is_cancelled_not_failed(self):
+        """上游任务被取消后处于取消状态，取消不会被当作错误吞掉"""
+        flight = SingleFlight()
+
+        async def upstream():
+            while True:
+                await asyncio.sleep(0.01)
+                yield "x"
+
+        stream = flight.stream("k", upstream)
+        await stream.__anext__()
+        task = flight._streams[(asyncio.get_running_loop(), "k")].task
+        await stream.aclose()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        assert task.cancelled()
+
+
+class _SlowJSONHandler(BaseHTTPRequestHandler):
+    """延迟返回的伪DashScope服务，统计收到的POST次数"""
+
+    def do_POST(self):
+        self.server.posts += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(0.2)
+        body = json.dumps({
+            "output": {"choices": [{"message": {"role": "assistant", "content": "ok"}}]}
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowJSONHandler)
+    server.posts = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.mark.asyncio
+async def test_client_coalesces_identical_requests(slow_server):
+    """开启合并后相同payload的并发请求只发送一次"""
+    url = f"http://127.0.0.1:{slow_server.server_address[1]}/generation"
+    async with DashScopeAPIClient(api_key="test", api_url=url, coalesce=True) as client:
+        messages = [HumanMessage(content="同一个问题")]
+        results = await asyncio.gather(*[
+            client.call_api_async(messages, model_name="qwen-turbo", temperature=0.3) for _ in range(5)
+        ])
+        other = await client.call_api_async(messages, model_name="qwen-turbo", temperature=0.9)
+    assert results == ["ok"] * 5
+    assert other == "ok"
+    assert slow_server.posts == 2
+    assert client.coalescing_stats()["coalesced"] == 4
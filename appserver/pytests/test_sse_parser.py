@@ -0,0 +1,92 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.sse_parser import DashScopeStreamDecoder, SSEParser
+
+
+def _frame(content: str, idx: int = 0) -> bytes:
+    chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": content}}]}}
+    return f"id:{idx}\nevent:result\ndata:{json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+class TestSSEParser:
+    """测试SSEParser"""
+
+    def test_single_event_with_fields(self):
+        """解析 id/event/data 字段"""
+        events = SSEParser().feed(b"id: 7\nevent: result\ndata: hello\n\n")
+        assert len(events) == 1
+        assert events[0].id == "7"
+        assert events[0].event == "result"
+        assert events[0].data == b"hello"
+
+    def test_multiline_data_and_crlf(self):
+        """多行data以换行拼接，兼容CRLF"""
+        events = SSEParser().feed(b"data: a\r\ndata: b\r\n\r\n")
+        assert [e.data for e in events] == [b"a\nb"]
+        assert events[0].event == "message"
+
+    def test_comment_and_empty_events_ignored(self):
+        """注释行与不含data的事件不分发"""
+        events = SSEParser().feed(b": ping\n\nevent: noop\n\ndata: x\n\n")
+        assert [e.data for e in events] == [b"x"]
+
+    def test_frames_split_at_every_byte(self):
+        """逐字节输入时结果与整体输入一致"""
+        raw = _frame("你好", 1) + _frame("世界", 2)
+        parser = SSEParser()
+        events = []
+        for i in range(len(raw)):
+            events.extend(parser.feed(raw[i:i + 1]))
+        assert [e.id for e in events] == ["1", "2"]
+        assert events == SSEParser().feed(raw)
+
+    def test_crlf_split_across_reads(self):
+        """\r与\n分属两次读取、输入为bytearray或memoryview时结果不变"""
+        raw = b"id: 3\r\nevent: result\r\ndata: a\r\n\r\n"
+        parser = SSEParser()
+        events = parser.feed(bytearray(raw[:8])) + parser.feed(memoryview(raw[8:]))
+        assert [(e.id, e.event, e.data) for e in events] == [("3", "result", b"a")]
+
+    def test_flush_dispatches_trailing_event(self):
+        """流结束时残留的未闭合事件也能分发"""
+        parser = SSEParser()
+        assert parser.feed(b"data: tail") == []
+        assert [e.data for e in parser.flush()] == [b"tail"]
+
+
+class TestDashScopeStreamDecoder:
+    """测试DashScopeStreamDecoder"""
+
+    def test_incremental_mode(self):
+        """增量模式下每帧内容即为增量"""
+        decoder = DashScopeStreamDecoder(incremental=True)
+        assert decoder.feed(_frame("你") + _frame("好")) == ["你", "好"]
+
+    def test_cumulative_mode(self):
+        """累计模式下只输出新增部分"""
+        decoder = DashScopeStreamDecoder(incremental=False)
+        raw = _frame("你") + _frame("你好") + _frame("你好") + _frame("你好呀")
+        assert decoder.feed(raw) == ["你", "好", "呀"]
+
+    def test_done_sentinel_stops_decoding(self):
+        """遇到[DONE]后不再输出"""
+        decoder = DashScopeStreamDecoder()
+        assert decoder.feed(_frame("a") + b"data: [DONE]\n\n" + _frame("b")) == ["a"]
+        assert decoder.done
+
+    def test_invalid_json_skipped(self):
+        """无法解析的帧被跳过"""
+        decoder = DashScopeStreamDecoder()
+        assert decoder.feed(b"data: {broken\n\n" + _frame("ok")) == ["ok"]
+
+    def test_error_event_raises(self):
+        """错误事件抛出ValueError"""
+        decoder = DashScopeStreamDecoder()
+        with pytest.raises(ValueError) as excinfo:
+            decoder.feed(b'event: error\ndata: {"code": "Throttling"}\n\n')
+        assert "Throttling" in str(excinfo.value)
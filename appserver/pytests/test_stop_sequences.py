@@ -0,0 +1,140 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import CustomChatModel, DashScopeAPIClient
+from models.stop_sequences import StopSequenceMatcher, normalize_stop, truncate_at_stop
+
+FRAME_INTERVAL = 0.05
+TOKENS = ["Hel", "lo", " wor", "ld", "\n\nOb", "servation", ": ", "ignored"] + ["x"] * 40
+
+
+class _StreamingHandler(BaseHTTPRequestHandler):
+    """逐帧输出TOKENS并记录实际写出帧数的伪DashScope服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        server = self.server
+        server.payloads.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0)))))
+        if self.headers.get("X-DashScope-SSE") != "enable":
+            body = json.dumps({"output": {"choices": [{"message": {"content": "".join(TOKENS)}}]}}).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for token in TOKENS:
+                chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": token}}]}}
+                self._write_chunk(f"data:{json.dumps(chunk)}\n\n".encode("utf-8"))
+                server.frames_sent += 1
+                time.sleep(FRAME_INTERVAL)
+            self._write_chunk(b"")
+        except (BrokenPipeError, ConnectionResetError):
+            server.disconnected.set()
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    """启动本地流式服务器"""
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), _StreamingHandler)
+    httpd.payloads = []
+    httpd.frames_sent = 0
+    httpd.disconnected = threading.Event()
+    httpd.url = f"http://127.0.0.1:{httpd.server_address[1]}/generation"
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+class TestStopSequenceMatcher:
+    """测试StopSequenceMatcher"""
+
+    def test_split_across_chunks(self):
+        """停止词被拆分在多个片段之间时仍能匹配"""
+        matcher = StopSequenceMatcher(["\nObservation:"])
+        out = [matcher.feed(chunk) for chunk in ["answer\n", "Obser", "vation", ": rest"]]
+        assert "".join(out) == "answer"
+        assert matcher.stopped
+        assert matcher.feed("more") == ""
+
+    def test_only_possible_prefix_is_held(self):
+        """只扣留可能构成停止词前缀的尾部，其余立即输出"""
+        matcher = StopSequenceMatcher(["END"])
+        assert matcher.feed("abcE") == "abc"
+        assert matcher.feed("x") == "Ex"
+        assert matcher.feed("EN") == ""
+        assert matcher.flush() == "EN"
+
+    def test_earliest_match_wins(self):
+        """多个停止词时在最早出现的位置截断"""
+        assert truncate_at_stop("a.b;c", ["SEMI", ";", "."]) == "a"
+        assert truncate_at_stop("no stop here", ["###"]) == "no stop here"
+
+    def test_normalize(self):
+        """接受单个字符串，去掉空串与重复项"""
+        assert normalize_stop("###") == ["###"]
+        assert normalize_stop(["a", "", "a", "b"]) == ["a", "b"]
+        assert normalize_stop(None) == []
+
+
+def test_stop_is_sent_upstream_and_truncates(server):
+    """停止词写入请求参数，非流式结果在客户端截断"""
+    with DashScopeAPIClient(api_key="test", api_url=server.url) as client:
+        content = client.call_api([HumanMessage(content="hi")], model_name="qwen-turbo", stop=["Observation"])
+    assert content == "Hello world\n\n"
+    assert server.payloads[0]["parameters"]["stop"] == ["Observation"]
+
+
+def test_stream_stops_early_and_closes_connection(server):
+    """流式匹配到停止词后立即返回并断开上游连接"""
+    with DashScopeAPIClient(api_key="test", api_url=server.url) as client:
+        start = time.perf_counter()
+        chunks = list(client.call_api_stream(
+            [HumanMessage(content="hi")], model_name="qwen-turbo", stop=["\nObservation:"]
+        ))
+        elapsed = time.perf_counter() - start
+    assert "".join(chunks) == "Hello world\n"
+    assert elapsed < FRAME_INTERVAL * len(TOKENS) / 2
+    assert server.disconnected.wait(timeout=2)
+    assert server.frames_sent < len(TOKENS)
+
+
+@pytest.mark.asyncio
+async def test_astream_honors_stop(server):
+    """CustomChatModel异步流式把stop传给客户端并提前结束"""
+    model = CustomChatModel(api_key="test", api_url=server.url)
+    try:
+        chunks = [chunk.content async for chunk in model.astream("hi", stop=["wor"])]
+    finally:
+        await model.aclose()
+    assert "".join(chunks) == "Hello "
+    assert server.disconnected.wait(timeout=2)
+    assert server.frames_sent < len(TOKENS)
+
+
+def test_invoke_honors_stop(server):
+    """CustomChatModel.invoke 同样截断"""
+    model = CustomChatModel(api_key="test", api_url=server.url)
+    assert model.invoke("hi", stop=["\n"]).content == "Hello world"
@@ -12,12 +12,12 @@ from langchain.schema import BaseMessage, HumanMessage, SystemMessage
 # 配置日志
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def test_stream_generation_basic():
+def test_stream_generation_basic(dashscope_model_kwargs):
     """基础流式生成测试"""
     from models.new_model import CustomChatModel
 
     # 创建模型
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     
     # 准备消息
     messages: List[BaseMessage] = [
@@ -43,11 +43,11 @@ def test_stream_generation_basic():
         assert chunk is not None, f"chunk {i} 不应为空"
         logging.info(f"chunk {i+1}: {type(chunk)} - {chunk}")
 
-def test_stream_generation_content():
+def test_stream_generation_content(dashscope_model_kwargs):
     """测试流式生成的内容"""
     from models.new_model import CustomChatModel
     
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     messages: List[BaseMessage] = [HumanMessage(content="请简单介绍一下Python")]
     
     result = model._stream(messages)
@@ -75,23 +75,23 @@ def test_stream_generation_content():
     assert len(total_content.strip()) > 0, "总内容不应为空"
     logging.info(f"总内容: {total_content[:100]}...")
 
-def test_stream_generation_error_handling():
+def test_stream_generation_error_handling(dashscope_model_kwargs):
     """测试流式生成的错误处理"""
     from models.new_model import CustomChatModel
     
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     
     # 测试空消息
     with pytest.raises(Exception):
         list(model._stream([]))
 
-def test_stream_generation_performance():
+def test_stream_generation_performance(dashscope_model_kwargs):
     """测试流式生成的性能"""
     import time
 
     from models.new_model import CustomChatModel
     
-    model = CustomChatModel()
+    model = CustomChatModel(**dashscope_model_kwargs)
     messages: List[BaseMessage] = [HumanMessage(content="请写一个简单的Python函数")]
     
     start_time = time.time()
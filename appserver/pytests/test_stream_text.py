@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import CustomChatModel
+from models.stream_coalescer import acoalesce_chunks, coalesce_chunks
+
+TOKENS = [f"t{idx}" for idx in range(20)]
+
+
+class _SSEHandler(BaseHTTPRequestHandler):
+    """一次性输出TOKENS的伪DashScope流式服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        frames = []
+        for token in TOKENS:
+            chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": token}}]}}
+            frames.append(f"data:{json.dumps(chunk)}\n\n")
+        body = "".join(frames).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def sse_url():
+    """启动本地SSE服务器"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SSEHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/generation"
+    server.shutdown()
+    server.server_close()
+
+
+async def _agen(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+class TestCoalesceChunks:
+    """测试增量合并"""
+
+    def test_disabled_passes_through(self):
+        """未配置窗口时原样输出"""
+        assert list(coalesce_chunks(iter(["a", "b"]))) == ["a", "b"]
+
+    def test_first_chunk_immediate_then_by_size(self):
+        """首个增量立即输出，之后按字符数合并"""
+        assert list(coalesce_chunks(iter(["a", "b", "c", "d", "e", "f"]), max_chars=2)) == ["a", "bc", "de", "f"]
+
+    @pytest.mark.asyncio
+    async def test_async_flushes_on_deadline_while_upstream_stalls(self):
+        """上游停顿时缓冲区按时间窗口输出，不等待下一个增量"""
+
+        async def stalled():
+            yield "a"
+            yield "b"
+            await asyncio.sleep(0.5)
+            yield "c"
+
+        start = time.monotonic()
+        out = []
+        async for chunk in acoalesce_chunks(stalled(), max_chars=100, max_delay=0.05):
+            out.append((chunk, time.monotonic() - start))
+        assert [chunk for chunk, _ in out] == ["a", "b", "c"]
+        assert out[1][1] < 0.3
+
+    @pytest.mark.asyncio
+    async def test_async_by_size(self):
+        """异步按字符数合并"""
+        out = [chunk async for chunk in acoalesce_chunks(_agen(["a", "b", "c", "d"]), max_chars=3)]
+        assert out == ["a", "bcd"]
+
+
+def test_stream_text_yields_plain_strings(sse_url):
+    """stream_text 直接产出str"""
+    model = CustomChatModel(api_key="test", api_url=sse_url)
+    chunks = list(model.stream_text("hi"))
+    assert chunks == TOKENS
+    assert all(type(chunk) is str for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_astream_text_accepts_messages(sse_url):
+    """astream_text 接受消息列表"""
+    model = CustomChatModel(api_key="test", api_url=sse_url)
+    try:
+        chunks = [chunk async for chunk in model.astream_text([HumanMessage(content="hi")])]
+    finally:
+        await model.aclose()
+    assert chunks == TOKENS
+
+
+def test_stream_coalescing_reduces_chunk_objects(sse_url):
+    """配置合并窗口后 stream 产出的对象数减少，内容不变"""
+    model = CustomChatModel(api_key="test", api_url=sse_url, stream_coalesce_chars=12)
+    chunks = [chunk.content for chunk in model.stream("hi")]
+    assert "".join(chunks) == "".join(TOKENS)
+    assert len(chunks) < len(TOKENS) / 2
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from langchain_core.messages import HumanMessage
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from models.new_model import DashScopeAPIClient
+
+FIRST_FRAME_DELAY = 0.05
+FRAME_INTERVAL = 0.2
+FRAME_COUNT = 6
+
+
+class _SlowSSEHandler(BaseHTTPRequestHandler):
+    """按固定间隔逐帧输出SSE的伪DashScope服务"""
+
+    protocol_version = "HTTP/1.1"
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        time.sleep(FIRST_FRAME_DELAY)
+        for idx in range(FRAME_COUNT):
+            if idx:
+                time.sleep(FRAME_INTERVAL)
+            chunk = {"output": {"choices": [{"message": {"role": "assistant", "content": f"t{idx}"}}]}}
+            frame = f"id:{idx}\nevent:result\ndata:{json.dumps(chunk)}\n\n"
+            self._write_chunk(frame.encode("utf-8"))
+        self._write_chunk(b"")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def slow_sse_server():
+    """启动本地慢速SSE服务器"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowSSEHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/generation"
+    server.shutdown()
+    server.server_close()
+
+
+def test_stream_time_to_first_token(slow_sse_server):
+    """首个token的到达时间接近服务端首帧延迟，而不是整体耗时"""
+    total_latency = FIRST_FRAME_DELAY + FRAME_INTERVAL * (FRAME_COUNT - 1)
+    with DashScopeAPIClient(api_key="test", api_url=slow_sse_server) as client:
+        start = time.perf_counter()
+        stream = client.call_api_stream([HumanMessage(content="hi")], model_name="qwen-turbo")
+        first = next(stream)
+        ttft = time.perf_counter() - start
+        rest = list(stream)
+        elapsed = time.perf_counter() - start
+
+    assert first == "t0"
+    assert rest == [f"t{idx}" for idx in range(1, FRAME_COUNT)]
+    assert ttft < FIRST_FRAME_DELAY + FRAME_INTERVAL
+    assert elapsed >= total_latency * 0.9
+
+
+@pytest.mark.asyncio
+async def test_async_stream_time_to_first_token(slow_sse_server):
+    """异步流式同样逐帧输出"""
+    async with DashScopeAPIClient(api_key="test", api_url=slow_sse_server) as client:
+        start = time.perf_counter()
+        ttft = None
+        chunks = []
+        async for chunk in client.call_api_stream_async([HumanMessage(content="hi")], model_name="qwen-turbo"):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            chunks.append(chunk)
+
+    assert chunks == [f"t{idx}" for idx in range(FRAME_COUNT)]
+    assert ttft < FIRST_FRAME_DELAY + FRAME_INTERVAL
@@ -0,0 +1,160 @@
+"""
+LLM多后端路由
+
+LLMService 可以同时配置多个后端（CustomChatModel、通义、DeepSeek、OpenAI兼容的本地服务等），
+每次请求按滚动的延迟、错误率与价格选择后端；后端出错时自动转移到下一个，
+连续失败的后端由熔断器摘除，冷却后经半开探测恢复。状态机复用 EndpointRouter。
+"""
+
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from appserver.models.endpoints import EndpointRouter, EndpointState
+from appserver.models.errors import APIStatusError
+from appserver.models.registry import get_model
+
+# 路由偏好：fast 只看延迟，cheap 只看价格，balanced 两者按归一化后相加
+PREFERENCES = ("balanced", "fast", "cheap")
+
+
+@dataclass
+class Backend:
+    """
+    一个可路由的LLM后端
+
+    Attributes:
+        name: 后端名称，用于指定后端与统计
+        provider: 模型注册表中的名称，如 "chat_tongyi"、"deepseek"、"custom_chat"
+        params: 构造模型的参数，相同参数的后端共享同一模型实例
+        price: 每千token价格，用于成本优先路由
+        weight: 路由权重，越大越优先
+    """
+
+    name: str
+    provider: str
+    params: Dict[str, Any] = field(default_factory=dict)
+    price: float = 0.0
+    weight: float = 1.0
+
+    @classmethod
+    def openai_compatible(
+        cls,
+        name: str,
+        url: str,
+        model: str,
+        api_key: Optional[str] = None,
+        price: float = 0.0,
+        **params: Any
+    ) -> "Backend":
+        """
+        OpenAI兼容服务（如本地vLLM）的后端，经由 CustomChatModel 的 openai 协议端点访问
+
+        Args:
+            name: 后端名称
+            url: chat/completions 接口地址
+            model: 模型名称
+            api_key: API密钥，本地服务通常不需要
+            price: 每千token价格
+            **params: CustomChatModel 的其他参数
+        """
+        return cls(
+            name=name,
+            provider="custom_chat",
+            params={
+                "model_name": model,
+                "api_key": api_key or "EMPTY",
+                "endpoints": [{"url": url, "protocol": "openai"}],
+                **params,
+            },
+            price=price,
+        )
+
+    def model(self) -> Any:
+        """从进程级注册表获取该后端的共享模型实例"""
+        return get_model(self.provider, **self.params)
+
+
+def to_backend(value: Union[Backend, Dict[str, Any]]) -> Backend:
+    """将配置字典或Backend统一为Backend"""
+    if isinstance(value, Backend):
+        return value
+    return Backend(**value)
+
+
+def is_backend_retryable(exc: BaseException) -> bool:
+    """
+    判断后端异常是否应当转移到下一个后端
+
+    各后端SDK的异常类型各不相同，除明确的4xx状态错误外一律转移。
+    """
+    if isinstance(exc, APIStatusError):
+        return exc.retryable
+    return isinstance(exc, Exception)
+
+
+class BackendRouter(EndpointRouter):
+    """
+    按偏好为每次请求排序后端的路由器
+    """
+
+    def __init__(self, backends: List[Backend], **routing: Any):
+        """
+        Args:
+            backends: 后端列表
+            **routing: EndpointRouter 的参数（alpha、error_penalty、failure_threshold、reset_timeout）
+        """
+        routing.setdefault("retryable", is_backend_retryable)
+        super().__init__(backends, **routing)
+        self.backends = backends
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """返回各后端的延迟、错误率、熔断状态与价格"""
+        snapshots = super().stats()
+        for snapshot, backend in zip(snapshots, self.backends):
+            snapshot["provider"] = backend.provider
+            snapshot["price"] = backend.price
+        return snapshots
+
+    def rank(
+        self,
+        prefer: Optional[str] = None,
+        backend: Optional[str] = None
+    ) -> Callable[[EndpointState], Any]:
+        """
+        构造本次请求的后端排序函数
+
+        Args:
+            prefer: 路由偏好，见 PREFERENCES，None表示 balanced
+            backend: 优先使用的后端名称，失败时仍会转移到其他后端
+
+        Returns:
+            Callable: 传给 EndpointRouter.candidates 的排序函数，越小越优先
+
+        Raises:
+            ValueError: 偏好或后端名称无效时抛出
+        """
+        prefer = prefer or "balanced"
+        if prefer not in PREFERENCES:
+            raise ValueError(f"不支持的路由偏好: {prefer}，可选: {PREFERENCES}")
+        if backend is not None and backend not in {b.name for b in self.backends}:
+            raise ValueError(f"未配置的后端: {backend}")
+
+        penalty = self.error_penalty
+        max_latency = max((s.score(penalty) for s in self.states), default=0.0) or 1.0
+        max_price = max((b.price for b in self.backends), default=0.0) or 1.0
+
+        def cost(state: EndpointState) -> float:
+            return state.endpoint.price * (1.0 + penalty * state.ewma_error) / max(state.endpoint.weight, 1e-6)
+
+        def score(state: EndpointState) -> Any:
+            if prefer == "fast":
+                value = (state.score(penalty),)
+            elif prefer == "cheap":
+                value = (cost(state), state.score(penalty))
+            else:
+                value = (state.score(penalty) / max_latency + cost(state) / max_price,)
+            if backend is not None:
+                return (state.endpoint.name != backend,) + value
+            return value
+
+        return score
@@ -1,94 +1,238 @@
+import json
 import os
-from typing import AsyncGenerator, List, Optional, Union
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional, Union
 
-from langchain_community.chat_models import Tongyi
 from langchain_core.language_models import BaseChatModel
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 
+from appserver.models.response_cache import iter_replay_chunks
+from appserver.models.singleflight import SingleFlight, payload_key
+from appserver.service.llm_router import Backend, BackendRouter, to_backend
+from appserver.service.scheduler import INTERACTIVE, STANDARD, PriorityScheduler
+from appserver.service.semantic_cache import SemanticCache
+
 
 class LLMService:
     """
     LLM服务封装类，提供统一的LLM调用接口
+
+    可配置多个后端，每次请求按延迟、错误率与价格选择后端，后端故障时自动转移。
+    所有请求经过优先级调度器：流式对话默认 interactive，非流式调用默认 standard，批量任务可指定 batch。
+    配置语义缓存后，措辞相近的重复提问直接返回缓存的回答，不占用调度槽位。
+    开启广播后，完全相同的并发流式对话共享同一个上游流，迟到者先收到已输出的前缀再接收实时内容；
+    不同调用方会拿到同一份回答，因此默认关闭，可按服务或按调用开启。
     """
-    
+
     def __init__(
         self,
         model_name: str = "gpt-3.5-turbo",
         temperature: float = 0.7,
         max_tokens: Optional[int] = 2000,
+        backends: Optional[List[Union[Backend, Dict[str, Any]]]] = None,
+        routing: Optional[Dict[str, Any]] = None,
+        scheduler: Optional[Dict[str, Any]] = None,
+        semantic_cache: Optional[Union[SemanticCache, Dict[str, Any]]] = None,
+        broadcast: bool = False,
         **kwargs
     ):
         """
         初始化LLM服务
-        
+
         Args:
-            model_name: 模型名称，默认为gpt-3.5-turbo
+            model_name: 模型名称，默认为gpt-3.5-turbo；未配置backends时据此构造唯一的后端
             temperature: 温度参数，控制生成文本的随机性
             max_tokens: 最大生成长度
+            backends: 后端列表（Backend或配置字典），None表示只使用model_name对应的后端
+            routing: 路由与熔断配置（EndpointRouter的参数）
+            scheduler: 调度配置（PriorityScheduler的参数），如并发上限与各类别权重
+            semantic_cache: 语义缓存实例或配置（SemanticCache的参数），None表示不启用
+            broadcast: achat 的默认广播设置：是否让完全相同的并发流式对话共享同一个上游流，可按调用覆盖
             **kwargs: 其他模型参数
         """
         self.model_name = model_name
         self.temperature = temperature
         self.max_tokens = max_tokens
-        self.model = self._init_model(**kwargs)
-    
-    def _init_model(self, **kwargs) -> BaseChatModel:
+        self.model_kwargs = kwargs
+        self.router = BackendRouter(
+            [to_backend(backend) for backend in backends] if backends else [self._init_model(**kwargs)],
+            **(routing or {})
+        )
+        self.scheduler = PriorityScheduler(**(scheduler or {}))
+        if isinstance(semantic_cache, dict):
+            semantic_cache = SemanticCache(**semantic_cache)
+        self.semantic_cache = semantic_cache
+        self.broadcast_default = broadcast
+        self.broadcast = SingleFlight()
+
+    @property
+    def model(self) -> BaseChatModel:
+        """第一个后端的共享模型实例"""
+        return self.router.backends[0].model()
+
+    def _init_model(self, **kwargs) -> Backend:
         """
-        根据模型名称初始化对应的ChatModel
+        根据模型名称构造默认后端，模型实例在首次使用时从注册表获取
         """
         model_kwargs = {
             "temperature": self.temperature,
             "max_tokens": self.max_tokens,
             **kwargs
         }
-        
+
         # 根据模型名称选择不同的模型
-        if "qwen" in self.model_name.lower():
-            return Tongyi(
-                model_name=self.model_name,
-                **model_kwargs
-            )
-        else:
-            # 默认使用OpenAI
-             return Tongyi(
-                model_name=self.model_name,
-                **model_kwargs
-            )
-    
+        name = self.model_name.lower()
+        if "deepseek" in name:
+            return Backend(name=self.model_name, provider="deepseek", params={"model": self.model_name, **model_kwargs})
+        # 通义系列及其他模型名称使用 ChatTongyi，生成参数通过 model_kwargs 传入
+        return Backend(
+            name=self.model_name,
+            provider="chat_tongyi",
+            params={"model_name": self.model_name, "model_kwargs": model_kwargs}
+        )
+
+    def backend_stats(self) -> List[Dict[str, Any]]:
+        """返回各后端的延迟、错误率、熔断状态与价格"""
+        return self.router.stats()
+
+    def scheduler_stats(self) -> Dict[str, Any]:
+        """返回各优先级类别的排队深度、在途数与排队时间"""
+        return self.scheduler.stats()
+
+    def broadcast_stats(self) -> Dict[str, Any]:
+        """返回流式广播的合并统计，只统计开启了广播的调用"""
+        return self.broadcast.stats()
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """返回语义缓存的命中统计，未启用时返回None"""
+        return self.semantic_cache.stats() if self.semantic_cache is not None else None
+
     async def chat(
         self,
         messages: List[Union[HumanMessage, AIMessage, SystemMessage]],
+        prefer: Optional[str] = None,
+        backend: Optional[str] = None,
+        priority: str = STANDARD,
+        deadline: Optional[float] = None,
+        cache_namespace: Optional[str] = "default",
         **kwargs
     ) -> str:
         """
         同步聊天接口
-        
+
         Args:
             messages: 消息列表
+            prefer: 路由偏好："fast"、"cheap" 或 "balanced"（默认）
+            backend: 优先使用的后端名称
+            priority: 优先级类别："interactive"、"standard"（默认）或 "batch"
+            deadline: 最长排队时间（秒），超时抛出 DeadlineExceeded
+            cache_namespace: 语义缓存的命名空间，None表示本次调用不使用缓存
             **kwargs: 其他模型参数
-            
+
         Returns:
             模型生成的回复
         """
-        response = await self.model.agenerate([messages], **kwargs)
-        return response.generations[0][0].text
-    
+        async def attempt(target: Backend) -> str:
+            response = await target.model().agenerate([messages], **kwargs)
+            return response.generations[0][0].text
+
+        rank = self.router.rank(prefer, backend)
+        cache = self.semantic_cache if cache_namespace is not None else None
+        if cache is not None:
+            cached = await cache.alookup(messages, kwargs, cache_namespace)
+            if cached is not None:
+                return cached
+
+        async with self.scheduler.slot(priority, deadline):
+            text = await self.router.call(attempt, rank)
+        if cache is not None:
+            await cache.astore(messages, text, kwargs, cache_namespace)
+        return text
+
     async def achat(
         self,
         messages: List[Union[HumanMessage, AIMessage, SystemMessage]],
+        prefer: Optional[str] = None,
+        backend: Optional[str] = None,
+        priority: str = INTERACTIVE,
+        deadline: Optional[float] = None,
+        cache_namespace: Optional[str] = "default",
+        broadcast: Optional[bool] = None,
         **kwargs
     ) -> AsyncGenerator[str, None]:
         """
-        异步流式聊天接口
-        
+        异步流式聊天接口，首个片段到达前失败会透明地转移到其他后端
+
         Args:
             messages: 消息列表
+            prefer: 路由偏好："fast"、"cheap" 或 "balanced"（默认）
+            backend: 优先使用的后端名称
+            priority: 优先级类别，默认 "interactive"；槽位在整个流式输出期间占用
+            deadline: 最长排队时间（秒），超时抛出 DeadlineExceeded
+            cache_namespace: 语义缓存的命名空间，None表示本次调用不使用缓存；命中时按片段回放缓存的回答
+            broadcast: 本次调用是否加入相同请求的广播，None表示使用服务的默认设置；
+                只有同样开启广播的相同请求之间才会共享上游流
             **kwargs: 其他模型参数
-            
+
         Yields:
             模型生成的回复片段
+
+        启用广播时，相同消息与参数的并发调用只有第一个会排队并请求上游，
+        之后加入的调用沿用它的槽位、后端与截止时间，上游出错时所有订阅者都会收到该异常；
+        最后一个订阅者离开时才取消上游流。
         """
-        async for chunk in self.model.astream(messages, **kwargs):
+        def attempt(target: Backend) -> AsyncIterator[str]:
+            return self._astream_text(target, messages, **kwargs)
+
+        async def upstream() -> AsyncIterator[str]:
+            parts = []
+            async with self.scheduler.slot(priority, deadline):
+                async for text in self.router.stream(attempt, rank):
+                    parts.append(text)
+                    yield text
+            # 只缓存完整输出的回答，上游被取消时不会走到这里
+            if cache is not None:
+                await cache.astore(messages, "".join(parts), kwargs, cache_namespace)
+
+        rank = self.router.rank(prefer, backend)
+        cache = self.semantic_cache if cache_namespace is not None else None
+        if cache is not None:
+            cached = await cache.alookup(messages, kwargs, cache_namespace)
+            if cached is not None:
+                for text in iter_replay_chunks(cached):
+                    yield text
+                return
+
+        if not (self.broadcast_default if broadcast is None else broadcast):
+            stream = upstream()
+        else:
+            key = self._stream_key(messages, prefer, backend, cache_namespace, kwargs)
+            stream = self.broadcast.stream(key, upstream)
+        async for text in stream:
+            yield text
+
+    @staticmethod
+    def _stream_key(
+        messages: List[Union[HumanMessage, AIMessage, SystemMessage]],
+        prefer: Optional[str],
+        backend: Optional[str],
+        cache_namespace: Optional[str],
+        params: Dict[str, Any]
+    ) -> str:
+        """计算流式广播的key：消息、路由选项、缓存命名空间与模型参数都相同的调用才会合并"""
+        payload = {
+            "messages": [[getattr(m, "type", ""), str(getattr(m, "content", m))] for m in messages],
+            "params": json.dumps(params, sort_keys=True, ensure_ascii=False, default=str),
+        }
+        return payload_key(payload, "achat", prefer or "", backend or "", cache_namespace or "")
+
+    async def _astream_text(
+        self,
+        target: Backend,
+        messages: List[Union[HumanMessage, AIMessage, SystemMessage]],
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """从指定后端流式读取文本片段"""
+        async for chunk in target.model().astream(messages, **kwargs):
             if hasattr(chunk, 'content'):
                 yield chunk.content
             else:
@@ -1,11 +1,17 @@
 import asyncio
+import json
 import os
-from typing import Dict, List
+import re
+from contextlib import asynccontextmanager
+from typing import Any, AsyncContextManager, AsyncIterator, Callable, Dict, List, Optional, Sequence
 
+import aiohttp
 from docx import Document
-from langchain_community.chat_models import ChatTongyi
-from langchain_community.llms.tongyi import Tongyi
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+from appserver.models.registry import get_model
+from appserver.service.paragraph_retriever import ParagraphRetriever, RetrievalResult
+from appserver.service.scheduler import BATCH, PriorityScheduler
 
 # 尝试加载 .env 文件（如果存在）
 try:
@@ -39,9 +45,37 @@ def extract_paragraphs(file_path: str) -> List[str]:
     else:
         raise ValueError('仅支持docx或md文件')
 
+# 原生异步调用使用基于 aiohttp 的 CustomDashScopeLLM：Tongyi 的异步接口只是把同步调用放进线程池，
+# 受默认线程池大小限制，也无法真正取消
+ASYNC_REVIEW_MODEL = "dashscope_llm"
+
+# 并发限制：返回一个异步上下文管理器，在其中执行一次模型调用
+Limit = Callable[[], AsyncContextManager[None]]
+
+@asynccontextmanager
+async def _unlimited() -> AsyncIterator[None]:
+    yield
+
+async def _ainvoke(messages: List[BaseMessage], model_name: str, limit: Optional[Limit] = None, **kwargs: Any) -> str:
+    # 从进程级注册表获取共享实例，避免每次调用重新构造模型与连接
+    llm = get_model(ASYNC_REVIEW_MODEL, model_name=model_name)
+    async with (limit or _unlimited)():
+        return str(await llm.ainvoke(messages, **kwargs))
+
 # 2. 基于 LLM 匹配评审要点与文档内容
 
-def llm_match_content(paragraphs: List[str], review_point: str, model_name: str = "qwen-turbo", temperature: float = 0.3, max_tokens: int = 512) -> str:
+# 逐要点匹配的两种输出格式：text 要求模型逐字返回段落原文；indices 只要求返回段落编号，由本地按编号还原原文
+MATCH_OUTPUT_INSTRUCTIONS = {
+    "indices": "\n请只返回最相关段落的编号组成的JSON数组，例如 [3, 7]；没有相关段落时返回 []。不要返回段落原文，不要添加解释。",
+    "text": "\n请直接返回最相关的段落原文（如有多个可合并），不要添加解释。",
+}
+
+# 逐要点匹配默认只要求返回段落编号，避免模型逐字复述段落；可通过环境变量 REVIEW_MATCH_OUTPUT=text 改回逐字输出
+REVIEW_MATCH_OUTPUT = os.getenv("REVIEW_MATCH_OUTPUT", "indices")
+
+_INDEX_GROUP = re.compile(r"\[([\d\s,，]*)\]")
+
+def build_match_messages(paragraphs: List[str], review_point: str, indices: Optional[Sequence[int]] = None, output: str = "indices") -> List[BaseMessage]:
     prompt = f"""
             你是一名文档分析专家。请从下列文档段落中，找出与评审要点最相关的内容。
 
@@ -49,20 +83,257 @@ def llm_match_content(paragraphs: List[str], review_point: str, model_name: str
 
             文档段落：
             """
-    for idx, para in enumerate(paragraphs):
+    # 只传入候选段落时，indices 为候选在原文档中的序号，保持编号与原文一致
+    for idx, para in zip(indices if indices is not None else range(len(paragraphs)), paragraphs):
         prompt += f"[{idx+1}] {para}\n"
-    prompt += "\n请直接返回最相关的段落原文（如有多个可合并），不要添加解释。"
-    messages = [
+    prompt += MATCH_OUTPUT_INSTRUCTIONS[output]
+    return [
         SystemMessage(content="你是一名文档分析专家。"),
         HumanMessage(content=prompt)
     ]
-    llm = Tongyi(model="qwen-turbo")
+
+def parse_match_indices(text: str, allowed: Sequence[int]) -> List[int]:
+    """
+    解析逐要点匹配输出的段落编号
+
+    Args:
+        text: LLM输出，如 "[3, 7]"；模型按提示词的格式逐个输出 "[3] [7]" 时同样可以解析
+        allowed: 本次请求发送的段落序号（从0开始），不在其中的编号被忽略
+
+    Returns:
+        List[int]: 相关段落序号（从0开始，升序）
+
+    Raises:
+        ValueError: 输出中没有编号数组时抛出
+    """
+    groups = _INDEX_GROUP.findall(text)
+    if not groups:
+        raise ValueError(f"匹配输出不含段落编号: {text[:200]}")
+    found = {int(n) - 1 for group in groups for n in re.findall(r"\d+", group)}
+    return sorted(found & set(allowed))
+
+def llm_match_indices(paragraphs: List[str], review_point: str, model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None) -> List[int]:
+    messages = build_match_messages(paragraphs, review_point, indices, output="indices")
+    # 从进程级注册表获取共享实例，避免每次调用重新构造模型与连接
+    llm = get_model("tongyi", model_name=model_name)
     result = llm.invoke(messages)
-    return str(result)
+    return parse_match_indices(str(result), indices if indices is not None else range(len(paragraphs)))
+
+def llm_match_content(paragraphs: List[str], review_point: str, model_name: str = "qwen-turbo", temperature: float = 0.3, max_tokens: int = 512, indices: Optional[Sequence[int]] = None, output: Optional[str] = None) -> str:
+    indices = list(indices if indices is not None else range(len(paragraphs)))
+    if (output or REVIEW_MATCH_OUTPUT) == "text":
+        messages = build_match_messages(paragraphs, review_point, indices, output="text")
+        return str(get_model("tongyi", model_name=model_name).invoke(messages))
+    try:
+        found = llm_match_indices(paragraphs, review_point, model_name, indices)
+    except ValueError:
+        # 编号无法解析时，回退为要求模型返回段落原文
+        messages = build_match_messages(paragraphs, review_point, indices, output="text")
+        return str(get_model("tongyi", model_name=model_name).invoke(messages))
+    texts = dict(zip(indices, paragraphs))
+    return "\n".join(texts[i] for i in found)
+
+def match_content(retrieval: RetrievalResult, review_point: str, model_name: str = "qwen-turbo", paragraphs: Optional[List[str]] = None) -> str:
+    """
+    根据检索结果匹配评审要点的相关内容
+
+    检索置信度足够高时直接返回置信候选原文，不调用LLM；否则只把候选段落交给LLM筛选。
+
+    Args:
+        retrieval: 该评审要点的检索结果
+        review_point: 评审要点
+        model_name: 模型名称
+        paragraphs: 完整文档段落；检索没有任何候选时交给LLM在完整文档上匹配
+
+    Returns:
+        str: 相关内容；没有任何候选且未提供完整文档时返回空字符串
+    """
+    if retrieval.confident:
+        return retrieval.matched_content()
+    if not retrieval.candidates:
+        return llm_match_content(paragraphs, review_point, model_name) if paragraphs else ""
+    # 候选按文档顺序排列，便于LLM理解上下文
+    candidates = sorted(retrieval.candidates, key=lambda c: c.index)
+    return llm_match_content(
+        [c.text for c in candidates], review_point, model_name, indices=[c.index for c in candidates]
+    )
+
+async def allm_match_indices(paragraphs: List[str], review_point: str, model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None, limit: Optional[Limit] = None) -> List[int]:
+    text = await _ainvoke(build_match_messages(paragraphs, review_point, indices, output="indices"), model_name, limit)
+    return parse_match_indices(text, indices if indices is not None else range(len(paragraphs)))
+
+async def allm_match_content(paragraphs: List[str], review_point: str, model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None, limit: Optional[Limit] = None, output: Optional[str] = None) -> str:
+    indices = list(indices if indices is not None else range(len(paragraphs)))
+    if (output or REVIEW_MATCH_OUTPUT) == "text":
+        return await _ainvoke(build_match_messages(paragraphs, review_point, indices, output="text"), model_name, limit)
+    try:
+        found = await allm_match_indices(paragraphs, review_point, model_name, indices, limit)
+    except ValueError:
+        # 编号无法解析时，回退为要求模型返回段落原文
+        return await _ainvoke(build_match_messages(paragraphs, review_point, indices, output="text"), model_name, limit)
+    texts = dict(zip(indices, paragraphs))
+    return "\n".join(texts[i] for i in found)
+
+async def amatch_content(retrieval: RetrievalResult, review_point: str, model_name: str = "qwen-turbo", limit: Optional[Limit] = None, paragraphs: Optional[List[str]] = None) -> str:
+    """match_content 的原生异步版本，limit 为每次模型调用的并发限制"""
+    if retrieval.confident:
+        return retrieval.matched_content()
+    if not retrieval.candidates:
+        return await allm_match_content(paragraphs, review_point, model_name, limit=limit) if paragraphs else ""
+    candidates = sorted(retrieval.candidates, key=lambda c: c.index)
+    return await allm_match_content(
+        [c.text for c in candidates], review_point, model_name, indices=[c.index for c in candidates], limit=limit
+    )
+
+# 2.1 批量匹配：文档只发送一次，所有评审要点一次返回结构化结果
+
+# 批量匹配单次请求的输入token预算（约一字一token估算），超出时自动拆分评审要点
+BATCH_MATCH_TOKEN_BUDGET = 6000
+
+_JSON_OBJECT = re.compile(r"\{.*\}", re.S)
+
+def estimate_tokens(messages: Sequence[BaseMessage]) -> int:
+    # 与调用埋点、限流的估算一致：约一字一token
+    return sum(len(str(message.content)) for message in messages)
+
+def build_batch_match_messages(paragraphs: List[str], review_points: List[str], indices: Optional[Sequence[int]] = None) -> List[BaseMessage]:
+    prompt = """
+            你是一名文档分析专家。请针对下列每个评审要点，从文档段落中找出与之最相关的段落。
+
+            评审要点：
+            """
+    for number, point in enumerate(review_points, 1):
+        prompt += f"<{number}> {point}\n"
+    prompt += "\n文档段落：\n"
+    for idx, para in zip(indices if indices is not None else range(len(paragraphs)), paragraphs):
+        prompt += f"[{idx+1}] {para}\n"
+    prompt += (
+        "\n请只返回一个JSON对象，键为评审要点编号，值为相关段落编号组成的数组（没有相关段落时为空数组），"
+        '例如 {"1": [3, 5], "2": []}。不要添加解释。'
+    )
+    return [
+        SystemMessage(content="你是一名文档分析专家。"),
+        HumanMessage(content=prompt)
+    ]
+
+def chunk_review_points(paragraphs: List[str], review_points: List[str], indices: Optional[Sequence[int]] = None, budget: int = BATCH_MATCH_TOKEN_BUDGET) -> List[List[str]]:
+    """
+    按输入token预算将评审要点分组，每组与文档一起放进一次批量匹配请求
+
+    Args:
+        paragraphs: 发送给LLM的段落
+        review_points: 评审要点
+        indices: 段落在原文档中的序号
+        budget: 单次请求的输入token预算
+
+    Returns:
+        List[List[str]]: 评审要点分组；文档本身已超出预算时返回空列表，由调用方逐要点匹配
+    """
+    base = estimate_tokens(build_batch_match_messages(paragraphs, [], indices))
+    chunks: List[List[str]] = []
+    current: List[str] = []
+    size = base
+    for point in review_points:
+        cost = len(f"<{len(current) + 1}> {point}\n")
+        if current and size + cost > budget:
+            chunks.append(current)
+            current, size = [], base
+            cost = len(f"<1> {point}\n")
+        if size + cost > budget:
+            return []
+        current.append(point)
+        size += cost
+    if current:
+        chunks.append(current)
+    return chunks
+
+def parse_batch_match(text: str, review_points: List[str], allowed: Sequence[int]) -> Dict[str, List[int]]:
+    """
+    解析批量匹配的JSON输出
+
+    Args:
+        text: LLM输出，允许包含代码块标记等多余文本
+        review_points: 本次请求的评审要点，编号从1开始
+        allowed: 本次请求发送的段落序号（从0开始），不在其中的编号被忽略
+
+    Returns:
+        Dict[str, List[int]]: 评审要点到相关段落序号（从0开始，升序）的映射
+
+    Raises:
+        ValueError: 输出不是合法JSON或缺少某个评审要点时抛出
+    """
+    match = _JSON_OBJECT.search(text)
+    if match is None:
+        raise ValueError(f"批量匹配输出不是JSON: {text[:200]}")
+    data = json.loads(match.group())
+    if not isinstance(data, dict):
+        raise ValueError("批量匹配输出不是JSON对象")
+    allowed = set(allowed)
+    result = {}
+    for number, point in enumerate(review_points, 1):
+        value = data.get(str(number), data.get(point))
+        if not isinstance(value, list):
+            raise ValueError(f"批量匹配输出缺少评审要点 {number}: {point}")
+        try:
+            found = {int(v) - 1 for v in value}
+        except (TypeError, ValueError):
+            raise ValueError(f"批量匹配输出的段落编号无效: {value}")
+        result[point] = sorted(found & allowed)
+    return result
+
+def llm_batch_match(paragraphs: List[str], review_points: List[str], model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None) -> Dict[str, List[int]]:
+    messages = build_batch_match_messages(paragraphs, review_points, indices)
+    # 从进程级注册表获取共享实例，避免每次调用重新构造模型与连接
+    llm = get_model("tongyi", model_name=model_name)
+    result = llm.invoke(messages)
+    return parse_batch_match(str(result), review_points, indices if indices is not None else range(len(paragraphs)))
+
+async def allm_batch_match(paragraphs: List[str], review_points: List[str], model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None, limit: Optional[Limit] = None) -> Dict[str, List[int]]:
+    text = await _ainvoke(build_batch_match_messages(paragraphs, review_points, indices), model_name, limit)
+    return parse_batch_match(text, review_points, indices if indices is not None else range(len(paragraphs)))
+
+async def batch_match_content(paragraphs: List[str], review_points: List[str], model_name: str = "qwen-turbo", indices: Optional[Sequence[int]] = None, budget: Optional[int] = None, limit: Optional[Limit] = None) -> Dict[str, str]:
+    """
+    批量匹配多个评审要点的相关内容，超出预算时按组并发请求
+
+    Args:
+        paragraphs: 发送给LLM的段落
+        review_points: 评审要点
+        model_name: 模型名称
+        indices: 段落在原文档中的序号，None表示 paragraphs 即完整文档
+        budget: 单次请求的输入token预算，None表示使用 BATCH_MATCH_TOKEN_BUDGET
+        limit: 每次模型调用的并发限制
+
+    Returns:
+        Dict[str, str]: 评审要点到相关段落原文的映射；文档超出预算或输出无法解析的要点不在其中，
+        由调用方回退到逐要点匹配
+    """
+    indices = list(indices if indices is not None else range(len(paragraphs)))
+    texts = dict(zip(indices, paragraphs))
+
+    async def run(chunk: List[str]) -> Dict[str, str]:
+        try:
+            mapping = await allm_batch_match(paragraphs, chunk, model_name, indices, limit)
+        except ValueError:
+            return {}
+        return {point: "\n".join(texts[i] for i in found) for point, found in mapping.items()}
+
+    matched: Dict[str, str] = {}
+    chunks = chunk_review_points(paragraphs, review_points, indices, budget or BATCH_MATCH_TOKEN_BUDGET)
+    for result in await asyncio.gather(*[run(chunk) for chunk in chunks]):
+        matched.update(result)
+    return matched
 
 # 3. 构造链式思维评审结论
 
-def llm_review_conclusion(review_point: str, matched_content: str, model_name: str = "qwen-turbo", temperature: float = 0.7, max_tokens: int = 1024) -> str:
+# 评审结论模式：compact 只返回结构化判定；detailed 返回完整的分步推理文本
+CONCLUSION_MODES = ("compact", "detailed")
+VERDICTS = ("符合", "部分符合", "不符合", "无法判断")
+SEVERITIES = ("无", "轻微", "一般", "严重")
+RATIONALE_MAX_CHARS = 80
+COMPACT_CONCLUSION_MAX_TOKENS = 160
+
+def build_review_conclusion_messages(review_point: str, matched_content: str) -> List[BaseMessage]:
     prompt = f"""
 你是一名文档评审专家。请根据以下评审要点和相关文档内容，给出详细的评审结论，并展示你的推理过程：
 
@@ -72,27 +343,295 @@ def llm_review_conclusion(review_point: str, matched_content: str, model_name: s
 
 请分步推理，最后给出结论。
 """
-    messages = [
+    return [
         SystemMessage(content="你是一名文档评审专家。"),
         HumanMessage(content=prompt)
     ]
-    llm = Tongyi(model="qwen-turbo")
+
+def llm_review_conclusion(review_point: str, matched_content: str, model_name: str = "qwen-turbo", temperature: float = 0.7, max_tokens: int = 1024) -> str:
+    messages = build_review_conclusion_messages(review_point, matched_content)
+    # 从进程级注册表获取共享实例，避免每次调用重新构造模型与连接
+    llm = get_model("tongyi", model_name=model_name)
     result = llm.invoke(messages)
     return str(result)
 
-# 4. 主流程：链式思维文档评审（异步并发优化）
+async def allm_review_conclusion(review_point: str, matched_content: str, model_name: str = "qwen-turbo", limit: Optional[Limit] = None) -> str:
+    return await _ainvoke(build_review_conclusion_messages(review_point, matched_content), model_name, limit)
+
+def build_compact_conclusion_messages(review_point: str, matched_content: str, include_reasoning: bool = False) -> List[BaseMessage]:
+    schema = (
+        f'{{"verdict": "{"|".join(VERDICTS)}", "severity": "{"|".join(SEVERITIES)}", '
+        f'"rationale": "不超过{RATIONALE_MAX_CHARS}字的理由"}}'
+    )
+    if include_reasoning:
+        instructions = f"请先分步推理，最后另起一行只输出一个JSON对象：{schema}"
+    else:
+        instructions = f"请不要展示推理过程，只输出一个JSON对象：{schema}"
+    prompt = f"""
+你是一名文档评审专家。请根据以下评审要点和相关文档内容给出评审结论。
+
+评审要点：{review_point}
+
+相关内容：{matched_content}
+
+{instructions}
+"""
+    return [
+        SystemMessage(content="你是一名文档评审专家。"),
+        HumanMessage(content=prompt)
+    ]
+
+def parse_compact_conclusion(text: str) -> Dict[str, Any]:
+    """
+    解析结构化评审结论，取输出中最后一个JSON对象
+
+    Args:
+        text: LLM输出，允许在JSON前包含推理过程
+
+    Returns:
+        Dict[str, Any]: {"verdict", "severity", "rationale"}；输出无法解析时 verdict 为“无法判断”，
+        severity 为None，rationale 为截断后的原始输出
+    """
+    start = text.rfind("{")
+    end = text.rfind("}")
+    try:
+        data = json.loads(text[start:end + 1]) if 0 <= start < end else None
+    except ValueError:
+        data = None
+    if not isinstance(data, dict) or data.get("verdict") not in VERDICTS:
+        return {"verdict": "无法判断", "severity": None, "rationale": text.strip()[:RATIONALE_MAX_CHARS]}
+    severity = data.get("severity")
+    return {
+        "verdict": data["verdict"],
+        "severity": severity if severity in SEVERITIES else None,
+        "rationale": str(data.get("rationale", "")).strip()[:RATIONALE_MAX_CHARS],
+    }
+
+def llm_compact_conclusion(review_point: str, matched_content: str, model_name: str = "qwen-turbo", include_reasoning: bool = False) -> Dict[str, Any]:
+    """
+    生成结构化评审结论
+
+    Args:
+        review_point: 评审要点
+        matched_content: 相关内容
+        model_name: 模型名称
+        include_reasoning: 是否同时生成分步推理；推理放在返回值的 reasoning 字段，与结论分开
+
+    Returns:
+        Dict[str, Any]: {"verdict", "severity", "rationale"}，include_reasoning 时另含 "reasoning"
+    """
+    messages = build_compact_conclusion_messages(review_point, matched_content, include_reasoning)
+    llm = get_model("tongyi", model_name=model_name)
+    text = str(llm.invoke(messages, max_tokens=_compact_max_tokens(include_reasoning)))
+    return _compact_result(text, include_reasoning)
+
+async def allm_compact_conclusion(review_point: str, matched_content: str, model_name: str = "qwen-turbo", include_reasoning: bool = False, limit: Optional[Limit] = None) -> Dict[str, Any]:
+    """llm_compact_conclusion 的原生异步版本，limit 为模型调用的并发限制"""
+    messages = build_compact_conclusion_messages(review_point, matched_content, include_reasoning)
+    text = await _ainvoke(messages, model_name, limit, max_tokens=_compact_max_tokens(include_reasoning))
+    return _compact_result(text, include_reasoning)
+
+def _compact_max_tokens(include_reasoning: bool) -> int:
+    # 只要判定时严格限制输出长度；需要推理时沿用详细模式的上限
+    return 1024 if include_reasoning else COMPACT_CONCLUSION_MAX_TOKENS
+
+def _compact_result(text: str, include_reasoning: bool) -> Dict[str, Any]:
+    conclusion = parse_compact_conclusion(text)
+    if include_reasoning:
+        start = text.rfind("{")
+        conclusion["reasoning"] = (text[:start] if start >= 0 else text).strip()
+    return conclusion
+
+# 4. 主流程：链式思维文档评审（原生异步，限制并发）
+
+# 所有评审请求共享的模型调用并发上限，可通过环境变量 REVIEW_MAX_CONCURRENCY 配置
+REVIEW_MAX_CONCURRENCY = int(os.getenv("REVIEW_MAX_CONCURRENCY", "16"))
+# 单个评审请求的默认并发上限，避免一份要点很多的文档占满全局配额
+REVIEW_REQUEST_CONCURRENCY = 4
+
+# 调度器中的异步原语绑定事件循环，每个运行中的事件循环各自持有一个共享调度器
+_review_schedulers: Dict[asyncio.AbstractEventLoop, PriorityScheduler] = {}
+
+def get_review_scheduler() -> PriorityScheduler:
+    """
+    返回当前事件循环内所有评审请求共享的调度器，首次调用时创建
+
+    Returns:
+        PriorityScheduler: 当前事件循环的评审调度器
+    """
+    loop = asyncio.get_running_loop()
+    # 丢弃已关闭事件循环遗留的调度器
+    for stale_loop in [l for l in _review_schedulers if l.is_closed()]:
+        _review_schedulers.pop(stale_loop, None)
+    scheduler = _review_schedulers.get(loop)
+    if scheduler is None:
+        scheduler = _review_schedulers[loop] = PriorityScheduler(max_concurrency=REVIEW_MAX_CONCURRENCY, reserved=0)
+    return scheduler
+
+# 段落检索默认只使用BM25；设置环境变量 REVIEW_RETRIEVAL_EMBEDDINGS=1 时加载本地向量模型
+REVIEW_RETRIEVAL_EMBEDDINGS = os.getenv("REVIEW_RETRIEVAL_EMBEDDINGS", "0").lower() in ("1", "true", "yes")
+
+# 段落检索器无状态，在所有请求间共享（向量模型只加载一次，应用启动时调用 get_retriever 预先创建）
+default_retriever: Optional[ParagraphRetriever] = None
+
+def get_retriever() -> ParagraphRetriever:
+    global default_retriever
+    if default_retriever is None:
+        default_retriever = ParagraphRetriever(use_embeddings=REVIEW_RETRIEVAL_EMBEDDINGS)
+    return default_retriever
+
+# 要点截止时间与HTTP客户端的读超时都按 status=timeout 返回
+_TIMEOUT_ERRORS = (asyncio.TimeoutError, TimeoutError, aiohttp.ServerTimeoutError)
+
+def _is_timeout(exc: Optional[BaseException]) -> bool:
+    """异常本身或其异常链（被模型封装层包装后重新抛出）中含有超时"""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        if isinstance(exc, _TIMEOUT_ERRORS):
+            return True
+        seen.add(id(exc))
+        exc = exc.__cause__ or exc.__context__
+    return False
+
+async def review_document_with_chain_of_thought(
+    file_path: str,
+    review_points: List[str],
+    model_name: str = "qwen-turbo",
+    retriever: Optional[ParagraphRetriever] = None,
+    use_retrieval: bool = True,
+    match_mode: str = "batch",
+    conclusion_mode: str = "compact",
+    include_reasoning: bool = False,
+    max_concurrency: int = REVIEW_REQUEST_CONCURRENCY,
+    point_timeout: Optional[float] = None,
+    scheduler: Optional[PriorityScheduler] = None,
+    priority: str = BATCH
+) -> Dict[str, Dict[str, Any]]:
+    """
+    链式思维文档评审
+
+    模型调用全部为原生异步，每次调用先占用本请求的并发额度，再从全局调度器获取槽位。
+    取消本协程（如客户端断开）会取消所有未完成的要点及其在途请求。
+    单个要点出错不影响其他要点，返回时不会遗留任何在途的要点任务。
+
+    Args:
+        file_path: 文档路径，支持 docx 与 md
+        review_points: 评审要点
+        model_name: 模型名称
+        retriever: 段落检索器，None表示使用共享的默认检索器
+        use_retrieval: 是否先检索候选段落
+        match_mode: batch 批量匹配所有要点；per_point 逐要点匹配
+        conclusion_mode: compact 结构化判定；detailed 完整推理文本
+        include_reasoning: compact 模式下是否另外返回推理过程
+        max_concurrency: 本请求同时在途的模型调用数上限
+        point_timeout: 每个要点从评审开始计的截止时间（秒），None表示不限
+        scheduler: 全局并发调度器，None表示使用当前事件循环的 get_review_scheduler()
+        priority: 在调度器中的优先级类别
+
+    Returns:
+        Dict[str, Dict[str, Any]]: 评审要点到结果的映射。status 为 ok、timeout 或 error；
+        超时或出错的要点保留已完成的部分（如匹配内容），未完成的字段为None，出错的要点另有 error 字段
+
+    Raises:
+        ValueError: 模式参数不合法时抛出
+    """
+    if match_mode not in ("batch", "per_point"):
+        raise ValueError(f"不支持的匹配模式: {match_mode}")
+    if conclusion_mode not in CONCLUSION_MODES:
+        raise ValueError(f"不支持的结论模式: {conclusion_mode}")
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + point_timeout if point_timeout is not None else None
+    scheduler = scheduler or get_review_scheduler()
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    @asynccontextmanager
+    async def limit() -> AsyncIterator[None]:
+        # 先占用本请求的额度，再排队获取全局槽位，排队中的请求不占用全局槽位
+        async with semaphore:
+            async with scheduler.slot(priority):
+                yield
 
-async def review_document_with_chain_of_thought(file_path: str, review_points: List[str], model_name: str = "qwen-turbo") -> Dict[str, Dict[str, str]]:
     paragraphs = extract_paragraphs(file_path)
-    review_results = {}
 
-    async def process_point(point: str):
-        matched_content = await asyncio.to_thread(llm_match_content, paragraphs, point, model_name)
-        conclusion = await asyncio.to_thread(llm_review_conclusion, point, matched_content, model_name)
-        return point, {"matched_content": matched_content, "conclusion": conclusion}
+    # 每份文档只建一次索引，所有评审要点批量检索
+    retrievals: Dict[str, RetrievalResult] = {}
+    if use_retrieval:
+        retriever = retriever or get_retriever()
+
+        def retrieve() -> List[RetrievalResult]:
+            return retriever.build(paragraphs).search_many(review_points)
+
+        retrievals = dict(zip(review_points, await asyncio.to_thread(retrieve)))
+
+    matched: Dict[str, str] = {}
+    pending = list(dict.fromkeys(review_points))
+    if use_retrieval:
+        # 只有检索器开启了置信度阈值时，高置信要点才直接采用检索原文
+        for point in pending:
+            if retrievals[point].confident:
+                matched[point] = retrievals[point].matched_content()
+        # 没有任何候选的要点不进入批量匹配，由逐要点匹配在完整文档上查找
+        pending = [point for point in pending if point not in matched and retrievals[point].candidates]
+
+    # 批量匹配由所有待匹配要点共享，单个要点超时不会取消它
+    batch_task: Optional[asyncio.Future] = None
+    if match_mode == "batch" and pending:
+        # 文档只发送一次；启用检索时只发送各要点候选段落的并集
+        if use_retrieval:
+            indices = sorted({c.index for point in pending for c in retrievals[point].candidates})
+            batch = batch_match_content([paragraphs[i] for i in indices], pending, model_name, indices, limit=limit)
+        else:
+            batch = batch_match_content(paragraphs, pending, model_name, limit=limit)
+        batch_task = asyncio.ensure_future(batch)
+
+    async def process_point(point: str, result: Dict[str, Any]) -> None:
+        matched_content = matched.get(point)
+        if matched_content is None and batch_task is not None:
+            matched_content = (await asyncio.shield(batch_task)).get(point)
+        if matched_content is None:
+            # 逐要点匹配：非批量模式，或批量匹配超出预算、输出无法解析时回退
+            if use_retrieval:
+                matched_content = await amatch_content(retrievals[point], point, model_name, limit, paragraphs)
+            else:
+                matched_content = await allm_match_content(paragraphs, point, model_name, limit=limit)
+        result["matched_content"] = matched_content
+
+        if conclusion_mode == "detailed":
+            result["conclusion"] = await allm_review_conclusion(point, matched_content, model_name, limit)
+        else:
+            conclusion = await allm_compact_conclusion(point, matched_content, model_name, include_reasoning, limit)
+            # 推理过程与结论分开返回，只在调用方要求时生成
+            if include_reasoning:
+                result["reasoning"] = conclusion.pop("reasoning")
+            result["conclusion"] = conclusion
+
+    async def run_point(point: str):
+        result: Dict[str, Any] = {
+            "status": "ok", "matched_content": None, "conclusion_mode": conclusion_mode, "conclusion": None
+        }
+        timeout = max(0.0, deadline - loop.time()) if deadline is not None else None
+        try:
+            await asyncio.wait_for(process_point(point, result), timeout)
+        except Exception as e:
+            if _is_timeout(e):
+                result["status"] = "timeout"
+            else:
+                result["status"] = "error"
+                result["error"] = str(e)
+        return point, result
 
-    tasks = [process_point(point) for point in review_points]
-    results = await asyncio.gather(*tasks)
+    tasks = [asyncio.ensure_future(run_point(point)) for point in review_points]
+    try:
+        results = await asyncio.gather(*tasks)
+    finally:
+        # 被取消或意外出错时，取消并等待剩余的要点任务与批量匹配，不留下在途请求
+        pending_tasks = [task for task in tasks if not task.done()]
+        if batch_task is not None and not batch_task.done():
+            pending_tasks.append(batch_task)
+        for task in pending_tasks:
+            task.cancel()
+        if pending_tasks:
+            await asyncio.gather(*pending_tasks, return_exceptions=True)
     return dict(results)
 
 # 5. main 函数示例
@@ -0,0 +1,303 @@
+"""
+文档段落检索
+
+评审流程原先把文档全部段落逐条拼进每个评审要点的提示词，输入token随“文档长度 × 要点数”增长，
+长报告会超出上下文窗口。ParagraphRetriever 对每份文档只建一次索引：
+- BM25：中文分词（安装 jieba 时使用 jieba，否则按字与相邻二字切分）
+- 向量（可选）：与语义缓存相同的本地 sentence-transformers 模型，余弦相似度
+默认只使用BM25；显式开启向量检索时两路得分归一化后加权融合，每个评审要点只取 top-k 候选段落交给LLM；
+配置了置信度阈值时，置信度足够高的候选直接返回原文，不再调用LLM（默认关闭）。
+标题与过短的段落不能单独作为评审依据，永远不会被判为高置信。
+"""
+
+import math
+import re
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from appserver.service.semantic_cache import Embedder, SentenceTransformerEmbedder
+
+try:
+    import jieba
+except ImportError:  # jieba 为可选依赖
+    jieba = None
+
+_CJK = re.compile(r"[一-鿿]+")
+_WORD = re.compile(r"[一-鿿]+|[a-z0-9]+(?:[._-][a-z0-9]+)*")
+# 表格分隔行、分割线等不含文字的段落
+_DECORATION = re.compile(r"^[\s|:\-=*#>`~_]*$")
+# Markdown 标题
+_HEADING = re.compile(r"^\s*#{1,6}\s")
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    中文分词：安装 jieba 时使用搜索引擎模式，否则中文按单字加相邻二字切分，英文与数字按词切分
+
+    Args:
+        text: 原始文本
+
+    Returns:
+        List[str]: 词项列表
+    """
+    text = text.lower()
+    tokens: List[str] = []
+    for word in _WORD.findall(text):
+        if not _CJK.fullmatch(word):
+            tokens.append(word)
+        elif jieba is not None:
+            tokens.extend(t for t in jieba.cut_for_search(word) if t.strip())
+        else:
+            tokens.extend(word)
+            tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class BM25:
+    """Okapi BM25"""
+
+    def __init__(self, corpus: Sequence[List[str]], k1: float = 1.5, b: float = 0.75):
+        """
+        Args:
+            corpus: 已分词的文档列表
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.freqs = [Counter(doc) for doc in corpus]
+        self.lengths = np.asarray([len(doc) for doc in corpus], dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if len(corpus) else 0.0
+        df: Counter = Counter()
+        for freq in self.freqs:
+            df.update(freq.keys())
+        n = len(corpus)
+        self.idf = {term: math.log(1 + (n - count + 0.5) / (count + 0.5)) for term, count in df.items()}
+
+    def scores(self, query: List[str]) -> np.ndarray:
+        """
+        计算查询对每个文档的BM25得分
+
+        Args:
+            query: 已分词的查询
+
+        Returns:
+            np.ndarray: 每个文档的得分
+        """
+        scores = np.zeros(len(self.freqs), dtype=np.float32)
+        if not self.avg_length:
+            return scores
+        norm = self.k1 * (1 - self.b + self.b * self.lengths / self.avg_length)
+        for term in set(query):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            tf = np.asarray([freq.get(term, 0) for freq in self.freqs], dtype=np.float32)
+            scores += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def coverage(self, query: List[str]) -> np.ndarray:
+        """
+        每个文档覆盖的查询词项比例（按idf加权），取值 [0, 1]，不受语料规模影响，用于判断置信度
+
+        只统计多字词项（单字在中文里区分度太低），语料中不存在的词项按最大idf计入分母。
+
+        Args:
+            query: 已分词的查询
+
+        Returns:
+            np.ndarray: 每个文档的覆盖率
+        """
+        terms = {term for term in query if len(term) > 1} or set(query)
+        unseen = math.log(1 + (len(self.freqs) + 0.5) / 0.5)
+        weights = {term: self.idf.get(term, unseen) for term in terms}
+        total = sum(weights.values())
+        covered = np.zeros(len(self.freqs), dtype=np.float32)
+        if not total:
+            return covered
+        for i, freq in enumerate(self.freqs):
+            covered[i] = sum(weight for term, weight in weights.items() if term in freq)
+        return covered / total
+
+
+@dataclass
+class Candidate:
+    """
+    检索命中的候选段落
+
+    Attributes:
+        index: 段落在文档中的序号（从0开始）
+        text: 段落原文
+        score: 融合得分，用于排序
+        confidence: 置信度，取值 [0, 1]
+        confident: 置信度是否达到检索器阈值（标题与过短的段落总为False）
+    """
+
+    index: int
+    text: str
+    score: float
+    confidence: float
+    confident: bool = False
+
+
+@dataclass
+class RetrievalResult:
+    """
+    单个评审要点的检索结果
+
+    Attributes:
+        candidates: 按得分降序排列的候选段落
+        confident: 是否存在置信度达到阈值的候选，为True时无需再交给LLM筛选
+    """
+
+    candidates: List[Candidate]
+    confident: bool
+
+    @property
+    def confident_candidates(self) -> List[Candidate]:
+        """置信度达到阈值的候选，按文档顺序排列"""
+        return sorted((c for c in self.candidates if c.confident), key=lambda c: c.index)
+
+    def matched_content(self) -> str:
+        """置信候选的原文，按文档顺序合并"""
+        return "\n".join(c.text for c in self.confident_candidates)
+
+
+class ParagraphIndex:
+    """单份文档的段落索引，由 ParagraphRetriever.build 创建"""
+
+    def __init__(self, retriever: "ParagraphRetriever", paragraphs: Sequence[str]):
+        self.retriever = retriever
+        self.paragraphs = list(paragraphs)
+        # 不含文字的装饰性段落不参与检索
+        self.positions = [i for i, p in enumerate(self.paragraphs) if not _DECORATION.match(p)]
+        # 标题与过短的段落可以作为候选交给LLM，但不能直接作为匹配结果
+        self.substantive = np.asarray([
+            not _HEADING.match(self.paragraphs[i]) and len(self.paragraphs[i].strip()) >= retriever.min_confident_chars
+            for i in self.positions
+        ], dtype=bool)
+        self.bm25 = BM25([tokenize(self.paragraphs[i]) for i in self.positions], retriever.k1, retriever.b)
+        self.vectors: Optional[np.ndarray] = None
+        if retriever.embedder is not None and self.positions:
+            self.vectors = retriever.embed([self.paragraphs[i] for i in self.positions])
+
+    def search(self, query: str, top_k: Optional[int] = None) -> RetrievalResult:
+        """检索单个评审要点，见 search_many"""
+        return self.search_many([query], top_k)[0]
+
+    def search_many(self, queries: Sequence[str], top_k: Optional[int] = None) -> List[RetrievalResult]:
+        """
+        批量检索多个评审要点，查询向量一次批量计算
+
+        Args:
+            queries: 评审要点列表
+            top_k: 每个要点返回的候选数，None表示使用检索器配置
+
+        Returns:
+            List[RetrievalResult]: 与 queries 一一对应的检索结果
+        """
+        retriever = self.retriever
+        top_k = top_k or retriever.top_k
+        if not self.positions:
+            return [RetrievalResult([], False) for _ in queries]
+        query_vectors = retriever.embed(list(queries)) if self.vectors is not None else None
+
+        results = []
+        for qi, query in enumerate(queries):
+            tokens = tokenize(query)
+            bm25 = self.bm25.scores(tokens)
+            peak = float(bm25.max())
+            lexical = bm25 / peak if peak > 0 else bm25
+            coverage = self.bm25.coverage(tokens)
+            if query_vectors is not None:
+                cosine = np.clip(self.vectors @ query_vectors[qi], 0.0, 1.0)
+                weight = retriever.bm25_weight
+                score = weight * lexical + (1 - weight) * cosine
+                confidence = weight * coverage + (1 - weight) * cosine
+            else:
+                score, confidence = lexical, coverage
+
+            threshold = retriever.confidence_threshold
+            order = np.argsort(-score, kind="stable")[:top_k]
+            candidates = [
+                Candidate(
+                    self.positions[i], self.paragraphs[self.positions[i]], float(score[i]), float(confidence[i]),
+                    confident=bool(threshold is not None and confidence[i] >= threshold and self.substantive[i])
+                )
+                for i in order if score[i] > 0
+            ]
+            results.append(RetrievalResult(candidates, any(c.confident for c in candidates)))
+        return results
+
+
+class ParagraphRetriever:
+    """
+    BM25与向量混合的段落检索器
+
+    检索器本身无状态，可在多份文档间共享；每份文档调用一次 build 建立索引，再对各评审要点检索。
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        use_embeddings: bool = False,
+        top_k: int = 5,
+        bm25_weight: float = 0.5,
+        confidence_threshold: Optional[float] = None,
+        min_confident_chars: int = 20,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        """
+        初始化段落检索器
+
+        Args:
+            embedder: 向量化函数，提供时使用向量检索
+            use_embeddings: 未提供 embedder 时是否加载本地 sentence-transformers 模型做向量检索
+            top_k: 每个评审要点交给LLM的候选段落数
+            bm25_weight: 融合得分中BM25的权重，其余为向量相似度
+            confidence_threshold: 候选置信度达到该值时直接采用，不再调用LLM；None（默认）表示总是调用LLM
+            min_confident_chars: 段落至少包含的字符数，更短的段落与标题不会被直接采用
+            k1: BM25词频饱和参数
+            b: BM25文档长度归一化参数
+        """
+        if embedder is None and use_embeddings:
+            embedder = SentenceTransformerEmbedder()
+        self.embedder = embedder
+        self.top_k = top_k
+        self.bm25_weight = bm25_weight if self.embedder is not None else 1.0
+        self.confidence_threshold = confidence_threshold
+        self.min_confident_chars = min_confident_chars
+        self.k1 = k1
+        self.b = b
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """批量向量化并按行归一化"""
+        vectors = np.asarray(self.embedder(texts), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def build(self, paragraphs: Sequence[str]) -> ParagraphIndex:
+        """
+        为一份文档建立段落索引
+
+        Args:
+            paragraphs: 文档段落列表
+
+        Returns:
+            ParagraphIndex: 段落索引
+        """
+        return ParagraphIndex(self, paragraphs)
+
+    def stats(self) -> Dict[str, object]:
+        """返回检索器配置"""
+        return {
+            "tokenizer": "jieba" if jieba is not None else "char-bigram",
+            "embeddings": self.embedder is not None,
+            "top_k": self.top_k,
+            "bm25_weight": self.bm25_weight,
+            "confidence_threshold": self.confidence_threshold,
+        }
@@ -0,0 +1,196 @@
+"""
+LLM请求的优先级调度
+
+交互式流式对话与批量文档评审共用同一份上游配额。调度器限制同时在途的请求数，
+排队的请求按优先级类别出队：interactive 严格优先，可越过所有排队中的 standard/batch 请求，
+另外可以为其预留若干并发槽位；standard 与 batch 之间按权重公平排队（WFQ），批量任务不会被饿死。
+同一类别内按截止时间先到先出（EDF），超过截止时间仍未出队的请求直接失败。
+"""
+
+import asyncio
+import heapq
+import itertools
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from appserver.models.hedging import LatencyTracker
+
+INTERACTIVE = "interactive"
+STANDARD = "standard"
+BATCH = "batch"
+
+DEFAULT_WEIGHTS = {INTERACTIVE: 8.0, STANDARD: 4.0, BATCH: 1.0}
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """请求在截止时间前未能出队"""
+
+
+class _ClassQueue:
+    """单个优先级类别的等待队列与统计"""
+
+    def __init__(self, weight: float):
+        self.weight = weight
+        self.heap: List[Tuple[float, int, asyncio.Future]] = []
+        self.vtime = 0.0
+        self.running = 0
+        self.dispatched = 0
+        self.expired = 0
+        self.wait = LatencyTracker()
+
+    def prune(self) -> None:
+        """丢弃已取消（超时或调用方放弃）的等待者"""
+        while self.heap and self.heap[0][2].done():
+            heapq.heappop(self.heap)
+
+
+class PriorityScheduler:
+    """
+    带优先级类别、加权公平排队与截止时间的并发调度器
+
+    所有方法需在同一事件循环内调用。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 16,
+        weights: Optional[Dict[str, float]] = None,
+        strict: Tuple[str, ...] = (INTERACTIVE,),
+        reserved: int = 1
+    ):
+        """
+        初始化调度器
+
+        Args:
+            max_concurrency: 同时在途的最大请求数
+            weights: 各类别的权重，非严格优先的类别按权重分配出队机会
+            strict: 严格优先的类别，有排队请求时总是先于其他类别出队
+            reserved: 为严格优先类别预留的并发槽位，其他类别最多使用 max_concurrency - reserved 个
+        """
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency 必须大于0")
+        self.max_concurrency = max_concurrency
+        self.strict = strict
+        self.reserved = min(reserved, max_concurrency - 1)
+        self._queues = {name: _ClassQueue(weight) for name, weight in (weights or DEFAULT_WEIGHTS).items()}
+        self._running = 0
+        self._vtime = 0.0
+        self._seq = itertools.count()
+
+    def _queue(self, priority: str) -> _ClassQueue:
+        queue = self._queues.get(priority)
+        if queue is None:
+            raise ValueError(f"未知的优先级类别: {priority}，可选: {list(self._queues)}")
+        return queue
+
+    def _capacity(self, priority: str) -> int:
+        """该类别可使用的并发上限"""
+        return self.max_concurrency if priority in self.strict else self.max_concurrency - self.reserved
+
+    def _next_class(self) -> Optional[str]:
+        """选择下一个出队的类别：严格优先类别优先，其余按虚拟时间最小者"""
+        best: Optional[str] = None
+        for name, queue in self._queues.items():
+            queue.prune()
+            if not queue.heap or self._running >= self._capacity(name):
+                continue
+            if name in self.strict:
+                return name
+            if best is None or queue.vtime < self._queues[best].vtime:
+                best = name
+        return best
+
+    def _grant(self, name: str) -> None:
+        queue = self._queues[name]
+        queue.running += 1
+        queue.dispatched += 1
+        self._running += 1
+        if name not in self.strict:
+            self._vtime = max(self._vtime, queue.vtime)
+            queue.vtime += 1.0 / queue.weight
+
+    def _dispatch(self) -> None:
+        """在有空闲槽位时依次唤醒等待者"""
+        while self._running < self.max_concurrency:
+            name = self._next_class()
+            if name is None:
+                return
+            _, _, future = heapq.heappop(self._queues[name].heap)
+            self._grant(name)
+            future.set_result(None)
+
+    async def acquire(self, priority: str = STANDARD, deadline: Optional[float] = None) -> None:
+        """
+        获取一个并发槽位
+
+        Args:
+            priority: 优先级类别
+            deadline: 最长排队时间（秒），None表示不限
+
+        Raises:
+            DeadlineExceeded: 超过截止时间仍未出队时抛出
+            ValueError: 优先级类别未知时抛出
+        """
+        queue = self._queue(priority)
+        start = time.monotonic()
+        queue.prune()
+        if not queue.heap and self._running < self._capacity(priority) and self._next_class() in (None, priority):
+            self._grant(priority)
+            queue.wait.record(0.0)
+            return
+
+        if not queue.heap and priority not in self.strict:
+            # 空闲后重新排队的类别从当前虚拟时间开始计，不能凭空闲期间积累的额度插队
+            queue.vtime = max(queue.vtime, self._vtime)
+        future = asyncio.get_running_loop().create_future()
+        expires_at = start + deadline if deadline is not None else float("inf")
+        heapq.heappush(queue.heap, (expires_at, next(self._seq), future))
+        try:
+            await asyncio.wait_for(future, timeout=deadline)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # 截止时间到达的同时恰好分配到槽位，调用方不会再使用它，归还槽位
+                self.release(priority)
+            queue.expired += 1
+            raise DeadlineExceeded(f"{priority} 请求排队超过 {deadline} 秒") from None
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配槽位但调用方放弃，归还槽位
+                self.release(priority)
+            raise
+        queue.wait.record(time.monotonic() - start)
+
+    def release(self, priority: str = STANDARD) -> None:
+        """归还槽位并唤醒下一个等待者"""
+        self._queue(priority).running -= 1
+        self._running -= 1
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self, priority: str = STANDARD, deadline: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        在槽位内执行请求
+
+        Args:
+            priority: 优先级类别
+            deadline: 最长排队时间（秒）
+        """
+        await self.acquire(priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回总在途数与各类别的排队深度、在途数、出队/超时计数与排队时间分位数"""
+        classes = {}
+        for name, queue in self._queues.items():
+            classes[name] = {
+                "queued": sum(1 for _, _, future in queue.heap if not future.done()),
+                "running": queue.running,
+                "dispatched": queue.dispatched,
+                "expired": queue.expired,
+                "wait": queue.wait.snapshot(),
+            }
+        return {"running": self._running, "max_concurrency": self.max_concurrency, "classes": classes}
@@ -0,0 +1,360 @@
+"""
+语义响应缓存
+
+用户经常用略有不同的措辞提同一个问题，每个变体都要完整请求一次LLM。
+SemanticCache 用本地 sentence-transformers 模型对规范化后的提问做向量化，
+在 FAISS 内积索引中查找近邻，相似度超过阈值时直接返回缓存的回答：
+- 只有最后一条用户消息参与语义匹配；系统提示词、历史消息与生成参数必须完全一致
+- 按命名空间隔离（不同业务、不同用户的缓存互不可见）
+- 每个命名空间有界，按LRU与TTL淘汰
+- 流式调用命中时按片段回放
+未安装 faiss 时退化为 numpy 暴力检索，结果一致。
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import faiss
+except ImportError:  # faiss 为可选依赖
+    faiss = None
+
+DEFAULT_EMBEDDING_MODEL = "paraphrase-multilingual-MiniLM-L12-v2"
+
+# 向量化函数：输入文本列表，输出 (n, dim) 的 float32 矩阵
+Embedder = Callable[[List[str]], np.ndarray]
+
+_SPACES = re.compile(r"\s+")
+_TRAILING_PUNCT = re.compile(r"[\s?？!！。.,，~～]+$")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    规范化提问文本：全角转半角、小写、合并空白、去掉句末标点
+
+    Args:
+        text: 原始提问
+
+    Returns:
+        str: 规范化后的文本
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = _SPACES.sub(" ", text).strip()
+    return _TRAILING_PUNCT.sub("", text)
+
+
+def _message_fields(message: Any) -> Tuple[str, str]:
+    """返回消息的 (类型, 文本)，兼容LangChain消息与字典"""
+    if isinstance(message, dict):
+        return str(message.get("role", "")), str(message.get("content", ""))
+    return str(getattr(message, "type", "")), str(getattr(message, "content", message))
+
+
+def split_prompt(messages: Sequence[Any], params: Optional[Dict[str, Any]] = None) -> Tuple[str, str]:
+    """
+    将对话拆分为精确匹配的上下文key与参与语义匹配的提问
+
+    Args:
+        messages: 消息列表，最后一条为当前提问
+        params: 影响回答的生成参数
+
+    Returns:
+        Tuple[str, str]: (上下文key, 规范化后的提问)
+    """
+    fields = [_message_fields(message) for message in messages]
+    question = normalize_prompt(fields[-1][1]) if fields else ""
+    context = json.dumps(
+        {"messages": fields[:-1], "role": fields[-1][0] if fields else "", "params": params or {}},
+        sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(context.encode("utf-8")).hexdigest(), question
+
+
+class SentenceTransformerEmbedder:
+    """
+    基于 sentence-transformers 的本地向量化，模型在首次调用时加载
+    """
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL, device: Optional[str] = None):
+        """
+        Args:
+            model_name: sentence-transformers 模型名称或本地路径
+            device: 运行设备，None表示自动选择
+        """
+        self.model_name = model_name
+        self.device = device
+        self._model = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> Any:
+        with self._lock:
+            if self._model is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError("语义缓存需要安装 sentence-transformers：pip install sentence-transformers") from e
+                self._model = SentenceTransformer(self.model_name, device=self.device)
+        return self._model
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        model = self._model or self._load()
+        return np.asarray(model.encode(texts, normalize_embeddings=True, convert_to_numpy=True), dtype=np.float32)
+
+
+class _NumpyIndex:
+    """未安装 faiss 时使用的暴力内积检索"""
+
+    def __init__(self, dim: int):
+        self.ids = np.empty(0, dtype=np.int64)
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        self.ids = np.concatenate([self.ids, ids])
+        self.vectors = np.vstack([self.vectors, vectors])
+
+    def remove(self, ids: np.ndarray) -> None:
+        keep = ~np.isin(self.ids, ids)
+        self.ids = self.ids[keep]
+        self.vectors = self.vectors[keep]
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        if not len(self.ids):
+            return []
+        scores = self.vectors @ vector
+        top = np.argsort(-scores)[:k]
+        return [(float(scores[i]), int(self.ids[i])) for i in top]
+
+
+class _FaissIndex:
+    """FAISS 内积索引（向量已归一化，内积即余弦相似度）"""
+
+    def __init__(self, dim: int):
+        self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(dim))
+
+    def add(self, ids: np.ndarray, vectors: np.ndarray) -> None:
+        self.index.add_with_ids(vectors, ids)
+
+    def remove(self, ids: np.ndarray) -> None:
+        self.index.remove_ids(ids)
+
+    def search(self, vector: np.ndarray, k: int) -> List[Tuple[float, int]]:
+        if not self.index.ntotal:
+            return []
+        scores, ids = self.index.search(vector.reshape(1, -1), min(k, self.index.ntotal))
+        return [(float(score), int(i)) for score, i in zip(scores[0], ids[0]) if i != -1]
+
+
+@dataclass
+class _Entry:
+    context: str
+    question: str
+    answer: str
+    expires_at: Optional[float]
+
+
+class _Namespace:
+    """单个命名空间的索引与条目，条目按LRU顺序保存"""
+
+    def __init__(self):
+        self.index: Any = None
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+
+
+class SemanticCache:
+    """
+    基于向量近邻的语义响应缓存
+
+    线程安全；向量化在锁外执行。异步调用方使用 alookup/astore，向量化放到线程池中执行。
+    """
+
+    def __init__(
+        self,
+        embedder: Optional[Embedder] = None,
+        threshold: float = 0.92,
+        max_entries: int = 2048,
+        ttl: Optional[float] = 3600.0,
+        top_k: int = 8,
+        use_faiss: Optional[bool] = None
+    ):
+        """
+        初始化语义缓存
+
+        Args:
+            embedder: 向量化函数，None表示使用本地 sentence-transformers 模型
+            threshold: 命中所需的最小余弦相似度
+            max_entries: 每个命名空间的最大条目数
+            ttl: 条目存活时间（秒），None表示永不过期
+            top_k: 每次检索的近邻数，近邻中上下文不一致或已过期的会被跳过
+            use_faiss: 是否使用 faiss，None表示已安装时使用
+        """
+        if use_faiss and faiss is None:
+            raise ImportError("未安装 faiss：pip install faiss-cpu")
+        self.embedder = embedder or SentenceTransformerEmbedder()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.top_k = top_k
+        self.use_faiss = faiss is not None if use_faiss is None else use_faiss
+        self._namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.Lock()
+        self._next_id = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """返回命中、未命中、淘汰计数与各命名空间的条目数"""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / total if total else 0.0,
+            "backend": "faiss" if self.use_faiss else "numpy",
+            "namespaces": {name: len(ns.entries) for name, ns in self._namespaces.items()},
+        }
+
+    def _embed(self, text: str) -> np.ndarray:
+        vector = np.asarray(self.embedder([text]), dtype=np.float32)[0]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, namespace: _Namespace, ids: List[int]) -> None:
+        """从索引与条目中删除，调用方需持有锁"""
+        if not ids:
+            return
+        namespace.index.remove(np.asarray(ids, dtype=np.int64))
+        for entry_id in ids:
+            namespace.entries.pop(entry_id, None)
+
+    def lookup(
+        self,
+        messages: Sequence[Any],
+        params: Optional[Dict[str, Any]] = None,
+        namespace: str = "default"
+    ) -> Optional[str]:
+        """
+        查询语义相近的缓存回答
+
+        Args:
+            messages: 消息列表
+            params: 影响回答的生成参数，须与写入时完全一致
+            namespace: 命名空间
+
+        Returns:
+            Optional[str]: 命中时返回缓存的回答，否则返回None
+        """
+        context, question = split_prompt(messages, params)
+        ns = self._namespaces.get(namespace)
+        if not question or ns is None or not ns.entries:
+            self.misses += 1
+            return None
+
+        vector = self._embed(question)
+        now = time.time()
+        with self._lock:
+            expired = []
+            answer = None
+            for score, entry_id in ns.index.search(vector, self.top_k):
+                entry = ns.entries.get(entry_id)
+                if entry is None:
+                    continue
+                if entry.expires_at is not None and entry.expires_at <= now:
+                    expired.append(entry_id)
+                    continue
+                if score < self.threshold:
+                    break
+                if entry.context == context:
+                    ns.entries.move_to_end(entry_id)
+                    answer = entry.answer
+                    break
+            self._remove(ns, expired)
+            self.expirations += len(expired)
+            if answer is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return answer
+
+    def store(
+        self,
+        messages: Sequence[Any],
+        answer: str,
+        params: Optional[Dict[str, Any]] = None,
+        namespace: str = "default"
+    ) -> None:
+        """
+        写入缓存
+
+        Args:
+            messages: 消息列表
+            answer: 完整回答
+            params: 影响回答的生成参数
+            namespace: 命名空间
+        """
+        context, question = split_prompt(messages, params)
+        if not question or not answer:
+            return
+        vector = self._embed(question)
+        expires_at = time.time() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            ns = self._namespaces.setdefault(namespace, _Namespace())
+            if ns.index is None:
+                ns.index = (_FaissIndex if self.use_faiss else _NumpyIndex)(vector.shape[0])
+            # 同一提问重复写入时覆盖旧条目
+            self._remove(ns, [i for i, e in ns.entries.items() if e.context == context and e.question == question])
+            entry_id = self._next_id
+            self._next_id += 1
+            ns.index.add(np.asarray([entry_id], dtype=np.int64), vector.reshape(1, -1))
+            ns.entries[entry_id] = _Entry(context, question, answer, expires_at)
+            overflow = list(ns.entries)[:max(0, len(ns.entries) - self.max_entries)]
+            self._remove(ns, overflow)
+            self.evictions += len(overflow)
+
+    async def alookup(
+        self,
+        messages: Sequence[Any],
+        params: Optional[Dict[str, Any]] = None,
+        namespace: str = "default"
+    ) -> Optional[str]:
+        """异步查询，向量化不阻塞事件循环"""
+        return await asyncio.to_thread(self.lookup, messages, params, namespace)
+
+    async def astore(
+        self,
+        messages: Sequence[Any],
+        answer: str,
+        params: Optional[Dict[str, Any]] = None,
+        namespace: str = "default"
+    ) -> None:
+        """异步写入，向量化不阻塞事件循环"""
+        await asyncio.to_thread(self.store, messages, answer, params, namespace)
+
+    def invalidate(self, namespace: Optional[str] = None) -> int:
+        """
+        清空指定命名空间，namespace为空时清空全部
+
+        Returns:
+            int: 被删除的条目数
+        """
+        with self._lock:
+            names = [namespace] if namespace is not None else list(self._namespaces)
+            removed = 0
+            for name in names:
+                ns = self._namespaces.pop(name, None)
+                if ns is not None:
+                    removed += len(ns.entries)
+            return removed
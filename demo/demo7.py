@@ -1,12 +1,16 @@
+import os
+import sys
 from dataclasses import dataclass
 from re import A
 from typing import Annotated, Literal, TypedDict
 
 from langchain.chat_models import init_chat_model
-from langchain_deepseek import ChatDeepSeek
 from langgraph.checkpoint.memory import InMemorySaver
 from langgraph.graph import START, StateGraph, add_messages
 
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+from appserver.models.registry import get_model
+
 
 class MyState(TypedDict):
     attitude: Literal["positive", "negative"]
@@ -19,7 +23,8 @@ class Attitude(TypedDict):
 
 
 async def classify_attitude_node(state: MyState):
-    llm = ChatDeepSeek(model="deepseek-reasoner", temperature=0)
+    # 节点每次执行都复用注册表中的同一实例
+    llm = get_model("deepseek", model="deepseek-reasoner", temperature=0)
 
     new_llm = llm.with_structured_output(Attitude)
     llm_response = await new_llm.ainvoke(
@@ -49,7 +54,7 @@ def condition_func(state: MyState):
 
 async def positive_node(state: MyState):
     # 再次请求 llm
-    llm = ChatDeepSeek(model="deepseek-reasoner", temperature=1.5)
+    llm = get_model("deepseek", model="deepseek-reasoner", temperature=1.5)
     llm_response = await llm.ainvoke(
         [
             {
@@ -63,7 +68,7 @@ async def positive_node(state: MyState):
 
 async def negative_node(state: MyState):
     # 再次请求 llm
-    llm = ChatDeepSeek(model="deepseek-reasoner", temperature=1.5)
+    llm = get_model("deepseek", model="deepseek-reasoner", temperature=1.5)
 
     llm_response = await llm.ainvoke(
         [